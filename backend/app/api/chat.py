@@ -1,8 +1,22 @@
-from fastapi import APIRouter, HTTPException, Request
-from app.models.schemas import ChatMessage, ChatResponse
+from fastapi import APIRouter, HTTPException, Request, Query, BackgroundTasks
+from app.models.schemas import ChatMessage, ChatResponse, MAX_BULK_MESSAGES
 from app.services.gmail_service import GmailService
 from app.services.ai_service import AIService
 from app.core.security import verify_token
+from app.core.tracing import current_span, hash_user
+from app.core.pagination import encode_cursor
+from app.core.resilience import http_status, detached
+from app.core.state import rate_limited
+from app.core.config import settings
+from app.models.message import project_emails
+from app.services.bulk_service import bulk_service
+from app.services.semantic_index import semantic_index
+from app.services.priority import priority_ranker
+from app.services.contacts import contact_index
+from app.services.chat_session import conversation_store
+from app.services.digest_scheduler import digest_scheduler
+from app.services.inbox_delta import latest_history_id
+from typing import Optional, List
 import logging
 import re
 
@@ -22,14 +36,87 @@ def get_current_user_tokens(request: Request) -> dict:
     if not payload:
         raise HTTPException(status_code=401, detail="Invalid token")
     
+    current_span().set_attribute("user.hash", hash_user(payload.get("email", "")))
     return payload
 
 
+# Phrases that translate into Gmail search operators for bulk commands
+BULK_QUERY_TERMS = [
+    (r'\bpromotions?\b', "category:promotions"),
+    (r'\bsocial\b', "category:social"),
+    (r'\bupdates?\b', "category:updates"),
+    (r'\bforums?\b', "category:forums"),
+    (r'\bnewsletters?\b', "unsubscribe"),
+    (r'\bunread\b', "is:unread"),
+    (r'\btoday\b', "newer_than:1d"),
+    (r'\b(last|this|past) week\b', "newer_than:7d"),
+    (r'\b(last|this|past) month\b', "newer_than:1m"),
+]
+
+# Replies that confirm the action the assistant last asked about
+CONFIRM_WORDS = {"yes", "y", "confirm", "yes please", "do it", "ok", "okay"}
+
+
+def build_bulk_query(user_message: str) -> str:
+    """Translate a bulk command like 'delete all promotions from last week' into a Gmail query"""
+    terms = [query for pattern, query in BULK_QUERY_TERMS if re.search(pattern, user_message)]
+    
+    sender = re.search(r'\bfrom\s+([\w.@+-]+)', user_message)
+    if sender and sender.group(1) not in ("last", "this", "past", "the", "today"):
+        terms.append(f"from:{sender.group(1)}")
+    
+    return " ".join(terms)
+
+
+def run_pending_action(gmail: GmailService, user_key: str, pending: dict) -> ChatResponse:
+    """Carry out a remembered action the user just confirmed"""
+    if pending["action"] == "delete":
+        if not gmail.delete_email(pending["email_id"]):
+            return ChatResponse(response="Failed to delete email. Please try again.", action="error")
+        message_ids = [pending["email_id"]]
+        response = "Email deleted successfully!"
+    else:
+        message_ids = pending["email_ids"]
+        deleted = bulk_service.execute(gmail, "trash", message_ids)
+        response = f"Moved {deleted} emails to trash!"
+    
+    conversation_store.forget_emails(user_key, message_ids)
+    semantic_index.remove(user_key, message_ids)
+    priority_ranker.remove(user_key, message_ids)
+    return ChatResponse(
+        response=response,
+        action="delete_success",
+        data={"email_ids": message_ids, "query": pending.get("query")}
+    )
+
+
 @router.post("/message", response_model=ChatResponse)
-async def process_message(request: Request, message: ChatMessage):
-    """Process natural language chat message"""
+def process_message(request: Request, message: ChatMessage, background_tasks: BackgroundTasks):
+    """Process natural language chat message.
+
+    A plain def, so FastAPI runs it in its threadpool: waiting for the
+    session lock, Gmail and the model must not block the event loop.
+    """
+    payload = get_current_user_tokens(request)
+    user_key = payload["email"]
+    
+    if rate_limited("chat", user_key, settings.CHAT_RATE_LIMIT_PER_MINUTE):
+        raise HTTPException(status_code=429, detail="Too many messages, please slow down")
+    
+    response = handle_message(payload, message)
+    
+    conversation_store.add_turn(user_key, "user", message.message)
+    if conversation_store.add_turn(user_key, "assistant", response.response):
+        # Fold older turns into the summary after the response is sent
+        background_tasks.add_task(detached(conversation_store.compact), user_key, AIService().summarize_conversation)
+    
+    return response
+
+
+def handle_message(payload: dict, message: ChatMessage) -> ChatResponse:
+    """Dispatch one chat message for an authenticated user"""
     try:
-        payload = get_current_user_tokens(request)
+        user_key = payload["email"]
         user_message = message.message.lower().strip()
         
         # Initialize services
@@ -37,30 +124,52 @@ async def process_message(request: Request, message: ChatMessage):
             access_token=payload["access_token"],
             refresh_token=payload["refresh_token"]
         )
+        
+        # A confirmation resolves from the session: no intent parsing, no lookup
+        if user_message.strip(" .!") in CONFIRM_WORDS:
+            pending = conversation_store.pop_pending(user_key)
+            if pending:
+                return run_pending_action(gmail, user_key, pending)
+        else:
+            # Any other turn moves on: a later "ok" must not confirm a stale selection
+            conversation_store.pop_pending(user_key)
+        
         ai = AIService()
         
         # Parse intent using AI
-        intent_data = ai.parse_intent(message.message)
+        intent_data = ai.parse_intent(message.message, context=conversation_store.context(user_key))
         intent = intent_data["intent"]
+        params = intent_data["params"]
+        current_span().set_attribute("chat.intent", intent)
+        
+        # A parsed intent drives the dispatch; keywords only cover a failed parse
+        confident = intent_data["confidence"] != "low"
+        
+        def wants(intents, *keywords) -> bool:
+            if confident:
+                return intent in intents
+            return any(keyword in user_message for keyword in keywords)
         
         # Handle different intents
-        if "read" in user_message or "show" in user_message or "list" in user_message or "get" in user_message:
+        if wants(("read_emails",), "read", "show", "list", "get"):
             # Read emails
             count = 5
-            if "10" in user_message or "ten" in user_message:
+            if params.get("count"):
+                count = min(max(params["count"], 1), 20)
+            elif "10" in user_message or "ten" in user_message:
                 count = 10
             elif "20" in user_message or "twenty" in user_message:
                 count = 20
             
-            emails = gmail.list_emails(max_results=count)
+            page = gmail.list_emails_page(max_results=count)
+            emails = page['emails']
+            semantic_index.add(payload["email"], emails)
+            priority_ranker.add(payload["email"], emails)
+            contact_index.add(payload["email"], emails)
+            summaries = ai.summarize_emails(emails)
             email_summaries = []
             
-            for i, email in enumerate(emails, 1):
-                summary = ai.summarize_email(
-                    subject=email['subject'],
-                    body=email['body'],
-                    sender=email['sender_name']
-                )
+            for i, (email, summary) in enumerate(zip(emails, summaries), 1):
                 email_summaries.append({
                     "number": i,
                     "id": email['id'],
@@ -71,29 +180,71 @@ async def process_message(request: Request, message: ChatMessage):
                     "date": email['date']
                 })
             
+            conversation_store.remember_emails(
+                user_key,
+                [{**email, "summary": summary} for email, summary in zip(emails, summaries)],
+                source="inbox"
+            )
+            
             return ChatResponse(
                 response=f"I found {len(emails)} emails in your inbox. Here they are:",
                 action="list_emails",
-                data={"emails": email_summaries}
+                data={
+                    "emails": email_summaries,
+                    "next_cursor": encode_cursor(page['next_page_token'], user=user_key),
+                    "history_id": latest_history_id(emails)
+                }
             )
         
-        elif "delete" in user_message:
+        elif wants(("delete_email",), "delete"):
             # Delete email
+            # Bulk delete, e.g. "delete all promotions from last week"
+            if re.search(r'\ball\b', user_message):
+                search_query = build_bulk_query(user_message)
+                if search_query:
+                    message_ids = gmail.list_message_ids(query=search_query, max_results=MAX_BULK_MESSAGES)
+                    if not message_ids:
+                        return ChatResponse(
+                            response=f"I didn't find any emails matching '{search_query}'.",
+                            action="clarify"
+                        )
+                    conversation_store.set_pending(
+                        user_key, {"action": "bulk_delete", "email_ids": message_ids, "query": search_query}
+                    )
+                    return ChatResponse(
+                        response=f"Please confirm: Do you want to move {len(message_ids)} emails matching '{search_query}' to trash? Reply 'yes' or 'confirm' to proceed.",
+                        action="bulk_delete_confirm",
+                        data={"query": search_query, "count": len(message_ids)}
+                    )
+            
             # Extract email number or identifier
             numbers = re.findall(r'\d+', user_message)
             
-            if numbers:
+            if params.get("email_number") or numbers:
                 # Delete by number
-                email_num = int(numbers[0])
+                email_num = params.get("email_number") or int(numbers[0])
+                selected = conversation_store.email_by_number(user_key, email_num)
+                if selected:
+                    conversation_store.set_pending(user_key, {"action": "delete", "email_id": selected['id']})
+                    return ChatResponse(
+                        response=f"Please confirm: Do you want to delete email #{email_num} from {selected['sender_name']} ('{selected['subject']}')? Reply 'yes' or 'confirm' to proceed.",
+                        action="delete_confirm",
+                        data={"email_number": email_num, "email_id": selected['id']}
+                    )
                 return ChatResponse(
                     response=f"Please confirm: Do you want to delete email #{email_num}? Reply 'yes' or 'confirm' to proceed.",
                     action="delete_confirm",
                     data={"email_number": email_num}
                 )
             elif "latest" in user_message or "last" in user_message:
-                # Delete latest email
-                emails = gmail.list_emails(max_results=1)
+                # Delete latest email, from the inbox list already shown when there is one
+                source, listed = conversation_store.last_list(user_key)
+                if source == "inbox" and listed:
+                    emails = listed[:1]
+                else:
+                    emails = gmail.list_emails(max_results=1)
                 if emails:
+                    conversation_store.set_pending(user_key, {"action": "delete", "email_id": emails[0]['id']})
                     return ChatResponse(
                         response=f"Please confirm: Do you want to delete the latest email from {emails[0]['sender_name']}?",
                         action="delete_confirm",
@@ -101,14 +252,28 @@ async def process_message(request: Request, message: ChatMessage):
                     )
             else:
                 # Search for email to delete
-                search_query = user_message.replace("delete", "").replace("email", "").strip()
+                search_query = params.get("query") or user_message.replace("delete", "").replace("email", "").strip()
                 if search_query:
+                    # Messages the user has already seen resolve locally, without Gmail search
+                    matches = semantic_index.search(payload["email"], search_query, top_k=3)
+                    if matches:
+                        conversation_store.remember_emails(
+                            user_key, [email for email, _ in matches], source="search", query=search_query
+                        )
+                        return ChatResponse(
+                            response=f"I found {len(matches)} emails matching '{search_query}'. Which one do you want to delete?",
+                            action="delete_select",
+                            data={"emails": [email for email, _ in matches]}
+                        )
+                    
                     emails = gmail.search_emails(query=search_query, max_results=3)
+                    semantic_index.add(payload["email"], emails)
                     if emails:
+                        conversation_store.remember_emails(user_key, emails, source="search", query=search_query)
                         return ChatResponse(
                             response=f"I found {len(emails)} emails matching '{search_query}'. Which one do you want to delete?",
                             action="delete_select",
-                            data={"emails": emails[:3]}
+                            data={"emails": project_emails(emails[:3])}
                         )
             
             return ChatResponse(
@@ -116,41 +281,70 @@ async def process_message(request: Request, message: ChatMessage):
                 action="clarify"
             )
         
-        elif "reply" in user_message or "respond" in user_message:
+        elif wants(("generate_reply", "send_reply"), "reply", "respond"):
             # Generate reply
             numbers = re.findall(r'\d+', user_message)
             
-            if numbers:
-                email_num = int(numbers[0])
+            if params.get("email_number") or numbers:
+                email_num = params.get("email_number") or int(numbers[0])
+                selected = conversation_store.email_by_number(user_key, email_num)
+                if selected and selected.get('body'):
+                    # The remembered body is enough; no Gmail fetch
+                    reply = ai.generate_reply(
+                        subject=selected['subject'],
+                        body=selected['body'],
+                        sender=selected['sender_name'],
+                        sender_history=contact_index.describe(user_key, selected['sender_email'])
+                    )
+                    return ChatResponse(
+                        response=f"Here's a draft reply to '{selected['subject']}' from {selected['sender_name']}:",
+                        action="generate_reply",
+                        data={"email_number": email_num, "email_id": selected['id'], "reply": reply}
+                    )
                 return ChatResponse(
                     response=f"I'll generate a reply for email #{email_num}. One moment...",
                     action="generate_reply",
                     data={"email_number": email_num}
                 )
-            else:
+            
+            # "Reply to the Amazon email"
+            reference = params.get("query") or message.message
+            match = semantic_index.resolve(payload["email"], reference)
+            if match:
                 return ChatResponse(
-                    response="Which email would you like to reply to? Please specify the email number.",
-                    action="clarify"
+                    response=f"I'll generate a reply to '{match['subject']}' from {match['sender_name']}. One moment...",
+                    action="generate_reply",
+                    data={"email_id": match['id'], "subject": match['subject']}
                 )
+            
+            return ChatResponse(
+                response="Which email would you like to reply to? Please specify the email number.",
+                action="clarify"
+            )
         
-        elif "digest" in user_message or "summary" in user_message:
-            # Daily digest
-            emails = gmail.list_emails(max_results=20)
-            digest = ai.generate_daily_digest(emails)
+        elif wants(("daily_digest",), "digest", "summary"):
+            # Daily digest, precomputed before the user's morning when possible
+            digest_scheduler.register(user_key, payload["access_token"], payload["refresh_token"])
+            entry = digest_scheduler.fresh_digest(user_key) or digest_scheduler.compute(user_key)
             
             return ChatResponse(
-                response=digest,
+                response=entry["digest"],
                 action="daily_digest",
-                data={"email_count": len(emails)}
+                data={"email_count": entry["email_count"], "timestamp": entry["generated_at"]}
             )
         
-        elif "categorize" in user_message or "organize" in user_message:
+        elif wants(("categorize_emails",), "categorize", "organize"):
             # Categorize emails
             emails = gmail.list_emails(max_results=10)
+            categories = ai.categorize_emails(emails, payload["email"])
+            priority_ranker.add(payload["email"], emails)
+            contact_index.add(payload["email"], emails)
+            categorized_ids = {email['id']: category for email, category in zip(emails, categories)}
+            priority_ranker.set_categories(payload["email"], categorized_ids)
+            contact_index.set_categories(payload["email"], categorized_ids)
             categorized = {}
             
-            for email in emails:
-                category = ai.categorize_email(email['subject'], email['body'])
+            for email, category in zip(emails, categories):
                 if category not in categorized:
                     categorized[category] = []
                 categorized[category].append({
@@ -164,15 +358,17 @@ async def process_message(request: Request, message: ChatMessage):
                 data={"categories": categorized}
             )
         
-        elif "search" in user_message or "find" in user_message:
+        elif wants(("search_emails",), "search", "find"):
             # Search emails
-            search_query = user_message.replace("search", "").replace("find", "").replace("email", "").strip()
+            search_query = params.get("query") or user_message.replace("search", "").replace("find", "").replace("email", "").strip()
             if search_query:
                 emails = gmail.search_emails(query=search_query, max_results=5)
+                semantic_index.add(payload["email"], emails)
+                conversation_store.remember_emails(user_key, emails, source="search", query=search_query)
                 return ChatResponse(
                     response=f"I found {len(emails)} emails matching '{search_query}':",
                     action="search_results",
-                    data={"emails": emails, "query": search_query}
+                    data={"emails": project_emails(emails), "query": search_query}
                 )
             else:
                 return ChatResponse(
@@ -180,7 +376,7 @@ async def process_message(request: Request, message: ChatMessage):
                     action="clarify"
                 )
         
-        elif "help" in user_message or user_message == "":
+        elif wants(("help",), "help") or user_message == "":
             # Help message
             help_text = """I can help you with:
 • Read emails: "Show me my latest emails"
@@ -208,12 +404,21 @@ What would you like to do?"""
         raise
     except Exception as e:
         logger.error(f"Chat processing failed: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
+        raise HTTPException(status_code=http_status(e), detail=str(e))
 
 
 @router.post("/confirm-delete")
-async def confirm_delete(request: Request, email_id: str):
-    """Confirm and execute email deletion"""
+def confirm_delete(
+    request: Request,
+    email_id: Optional[str] = None,
+    email_ids: Optional[List[str]] = Query(None, max_length=MAX_BULK_MESSAGES),
+    query: Optional[str] = None
+):
+    """Confirm and execute email deletion for one email, a list of ids or a search query.
+
+    A query confirms the bulk delete the chat proposed for it: the ids counted
+    then are trashed, not whatever the query matches now.
+    """
     try:
         payload = get_current_user_tokens(request)
         
@@ -222,20 +427,48 @@ async def confirm_delete(request: Request, email_id: str):
             refresh_token=payload["refresh_token"]
         )
         
-        success = gmail.delete_email(email_id)
+        if email_id:
+            success = gmail.delete_email(email_id)
+            
+            if success:
+                semantic_index.remove(payload["email"], [email_id])
+                priority_ranker.remove(payload["email"], [email_id])
+                conversation_store.forget_emails(payload["email"], [email_id])
+                return ChatResponse(
+                    response="Email deleted successfully!",
+                    action="delete_success",
+                    data={"email_id": email_id}
+                )
+            else:
+                return ChatResponse(
+                    response="Failed to delete email. Please try again.",
+                    action="error"
+                )
         
-        if success:
-            return ChatResponse(
-                response="Email deleted successfully!",
-                action="delete_success",
-                data={"email_id": email_id}
-            )
+        if email_ids:
+            message_ids = email_ids
+        elif query:
+            pending = conversation_store.pop_pending(payload["email"], {"action": "bulk_delete", "query": query})
+            if pending is None:
+                raise HTTPException(status_code=400, detail="No bulk delete is awaiting confirmation for this query")
+            message_ids = pending["email_ids"]
         else:
-            return ChatResponse(
-                response="Failed to delete email. Please try again.",
-                action="error"
-            )
+            raise HTTPException(status_code=400, detail="email_id, email_ids or query is required")
+        
+        # One batchModify call per 1000 ids instead of one trash call per email
+        deleted = bulk_service.execute(gmail, "trash", message_ids)
+        semantic_index.remove(payload["email"], message_ids)
+        priority_ranker.remove(payload["email"], message_ids)
+        conversation_store.forget_emails(payload["email"], message_ids)
+        
+        return ChatResponse(
+            response=f"Moved {deleted} emails to trash!",
+            action="delete_success",
+            data={"count": deleted, "query": query}
+        )
     
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Delete confirmation failed: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
+        raise HTTPException(status_code=http_status(e), detail=str(e))
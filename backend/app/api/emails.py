@@ -1,17 +1,41 @@
-from fastapi import APIRouter, HTTPException, Request, Depends
+from fastapi import APIRouter, HTTPException, Request, Depends, BackgroundTasks, Query
+from fastapi.responses import StreamingResponse
 from app.models.schemas import (
     EmailListResponse, EmailSummary, GenerateReplyRequest, 
-    GenerateReplyResponse, DeleteEmailRequest
+    GenerateReplyResponse, DeleteEmailRequest, ThreadSummary, ThreadListResponse,
+    BulkActionRequest, BulkActionResponse, DigestScheduleRequest, EmailDeltaResponse,
+    OutboxReplyResponse
 )
+from app.models.message import project_emails, LIST_FIELDS
 from app.services.gmail_service import GmailService
 from app.services.ai_service import AIService
+from app.services.thread_cache import thread_summary_cache
+from app.services.semantic_index import semantic_index
+from app.services.priority import priority_ranker
+from app.services.contacts import contact_index
+from app.services.bulk_service import bulk_service
+from app.services.outbox import reply_outbox
+from app.services.attachments import attachment_text_cache
+from app.services.digest_scheduler import digest_scheduler
+from app.services.live_inbox import live_inbox
+from app.services.inbox_delta import compute_delta, latest_history_id
 from app.core.security import verify_token
+from app.core.tracing import current_span, hash_user
+from app.core.pagination import encode_cursor, decode_cursor
+from app.core.resilience import http_status, detached
+from app.core.responses import FastJSONResponse, parse_fields, project
 from typing import Optional, List
+from datetime import datetime, timezone
+from urllib.parse import quote
+import itertools
 import logging
 
 logger = logging.getLogger(__name__)
 router = APIRouter(prefix="/api/emails", tags=["emails"])
 
+# Routes are plain def: Gmail calls block, and back off between retries with
+# time.sleep, so FastAPI runs them in its threadpool rather than on the loop.
+
 
 def get_current_user_tokens(request: Request) -> dict:
     """Extract and verify user tokens from request"""
@@ -25,19 +49,66 @@ def get_current_user_tokens(request: Request) -> dict:
     if not payload:
         raise HTTPException(status_code=401, detail="Invalid token")
     
+    current_span().set_attribute("user.hash", hash_user(payload.get("email", "")))
     return payload
 
 
+EMAIL_SUMMARY_FIELDS = tuple(EmailSummary.model_fields)
+
+
+def _email_summaries(emails: List[dict], ai: AIService) -> List[dict]:
+    """EmailSummary-shaped dicts with AI summaries from one structured request"""
+    email_summaries = []
+    for email, summary in zip(emails, ai.summarize_emails(emails)):
+        # Every value is already a validated string
+        email_summaries.append({
+            'id': email['id'],
+            'sender_name': email['sender_name'],
+            'sender_email': email['sender_email'],
+            'subject': email['subject'],
+            'summary': summary,
+            'snippet': email['snippet'],
+            'date': email['date'],
+            'priority': email.get('priority')
+        })
+    return email_summaries
+
+
 @router.get("/list", response_model=EmailListResponse)
-async def list_emails(
+def list_emails(
     request: Request,
-    max_results: int = 5,
-    query: str = ""
+    # Every listed message is summarized in one LLM request
+    max_results: int = Query(5, ge=1, le=50),
+    query: str = "",
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    sort: str = "date"
 ):
-    """List emails from inbox with AI summaries"""
+    """List emails from inbox with AI summaries; ?fields=id,subject returns only those fields.
+
+    sort=priority returns the most important of the newest inbox messages
+    instead of the newest ones; it has a single page.
+    """
     try:
         payload = get_current_user_tokens(request)
         
+        try:
+            selected = parse_fields(fields, EMAIL_SUMMARY_FIELDS)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        
+        if sort not in ("date", "priority"):
+            raise HTTPException(status_code=400, detail="sort must be 'date' or 'priority'")
+        if sort == "priority" and cursor:
+            raise HTTPException(status_code=400, detail="sort=priority has no further pages")
+        
+        page_token = None
+        if cursor:
+            try:
+                page_token = decode_cursor(cursor, query, payload["email"])
+            except ValueError as e:
+                raise HTTPException(status_code=400, detail=str(e))
+        
         # Initialize services
         gmail = GmailService(
             access_token=payload["access_token"],
@@ -45,42 +116,144 @@ async def list_emails(
         )
         ai = AIService()
         
-        # Fetch emails
-        emails = gmail.list_emails(max_results=max_results, query=query)
-        
-        # Generate AI summaries
-        email_summaries = []
-        for email in emails:
-            summary = ai.summarize_email(
-                subject=email['subject'],
-                body=email['body'],
-                sender=email['sender_name']
-            )
-            
-            email_summaries.append(EmailSummary(
-                id=email['id'],
-                sender_name=email['sender_name'],
-                sender_email=email['sender_email'],
-                subject=email['subject'],
-                summary=summary,
-                snippet=email['snippet'],
-                date=email['date']
-            ))
-        
-        return EmailListResponse(
-            emails=email_summaries,
-            total=len(email_summaries)
-        )
+        if sort == "priority":
+            # Only the top ranked messages are fetched in full and summarized
+            emails = priority_ranker.top_emails(gmail, payload["email"], max_results, query)
+            page = {'next_page_token': None, 'history_id': gmail.get_history_id()}
+        else:
+            # Fetch only the requested page
+            page = gmail.list_emails_page(max_results=max_results, query=query, page_token=page_token)
+            emails = page['emails']
+            # Anything that changed after the newest listed message shows up in /delta
+            page['history_id'] = latest_history_id(emails)
+        semantic_index.add(payload["email"], emails)
+        priority_ranker.add(payload["email"], emails)
+        contact_index.add(payload["email"], emails)
+        
+        email_summaries = _email_summaries(emails, ai)
+        
+        return FastJSONResponse({
+            'emails': project(email_summaries, selected),
+            'total': len(email_summaries),
+            'next_cursor': encode_cursor(page['next_page_token'], query, payload["email"]),
+            'history_id': page['history_id']
+        })
     
     except HTTPException:
         raise
     except Exception as e:
         logger.error(f"List emails failed: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
+        raise HTTPException(status_code=http_status(e), detail=str(e))
+
+
+@router.get("/delta", response_model=EmailDeltaResponse)
+def email_delta(
+    request: Request,
+    history_id: str,
+    max_results: int = Query(25, ge=1, le=50),
+    fields: Optional[str] = None
+):
+    """Inbox changes since the history_id of a previous /list or /delta response.
+    
+    Only added emails are fetched and summarized; removed ones are ids and
+    changed ones their new labels, so polling costs scale with the change.
+    """
+    try:
+        payload = get_current_user_tokens(request)
+        
+        try:
+            selected = parse_fields(fields, EMAIL_SUMMARY_FIELDS)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        
+        if not history_id.isdigit():
+            raise HTTPException(status_code=400, detail="Invalid history_id")
+        
+        gmail = GmailService(
+            access_token=payload["access_token"],
+            refresh_token=payload["refresh_token"]
+        )
+        
+        history = gmail.list_history(history_id)
+        if history is None or history['truncated']:
+            return FastJSONResponse({'history_id': None, 'added': [], 'removed': [], 'changed': [], 'reset': True})
+        
+        delta = compute_delta(history['history'])
+        if len(delta['added']) > max_results:
+            # Cheaper for the client to reload the first page than to merge this many
+            return FastJSONResponse({'history_id': None, 'added': [], 'removed': [], 'changed': [], 'reset': True})
+        
+        emails = [email for email in map(gmail.get_email_details, delta['added']) if email]
+        semantic_index.add(payload["email"], emails)
+        priority_ranker.add(payload["email"], emails)
+        contact_index.add(payload["email"], emails)
+        if delta['removed']:
+            semantic_index.remove(payload["email"], delta['removed'])
+            priority_ranker.remove(payload["email"], delta['removed'])
+        
+        return FastJSONResponse({
+            'history_id': history['history_id'],
+            'added': project(_email_summaries(emails, AIService()), selected),
+            'removed': delta['removed'],
+            'changed': [{'id': message_id, 'label_ids': labels} for message_id, labels in delta['changed'].items()],
+            'reset': False
+        })
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Email delta failed: {e}")
+        raise HTTPException(status_code=http_status(e), detail=str(e))
+
+
+@router.get("/threads", response_model=ThreadListResponse)
+def list_threads(
+    request: Request,
+    max_results: int = Query(5, ge=1, le=50),
+    query: str = "",
+    cursor: Optional[str] = None
+):
+    """List inbox conversations with one AI summary per thread"""
+    try:
+        payload = get_current_user_tokens(request)
+        
+        page_token = None
+        if cursor:
+            try:
+                page_token = decode_cursor(cursor, query, payload["email"])
+            except ValueError as e:
+                raise HTTPException(status_code=400, detail=str(e))
+        
+        gmail = GmailService(
+            access_token=payload["access_token"],
+            refresh_token=payload["refresh_token"]
+        )
+        ai = AIService()
+        
+        page = gmail.list_threads_page(max_results=max_results, query=query, page_token=page_token)
+        
+        # Unchanged threads come straight from the cache
+        thread_summaries = []
+        for thread_ref in page['threads']:
+            entry = thread_summary_cache.summarize(payload["email"], thread_ref, gmail, ai)
+            if entry:
+                thread_summaries.append(ThreadSummary(**entry))
+        
+        return ThreadListResponse(
+            threads=thread_summaries,
+            total=len(thread_summaries),
+            next_cursor=encode_cursor(page['next_page_token'], query, payload["email"])
+        )
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"List threads failed: {e}")
+        raise HTTPException(status_code=http_status(e), detail=str(e))
 
 
 @router.get("/{email_id}")
-async def get_email(email_id: str, request: Request):
+def get_email(email_id: str, request: Request):
     """Get detailed email information"""
     try:
         payload = get_current_user_tokens(request)
@@ -101,11 +274,11 @@ async def get_email(email_id: str, request: Request):
         raise
     except Exception as e:
         logger.error(f"Get email failed: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
+        raise HTTPException(status_code=http_status(e), detail=str(e))
 
 
 @router.post("/generate-reply", response_model=GenerateReplyResponse)
-async def generate_reply(
+def generate_reply(
     request: Request,
     body: GenerateReplyRequest
 ):
@@ -123,13 +296,16 @@ async def generate_reply(
         email = gmail.get_email_details(body.email_id)
         if not email:
             raise HTTPException(status_code=404, detail="Email not found")
+        # Keeps its threading headers at hand for send-reply
+        semantic_index.add(payload["email"], [email])
         
         # Generate reply
         reply = ai.generate_reply(
             subject=email['subject'],
             body=email['body'],
             sender=email['sender_name'],
-            context=body.context
+            context=body.context,
+            sender_history=contact_index.describe(payload["email"], email['sender_email'])
         )
         
         return GenerateReplyResponse(
@@ -141,51 +317,57 @@ async def generate_reply(
         raise
     except Exception as e:
         logger.error(f"Generate reply failed: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
+        raise HTTPException(status_code=http_status(e), detail=str(e))
 
 
-@router.post("/send-reply")
-async def send_reply(
+@router.post("/send-reply", response_model=OutboxReplyResponse, status_code=202)
+def send_reply(
     request: Request,
     email_id: str,
     reply_content: str
 ):
-    """Send email reply"""
+    """Queue an email reply; it is sent in the background, poll /outbox/{outbox_id} for delivery"""
     try:
         payload = get_current_user_tokens(request)
         
-        gmail = GmailService(
-            access_token=payload["access_token"],
-            refresh_token=payload["refresh_token"]
-        )
-        
-        # Get original email
-        email = gmail.get_email_details(email_id)
-        if not email:
-            raise HTTPException(status_code=404, detail="Email not found")
+        # Threading headers from the listing or search that showed the email; without
+        # them the outbox worker looks them up, so the request never waits on Gmail
+        original = semantic_index.get(payload["email"], email_id)
         
-        # Send reply
-        success = gmail.send_reply(
-            to_email=email['sender_email'],
-            subject=email['subject'],
-            body=reply_content,
-            thread_id=email.get('thread_id')
+        item = reply_outbox.enqueue(
+            payload["email"], payload["access_token"], payload["refresh_token"],
+            email_id, reply_content, original
         )
-        
-        if success:
-            return {"message": "Reply sent successfully", "email_id": email_id}
-        else:
-            raise HTTPException(status_code=500, detail="Failed to send reply")
+        return OutboxReplyResponse(**item)
     
     except HTTPException:
         raise
     except Exception as e:
         logger.error(f"Send reply failed: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
+        raise HTTPException(status_code=http_status(e), detail=str(e))
+
+
+@router.get("/outbox/{outbox_id}", response_model=OutboxReplyResponse)
+def reply_status(outbox_id: str, request: Request):
+    """Get delivery status of a queued reply"""
+    try:
+        payload = get_current_user_tokens(request)
+        
+        item = reply_outbox.get(payload["email"], outbox_id)
+        if not item:
+            raise HTTPException(status_code=404, detail="Reply not found")
+        
+        return OutboxReplyResponse(**item)
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Reply status failed: {e}")
+        raise HTTPException(status_code=http_status(e), detail=str(e))
 
 
 @router.delete("/{email_id}")
-async def delete_email(
+def delete_email(
     email_id: str,
     request: Request
 ):
@@ -201,6 +383,7 @@ async def delete_email(
         success = gmail.delete_email(email_id)
         
         if success:
+            semantic_index.remove(payload["email"], [email_id])
             return {"message": "Email deleted successfully", "email_id": email_id}
         else:
             raise HTTPException(status_code=500, detail="Failed to delete email")
@@ -209,19 +392,99 @@ async def delete_email(
         raise
     except Exception as e:
         logger.error(f"Delete email failed: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
+        raise HTTPException(status_code=http_status(e), detail=str(e))
+
+
+@router.post("/bulk", response_model=BulkActionResponse)
+def bulk_action(
+    request: Request,
+    body: BulkActionRequest,
+    background_tasks: BackgroundTasks
+):
+    """Trash, archive, mark read or (un)label many emails at once.
+
+    A query selection always runs as a background job whose total is filled
+    in once the matching messages are listed.
+    """
+    try:
+        payload = get_current_user_tokens(request)
+        
+        try:
+            bulk_service.label_changes(body.action, body.label_id)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        
+        if body.email_ids is None and not body.query:
+            raise HTTPException(status_code=400, detail="Either email_ids or query is required")
+        
+        gmail = GmailService(
+            access_token=payload["access_token"],
+            refresh_token=payload["refresh_token"]
+        )
+        
+        if body.email_ids is None:
+            # Listing a broad query pages through Gmail; it happens in the job, not the request
+            job = bulk_service.create_job(payload["email"], body.action, 0)
+            background_tasks.add_task(detached(bulk_service.run_query_job), job, gmail, body.query,
+                                      body.max_messages, body.label_id)
+            return BulkActionResponse(**job)
+        
+        message_ids = body.email_ids
+        job = bulk_service.create_job(payload["email"], body.action, len(message_ids))
+        
+        if len(message_ids) <= gmail.BATCH_SIZE:
+            # Fits in a single batchModify call
+            bulk_service.run_job(job, gmail, message_ids, body.label_id)
+            if job["status"] == "failed":
+                raise HTTPException(status_code=500, detail=job["error"])
+        else:
+            # Large selections run in the background; poll /bulk/{job_id} for progress
+            background_tasks.add_task(detached(bulk_service.run_job), job, gmail, message_ids, body.label_id)
+        
+        return BulkActionResponse(**job)
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Bulk action failed: {e}")
+        raise HTTPException(status_code=http_status(e), detail=str(e))
+
+
+@router.get("/bulk/{job_id}", response_model=BulkActionResponse)
+def bulk_action_status(job_id: str, request: Request):
+    """Get progress of a bulk action"""
+    try:
+        payload = get_current_user_tokens(request)
+        
+        job = bulk_service.get_job(payload["email"], job_id)
+        if not job:
+            raise HTTPException(status_code=404, detail="Job not found")
+        
+        return BulkActionResponse(**job)
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Bulk action status failed: {e}")
+        raise HTTPException(status_code=http_status(e), detail=str(e))
 
 
 @router.get("/search/{query}")
-async def search_emails(
+def search_emails(
     query: str,
     request: Request,
-    max_results: int = 10
+    max_results: int = 10,
+    fields: Optional[str] = None
 ):
-    """Search emails with natural language query"""
+    """Search emails with natural language query; ?fields= selects fields (body included on request)"""
     try:
         payload = get_current_user_tokens(request)
         
+        try:
+            selected = parse_fields(fields, LIST_FIELDS + ('body',)) or LIST_FIELDS
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        
         gmail = GmailService(
             access_token=payload["access_token"],
             refresh_token=payload["refresh_token"]
@@ -229,17 +492,18 @@ async def search_emails(
         
         emails = gmail.search_emails(query=query, max_results=max_results)
         
-        return {"emails": emails, "total": len(emails), "query": query}
+        # Bodies only when asked for, otherwise through /{email_id}
+        return FastJSONResponse({"emails": project_emails(emails, selected), "total": len(emails), "query": query})
     
     except HTTPException:
         raise
     except Exception as e:
         logger.error(f"Search emails failed: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
+        raise HTTPException(status_code=http_status(e), detail=str(e))
 
 
 @router.post("/categorize")
-async def categorize_emails(request: Request):
+def categorize_emails(request: Request):
     """Categorize recent emails using AI"""
     try:
         payload = get_current_user_tokens(request)
@@ -252,9 +516,16 @@ async def categorize_emails(request: Request):
         
         emails = gmail.list_emails(max_results=10)
         
+        categories = ai.categorize_emails(emails, payload["email"])
+        priority_ranker.add(payload["email"], emails)
+        contact_index.add(payload["email"], emails)
+        categorized_ids = {email['id']: category for email, category in zip(emails, categories)}
+        priority_ranker.set_categories(payload["email"], categorized_ids)
+        contact_index.set_categories(payload["email"], categorized_ids)
+        
         categorized = {}
-        for email in emails:
-            category = ai.categorize_email(email['subject'], email['body'])
+        for email, category in zip(emails, categories):
+            live_inbox.publish(payload["email"], {"type": "category.completed", "id": email['id'], "category": category})
             if category not in categorized:
                 categorized[category] = []
             categorized[category].append({
@@ -269,12 +540,100 @@ async def categorize_emails(request: Request):
         raise
     except Exception as e:
         logger.error(f"Categorize emails failed: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
+        raise HTTPException(status_code=http_status(e), detail=str(e))
 
 
 @router.get("/digest/daily")
-async def daily_digest(request: Request):
-    """Generate daily email digest"""
+def daily_digest(request: Request):
+    """Return today's digest, precomputed before the user's local morning when possible"""
+    try:
+        payload = get_current_user_tokens(request)
+        user_key = payload["email"]
+        
+        # Keeps the user scheduled and their tokens current
+        digest_scheduler.register(user_key, payload["access_token"], payload["refresh_token"])
+        
+        entry = digest_scheduler.fresh_digest(user_key)
+        precomputed = entry is not None
+        if not precomputed:
+            entry = digest_scheduler.compute(user_key)
+        
+        return {
+            "digest": entry["digest"],
+            "email_count": entry["email_count"],
+            "timestamp": entry["generated_at"],
+            "precomputed": precomputed
+        }
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Daily digest failed: {e}")
+        raise HTTPException(status_code=http_status(e), detail=str(e))
+
+
+@router.put("/digest/schedule")
+def update_digest_schedule(request: Request, body: DigestScheduleRequest):
+    """Set the time zone and local hour the daily digest should be ready by"""
+    try:
+        payload = get_current_user_tokens(request)
+        
+        schedule = digest_scheduler.register(
+            payload["email"], payload["access_token"], payload["refresh_token"],
+            tz=body.timezone, hour=body.hour
+        )
+        
+        return {**schedule, "next_run": digest_scheduler.next_run(payload["email"], datetime.now(timezone.utc)).isoformat()}
+    
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Update digest schedule failed: {e}")
+        raise HTTPException(status_code=http_status(e), detail=str(e))
+
+
+# Defined last so fixed routes like /search/{query} and /bulk/{job_id} win
+@router.get("/{email_id}/attachments/{attachment_id}")
+def download_attachment(
+    email_id: str,
+    attachment_id: str,
+    request: Request,
+    filename: str = "attachment",
+    mime_type: str = "application/octet-stream"
+):
+    """Stream an attachment from Gmail to the client chunk by chunk"""
+    try:
+        payload = get_current_user_tokens(request)
+        
+        gmail = GmailService(
+            access_token=payload["access_token"],
+            refresh_token=payload["refresh_token"]
+        )
+        
+        chunks = gmail.stream_attachment(email_id, attachment_id)
+        # Pull the first chunk now so a missing attachment is still a 404
+        first = next(chunks, b"")
+        
+        return StreamingResponse(
+            itertools.chain([first], chunks),
+            media_type=mime_type,
+            headers={"Content-Disposition": f"attachment; filename*=UTF-8''{quote(filename)}"}
+        )
+    
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Attachment not found")
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Download attachment failed: {e}")
+        raise HTTPException(status_code=http_status(e), detail=str(e))
+
+
+@router.get("/{email_id}/summary")
+def summarize_email(email_id: str, request: Request):
+    """Summarize one email including the text of its small text/PDF attachments"""
     try:
         payload = get_current_user_tokens(request)
         
@@ -284,17 +643,29 @@ async def daily_digest(request: Request):
         )
         ai = AIService()
         
-        emails = gmail.list_emails(max_results=20)
-        digest = ai.generate_daily_digest(emails)
+        email = gmail.get_email_details(email_id)
+        if not email:
+            raise HTTPException(status_code=404, detail="Email not found")
         
-        return {
-            "digest": digest,
-            "email_count": len(emails),
-            "timestamp": "today"
-        }
+        extracted = []
+        attachments = []
+        for attachment in email['attachments'][:5]:
+            text = attachment_text_cache.get_text(payload["email"], gmail, email_id, attachment)
+            if text:
+                extracted.append(f"[{attachment['filename']}]\n{text}")
+            attachments.append({"filename": attachment['filename'], "text_extracted": bool(text)})
+        
+        summary = ai.summarize_email(
+            subject=email['subject'],
+            body=email['body'],
+            sender=email['sender_name'],
+            attachments_text="\n\n".join(extracted) or None
+        )
+        
+        return {"email_id": email_id, "summary": summary, "attachments": attachments}
     
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Daily digest failed: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
+        logger.error(f"Summarize email failed: {e}")
+        raise HTTPException(status_code=http_status(e), detail=str(e))
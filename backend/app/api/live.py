@@ -0,0 +1,58 @@
+from typing import Optional
+from fastapi import APIRouter, Request, WebSocket, status
+from app.api.emails import get_current_user_tokens
+from app.core.config import settings
+from app.core.security import encrypt_secret, decrypt_secret
+from app.core.state import state
+from app.core.tracing import hash_user
+from app.services.live_inbox import live_inbox
+import json
+import secrets
+import logging
+
+logger = logging.getLogger(__name__)
+router = APIRouter(prefix="/api", tags=["live"])
+
+
+@router.post("/live/ticket")
+async def live_ticket(request: Request):
+    """Short-lived, single-use ticket for opening /api/live.
+
+    Browsers cannot set headers on a WebSocket, and the session JWT carries
+    the Google tokens, so it must not appear in a URL where proxies, access
+    logs and browser history would keep it. The ticket goes there instead.
+    """
+    payload = get_current_user_tokens(request)
+    ticket = secrets.token_urlsafe(32)
+    session = {key: payload[key] for key in ("email", "access_token", "refresh_token")}
+    state.set(f"live:ticket:{ticket}", encrypt_secret(json.dumps(session)), ttl=settings.LIVE_TICKET_SECONDS)
+    return {"ticket": ticket, "expires_in": settings.LIVE_TICKET_SECONDS}
+
+
+def redeem_ticket(ticket: str) -> Optional[dict]:
+    """Session of a ticket, or None when it is unknown, expired or already used"""
+    key = f"live:ticket:{ticket}"
+    stored = state.get(key)
+    # Only the first connection to claim the ticket gets it
+    if stored is None or not state.add(f"{key}:used", "1", ttl=settings.LIVE_TICKET_SECONDS):
+        return None
+    state.delete(key)
+    session = decrypt_secret(stored)
+    return json.loads(session) if session else None
+
+
+@router.websocket("/live")
+async def live_events(websocket: WebSocket, ticket: str = ""):
+    """Per-user event stream: message.added/removed/changed, summary.completed,
+    category.completed, job.progress, resync and ping, one JSON object per message.
+
+    Opened with ?ticket= from POST /api/live/ticket.
+    """
+    payload = redeem_ticket(ticket) if ticket else None
+    if not payload:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+
+    await websocket.accept()
+    logger.info(f"Live inbox connected for {hash_user(payload['email'])}")
+    await live_inbox.serve(websocket, payload["email"], payload["access_token"], payload["refresh_token"])
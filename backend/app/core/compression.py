@@ -0,0 +1,167 @@
+from typing import Optional, Sequence, Tuple
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from app.core.metrics import HTTP_RESPONSE_BYTES
+import zlib
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - brotli is in requirements.txt; gzip only without it
+    brotli = None
+
+# Server preference when the client accepts several encodings with the same q-value
+SUPPORTED_ENCODINGS = ("br", "gzip") if brotli is not None else ("gzip",)
+
+# Event streams are flushed per event by the client; attachments are mostly compressed already
+COMPRESSIBLE_TYPES = ("application/json", "text/plain", "text/html", "text/csv")
+
+
+def negotiate_encoding(accept_encoding: str, supported: Sequence[str] = SUPPORTED_ENCODINGS) -> Optional[str]:
+    """Pick the best supported encoding from an Accept-Encoding header, None for identity"""
+    weights = {}
+    for item in accept_encoding.split(","):
+        name, _, params = item.strip().partition(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        weights[name] = q
+
+    best, best_q = None, 0.0
+    for encoding in supported:
+        q = weights.get(encoding, weights.get("*", 0.0))
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+class _Compressor:
+    """Incremental gzip or brotli stream"""
+
+    def __init__(self, encoding: str, gzip_level: int, brotli_quality: int):
+        self.encoding = encoding
+        if encoding == "br":
+            self._brotli = brotli.Compressor(quality=brotli_quality)
+        else:
+            # wbits=31 writes the gzip header and trailer
+            self._zlib = zlib.compressobj(gzip_level, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes, flush: bool = False) -> bytes:
+        """Compressed bytes of a chunk; flush=True makes everything so far decodable"""
+        if self.encoding == "br":
+            return self._brotli.process(data) + (self._brotli.flush() if flush else b"")
+        return self._zlib.compress(data) + (self._zlib.flush(zlib.Z_SYNC_FLUSH) if flush else b"")
+
+    def finish(self) -> bytes:
+        if self.encoding == "br":
+            return self._brotli.finish()
+        return self._zlib.flush()
+
+
+class CompressionMiddleware:
+    """Compress JSON and text responses with the encoding the client prefers.
+
+    Bodies smaller than minimum_size are sent as is: below roughly a packet
+    the CPU cost outweighs the saved bytes. Streamed responses are flushed
+    per chunk so the client can decode them as they arrive.
+    """
+
+    def __init__(self, app: ASGIApp, minimum_size: int = 1024, gzip_level: int = 6,
+                 brotli_quality: int = 4):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        encoding = negotiate_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        await self.app(scope, receive, _CompressingSend(self, encoding, send))
+
+
+class _CompressingSend:
+    """The send callable of one response: holds back the start message until the body is known"""
+
+    def __init__(self, middleware: CompressionMiddleware, encoding: str, send: Send):
+        self.middleware = middleware
+        self.encoding = encoding
+        self.send = send
+        self.start: Optional[Message] = None
+        self.compressor: Optional[_Compressor] = None
+        self.passthrough = False
+
+    def _compressible(self) -> bool:
+        headers = Headers(raw=self.start["headers"])
+        content_type = headers.get("content-type", "").split(";")[0].strip().lower()
+        return "content-encoding" not in headers and content_type in COMPRESSIBLE_TYPES
+
+    def _encode_headers(self, length: Optional[int]) -> None:
+        headers = MutableHeaders(raw=self.start["headers"])
+        headers["Content-Encoding"] = self.encoding
+        headers.add_vary_header("Accept-Encoding")
+        if length is None:
+            del headers["Content-Length"]
+        else:
+            headers["Content-Length"] = str(length)
+
+    def _compressor(self) -> _Compressor:
+        return _Compressor(self.encoding, self.middleware.gzip_level, self.middleware.brotli_quality)
+
+    async def __call__(self, message: Message) -> None:
+        if message["type"] == "http.response.start":
+            self.start = message
+            return
+        if message["type"] != "http.response.body" or self.passthrough:
+            await self.send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+
+        if self.compressor is None:
+            if self.start is None:
+                await self.send(message)
+                return
+            start = self.start
+            if not self._compressible() or (not more_body and len(body) < self.middleware.minimum_size):
+                self.passthrough = True
+                await self.send(start)
+                await self.send(message)
+                return
+
+            self.compressor = self._compressor()
+            if not more_body:
+                # Whole body at once: compress it in one go and send the exact length
+                data = self.compressor.compress(body) + self.compressor.finish()
+                self._encode_headers(len(data))
+                self._record(len(body), len(data))
+                await self.send(start)
+                await self.send({"type": "http.response.body", "body": data})
+                return
+
+            self._encode_headers(None)
+            await self.send(start)
+
+        if more_body:
+            data = self.compressor.compress(body, flush=True)
+        else:
+            data = self.compressor.compress(body) + self.compressor.finish()
+        self._record(len(body), len(data))
+        await self.send({"type": "http.response.body", "body": data, "more_body": more_body})
+
+    def _record(self, original: int, sent: int) -> None:
+        HTTP_RESPONSE_BYTES.inc(original, encoding=self.encoding, stage="original")
+        HTTP_RESPONSE_BYTES.inc(sent, encoding=self.encoding, stage="sent")
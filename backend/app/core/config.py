@@ -22,6 +22,117 @@ class Settings(BaseSettings):
     AI_PROVIDER: str = "anthropic"  # anthropic or openai
     ANTHROPIC_API_KEY: Optional[str] = None
     OPENAI_API_KEY: Optional[str] = None
+    AI_FALLBACK_PROVIDER: Optional[str] = None  # used for hedging and failover when its key is set
+    # Per-operation targets, e.g. "categorize=openai:gpt-4o-mini|anthropic;default=anthropic"
+    AI_OPERATION_ROUTES: str = ""
+    AI_HEDGE_ENABLED: bool = True
+    AI_HEDGE_MIN_DELAY_MS: int = 250
+    AI_HEDGE_DEFAULT_DELAY_MS: int = 4000  # until enough latency samples exist for a p95
+    AI_FAILURE_THRESHOLD: int = 3
+    AI_UNHEALTHY_COOLDOWN_SECONDS: float = 30.0
+    AI_REQUEST_TIMEOUT_SECONDS: float = 60.0
+    AI_MAX_RETRIES: int = 2
+    
+    # Model tiers
+    ANTHROPIC_SMALL_MODEL: str = "claude-3-5-haiku-20241022"
+    ANTHROPIC_LARGE_MODEL: str = "claude-sonnet-4-20250514"
+    OPENAI_SMALL_MODEL: str = "gpt-4o-mini"
+    OPENAI_LARGE_MODEL: str = "gpt-4-turbo-preview"
+    AI_OPERATION_TIERS: str = ""  # e.g. "summarize=large;categorize=small" (small, large or auto)
+    AI_TIER_MAX_FAILURE_RATE: float = 0.1  # auto tier escalates to large above this
+    AI_TIER_PROBE_RATE: float = 0.05  # share of escalated calls still sent to the small tier
+    
+    # Attachments
+    ATTACHMENT_CHUNK_SIZE: int = 64 * 1024
+    ATTACHMENT_TIMEOUT_SECONDS: float = 60.0
+    ATTACHMENT_TEXT_MAX_BYTES: int = 5 * 1024 * 1024  # larger attachments are never extracted
+    ATTACHMENT_TEXT_MAX_CHARS: int = 20000
+    
+    # Daily digest precomputation
+    DIGEST_SCHEDULER_ENABLED: bool = True
+    DIGEST_DEFAULT_TIMEZONE: str = "UTC"
+    DIGEST_DEFAULT_HOUR: int = 8  # local hour the digest should be ready by
+    DIGEST_LEAD_MINUTES: int = 30
+    DIGEST_STAGGER_SECONDS: int = 1200  # users are spread over this window before the lead time
+    DIGEST_CONCURRENCY: int = 2
+    DIGEST_SCHEDULER_INTERVAL_SECONDS: float = 60.0
+    DIGEST_RETRY_SECONDS: float = 900.0
+    
+    # Shared state (caches, sessions, jobs, rate limits) for multi-worker deployments
+    STATE_BACKEND: str = "memory"  # memory (single process), sqlite (one host) or redis
+    STATE_SQLITE_PATH: str = "state.db"
+    REDIS_URL: str = "redis://localhost:6379/0"
+    CHAT_RATE_LIMIT_PER_MINUTE: int = 0  # 0 disables the limit
+    
+    # Server (serve.py)
+    HOST: str = "0.0.0.0"
+    PORT: int = 8000
+    WEB_CONCURRENCY: Optional[int] = None  # worker processes; defaults to the number of cores
+    FORWARDED_ALLOW_IPS: str = "127.0.0.1"  # proxies whose X-Forwarded-For is trusted, comma-separated
+    WARMUP_ENABLED: bool = True  # import SDKs and build clients before serving the first request
+    COMPRESSION_MINIMUM_SIZE: int = 1024  # smaller responses are sent uncompressed
+    COMPRESSION_GZIP_LEVEL: int = 6
+    COMPRESSION_BROTLI_QUALITY: int = 4  # 0-11; higher levels cost far more CPU per response
+    
+    # Live inbox WebSocket
+    LIVE_POLL_SECONDS: float = 30.0  # Gmail history check per connected user
+    LIVE_QUEUE_SIZE: int = 100  # events buffered per connection before it is told to resync
+    LIVE_HEARTBEAT_SECONDS: float = 25.0
+    LIVE_SEND_TIMEOUT_SECONDS: float = 10.0  # a client that accepts nothing this long is dropped
+    LIVE_MAX_ADDED: int = 25  # more new messages than this in one check send a resync instead
+    LIVE_TICKET_SECONDS: int = 30  # lifetime of the single-use ticket that opens a live connection
+    LIVE_RELAY_SECONDS: float = 0.2  # how often events published by other worker processes are picked up
+    
+    # Priority inbox (sort=priority)
+    PRIORITY_CANDIDATES: int = 50  # newest inbox messages ranked per request
+    PRIORITY_RECENCY_HALF_LIFE_HOURS: float = 24.0
+    PRIORITY_WEIGHTS: str = ""  # e.g. "urgency=3;sender_frequency=0.5" (defaults for the rest)
+    
+    # Contact index: senders whose mail is always one of these categories skip the LLM
+    CONTACT_CATEGORY_SHORTCUTS: str = "Promotions,Social"
+    CONTACT_CATEGORY_MIN_MESSAGES: int = 3  # categorized messages needed before trusting the sender
+    CONTACT_CATEGORY_SHARE: float = 0.9
+    
+    # Reply outbox: replies are acknowledged at once and sent by a background worker
+    OUTBOX_WORKER_ENABLED: bool = True  # every worker process may run one; they share the queue
+    OUTBOX_POLL_SECONDS: float = 2.0  # replies accepted by this process wake the worker at once
+    OUTBOX_CONCURRENCY: int = 4
+    OUTBOX_BATCH_SIZE: int = 50  # queued replies taken per tick
+    OUTBOX_MAX_ATTEMPTS: int = 5
+    OUTBOX_RETRY_BASE_SECONDS: float = 5.0
+    OUTBOX_RETRY_MAX_SECONDS: float = 300.0
+    OUTBOX_LEASE_SECONDS: float = 600.0  # a reply taken by a worker that stops is requeued after this long
+    
+    # Outgoing HTTP to Google APIs and OAuth: one keep-alive pool per process
+    GOOGLE_HTTP_MAX_CONNECTIONS: int = 50
+    GOOGLE_HTTP_MAX_KEEPALIVE: int = 20  # idle connections kept open for reuse
+    GOOGLE_HTTP_KEEPALIVE_SECONDS: float = 60.0
+    GOOGLE_HTTP_TIMEOUT_SECONDS: float = 30.0
+    GOOGLE_HTTP_CONNECT_TIMEOUT_SECONDS: float = 5.0
+    GOOGLE_HTTP2: bool = True  # used when the h2 package is installed
+    GOOGLE_HTTP_CA_BUNDLE: Optional[str] = None  # extra CA file, e.g. for a TLS-intercepting proxy
+    
+    # Resilience: request deadlines, retries of idempotent calls and circuit breakers
+    REQUEST_DEADLINE_SECONDS: float = 60.0  # budget for all dependency calls of one API request; 0 disables
+    REQUEST_DEADLINES: str = "/api/emails/list=20;/api/emails/delta=10;/api/emails/search=20"  # per path prefix
+    RETRY_BASE_DELAY_MS: int = 100
+    RETRY_MAX_DELAY_MS: int = 1000  # backoff is drawn uniformly from 0 up to this cap
+    GMAIL_MAX_RETRIES: int = 2  # reads, label changes and trash; sends are never retried
+    GMAIL_CIRCUIT_FAILURE_THRESHOLD: int = 5  # consecutive 5xx/timeouts before failing fast
+    GMAIL_CIRCUIT_RECOVERY_SECONDS: float = 30.0
+    
+    # Endpoint overrides (local fakes for benchmarks, proxies)
+    GMAIL_API_ENDPOINT: Optional[str] = None
+    ANTHROPIC_BASE_URL: Optional[str] = None
+    OPENAI_BASE_URL: Optional[str] = None
+    
+    # Observability
+    METRICS_TOKEN: Optional[str] = None  # Bearer token required on /metrics when set
+    TRACING_EXPORTER: str = "none"  # none, file or otlp
+    TRACING_FILE: str = "traces.jsonl"
+    OTLP_ENDPOINT: str = "http://localhost:4318/v1/traces"
+    TRACING_SAMPLE_RATIO: float = 1.0
+    TRACING_SERVICE_NAME: str = "gmail-ai-assistant-backend"
     
     class Config:
         env_file = ".env"
@@ -0,0 +1,207 @@
+from contextlib import contextmanager
+from functools import lru_cache
+from http.cookiejar import CookieJar, DefaultCookiePolicy
+from typing import Any, Dict, Iterator, Optional, Tuple
+from urllib.parse import urlsplit
+import importlib.util
+import threading
+import logging
+
+import httpx
+from app.core.config import settings
+from app.core.metrics import HTTP_POOL_REQUESTS
+from app.core.resilience import remaining_seconds
+
+logger = logging.getLogger(__name__)
+
+
+class _ReuseTrace:
+    """httpcore trace hook: a request that opens no TCP connection ran on a pooled one"""
+
+    def __init__(self):
+        self.connected = False
+
+    def __call__(self, event_name: str, info: Dict[str, Any]) -> None:
+        if event_name == "connection.connect_tcp.started":
+            self.connected = True
+
+
+class PooledTransport:
+    """One keep-alive connection pool per process for outgoing HTTP.
+
+    The httpx client is built on first use from settings, so it picks up
+    overrides made before the first request; close() drops it and the next
+    request builds a fresh one. HTTP/2 is used when the h2 package is
+    installed, which multiplexes concurrent requests over one connection.
+    Cookies are never stored: the client is shared by every user.
+    """
+
+    def __init__(self):
+        self._client: Optional[httpx.Client] = None
+        self._lock = threading.Lock()
+
+    @property
+    def http2(self) -> bool:
+        return settings.GOOGLE_HTTP2 and importlib.util.find_spec("h2") is not None
+
+    @property
+    def client(self) -> httpx.Client:
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = httpx.Client(
+                        http2=self.http2,
+                        verify=settings.GOOGLE_HTTP_CA_BUNDLE or True,
+                        limits=httpx.Limits(
+                            max_connections=settings.GOOGLE_HTTP_MAX_CONNECTIONS,
+                            max_keepalive_connections=settings.GOOGLE_HTTP_MAX_KEEPALIVE,
+                            keepalive_expiry=settings.GOOGLE_HTTP_KEEPALIVE_SECONDS
+                        ),
+                        timeout=httpx.Timeout(
+                            settings.GOOGLE_HTTP_TIMEOUT_SECONDS,
+                            connect=settings.GOOGLE_HTTP_CONNECT_TIMEOUT_SECONDS
+                        ),
+                        cookies=CookieJar(policy=DefaultCookiePolicy(allowed_domains=[]))
+                    )
+        return self._client
+
+    def _record(self, url: str, trace: _ReuseTrace) -> None:
+        HTTP_POOL_REQUESTS.inc(host=urlsplit(url).hostname or "", connection="new" if trace.connected else "reused")
+
+    def request(self, method: str, url: str, content: Optional[bytes] = None,
+                headers: Optional[Dict[str, str]] = None, timeout: Optional[float] = None) -> httpx.Response:
+        trace = _ReuseTrace()
+        remaining = remaining_seconds()
+        if timeout is None and remaining is not None:
+            # Never wait past the request's deadline
+            timeout = max(0.001, min(settings.GOOGLE_HTTP_TIMEOUT_SECONDS, remaining))
+        kwargs = {"timeout": timeout} if timeout is not None else {}
+        response = self.client.request(method, url, content=content, headers=headers,
+                                       extensions={"trace": trace}, **kwargs)
+        self._record(url, trace)
+        return response
+
+    @contextmanager
+    def stream(self, method: str, url: str, params: Optional[Dict[str, str]] = None,
+               headers: Optional[Dict[str, str]] = None, timeout: Optional[float] = None) -> Iterator[httpx.Response]:
+        trace = _ReuseTrace()
+        kwargs = {"timeout": timeout} if timeout is not None else {}
+        with self.client.stream(method, url, params=params, headers=headers,
+                                extensions={"trace": trace}, **kwargs) as response:
+            self._record(url, trace)
+            yield response
+
+    def close(self) -> None:
+        with self._lock:
+            client, self._client = self._client, None
+        if client is not None:
+            client.close()
+
+
+class HttplibAdapter:
+    """httplib2.Http stand-in for googleapiclient and google_auth_httplib2"""
+
+    # Read by googleapiclient and AuthorizedHttp; redirects are not followed
+    timeout = None
+    follow_redirects = False
+    redirect_codes = frozenset()
+
+    def __init__(self, transport: PooledTransport):
+        self.transport = transport
+
+    def request(self, uri: str, method: str = "GET", body=None, headers: Optional[Dict[str, str]] = None,
+                redirections: int = 0, connection_type=None) -> Tuple[Any, bytes]:
+        import httplib2
+
+        if isinstance(body, str):
+            body = body.encode("utf-8")
+        try:
+            response = self.transport.request(method, uri, content=body, headers=headers)
+        except httpx.TimeoutException as e:
+            # The exception types googleapiclient retries on
+            raise TimeoutError(str(e)) from e
+        except httpx.TransportError as e:
+            raise ConnectionError(str(e)) from e
+
+        # The body is already decoded, so its encoding no longer applies
+        info = {k: v for k, v in response.headers.items() if k not in ("content-encoding", "content-length")}
+        info["status"] = str(response.status_code)
+        resp = httplib2.Response(info)
+        resp.reason = response.reason_phrase
+        return resp, response.content
+
+    def close(self) -> None:
+        # The pool outlives every client built on it
+        pass
+
+
+@lru_cache(maxsize=None)
+def _requests_adapter_class():
+    # Deferred with requests itself, which only the OAuth code paths need
+    import requests
+    from requests.adapters import BaseAdapter
+    from requests.structures import CaseInsensitiveDict
+    from requests.utils import get_encoding_from_headers
+
+    class RequestsAdapter(BaseAdapter):
+        """requests adapter sending through the shared pool (google.auth, requests-oauthlib)"""
+
+        def __init__(self, transport: PooledTransport):
+            super().__init__()
+            self.transport = transport
+
+        def send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None):
+            if isinstance(timeout, tuple):
+                timeout = max(t for t in timeout if t is not None) if any(timeout) else None
+            body = request.body.encode("utf-8") if isinstance(request.body, str) else request.body
+            try:
+                upstream = self.transport.request(request.method, request.url, content=body,
+                                                  headers=dict(request.headers), timeout=timeout)
+            except httpx.TimeoutException as e:
+                raise requests.exceptions.Timeout(str(e), request=request) from e
+            except httpx.TransportError as e:
+                raise requests.exceptions.ConnectionError(str(e), request=request) from e
+
+            response = requests.Response()
+            response.status_code = upstream.status_code
+            response.reason = upstream.reason_phrase
+            response.headers = CaseInsensitiveDict(
+                (k, v) for k, v in upstream.headers.items() if k not in ("content-encoding", "content-length")
+            )
+            response.encoding = get_encoding_from_headers(response.headers)
+            response._content = upstream.content
+            response.url = request.url
+            response.request = request
+            response.connection = self
+            return response
+
+        def close(self) -> None:
+            pass
+
+    return RequestsAdapter
+
+
+def mount_pool(session, transport: Optional[PooledTransport] = None):
+    """Route a requests.Session (e.g. requests-oauthlib's) through the shared pool"""
+    adapter = _requests_adapter_class()(transport or google_http)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def requests_session(transport: Optional[PooledTransport] = None):
+    """requests.Session whose connections come from the shared pool"""
+    import requests
+
+    return mount_pool(requests.Session(), transport)
+
+
+def auth_request(transport: Optional[PooledTransport] = None):
+    """google.auth transport for credential refresh and revocation over the shared pool"""
+    from google.auth.transport.requests import Request
+
+    return Request(session=requests_session(transport))
+
+
+# Google API and OAuth traffic
+google_http = PooledTransport()
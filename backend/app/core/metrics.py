@@ -0,0 +1,266 @@
+from typing import Dict, Tuple, List, Optional, Sequence
+from contextlib import contextmanager
+import bisect
+import threading
+import time
+
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape(value: str) -> str:
+    """Escape a label value for the exposition format"""
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labelnames: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    """Render a Prometheus label set"""
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric:
+    """Base class for metrics keyed by label values"""
+
+    type_name = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        registry.register(self)
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+        lines.extend(self.samples())
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    """Monotonically increasing counter"""
+
+    type_name = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self._values: Dict[Tuple[str, ...], float] = {}
+        super().__init__(name, documentation, labelnames)
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {value}" for key, value in items]
+
+
+class Gauge(Counter):
+    """Value that can go up and down, e.g. in-flight requests"""
+
+    type_name = "gauge"
+
+    def dec(self, amount: float = 1, **labels) -> None:
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels) -> None:
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    @contextmanager
+    def track_inprogress(self, **labels):
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+
+class Histogram(_Metric):
+    """Cumulative latency histogram with fixed buckets"""
+
+    type_name = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self._values: Dict[Tuple[str, ...], List[float]] = {}
+        super().__init__(name, documentation, labelnames)
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # Per-bucket counts, then +Inf count, then sum
+                state = self._values[key] = [0] * (len(self.buckets) + 2)
+            state[index] += 1
+            state[-1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def count(self, **labels) -> int:
+        state = self._values.get(self._key(labels))
+        return int(sum(state[:-1])) if state else 0
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = [(key, list(state)) for key, state in self._values.items()]
+
+        lines = []
+        for key, state in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), state[:-1]):
+                cumulative += bucket_count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                bucket_labels = _format_labels(self.labelnames, key, f'le="{le}"')
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {state[-1]}")
+        return lines
+
+
+class MetricsRegistry:
+    """Collection of metrics exposed on /metrics"""
+
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+
+    def register(self, metric: _Metric) -> None:
+        self._metrics.append(metric)
+
+    def get(self, name: str) -> Optional[_Metric]:
+        return next((metric for metric in self._metrics if metric.name == name), None)
+
+    def render(self) -> str:
+        """Render all metrics in the Prometheus text exposition format"""
+        return "\n".join(metric.render() for metric in self._metrics) + "\n"
+
+
+registry = MetricsRegistry()
+
+
+# Application metrics
+HTTP_REQUEST_LATENCY = Histogram(
+    "gmail_assistant_http_request_duration_seconds",
+    "HTTP request latency by route",
+    ["method", "route", "status"]
+)
+HTTP_IN_FLIGHT = Gauge(
+    "gmail_assistant_http_requests_in_flight",
+    "HTTP requests currently being served"
+)
+STAGE_LATENCY = Histogram(
+    "gmail_assistant_stage_duration_seconds",
+    "Latency of internal stages (jwt_verify, gmail_list, gmail_get, gmail_send, mime_decode, ...)",
+    ["stage"]
+)
+AI_REQUEST_LATENCY = Histogram(
+    "gmail_assistant_ai_request_duration_seconds",
+    "LLM request latency per operation, provider, model and tier",
+    ["operation", "provider", "model", "tier", "outcome"]
+)
+AI_IN_FLIGHT = Gauge(
+    "gmail_assistant_ai_requests_in_flight",
+    "LLM requests currently waiting on a provider",
+    ["provider"]
+)
+AI_TOKENS = Counter(
+    "gmail_assistant_ai_tokens_total",
+    "LLM tokens consumed per operation, provider, model, tier and direction (input/output)",
+    ["operation", "provider", "model", "tier", "direction"]
+)
+CACHE_REQUESTS = Counter(
+    "gmail_assistant_cache_requests_total",
+    "Cache lookups by cache and result (hit/miss); hit ratio = hit / (hit + miss)",
+    ["cache", "result"]
+)
+AI_HEDGES = Counter(
+    "gmail_assistant_ai_hedged_requests_total",
+    "Hedged LLM requests where the backup target answered first",
+    ["operation", "result"]
+)
+AI_FAILOVERS = Counter(
+    "gmail_assistant_ai_failovers_total",
+    "LLM requests retried on the next target after the previous ones failed",
+    ["operation", "provider"]
+)
+AI_PROVIDER_HEALTHY = Gauge(
+    "gmail_assistant_ai_provider_healthy",
+    "1 while a provider/model is healthy, 0 while it is skipped after repeated failures",
+    ["provider", "model"]
+)
+AI_QUALITY = Counter(
+    "gmail_assistant_ai_output_quality_total",
+    "LLM outputs per operation and tier by whether they were usable (ok/failed)",
+    ["operation", "tier", "result"]
+)
+STARTUP_DURATION = Gauge(
+    "gmail_assistant_startup_duration_seconds",
+    "Time spent in each cold-start phase (import, warm-up steps) of this process",
+    ["phase"]
+)
+HTTP_RESPONSE_BYTES = Counter(
+    "gmail_assistant_http_response_bytes_total",
+    "Compressed response body bytes per encoding, before (original) and after (sent) compression",
+    ["encoding", "stage"]
+)
+LIVE_CONNECTIONS = Gauge(
+    "gmail_assistant_live_connections",
+    "Open live inbox WebSocket connections in this process"
+)
+LIVE_EVENTS = Counter(
+    "gmail_assistant_live_events_total",
+    "Live inbox events per type by outcome (sent, or dropped for a client that fell behind)",
+    ["type", "result"]
+)
+HTTP_POOL_REQUESTS = Counter(
+    "gmail_assistant_http_pool_requests_total",
+    "Outgoing requests through the shared HTTP pool per host, on a new or a reused connection",
+    ["host", "connection"]
+)
+CIRCUIT_STATE = Gauge(
+    "gmail_assistant_circuit_state",
+    "Circuit breaker state per dependency: 0 closed, 1 half-open (probing), 2 open (failing fast)",
+    ["dependency"]
+)
+CIRCUIT_REJECTIONS = Counter(
+    "gmail_assistant_circuit_rejections_total",
+    "Dependency calls rejected without being attempted because the circuit was open",
+    ["dependency"]
+)
+DEPENDENCY_RETRIES = Counter(
+    "gmail_assistant_dependency_retries_total",
+    "Retries of idempotent dependency calls after a transient error",
+    ["dependency", "operation"]
+)
+OUTBOX_REPLIES = Counter(
+    "gmail_assistant_outbox_replies_total",
+    "Outbox replies by outcome: queued, sent, retried (transient error, sent again later), "
+    "reclaimed (requeued after its worker stopped) or failed",
+    ["result"]
+)
+OUTBOX_DELIVERY_LATENCY = Histogram(
+    "gmail_assistant_outbox_delivery_seconds",
+    "Time from a reply being accepted to Gmail confirming the send"
+)
@@ -0,0 +1,45 @@
+import base64
+import hashlib
+import hmac
+import json
+from typing import Optional
+from app.core.config import settings
+
+
+def _sign(page_token: str, query: str, user: str) -> str:
+    """Sign a page token together with the query and user it belongs to"""
+    message = f"{user}\x00{query}\x00{page_token}".encode('utf-8')
+    digest = hmac.new(settings.SECRET_KEY.encode('utf-8'), message, hashlib.sha256).digest()
+    return base64.urlsafe_b64encode(digest[:12]).decode('ascii')
+
+
+def encode_cursor(page_token: Optional[str], query: str = "", user: str = "") -> Optional[str]:
+    """Wrap a Gmail page token into an opaque cursor bound to the query and user"""
+    if not page_token:
+        return None
+
+    data = json.dumps({"t": page_token, "s": _sign(page_token, query, user)}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(data.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor: str, query: str = "", user: str = "") -> str:
+    """Unwrap an opaque cursor back into a Gmail page token"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        page_token = data["t"]
+        signature = data["s"]
+        if not isinstance(page_token, str) or not isinstance(signature, str):
+            raise TypeError("token and signature must be strings")
+    except (ValueError, KeyError, TypeError) as e:
+        raise ValueError(f"Malformed cursor: {e}")
+
+    try:
+        matches = hmac.compare_digest(signature, _sign(page_token, query, user))
+    except TypeError:
+        # compare_digest refuses non-ASCII strings
+        matches = False
+    if not matches:
+        raise ValueError("Cursor does not match this query or user")
+
+    return page_token
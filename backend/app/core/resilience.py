@@ -0,0 +1,257 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterator, Optional, TypeVar
+import asyncio
+import functools
+import random
+import threading
+import time
+import logging
+
+from app.core.config import settings
+from app.core.metrics import CIRCUIT_STATE, CIRCUIT_REJECTIONS, DEPENDENCY_RETRIES
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+CLOSED, HALF_OPEN, OPEN = "closed", "half_open", "open"
+_STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class DependencyUnavailable(Exception):
+    """A dependency's circuit is open: it is failing, so callers fail fast instead of waiting"""
+
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class DeadlineExceeded(TimeoutError):
+    """The request's deadline ran out before a dependency call could finish"""
+
+
+def http_status(error: Exception) -> int:
+    """Status an endpoint should answer with for an unexpected error"""
+    if isinstance(error, DependencyUnavailable):
+        return 503
+    if isinstance(error, DeadlineExceeded):
+        return 504
+    return 500
+
+
+# Absolute time.monotonic() by which the current request must be answered
+_deadline: ContextVar[Optional[float]] = ContextVar("deadline", default=None)
+
+
+@contextmanager
+def deadline(seconds: Optional[float]) -> Iterator[None]:
+    """Bound every dependency call made inside the block; nesting only ever shortens it"""
+    if not seconds or seconds <= 0:
+        yield
+        return
+    expires = time.monotonic() + seconds
+    current = _deadline.get()
+    token = _deadline.set(expires if current is None else min(current, expires))
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def detached(fn: Callable[..., T]) -> Callable[..., T]:
+    """Wrap work scheduled to run after the response, e.g. a BackgroundTasks job.
+
+    Such work starts from a copy of the request's context, deadline included,
+    by which time the deadline has mostly or entirely run out.
+    """
+    if asyncio.iscoroutinefunction(fn):
+        @functools.wraps(fn)
+        async def run_async(*args, **kwargs):
+            token = _deadline.set(None)
+            try:
+                return await fn(*args, **kwargs)
+            finally:
+                _deadline.reset(token)
+        return run_async
+
+    @functools.wraps(fn)
+    def run(*args, **kwargs):
+        token = _deadline.set(None)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _deadline.reset(token)
+    return run
+
+
+def remaining_seconds() -> Optional[float]:
+    """Seconds left before the current deadline, or None outside of one"""
+    expires = _deadline.get()
+    return None if expires is None else expires - time.monotonic()
+
+
+def check_deadline(dependency: str) -> None:
+    remaining = remaining_seconds()
+    if remaining is not None and remaining <= 0:
+        raise DeadlineExceeded(f"Deadline exceeded before calling {dependency}")
+
+
+def parse_deadlines(spec: str) -> Dict[str, float]:
+    """Parse "/api/emails/list=20;/api/chat=45" into {path prefix: seconds}"""
+    deadlines = {}
+    for entry in spec.split(";"):
+        if not entry.strip():
+            continue
+        prefix, _, seconds = entry.partition("=")
+        try:
+            deadlines[prefix.strip()] = float(seconds)
+        except ValueError:
+            logger.warning(f"Ignoring invalid deadline entry: {entry!r}")
+    return deadlines
+
+
+def deadline_for(path: str) -> float:
+    """Deadline of the longest configured prefix of path, else REQUEST_DEADLINE_SECONDS"""
+    deadlines = parse_deadlines(settings.REQUEST_DEADLINES)
+    matches = [prefix for prefix in deadlines if path.startswith(prefix)]
+    return deadlines[max(matches, key=len)] if matches else settings.REQUEST_DEADLINE_SECONDS
+
+
+def backoff_delay(attempt: int, base: float, cap: float) -> float:
+    """Full-jitter exponential backoff: uniform in [0, min(cap, base * 2^attempt)]"""
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker for one dependency.
+
+    Closed: calls go through. After failure_threshold consecutive failures the
+    circuit opens and calls are rejected at once with DependencyUnavailable.
+    Once recovery_seconds have passed it goes half-open and lets one probe
+    call through: success closes the circuit, failure opens it again. A probe
+    that never reports back (e.g. a cancelled hedge) frees its slot after
+    another recovery_seconds. The state is exported as a gauge per dependency.
+    """
+
+    def __init__(self, name: str, failure_threshold: int = 5, recovery_seconds: float = 30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_seconds = recovery_seconds
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_started: Optional[float] = None
+        self._lock = threading.Lock()
+        CIRCUIT_STATE.set(0, dependency=name)
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            self._advance(time.monotonic())
+            return self._state
+
+    def _transition(self, state: str) -> None:
+        if state != self._state:
+            logger.info(f"Circuit {self.name}: {self._state} -> {state}")
+            self._state = state
+            CIRCUIT_STATE.set(_STATE_VALUES[state], dependency=self.name)
+
+    def _advance(self, now: float) -> None:
+        if self._state == OPEN and now - self._opened_at >= self.recovery_seconds:
+            self._transition(HALF_OPEN)
+            self._probe_started = None
+
+    def _probe_free(self, now: float) -> bool:
+        return self._probe_started is None or now - self._probe_started >= self.recovery_seconds
+
+    def available(self) -> bool:
+        """Whether a call would be let through now, without claiming the half-open probe"""
+        now = time.monotonic()
+        with self._lock:
+            self._advance(now)
+            return self._state == CLOSED or (self._state == HALF_OPEN and self._probe_free(now))
+
+    def allow(self) -> bool:
+        """Admit one call; in half-open only the probe is admitted"""
+        now = time.monotonic()
+        with self._lock:
+            self._advance(now)
+            if self._state == CLOSED:
+                return True
+            if self._state == HALF_OPEN and self._probe_free(now):
+                self._probe_started = now
+                return True
+        CIRCUIT_REJECTIONS.inc(dependency=self.name)
+        return False
+
+    def retry_after(self) -> float:
+        """Seconds until the next probe will be let through"""
+        with self._lock:
+            if self._state != OPEN:
+                return 0.0
+            return max(0.0, self._opened_at + self.recovery_seconds - time.monotonic())
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._failures = 0
+            self._probe_started = None
+            self._transition(CLOSED)
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if self._state == HALF_OPEN or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+                self._probe_started = None
+                self._transition(OPEN)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._failures = 0
+            self._probe_started = None
+            self._transition(CLOSED)
+
+    def unavailable(self) -> DependencyUnavailable:
+        retry_after = self.retry_after()
+        return DependencyUnavailable(
+            f"{self.name} is temporarily unavailable; retry in {retry_after:.0f}s", retry_after=retry_after
+        )
+
+    def call(self, fn: Callable[[], T], operation: str, retries: int = 0,
+             retryable: Callable[[Exception], bool] = lambda e: False,
+             is_failure: Callable[[Exception], bool] = lambda e: True) -> T:
+        """Run fn through the breaker, retrying up to `retries` times with jittered backoff.
+
+        Only pass retries for idempotent calls. An error is retried when
+        retryable(error) is true and the backoff still fits in the deadline;
+        it counts against the circuit when is_failure(error) is true. Other
+        errors (e.g. a 404) mean the dependency answered, which counts as
+        healthy.
+        """
+        attempt = 0
+        while True:
+            check_deadline(self.name)
+            if not self.allow():
+                raise self.unavailable()
+            try:
+                result = fn()
+            except Exception as e:
+                if is_failure(e):
+                    self.record_failure()
+                else:
+                    self.record_success()
+                if attempt >= retries or not retryable(e) or not self.available():
+                    raise
+                delay = backoff_delay(attempt, settings.RETRY_BASE_DELAY_MS / 1000,
+                                      settings.RETRY_MAX_DELAY_MS / 1000)
+                remaining = remaining_seconds()
+                if remaining is not None and delay >= remaining:
+                    raise
+                DEPENDENCY_RETRIES.inc(dependency=self.name, operation=operation)
+                logger.info(f"Retrying {self.name} {operation} in {delay * 1000:.0f}ms after: {e}")
+                time.sleep(delay)
+                attempt += 1
+                continue
+            self.record_success()
+            return result
@@ -0,0 +1,49 @@
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+from fastapi.responses import Response
+import json
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is in requirements.txt
+    orjson = None
+
+
+def dumps(content: Any) -> bytes:
+    """Compact JSON bytes, with orjson when it is installed"""
+    if orjson is not None:
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(content, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+class FastJSONResponse(Response):
+    """JSON response rendered with orjson (stdlib json when it is not installed).
+
+    Endpoints that return one of these directly also skip FastAPI's
+    response_model validation and jsonable_encoder pass, so they must build
+    their content from already validated data; response_model then only
+    documents the shape.
+    """
+
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+def parse_fields(fields: Optional[str], allowed: Sequence[str]) -> Optional[Tuple[str, ...]]:
+    """Parse a ?fields=id,subject projection; None means every field"""
+    if not fields:
+        return None
+
+    requested = tuple(dict.fromkeys(field.strip() for field in fields.split(',') if field.strip()))
+    unknown = [field for field in requested if field not in allowed]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}; allowed: {', '.join(allowed)}")
+    return requested
+
+
+def project(items: Iterable[Dict[str, Any]], fields: Optional[Sequence[str]]) -> List[Dict[str, Any]]:
+    """Keep only the requested keys of each item"""
+    if fields is None:
+        return list(items)
+    return [{field: item[field] for field in fields} for item in items]
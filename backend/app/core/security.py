@@ -1,7 +1,13 @@
+import base64
 from datetime import datetime, timedelta
+from functools import lru_cache
 from typing import Optional, Dict, Any
+from cryptography.fernet import Fernet, InvalidToken
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
 from jose import JWTError, jwt
 from app.core.config import settings
+from app.core.tracing import trace_stage, SPAN_KIND_INTERNAL
 
 
 def create_access_token(data: Dict[str, Any], expires_delta: Optional[timedelta] = None) -> str:
@@ -21,7 +27,34 @@ def create_access_token(data: Dict[str, Any], expires_delta: Optional[timedelta]
 def verify_token(token: str) -> Optional[Dict[str, Any]]:
     """Verify and decode JWT token"""
     try:
-        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+        with trace_stage("jwt_verify", kind=SPAN_KIND_INTERNAL):
+            payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
         return payload
     except JWTError:
         return None
+
+
+@lru_cache(maxsize=None)
+def _fernet(secret_key: str) -> Fernet:
+    """Encryption key derived from SECRET_KEY, distinct from the JWT signing key"""
+    key = HKDF(
+        algorithm=hashes.SHA256(), length=32, salt=None, info=b"email-assistant stored credentials"
+    ).derive(secret_key.encode('utf-8'))
+    return Fernet(base64.urlsafe_b64encode(key))
+
+
+def encrypt_secret(value: Optional[str]) -> Optional[str]:
+    """Encrypt a credential before it is written to the shared state backend"""
+    if value is None:
+        return None
+    return _fernet(settings.SECRET_KEY).encrypt(value.encode('utf-8')).decode('ascii')
+
+
+def decrypt_secret(value: Optional[str]) -> Optional[str]:
+    """Plaintext of encrypt_secret() output; None when it was encrypted under another SECRET_KEY"""
+    if value is None:
+        return None
+    try:
+        return _fernet(settings.SECRET_KEY).decrypt(value.encode('ascii')).decode('utf-8')
+    except InvalidToken:
+        return None
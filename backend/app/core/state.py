@@ -0,0 +1,473 @@
+"""Shared state for caches, sessions, job records, queues and rate limits.
+
+Every worker process talks to the same backend, so state stays coherent
+when the API runs as several uvicorn workers or on several hosts:
+
+- memory: per-process dict, for development and tests
+- sqlite: one database file shared by the workers of a host
+- redis:  any server speaking the Redis protocol, shared across hosts
+"""
+from typing import Dict, Any, Optional, List, Tuple, Iterator
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from urllib.parse import urlparse
+from app.core.config import settings
+import json
+import queue
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class StateBackend:
+    """Key/value store with TTLs, atomic counters and FIFO queues"""
+
+    def get(self, key: str) -> Optional[str]:
+        raise NotImplementedError
+
+    def set(self, key: str, value: str, ttl: Optional[float] = None) -> None:
+        raise NotImplementedError
+
+    def add(self, key: str, value: str, ttl: Optional[float] = None) -> bool:
+        """Set only if the key does not exist; True when this call set it"""
+        raise NotImplementedError
+
+    def delete(self, key: str) -> None:
+        raise NotImplementedError
+
+    def incr(self, key: str, amount: int = 1, ttl: Optional[float] = None) -> int:
+        """Atomically add to a counter; ttl applies when the counter is created"""
+        raise NotImplementedError
+
+    def keys(self, prefix: str) -> List[str]:
+        raise NotImplementedError
+
+    def push(self, queue_name: str, value: str) -> None:
+        """Append to the tail of a queue"""
+        raise NotImplementedError
+
+    def pop(self, queue_name: str) -> Optional[str]:
+        """Take from the head of a queue"""
+        raise NotImplementedError
+
+    def get_json(self, key: str) -> Optional[Any]:
+        value = self.get(key)
+        return json.loads(value) if value is not None else None
+
+    def set_json(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        self.set(key, json.dumps(value, separators=(',', ':')), ttl)
+
+    def close(self) -> None:
+        pass
+
+
+class MemoryBackend(StateBackend):
+    """Process-local backend; beyond max_keys the least recently used keys with a TTL are evicted.
+
+    Only cache-like entries (set with a TTL) are evicted. Queues, keys set
+    without a TTL (outbox items' leases) and set-if-absent claims such as
+    locks stay until they are deleted or expire.
+    """
+
+    def __init__(self, max_keys: int = 100000):
+        self.max_keys = max_keys
+        self._data: Dict[str, Tuple[Any, Optional[float]]] = {}
+        # Evictable keys, least recently used first
+        self._evictable: "OrderedDict[str, None]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _live(self, key: str) -> Optional[Tuple[Any, Optional[float]]]:
+        """Entry for a key unless expired; caller holds the lock"""
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        if entry[1] is not None and entry[1] <= time.monotonic():
+            self._drop(key)
+            return None
+        if key in self._evictable:
+            self._evictable.move_to_end(key)
+        return entry
+
+    def _drop(self, key: str) -> None:
+        self._data.pop(key, None)
+        self._evictable.pop(key, None)
+
+    def _store(self, key: str, value: Any, ttl: Optional[float], evictable: bool = True) -> None:
+        self._data[key] = (value, time.monotonic() + ttl if ttl else None)
+        if evictable and ttl:
+            self._evictable[key] = None
+            self._evictable.move_to_end(key)
+        else:
+            self._evictable.pop(key, None)
+        if len(self._data) > self.max_keys:
+            self._evict(keep=key)
+
+    def _evict(self, keep: str) -> None:
+        """Make room, never dropping keep, the key that was just written"""
+        while len(self._data) > self.max_keys and self._evictable:
+            key = next(iter(self._evictable))
+            if key == keep:
+                # The newest entry: nothing older is left to evict
+                break
+            self._drop(key)
+        if len(self._data) > self.max_keys:
+            # Only pinned keys left: at least clear out the expired ones
+            now = time.monotonic()
+            expired = [key for key, (_, expires_at) in self._data.items()
+                       if expires_at is not None and expires_at <= now]
+            for key in expired:
+                self._drop(key)
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._live(key)
+            return entry[0] if entry and isinstance(entry[0], str) else None
+
+    def set(self, key: str, value: str, ttl: Optional[float] = None) -> None:
+        with self._lock:
+            self._store(key, value, ttl)
+
+    def add(self, key: str, value: str, ttl: Optional[float] = None) -> bool:
+        with self._lock:
+            if self._live(key) is not None:
+                return False
+            # Claims and locks: evicting one would let a second holder in
+            self._store(key, value, ttl, evictable=False)
+            return True
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._drop(key)
+
+    def incr(self, key: str, amount: int = 1, ttl: Optional[float] = None) -> int:
+        with self._lock:
+            entry = self._live(key)
+            if entry is None:
+                self._store(key, str(amount), ttl)
+                return amount
+            value = int(entry[0]) + amount
+            self._data[key] = (str(value), entry[1])
+            return value
+
+    def keys(self, prefix: str) -> List[str]:
+        with self._lock:
+            return [key for key in list(self._data) if key.startswith(prefix) and self._live(key)]
+
+    def push(self, queue_name: str, value: str) -> None:
+        with self._lock:
+            entry = self._live(queue_name)
+            items = entry[0] if entry else deque()
+            items.append(value)
+            self._store(queue_name, items, None, evictable=False)
+
+    def pop(self, queue_name: str) -> Optional[str]:
+        with self._lock:
+            entry = self._live(queue_name)
+            if not entry or not entry[0]:
+                return None
+            return entry[0].popleft()
+
+
+class SQLiteBackend(StateBackend):
+    """Backend in a SQLite file shared by all workers on one host (WAL mode)"""
+
+    # Expired rows are purged every this many writes
+    PURGE_EVERY = 1000
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        self._writes = 0
+        with self._connection() as db:
+            db.execute("CREATE TABLE IF NOT EXISTS kv (key TEXT PRIMARY KEY, value TEXT, expires_at REAL)")
+            db.execute("CREATE TABLE IF NOT EXISTS queue (id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT, value TEXT)")
+            db.execute("CREATE INDEX IF NOT EXISTS queue_name ON queue (name, id)")
+
+    def _connection(self) -> sqlite3.Connection:
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            self._local.db = db
+        return db
+
+    def _write(self, sql: str, params: tuple) -> None:
+        db = self._connection()
+        db.execute(sql, params)
+        self._writes += 1
+        if self._writes % self.PURGE_EVERY == 0:
+            db.execute("DELETE FROM kv WHERE expires_at IS NOT NULL AND expires_at <= ?", (time.time(),))
+
+    def get(self, key: str) -> Optional[str]:
+        row = self._connection().execute(
+            "SELECT value FROM kv WHERE key = ? AND (expires_at IS NULL OR expires_at > ?)", (key, time.time())
+        ).fetchone()
+        return row[0] if row else None
+
+    def set(self, key: str, value: str, ttl: Optional[float] = None) -> None:
+        self._write(
+            "INSERT OR REPLACE INTO kv (key, value, expires_at) VALUES (?, ?, ?)",
+            (key, value, time.time() + ttl if ttl else None)
+        )
+
+    def add(self, key: str, value: str, ttl: Optional[float] = None) -> bool:
+        db = self._connection()
+        now = time.time()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            db.execute("DELETE FROM kv WHERE key = ? AND expires_at IS NOT NULL AND expires_at <= ?", (key, now))
+            inserted = db.execute(
+                "INSERT OR IGNORE INTO kv (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, value, now + ttl if ttl else None)
+            ).rowcount == 1
+            db.execute("COMMIT")
+        except Exception:
+            db.execute("ROLLBACK")
+            raise
+        return inserted
+
+    def delete(self, key: str) -> None:
+        self._write("DELETE FROM kv WHERE key = ?", (key,))
+
+    def incr(self, key: str, amount: int = 1, ttl: Optional[float] = None) -> int:
+        db = self._connection()
+        now = time.time()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            db.execute("DELETE FROM kv WHERE key = ? AND expires_at IS NOT NULL AND expires_at <= ?", (key, now))
+            db.execute(
+                "INSERT INTO kv (key, value, expires_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET value = CAST(value AS INTEGER) + excluded.value",
+                (key, str(amount), now + ttl if ttl else None)
+            )
+            value = int(db.execute("SELECT value FROM kv WHERE key = ?", (key,)).fetchone()[0])
+            db.execute("COMMIT")
+        except Exception:
+            db.execute("ROLLBACK")
+            raise
+        return value
+
+    def keys(self, prefix: str) -> List[str]:
+        rows = self._connection().execute(
+            "SELECT key FROM kv WHERE key >= ? AND key < ? AND (expires_at IS NULL OR expires_at > ?)",
+            (prefix, prefix + "￿", time.time())
+        ).fetchall()
+        return [row[0] for row in rows]
+
+    def push(self, queue_name: str, value: str) -> None:
+        self._write("INSERT INTO queue (name, value) VALUES (?, ?)", (queue_name, value))
+
+    def pop(self, queue_name: str) -> Optional[str]:
+        db = self._connection()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            row = db.execute(
+                "SELECT id, value FROM queue WHERE name = ? ORDER BY id LIMIT 1", (queue_name,)
+            ).fetchone()
+            if row:
+                db.execute("DELETE FROM queue WHERE id = ?", (row[0],))
+            db.execute("COMMIT")
+        except Exception:
+            db.execute("ROLLBACK")
+            raise
+        return row[1] if row else None
+
+
+class RedisError(Exception):
+    pass
+
+
+class _RedisConnection:
+    """One socket speaking RESP2"""
+
+    def __init__(self, host: str, port: int, timeout: float):
+        self.sock = socket.create_connection((host, port), timeout=timeout)
+        self.reader = self.sock.makefile("rb")
+
+    def command(self, *args) -> Any:
+        parts = [f"*{len(args)}\r\n".encode()]
+        for arg in args:
+            data = arg if isinstance(arg, bytes) else str(arg).encode("utf-8")
+            parts.append(b"$%d\r\n%s\r\n" % (len(data), data))
+        self.sock.sendall(b"".join(parts))
+        return self._read()
+
+    def _read(self, nested: bool = False) -> Any:
+        """One reply; an error reply raises RedisError only after the whole reply was read"""
+        line = self.reader.readline()
+        if not line:
+            raise ConnectionError("Redis connection closed")
+        kind, rest = line[:1], line[1:-2]
+        if kind == b"+":
+            return rest.decode("utf-8")
+        if kind == b"-":
+            error = RedisError(rest.decode("utf-8"))
+            if nested:
+                return error
+            raise error
+        if kind == b":":
+            return int(rest)
+        if kind == b"$":
+            length = int(rest)
+            if length == -1:
+                return None
+            data = self.reader.read(length + 2)[:-2]
+            return data.decode("utf-8")
+        if kind == b"*":
+            length = int(rest)
+            if length == -1:
+                return None
+            items = [self._read(nested=True) for _ in range(length)]
+            error = next((item for item in items if isinstance(item, RedisError)), None)
+            if error is not None and not nested:
+                raise error
+            return items
+        raise RedisError(f"Unexpected reply: {line!r}")
+
+    def close(self) -> None:
+        try:
+            self.reader.close()
+            self.sock.close()
+        except OSError:
+            pass
+
+
+class RedisBackend(StateBackend):
+    """Backend on a Redis-protocol server with a small connection pool"""
+
+    def __init__(self, url: str, pool_size: int = 8, timeout: float = 5.0):
+        parsed = urlparse(url)
+        self.host = parsed.hostname or "localhost"
+        self.port = parsed.port or 6379
+        self.password = parsed.password
+        self.db = int(parsed.path.lstrip("/") or 0)
+        self.timeout = timeout
+        self._pool: "queue.LifoQueue[_RedisConnection]" = queue.LifoQueue(maxsize=pool_size)
+
+    def _connect(self) -> _RedisConnection:
+        conn = _RedisConnection(self.host, self.port, self.timeout)
+        if self.password:
+            conn.command("AUTH", self.password)
+        if self.db:
+            conn.command("SELECT", self.db)
+        return conn
+
+    def _command(self, *args) -> Any:
+        try:
+            conn = self._pool.get_nowait()
+        except queue.Empty:
+            conn = self._connect()
+        reusable = False
+        try:
+            result = conn.command(*args)
+            reusable = True
+            return result
+        except RedisError:
+            # An error reply was read in full; the connection is still in sync
+            reusable = True
+            raise
+        finally:
+            if not reusable:
+                # I/O error or a half-read reply
+                conn.close()
+            else:
+                try:
+                    self._pool.put_nowait(conn)
+                except queue.Full:
+                    conn.close()
+
+    def get(self, key: str) -> Optional[str]:
+        return self._command("GET", key)
+
+    def set(self, key: str, value: str, ttl: Optional[float] = None) -> None:
+        if ttl:
+            self._command("SET", key, value, "PX", int(ttl * 1000))
+        else:
+            self._command("SET", key, value)
+
+    def add(self, key: str, value: str, ttl: Optional[float] = None) -> bool:
+        args = ["SET", key, value, "NX"]
+        if ttl:
+            args += ["PX", int(ttl * 1000)]
+        return self._command(*args) == "OK"
+
+    def delete(self, key: str) -> None:
+        self._command("DEL", key)
+
+    def incr(self, key: str, amount: int = 1, ttl: Optional[float] = None) -> int:
+        value = self._command("INCRBY", key, amount)
+        if ttl and value == amount:
+            self._command("PEXPIRE", key, int(ttl * 1000))
+        return value
+
+    def keys(self, prefix: str) -> List[str]:
+        pattern = "".join(f"\\{char}" if char in "*?[]\\" else char for char in prefix) + "*"
+        keys, cursor = [], "0"
+        while True:
+            cursor, batch = self._command("SCAN", cursor, "MATCH", pattern, "COUNT", 1000)
+            keys.extend(batch)
+            if cursor == "0":
+                return keys
+
+    def push(self, queue_name: str, value: str) -> None:
+        self._command("RPUSH", queue_name, value)
+
+    def pop(self, queue_name: str) -> Optional[str]:
+        return self._command("LPOP", queue_name)
+
+    def close(self) -> None:
+        while True:
+            try:
+                self._pool.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+def rate_limited(scope: str, user_key: str, limit: int, window_seconds: float = 60.0) -> bool:
+    """Fixed-window rate limit shared by all workers; True when over the limit"""
+    if limit <= 0:
+        return False
+    window = int(time.time() // window_seconds)
+    return state.incr(f"ratelimit:{scope}:{user_key}:{window}", ttl=window_seconds * 2) > limit
+
+
+@contextmanager
+def state_lock(backend: StateBackend, key: str, ttl: float = 10.0, timeout: float = 5.0) -> Iterator[None]:
+    """Mutual exclusion across every worker sharing the backend.
+
+    The ttl frees a lock whose holder died; raises TimeoutError when the lock
+    stays taken for longer than timeout. Waiting sleeps the calling thread,
+    so take it from worker threads (plain def routes), not the event loop.
+    """
+    token = uuid.uuid4().hex
+    give_up = time.monotonic() + timeout
+    while not backend.add(key, token, ttl=ttl):
+        if time.monotonic() >= give_up:
+            raise TimeoutError(f"Timed out waiting for lock {key}")
+        time.sleep(0.005)
+    try:
+        yield
+    finally:
+        if backend.get(key) == token:
+            backend.delete(key)
+
+
+def build_backend() -> StateBackend:
+    backend = settings.STATE_BACKEND.lower()
+
+    if backend == "memory":
+        return MemoryBackend()
+    if backend == "sqlite":
+        return SQLiteBackend(settings.STATE_SQLITE_PATH)
+    if backend == "redis":
+        return RedisBackend(settings.REDIS_URL)
+    raise ValueError(f"Invalid state backend: {settings.STATE_BACKEND}")
+
+
+state = build_backend()
@@ -0,0 +1,306 @@
+from typing import Dict, Any, Optional, List
+from contextlib import contextmanager
+from contextvars import ContextVar
+from app.core.config import settings
+from app.core.metrics import STAGE_LATENCY
+import hashlib
+import json
+import logging
+import os
+import queue
+import random
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# OTLP span kinds
+SPAN_KIND_INTERNAL = 1
+SPAN_KIND_SERVER = 2
+SPAN_KIND_CLIENT = 3
+
+# OTLP status codes
+STATUS_OK = 1
+STATUS_ERROR = 2
+
+
+class Span:
+    """A finished or in-progress unit of work, shaped after the OTLP span model"""
+
+    __slots__ = ("name", "trace_id", "span_id", "parent_span_id", "kind",
+                 "start_ns", "end_ns", "attributes", "status_code", "status_message")
+
+    sampled = True
+
+    def __init__(self, name: str, trace_id: str, parent_span_id: Optional[str] = None,
+                 kind: int = SPAN_KIND_INTERNAL, attributes: Optional[Dict[str, Any]] = None):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = os.urandom(8).hex()
+        self.parent_span_id = parent_span_id
+        self.kind = kind
+        self.start_ns = time.time_ns()
+        self.end_ns = 0
+        self.attributes = dict(attributes or {})
+        self.status_code = 0
+        self.status_message = ""
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        if value is not None:
+            self.attributes[key] = value
+
+    def record_error(self, error: BaseException) -> None:
+        self.status_code = STATUS_ERROR
+        self.status_message = str(error)[:200]
+        self.attributes["exception.type"] = type(error).__name__
+
+    def to_otlp(self) -> Dict[str, Any]:
+        """Serialize into the OTLP/JSON span representation"""
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": self.kind,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns),
+            "attributes": [_otlp_attribute(key, value) for key, value in self.attributes.items()],
+            "status": {"code": self.status_code, "message": self.status_message}
+        }
+        if self.parent_span_id:
+            span["parentSpanId"] = self.parent_span_id
+        return span
+
+
+class _NonRecordingSpan:
+    """Span handed out when tracing is off or the trace is not sampled"""
+
+    sampled = False
+    trace_id = ""
+    span_id = ""
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        pass
+
+    def record_error(self, error: BaseException) -> None:
+        pass
+
+
+NON_RECORDING_SPAN = _NonRecordingSpan()
+
+_current_span: ContextVar[Any] = ContextVar("current_span", default=None)
+
+
+def _otlp_attribute(key: str, value: Any) -> Dict[str, Any]:
+    """Convert a Python value to an OTLP AnyValue"""
+    if isinstance(value, bool):
+        typed = {"boolValue": value}
+    elif isinstance(value, int):
+        typed = {"intValue": str(value)}
+    elif isinstance(value, float):
+        typed = {"doubleValue": value}
+    else:
+        typed = {"stringValue": str(value)}
+    return {"key": key, "value": typed}
+
+
+def _resource_spans(spans: List[Span]) -> Dict[str, Any]:
+    """Wrap spans into an OTLP ExportTraceServiceRequest document"""
+    return {
+        "resourceSpans": [{
+            "resource": {"attributes": [
+                _otlp_attribute("service.name", settings.TRACING_SERVICE_NAME),
+                _otlp_attribute("deployment.environment", settings.ENVIRONMENT)
+            ]},
+            "scopeSpans": [{
+                "scope": {"name": "app.core.tracing"},
+                "spans": [span.to_otlp() for span in spans]
+            }]
+        }]
+    }
+
+
+class FileSpanExporter:
+    """Append OTLP/JSON documents, one per batch, to a local file"""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def export(self, spans: List[Span]) -> None:
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(_resource_spans(spans), separators=(',', ':')) + "\n")
+
+
+class OTLPHttpSpanExporter:
+    """Send OTLP/JSON batches to a collector's /v1/traces endpoint"""
+
+    def __init__(self, endpoint: str, timeout: float = 5.0):
+        self.endpoint = endpoint
+        self.timeout = timeout
+
+    def export(self, spans: List[Span]) -> None:
+        import httpx
+        response = httpx.post(self.endpoint, json=_resource_spans(spans), timeout=self.timeout)
+        response.raise_for_status()
+
+
+class BatchSpanProcessor:
+    """Queue finished spans and export them from a background thread"""
+
+    def __init__(self, exporter, max_batch_size: int = 256, flush_interval: float = 2.0,
+                 max_queue_size: int = 10000):
+        self.exporter = exporter
+        self.max_batch_size = max_batch_size
+        self.flush_interval = flush_interval
+        self._queue: "queue.Queue[Span]" = queue.Queue(maxsize=max_queue_size)
+        self._thread: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+        self._lock = threading.Lock()
+
+    def on_end(self, span: Span) -> None:
+        if self._thread is None:
+            self._start()
+        try:
+            self._queue.put_nowait(span)
+        except queue.Full:
+            # Never block a request on tracing
+            pass
+
+    def _start(self) -> None:
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="span-exporter", daemon=True)
+                self._thread.start()
+
+    def _drain(self) -> List[Span]:
+        batch = []
+        while len(batch) < self.max_batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _export(self, batch: List[Span]) -> None:
+        try:
+            self.exporter.export(batch)
+        except Exception as e:
+            logger.error(f"Span export failed: {e}")
+
+    def _run(self) -> None:
+        while not self._stopped.wait(self.flush_interval):
+            self.flush()
+
+    def flush(self) -> None:
+        """Export everything queued so far"""
+        batch = self._drain()
+        while batch:
+            self._export(batch)
+            batch = self._drain()
+
+    def shutdown(self) -> None:
+        self._stopped.set()
+        self.flush()
+
+
+class Tracer:
+    """Creates spans and propagates the current span through contextvars"""
+
+    def __init__(self, processor: Optional[BatchSpanProcessor] = None, sample_ratio: float = 1.0):
+        self.processor = processor
+        self.sample_ratio = sample_ratio
+
+    @property
+    def enabled(self) -> bool:
+        return self.processor is not None
+
+    @contextmanager
+    def start_span(self, name: str, kind: int = SPAN_KIND_INTERNAL,
+                   traceparent: Optional[str] = None, **attributes):
+        """Start a child of the current span (or a new trace) and make it current"""
+        parent = _current_span.get()
+
+        if not self.enabled or (parent is not None and not parent.sampled):
+            yield NON_RECORDING_SPAN
+            return
+
+        if parent is not None:
+            trace_id, parent_span_id = parent.trace_id, parent.span_id
+        else:
+            remote = parse_traceparent(traceparent)
+            if remote:
+                trace_id, parent_span_id = remote
+            elif random.random() < self.sample_ratio:
+                trace_id, parent_span_id = os.urandom(16).hex(), None
+            else:
+                token = _current_span.set(NON_RECORDING_SPAN)
+                try:
+                    yield NON_RECORDING_SPAN
+                finally:
+                    _current_span.reset(token)
+                return
+
+        span = Span(name, trace_id, parent_span_id, kind, attributes)
+        token = _current_span.set(span)
+        try:
+            yield span
+            if span.status_code == 0:
+                span.status_code = STATUS_OK
+        except BaseException as e:
+            span.record_error(e)
+            raise
+        finally:
+            _current_span.reset(token)
+            span.end_ns = time.time_ns()
+            self.processor.on_end(span)
+
+    def shutdown(self) -> None:
+        if self.processor:
+            self.processor.shutdown()
+
+
+def parse_traceparent(header: Optional[str]) -> Optional[tuple]:
+    """Parse a W3C traceparent header into (trace_id, parent_span_id)"""
+    if not header:
+        return None
+    parts = header.strip().split("-")
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    if parts[1] == "0" * 32 or parts[2] == "0" * 16:
+        return None
+    return parts[1], parts[2]
+
+
+def current_span():
+    """Return the active span (non-recording when there is none)"""
+    return _current_span.get() or NON_RECORDING_SPAN
+
+
+def hash_user(email: str) -> str:
+    """Stable pseudonymous id so traces never carry raw email addresses"""
+    return hashlib.sha256(email.lower().encode('utf-8')).hexdigest()[:16]
+
+
+@contextmanager
+def trace_stage(stage: str, kind: int = SPAN_KIND_CLIENT, **attributes):
+    """Time a stage as both a latency histogram sample and a span"""
+    with tracer.start_span(stage, kind=kind, **attributes) as span:
+        with STAGE_LATENCY.time(stage=stage):
+            yield span
+
+
+def _build_tracer() -> Tracer:
+    exporter_name = settings.TRACING_EXPORTER.lower()
+
+    if exporter_name == "file":
+        exporter = FileSpanExporter(settings.TRACING_FILE)
+    elif exporter_name == "otlp":
+        exporter = OTLPHttpSpanExporter(settings.OTLP_ENDPOINT)
+    elif exporter_name == "none":
+        return Tracer()
+    else:
+        raise ValueError(f"Invalid tracing exporter: {settings.TRACING_EXPORTER}")
+
+    return Tracer(BatchSpanProcessor(exporter), sample_ratio=settings.TRACING_SAMPLE_RATIO)
+
+
+tracer = _build_tracer()
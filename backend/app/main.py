@@ -1,8 +1,29 @@
-from fastapi import FastAPI
+import time
+
+# Import time of the app, reported as the "import" startup phase
+_import_started = time.perf_counter()
+
+from fastapi import FastAPI, Request, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from app.api import auth, emails, chat
+from fastapi.responses import PlainTextResponse
+from app.api import auth, emails, chat, live
 from app.core.config import settings
+from app.core.metrics import registry, HTTP_REQUEST_LATENCY, HTTP_IN_FLIGHT, STARTUP_DURATION
+from app.core.tracing import tracer, SPAN_KIND_SERVER
+from app.core.state import state
+from app.core.http_transport import google_http
+from app.core.responses import FastJSONResponse
+from app.core.compression import CompressionMiddleware
+from app.core.resilience import deadline, deadline_for
+from app.services.digest_scheduler import digest_scheduler
+from app.services.live_inbox import live_inbox
+from app.services.outbox import reply_outbox
+from app.services.warmup import warm_up
+import asyncio
 import logging
+import secrets
+
+STARTUP_DURATION.set(time.perf_counter() - _import_started, phase="import")
 
 # Configure logging
 logging.basicConfig(
@@ -15,7 +36,8 @@ logger = logging.getLogger(__name__)
 app = FastAPI(
     title="Gmail AI Assistant API",
     description="AI-powered Gmail automation assistant",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=FastJSONResponse
 )
 
 # CORS configuration
@@ -31,10 +53,52 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# gzip/brotli for large JSON bodies, negotiated from Accept-Encoding
+app.add_middleware(
+    CompressionMiddleware,
+    minimum_size=settings.COMPRESSION_MINIMUM_SIZE,
+    gzip_level=settings.COMPRESSION_GZIP_LEVEL,
+    brotli_quality=settings.COMPRESSION_BROTLI_QUALITY
+)
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    """Record per-route latency, in-flight requests and the root trace span; start the request deadline"""
+    start = time.perf_counter()
+    status = 500
+    
+    with HTTP_IN_FLIGHT.track_inprogress(), tracer.start_span(
+        f"{request.method} {request.url.path}",
+        kind=SPAN_KIND_SERVER,
+        traceparent=request.headers.get("traceparent"),
+        **{"http.request.method": request.method}
+    ) as span:
+        try:
+            with deadline(deadline_for(request.url.path)):
+                response = await call_next(request)
+            status = response.status_code
+            if span.sampled:
+                response.headers["X-Trace-Id"] = span.trace_id
+            return response
+        finally:
+            # Label by route template, not raw path, to keep cardinality bounded
+            route = request.scope.get("route")
+            route_path = route.path if route else "unmatched"
+            span.set_attribute("http.route", route_path)
+            span.set_attribute("http.response.status_code", status)
+            HTTP_REQUEST_LATENCY.observe(
+                time.perf_counter() - start,
+                method=request.method,
+                route=route_path,
+                status=status
+            )
+
+
 # Include routers
 app.include_router(auth.router)
 app.include_router(emails.router)
 app.include_router(chat.router)
+app.include_router(live.router)
 
 
 @app.get("/")
@@ -56,18 +120,50 @@ async def health_check():
     }
 
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics(request: Request):
+    """Prometheus metrics endpoint; in production only with METRICS_TOKEN set"""
+    if settings.METRICS_TOKEN:
+        auth_header = request.headers.get("Authorization") or ""
+        if not secrets.compare_digest(auth_header, f"Bearer {settings.METRICS_TOKEN}"):
+            raise HTTPException(status_code=401, detail="Not authenticated")
+    elif settings.ENVIRONMENT == "production":
+        # Route and dependency metrics are not for the public internet
+        raise HTTPException(status_code=404, detail="Not Found")
+    
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
+
 @app.on_event("startup")
 async def startup_event():
     """Startup event handler"""
     logger.info("Gmail AI Assistant API starting up...")
     logger.info(f"Environment: {settings.ENVIRONMENT}")
     logger.info(f"AI Provider: {settings.AI_PROVIDER}")
+    if settings.ENVIRONMENT == "production" and not settings.METRICS_TOKEN:
+        logger.warning("METRICS_TOKEN is not set: /metrics is disabled")
+    
+    if settings.WARMUP_ENABLED:
+        # Off the event loop, but before the server starts accepting requests
+        await asyncio.to_thread(warm_up)
+    
+    if settings.DIGEST_SCHEDULER_ENABLED:
+        digest_scheduler.start()
+    
+    if settings.OUTBOX_WORKER_ENABLED:
+        reply_outbox.start()
 
 
 @app.on_event("shutdown")
 async def shutdown_event():
     """Shutdown event handler"""
     logger.info("Gmail AI Assistant API shutting down...")
+    await digest_scheduler.stop()
+    await reply_outbox.stop()
+    await live_inbox.stop()
+    state.close()
+    google_http.close()
+    tracer.shutdown()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,105 @@
+from dataclasses import dataclass
+from typing import Dict, Any, Optional, Tuple, Iterable, List
+import base64
+import sys
+import zlib
+
+# Fields returned wherever a list of emails is sent to the client; bodies never are
+LIST_FIELDS = ("id", "thread_id", "sender_name", "sender_email", "subject", "snippet", "date")
+
+# Shorter bodies are not worth compressing
+COMPRESS_MIN_BYTES = 512
+
+
+def _intern(value: str) -> str:
+    # Senders repeat across a mailbox; interned strings are shared by every record
+    return sys.intern(value) if value else ""
+
+
+@dataclass(slots=True)
+class MessageRecord:
+    """Compact email kept by caches: interned senders, body stored once as (compressed) bytes"""
+    id: str
+    thread_id: str = ""
+    sender_name: str = ""
+    sender_email: str = ""
+    subject: str = ""
+    snippet: str = ""
+    date: str = ""
+    message_id_header: str = ""
+    attachments: Tuple[Dict[str, Any], ...] = ()
+    summary: Optional[str] = None
+    body_data: bytes = b""
+    body_compressed: bool = False
+
+    @classmethod
+    def from_email(cls, email: Dict[str, Any], max_body_chars: Optional[int] = None,
+                   keep_body: bool = True) -> "MessageRecord":
+        """Build a record from a GmailService email dict"""
+        record = cls(
+            id=email['id'],
+            thread_id=email.get('thread_id', ''),
+            sender_name=_intern(email.get('sender_name', '')),
+            sender_email=_intern(email.get('sender_email', '')),
+            subject=email.get('subject', ''),
+            snippet=email.get('snippet', ''),
+            date=email.get('date', ''),
+            message_id_header=email.get('message_id_header', ''),
+            attachments=tuple(email.get('attachments') or ()),
+            summary=email.get('summary')
+        )
+        if keep_body and email.get('body'):
+            record.set_body(email['body'][:max_body_chars] if max_body_chars else email['body'])
+        return record
+
+    def set_body(self, body: str) -> None:
+        data = body.encode("utf-8")
+        if len(data) >= COMPRESS_MIN_BYTES:
+            compressed = zlib.compress(data, 6)
+            if len(compressed) < len(data):
+                self.body_data, self.body_compressed = compressed, True
+                return
+        self.body_data, self.body_compressed = data, False
+
+    @property
+    def body(self) -> str:
+        """Decoded on access; callers that only list emails never pay for it"""
+        data = zlib.decompress(self.body_data) if self.body_compressed else self.body_data
+        return data.decode("utf-8")
+
+    def project(self, fields: Iterable[str] = LIST_FIELDS) -> Dict[str, Any]:
+        """Lightweight dict with only the requested fields"""
+        return {field: getattr(self, field) for field in fields}
+
+    def to_dict(self, include_body: bool = True) -> Dict[str, Any]:
+        """The GmailService email dict shape"""
+        email = self.project(LIST_FIELDS + ("message_id_header",))
+        email['attachments'] = list(self.attachments)
+        if self.summary is not None:
+            email['summary'] = self.summary
+        if include_body:
+            email['body'] = self.body
+        return email
+
+    def to_state(self) -> Dict[str, Any]:
+        """JSON-safe form for the shared state backend; the body stays compressed"""
+        state = self.to_dict(include_body=False)
+        if self.body_data:
+            state['body_z' if self.body_compressed else 'body'] = (
+                base64.b64encode(self.body_data).decode("ascii") if self.body_compressed
+                else self.body_data.decode("utf-8")
+            )
+        return state
+
+    @classmethod
+    def from_state(cls, state: Dict[str, Any]) -> "MessageRecord":
+        record = cls.from_email(state)
+        if state.get('body_z'):
+            record.body_data, record.body_compressed = base64.b64decode(state['body_z']), True
+        return record
+
+
+def project_emails(emails: Iterable[Dict[str, Any]], fields: Iterable[str] = LIST_FIELDS) -> List[Dict[str, Any]]:
+    """List projection of email dicts, e.g. search results sent to the client"""
+    fields = tuple(fields)
+    return [{field: email.get(field, '') for field in fields} for email in emails]
@@ -1,5 +1,5 @@
-from pydantic import BaseModel, EmailStr
-from typing import Optional, List, Dict, Any
+from pydantic import BaseModel, EmailStr, Field
+from typing import Optional, List, Dict, Any, Literal
 
 
 class Token(BaseModel):
@@ -35,6 +35,8 @@ class EmailSummary(BaseModel):
     summary: str
     snippet: str
     date: str
+    # Set when listed with sort=priority
+    priority: Optional[float] = None
 
 
 class EmailReply(BaseModel):
@@ -51,6 +53,40 @@ class EmailAction(BaseModel):
 class EmailListResponse(BaseModel):
     emails: List[EmailSummary]
     total: int
+    next_cursor: Optional[str] = None
+    history_id: Optional[str] = None  # pass to /delta to fetch only later changes
+
+
+class EmailLabelChange(BaseModel):
+    id: str
+    label_ids: List[str]
+
+
+class EmailDeltaResponse(BaseModel):
+    history_id: Optional[str] = None
+    added: List[EmailSummary]
+    removed: List[str]
+    changed: List[EmailLabelChange]
+    reset: bool = False  # history expired or too many changes: reload with /list
+
+
+class ThreadSummary(BaseModel):
+    id: str
+    subject: str
+    participants: List[str]
+    message_count: int
+    summary: str
+    snippet: str
+    date: str
+    latest_message_id: str
+    latest_sender_name: str
+    latest_sender_email: str
+
+
+class ThreadListResponse(BaseModel):
+    threads: List[ThreadSummary]
+    total: int
+    next_cursor: Optional[str] = None
 
 
 class GenerateReplyRequest(BaseModel):
@@ -66,3 +102,87 @@ class GenerateReplyResponse(BaseModel):
 class DeleteEmailRequest(BaseModel):
     email_id: str
     confirmation: bool = True
+
+
+# Upper bound of messages a single bulk request or chat command may touch
+MAX_BULK_MESSAGES = 500
+
+BulkAction = Literal["trash", "archive", "mark_read", "mark_unread", "label", "unlabel"]
+
+
+class BulkActionRequest(BaseModel):
+    action: BulkAction
+    email_ids: Optional[List[str]] = Field(None, max_length=MAX_BULK_MESSAGES)
+    query: Optional[str] = None
+    label_id: Optional[str] = None
+    max_messages: int = Field(MAX_BULK_MESSAGES, ge=1, le=MAX_BULK_MESSAGES)
+
+
+class BulkActionResponse(BaseModel):
+    job_id: str
+    action: str
+    status: str
+    total: int
+    processed: int
+    error: Optional[str] = None
+
+
+class OutboxReplyResponse(BaseModel):
+    outbox_id: str
+    email_id: str
+    status: str  # queued, sending, retrying, sent or failed
+    to: Optional[str] = None
+    subject: Optional[str] = None
+    thread_id: Optional[str] = None
+    attempts: int
+    error: Optional[str] = None
+    created_at: str
+    sent_at: Optional[str] = None
+
+
+class DigestScheduleRequest(BaseModel):
+    timezone: Optional[str] = None  # IANA name, e.g. "Europe/Berlin"
+    hour: Optional[int] = None  # local hour the digest should be ready by
+
+# Structured LLM outputs
+
+EmailCategory = Literal["Work", "Personal", "Promotions", "Finance", "Urgent", "Social"]
+
+ChatIntent = Literal[
+    "read_emails", "generate_reply", "send_reply", "delete_email", "search_emails",
+    "daily_digest", "categorize_emails", "help"
+]
+
+
+class IntentParams(BaseModel):
+    count: Optional[int] = None
+    email_number: Optional[int] = None
+    query: Optional[str] = None
+
+
+class IntentResult(BaseModel):
+    intent: ChatIntent
+    params: IntentParams = IntentParams()
+    confidence: Literal["high", "medium", "low"] = "medium"
+
+
+class CategoryResult(BaseModel):
+    category: EmailCategory
+
+
+class IndexedSummary(BaseModel):
+    index: int
+    summary: str
+
+
+class BatchSummaryResult(BaseModel):
+    summaries: List[IndexedSummary]
+
+
+class IndexedCategory(BaseModel):
+    index: int
+    category: EmailCategory
+
+
+class BatchCategoryResult(BaseModel):
+    categories: List[IndexedCategory]
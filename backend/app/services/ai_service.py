@@ -1,9 +1,27 @@
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any, List, Type, TypeVar, get_args
+from functools import lru_cache
+from pydantic import BaseModel, ValidationError
 from app.core.config import settings
+from app.core.metrics import CACHE_REQUESTS
+from app.core.state import state
+from app.models.schemas import (
+    EmailCategory, ChatIntent, IntentResult, CategoryResult, BatchSummaryResult, BatchCategoryResult
+)
+from app.services.contacts import contact_index
+from app.services.llm_providers import provider_registry, llm_router, background_loop
+import hashlib
 import logging
 
 logger = logging.getLogger(__name__)
 
+CATEGORIES = list(get_args(EmailCategory))
+INTENTS = list(get_args(ChatIntent))
+
+# Parsed intents keyed by normalized message text, shared by all workers
+INTENT_CACHE_TTL_SECONDS = 24 * 3600
+
+ResultModel = TypeVar("ResultModel", bound=BaseModel)
+
 
 class AIService:
     """AI service for email summarization and reply generation"""
@@ -11,55 +29,103 @@ class AIService:
     def __init__(self):
         self.provider = settings.AI_PROVIDER
         
-        if self.provider == "anthropic":
-            from anthropic import Anthropic
-            self.client = Anthropic(api_key=settings.ANTHROPIC_API_KEY)
-            self.model = "claude-sonnet-4-20250514"
-        elif self.provider == "openai":
-            from openai import OpenAI
-            self.client = OpenAI(api_key=settings.OPENAI_API_KEY)
-            self.model = "gpt-4-turbo-preview"
-        else:
+        if self.provider not in provider_registry:
             raise ValueError(f"Invalid AI provider: {self.provider}")
+        
+        self.model = provider_registry.get(self.provider).default_model
+        self.router = llm_router
+    
+    def _complete(self, operation: str, prompt: str, max_tokens: int) -> str:
+        """Route a single-turn prompt to the operation's providers (hedged, with failover)"""
+        completion = background_loop.run(self.router.complete(operation, prompt, max_tokens))
+        self.router.selector.record_quality(operation, completion.tier, bool(completion.text.strip()))
+        return completion.text
     
-    def summarize_email(self, subject: str, body: str, sender: str) -> str:
-        """Generate AI summary of email content"""
+    def _complete_structured(self, operation: str, prompt: str, max_tokens: int,
+                             result_model: Type[ResultModel]) -> ResultModel:
+        """Request schema-constrained JSON output and validate it into result_model.
+
+        Raises ValueError when the output does not match the schema.
+        """
+        completion = background_loop.run(
+            self.router.complete(operation, prompt, max_tokens, schema=_output_schema(result_model))
+        )
         try:
+            result = result_model.model_validate_json(completion.text)
+        except ValidationError as e:
+            self.router.selector.record_quality(operation, completion.tier, False)
+            raise ValueError(f"Invalid {operation} output: {e.error_count()} errors") from e
+        
+        self.router.selector.record_quality(operation, completion.tier, True)
+        return result
+    
+    def summarize_email(self, subject: str, body: str, sender: str,
+                        attachments_text: Optional[str] = None) -> str:
+        """Generate AI summary of email content, optionally including extracted attachment text"""
+        try:
+            attachments_section = f"\n\nAttachments (extracted text):\n{attachments_text[:2000]}" if attachments_text else ""
             prompt = f"""Summarize this email in 2-3 concise sentences. Focus on the main point and any actions needed.
 
 From: {sender}
 Subject: {subject}
 
 Email content:
-{body[:1000]}
+{body[:1000]}{attachments_section}
 
 Provide a clear, professional summary."""
 
-            if self.provider == "anthropic":
-                response = self.client.messages.create(
-                    model=self.model,
-                    max_tokens=200,
-                    messages=[{"role": "user", "content": prompt}]
-                )
-                return response.content[0].text
-            
-            else:  # openai
-                response = self.client.chat.completions.create(
-                    model=self.model,
-                    max_tokens=200,
-                    messages=[{"role": "user", "content": prompt}]
-                )
-                return response.choices[0].message.content
+            return self._complete("summarize", prompt, max_tokens=200)
         
         except Exception as e:
             logger.error(f"AI summarization failed: {e}")
             # Fallback to snippet
             return body[:200] + "..." if len(body) > 200 else body
     
-    def generate_reply(self, subject: str, body: str, sender: str, context: Optional[str] = None) -> str:
-        """Generate professional email reply"""
+    def summarize_thread(self, subject: str, messages: List[Dict[str, Any]],
+                         previous_summary: Optional[str] = None) -> str:
+        """Generate or extend an AI summary of an email thread"""
+        try:
+            messages_text = "\n".join(
+                f"- {msg['sender_name']}: {msg.get('body') or msg.get('snippet', '')}"[:500]
+                for msg in messages[-10:]  # Limit to the 10 newest messages
+            )
+            
+            if previous_summary:
+                prompt = f"""Update this email thread summary with the new messages. Keep it to 2-3 concise sentences and mention any actions needed.
+
+Subject: {subject}
+
+Current summary:
+{previous_summary}
+
+New messages:
+{messages_text}
+
+Provide the updated summary."""
+            else:
+                prompt = f"""Summarize this email thread in 2-3 concise sentences. Focus on the main point, the latest state of the conversation and any actions needed.
+
+Subject: {subject}
+
+Messages (oldest first):
+{messages_text}
+
+Provide a clear, professional summary."""
+
+            return self._complete("summarize_thread", prompt, max_tokens=200)
+        
+        except Exception as e:
+            logger.error(f"AI thread summarization failed: {e}")
+            # Fallback to the previous summary or the latest snippet
+            return previous_summary or (messages[-1].get('snippet', '') if messages else '')
+    
+    def generate_reply(self, subject: str, body: str, sender: str, context: Optional[str] = None,
+                       sender_history: Optional[str] = None) -> str:
+        """Generate professional email reply; sender_history is ContactIndex.describe() of the sender"""
         try:
             context_text = f"\nAdditional context: {context}" if context else ""
+            if sender_history:
+                context_text += f"\nAbout the sender: {sender_history}"
             
             prompt = f"""Generate a professional, helpful email reply to this email. Keep it concise but warm.
 
@@ -71,84 +137,50 @@ Email content:
 
 Generate a complete email reply. Do not include subject line or salutation - just the body of the reply."""
 
-            if self.provider == "anthropic":
-                response = self.client.messages.create(
-                    model=self.model,
-                    max_tokens=500,
-                    messages=[{"role": "user", "content": prompt}]
-                )
-                return response.content[0].text
-            
-            else:  # openai
-                response = self.client.chat.completions.create(
-                    model=self.model,
-                    max_tokens=500,
-                    messages=[{"role": "user", "content": prompt}]
-                )
-                return response.choices[0].message.content
+            return self._complete("generate_reply", prompt, max_tokens=500)
         
         except Exception as e:
             logger.error(f"AI reply generation failed: {e}")
             return f"Thank you for your email. I've received your message regarding '{subject}' and will respond shortly."
     
-    def parse_intent(self, user_message: str) -> Dict[str, Any]:
-        """Parse user intent from natural language"""
-        try:
-            prompt = f"""Analyze this user command and extract the intent and parameters.
+    def parse_intent(self, user_message: str, context: Optional[str] = None) -> Dict[str, Any]:
+        """Parse user intent from natural language, resolving follow-ups against the conversation context"""
+        key = " ".join(user_message.lower().split())
+        if context:
+            # The same words mean different things in different conversations
+            key = f"{key}\x00{hashlib.sha1(context.encode('utf-8')).hexdigest()}"
+        key = f"intent:{hashlib.sha1(key.encode('utf-8')).hexdigest()}"
+        cached = state.get_json(key)
+        if cached is not None:
+            CACHE_REQUESTS.inc(cache="intent", result="hit")
+            return {**cached, "params": dict(cached["params"]), "original_message": user_message}
+        CACHE_REQUESTS.inc(cache="intent", result="miss")
 
+        try:
+            context_text = f"\nConversation so far:\n{context}\n" if context else ""
+            prompt = f"""Classify this email assistant command and extract its parameters. Use the conversation so far to resolve follow-ups like "the second one".
+{context_text}
 User message: "{user_message}"
 
-Respond in this exact format:
-INTENT: [read_emails | generate_reply | send_reply | delete_email | search_emails | help]
-PARAMS: [any relevant parameters like email_id, query, number, etc.]
-CONFIDENCE: [high | medium | low]
+Intents: {', '.join(INTENTS)}
+Parameters: count (how many emails to show), email_number (the number of an email in the last list), query (who or what to search for).
 
 Examples:
-"Show me my latest emails" -> INTENT: read_emails, PARAMS: count=5, CONFIDENCE: high
-"Delete email 2" -> INTENT: delete_email, PARAMS: email_id=2, CONFIDENCE: high
-"Reply to the Amazon email" -> INTENT: generate_reply, PARAMS: query=Amazon, CONFIDENCE: medium"""
-
-            if self.provider == "anthropic":
-                response = self.client.messages.create(
-                    model=self.model,
-                    max_tokens=150,
-                    messages=[{"role": "user", "content": prompt}]
-                )
-                result = response.content[0].text
-            else:  # openai
-                response = self.client.chat.completions.create(
-                    model=self.model,
-                    max_tokens=150,
-                    messages=[{"role": "user", "content": prompt}]
-                )
-                result = response.choices[0].message.content
-            
-            # Parse the response
-            lines = result.strip().split('\n')
-            intent = "help"
-            params = {}
-            confidence = "medium"
-            
-            for line in lines:
-                if line.startswith("INTENT:"):
-                    intent = line.split("INTENT:")[1].strip().split(',')[0].strip()
-                elif line.startswith("PARAMS:"):
-                    params_str = line.split("PARAMS:")[1].strip()
-                    if params_str and params_str != "none":
-                        # Simple parsing
-                        for param in params_str.split(','):
-                            if '=' in param:
-                                k, v = param.split('=', 1)
-                                params[k.strip()] = v.strip()
-                elif line.startswith("CONFIDENCE:"):
-                    confidence = line.split("CONFIDENCE:")[1].strip()
-            
-            return {
-                "intent": intent,
-                "params": params,
-                "confidence": confidence,
-                "original_message": user_message
+"Show me my latest emails" -> intent read_emails, count 5, confidence high
+"Delete email 2" -> intent delete_email, email_number 2, confidence high
+"Reply to the Amazon email" -> intent generate_reply, query Amazon, confidence medium"""
+
+            result = self._complete_structured("parse_intent", prompt, 150, IntentResult)
+            intent_data = {
+                "intent": result.intent,
+                "params": result.params.model_dump(exclude_none=True),
+                "confidence": result.confidence
             }
+
+            # Validated results only; fallbacks below are never cached
+            state.set_json(key, intent_data, ttl=INTENT_CACHE_TTL_SECONDS)
+
+            return {**intent_data, "params": dict(intent_data["params"]), "original_message": user_message}
         
         except Exception as e:
             logger.error(f"Intent parsing failed: {e}")
@@ -159,35 +191,103 @@ Examples:
                 "original_message": user_message
             }
     
+    def summarize_conversation(self, previous_summary: str, turns: List[Dict[str, Any]]) -> str:
+        """Fold older chat turns into a rolling conversation summary"""
+        turns_text = "\n".join(f"{turn['role'].capitalize()}: {turn['text']}" for turn in turns)
+        try:
+            prompt = f"""Update the summary of this conversation between a user and their email assistant. Keep it under 80 words. Keep which emails were discussed (sender, subject, number) and any unfinished requests.
+
+Current summary:
+{previous_summary or "(none)"}
+
+New turns:
+{turns_text}
+
+Provide only the updated summary."""
+
+            return self._complete("summarize_conversation", prompt, max_tokens=150)
+        
+        except Exception as e:
+            logger.error(f"Conversation summarization failed: {e}")
+            # Fallback: keep the most recent part of the raw turns
+            return f"{previous_summary} {turns_text}".strip()[-300:]
+    
     def categorize_email(self, subject: str, body: str) -> str:
         """AI-based email categorization"""
         try:
-            prompt = f"""Categorize this email into ONE of these categories: Work, Personal, Promotions, Finance, Urgent, Social
+            prompt = f"""Categorize this email into ONE of these categories: {', '.join(CATEGORIES)}
 
 Subject: {subject}
-Body: {body[:500]}
-
-Respond with only the category name."""
+Body: {body[:500]}"""
 
-            if self.provider == "anthropic":
-                response = self.client.messages.create(
-                    model=self.model,
-                    max_tokens=20,
-                    messages=[{"role": "user", "content": prompt}]
-                )
-                return response.content[0].text.strip()
-            else:  # openai
-                response = self.client.chat.completions.create(
-                    model=self.model,
-                    max_tokens=20,
-                    messages=[{"role": "user", "content": prompt}]
-                )
-                return response.choices[0].message.content.strip()
+            return self._complete_structured("categorize", prompt, 50, CategoryResult).category
         
         except Exception as e:
             logger.error(f"AI categorization failed: {e}")
             return "Personal"
     
+    def summarize_emails(self, emails: List[Dict[str, Any]]) -> List[str]:
+        """Summarize several emails with one structured request, in input order"""
+        if not emails:
+            return []
+        
+        fallbacks = [
+            email['body'][:200] + "..." if len(email['body']) > 200 else email['body']
+            for email in emails
+        ]
+        try:
+            emails_text = "\n\n".join(
+                f"[{i}] From: {email['sender_name']}\nSubject: {email['subject']}\n{email['body'][:600]}"
+                for i, email in enumerate(emails)
+            )
+            prompt = f"""Summarize each of these emails in 2-3 concise sentences. Focus on the main point and any actions needed. Return one summary per email, keyed by its [index].
+
+{emails_text}"""
+
+            result = self._complete_structured(
+                "summarize", prompt, 150 * len(emails), BatchSummaryResult
+            )
+            summaries = {item.index: item.summary for item in result.summaries if item.summary.strip()}
+            return [summaries.get(i, fallback) for i, fallback in enumerate(fallbacks)]
+        
+        except Exception as e:
+            logger.error(f"AI batch summarization failed: {e}")
+            return fallbacks
+    
+    def categorize_emails(self, emails: List[Dict[str, Any]], user_key: Optional[str] = None) -> List[str]:
+        """Categorize several emails with one structured request, in input order.
+
+        With user_key, mail from senders the contact index already knows as
+        e.g. newsletters is categorized without asking the model.
+        """
+        if not emails:
+            return []
+        
+        known = contact_index.known_categories(user_key, emails) if user_key else {}
+        pending = [i for i in range(len(emails)) if i not in known]
+        if not pending:
+            return [known[i] for i in range(len(emails))]
+        
+        try:
+            emails_text = "\n\n".join(
+                f"[{n}] Subject: {emails[i]['subject']}\n{emails[i]['body'][:300]}"
+                for n, i in enumerate(pending)
+            )
+            prompt = f"""Categorize each of these emails into ONE of these categories: {', '.join(CATEGORIES)}. Return one category per email, keyed by its [index].
+
+{emails_text}"""
+
+            result = self._complete_structured(
+                "categorize", prompt, 30 * len(pending) + 50, BatchCategoryResult
+            )
+            categories = {item.index: item.category for item in result.categories}
+            predicted = {i: categories.get(n, "Personal") for n, i in enumerate(pending)}
+        
+        except Exception as e:
+            logger.error(f"AI batch categorization failed: {e}")
+            predicted = dict.fromkeys(pending, "Personal")
+        return [known.get(i) or predicted[i] for i in range(len(emails))]
+    
     def generate_daily_digest(self, emails: List[Dict[str, Any]]) -> str:
         """Generate a daily email digest summary"""
         try:
@@ -206,21 +306,13 @@ Emails received:
 
 Provide a concise executive summary."""
 
-            if self.provider == "anthropic":
-                response = self.client.messages.create(
-                    model=self.model,
-                    max_tokens=400,
-                    messages=[{"role": "user", "content": prompt}]
-                )
-                return response.content[0].text
-            else:  # openai
-                response = self.client.chat.completions.create(
-                    model=self.model,
-                    max_tokens=400,
-                    messages=[{"role": "user", "content": prompt}]
-                )
-                return response.choices[0].message.content
+            return self._complete("daily_digest", prompt, max_tokens=400)
         
         except Exception as e:
             logger.error(f"Digest generation failed: {e}")
             return f"You have {len(emails)} emails. Please review them at your convenience."
+
+
+@lru_cache(maxsize=None)
+def _output_schema(result_model: Type[BaseModel]) -> Dict[str, Any]:
+    return {"name": result_model.__name__, "schema": result_model.model_json_schema()}
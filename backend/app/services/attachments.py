@@ -0,0 +1,129 @@
+from typing import Dict, Any, Optional
+from app.core.config import settings
+from app.core.metrics import CACHE_REQUESTS
+from app.core.state import StateBackend, state
+import base64
+import io
+import re
+import logging
+
+logger = logging.getLogger(__name__)
+
+TEXT_MIME_TYPES = {"text/plain", "text/csv", "text/markdown"}
+PDF_MIME_TYPE = "application/pdf"
+
+_DATA_FIELD = re.compile(rb'"data"\s*:\s*"')
+
+
+class Base64FieldDecoder:
+    """Incrementally decode the base64url "data" field of a Gmail attachment response.
+
+    Bytes are fed as they arrive from the network; decoded bytes are returned
+    as soon as whole base64 quanta are available, so the attachment is never
+    held in memory in full.
+    """
+
+    def __init__(self):
+        self._prefix = b""
+        self._pending = b""
+        self._in_data = False
+        self._done = False
+
+    def feed(self, chunk: bytes) -> bytes:
+        if self._done:
+            return b""
+
+        if not self._in_data:
+            self._prefix += chunk
+            match = _DATA_FIELD.search(self._prefix)
+            if not match:
+                # Keep just enough to match a field name split across chunks
+                self._prefix = self._prefix[-32:]
+                return b""
+            chunk = self._prefix[match.end():]
+            self._prefix = b""
+            self._in_data = True
+
+        # base64url never contains a quote, so the first one ends the field
+        end = chunk.find(b'"')
+        if end != -1:
+            chunk = chunk[:end]
+            self._done = True
+
+        self._pending += chunk
+        usable = len(self._pending) - len(self._pending) % 4
+        data, self._pending = self._pending[:usable], self._pending[usable:]
+        return base64.urlsafe_b64decode(data) if data else b""
+
+    def finish(self) -> bytes:
+        """Decode whatever is left (Gmail omits the padding)"""
+        if not self._pending:
+            return b""
+        data = self._pending + b"=" * (-len(self._pending) % 4)
+        self._pending = b""
+        return base64.urlsafe_b64decode(data)
+
+
+def extract_text(data: bytes, mime_type: str, max_chars: int) -> Optional[str]:
+    """Plain text of a text or PDF attachment, or None when the type is not supported"""
+    if mime_type in TEXT_MIME_TYPES:
+        return data.decode("utf-8", errors="replace")[:max_chars]
+
+    if mime_type == PDF_MIME_TYPE:
+        try:
+            from pypdf import PdfReader
+        except ImportError:
+            logger.info("pypdf is not installed; skipping PDF text extraction")
+            return None
+
+        text = []
+        length = 0
+        for page in PdfReader(io.BytesIO(data)).pages:
+            page_text = page.extract_text() or ""
+            text.append(page_text)
+            length += len(page_text)
+            if length >= max_chars:
+                break
+        return "\n".join(text)[:max_chars]
+
+    return None
+
+
+class AttachmentTextCache:
+    """Size-capped text extraction of attachments, cached per message part"""
+
+    # Attachments never change, so entries only expire to reclaim space
+    TTL_SECONDS = 7 * 24 * 3600
+
+    def __init__(self, backend: Optional[StateBackend] = None):
+        self.state = backend or state
+
+    def get_text(self, user_key: str, gmail, message_id: str, attachment: Dict[str, Any]) -> Optional[str]:
+        """Extracted text of an attachment, fetching it only if it is small and of a supported type"""
+        if attachment['mime_type'] not in TEXT_MIME_TYPES and attachment['mime_type'] != PDF_MIME_TYPE:
+            return None
+        if attachment['size'] > settings.ATTACHMENT_TEXT_MAX_BYTES:
+            return None
+
+        # Gmail hands out a new attachment id on every fetch of a message,
+        # so entries are keyed by message id and MIME part id instead
+        key = f"attachment:{user_key}:{message_id}:{attachment['part_id']}"
+        cached = self.state.get_json(key)
+        if cached is not None:
+            CACHE_REQUESTS.inc(cache="attachment_text", result="hit")
+            return cached["text"]
+        CACHE_REQUESTS.inc(cache="attachment_text", result="miss")
+
+        data = b"".join(gmail.stream_attachment(message_id, attachment['attachment_id']))
+        try:
+            text = extract_text(data, attachment['mime_type'], settings.ATTACHMENT_TEXT_MAX_CHARS)
+        except Exception as e:
+            logger.warning(f"Text extraction failed for {attachment['filename']}: {e}")
+            text = None
+
+        # Wrapped so that "no text" is cached as well
+        self.state.set_json(key, {"text": text}, ttl=self.TTL_SECONDS)
+        return text
+
+
+attachment_text_cache = AttachmentTextCache()
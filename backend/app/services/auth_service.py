@@ -1,8 +1,7 @@
-from google_auth_oauthlib.flow import Flow
-from google.auth.transport import requests
 from google.oauth2.credentials import Credentials
-from googleapiclient.discovery import build
 from app.core.config import settings
+from app.services.google_api import build_service
+from app.core.http_transport import auth_request, mount_pool
 import logging
 
 logger = logging.getLogger(__name__)
@@ -33,6 +32,9 @@ class GoogleOAuthService:
     
     def get_authorization_url(self) -> str:
         """Get Google OAuth authorization URL"""
+        # Deferred: google_auth_oauthlib is only needed by the login routes
+        from google_auth_oauthlib.flow import Flow
+        
         try:
             flow = Flow.from_client_config(
                 self.client_config,
@@ -54,6 +56,8 @@ class GoogleOAuthService:
     
     def exchange_code_for_tokens(self, code: str) -> dict:
         """Exchange authorization code for access and refresh tokens"""
+        from google_auth_oauthlib.flow import Flow
+        
         try:
             flow = Flow.from_client_config(
                 self.client_config,
@@ -61,6 +65,7 @@ class GoogleOAuthService:
                 redirect_uri=settings.GOOGLE_REDIRECT_URI
             )
             
+            mount_pool(flow.oauth2session)
             flow.fetch_token(code=code)
             credentials = flow.credentials
             
@@ -89,8 +94,7 @@ class GoogleOAuthService:
                 client_secret=settings.GOOGLE_CLIENT_SECRET
             )
             
-            request = requests.Request()
-            credentials.refresh(request)
+            credentials.refresh(auth_request())
             
             return {
                 "access_token": credentials.token,
@@ -105,7 +109,7 @@ class GoogleOAuthService:
         """Get user information from Google"""
         try:
             credentials = Credentials(token=access_token)
-            service = build('oauth2', 'v2', credentials=credentials)
+            service = build_service('oauth2', 'v2', credentials)
             user_info = service.userinfo().get().execute()
             
             return {
@@ -122,7 +126,7 @@ class GoogleOAuthService:
         """Revoke access token"""
         try:
             credentials = Credentials(token=token)
-            credentials.revoke(requests.Request())
+            credentials.revoke(auth_request())
             return True
         except Exception as e:
             logger.error(f"Token revocation failed: {e}")
@@ -0,0 +1,126 @@
+from typing import Dict, Any, Optional, List, Callable
+from datetime import datetime
+from app.core.state import StateBackend, state
+from app.services.live_inbox import live_inbox
+import uuid
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class BulkActionService:
+    """Bulk trash/archive/read/label operations built on Gmail batchModify"""
+
+    # Label changes applied by each action; "label"/"unlabel" use the request's label id
+    ACTIONS = {
+        "trash": {"add": ["TRASH"], "remove": ["INBOX"]},
+        "archive": {"add": [], "remove": ["INBOX"]},
+        "mark_read": {"add": [], "remove": ["UNREAD"]},
+        "mark_unread": {"add": ["UNREAD"], "remove": []},
+        "label": {"add": [], "remove": []},
+        "unlabel": {"add": [], "remove": []},
+    }
+
+    # Finished jobs can be polled for this long
+    JOB_TTL_SECONDS = 24 * 3600
+
+    def __init__(self, backend: Optional[StateBackend] = None):
+        # Jobs live in the shared backend so any worker can answer a status poll
+        self.state = backend or state
+
+    def _save_job(self, job: Dict[str, Any]) -> None:
+        self.state.set_json(f"bulk:job:{job['job_id']}", job, ttl=self.JOB_TTL_SECONDS)
+        live_inbox.publish(job["user"], {"type": "job.progress", "job": job})
+
+    def label_changes(self, action: str, label_id: Optional[str] = None) -> Dict[str, List[str]]:
+        """Resolve an action into the label ids to add and remove"""
+        if action not in self.ACTIONS:
+            raise ValueError(f"Invalid bulk action: {action}")
+
+        changes = {"add": list(self.ACTIONS[action]["add"]), "remove": list(self.ACTIONS[action]["remove"])}
+
+        if action in ("label", "unlabel"):
+            if not label_id:
+                raise ValueError(f"label_id is required for '{action}'")
+            changes["add" if action == "label" else "remove"].append(label_id)
+
+        return changes
+
+    def create_job(self, user_key: str, action: str, total: int) -> Dict[str, Any]:
+        """Register a new bulk job so its progress can be polled"""
+        job = {
+            "job_id": uuid.uuid4().hex,
+            "user": user_key,
+            "action": action,
+            "status": "pending",
+            "total": total,
+            "processed": 0,
+            "error": None,
+            "created_at": datetime.utcnow().isoformat()
+        }
+
+        self._save_job(job)
+        return job
+
+    def get_job(self, user_key: str, job_id: str) -> Optional[Dict[str, Any]]:
+        """Return a job owned by the user"""
+        job = self.state.get_json(f"bulk:job:{job_id}")
+        if job and job["user"] == user_key:
+            return job
+        return None
+
+    def execute(self, gmail, action: str, message_ids: List[str], label_id: Optional[str] = None,
+                on_progress: Optional[Callable[[int, int], None]] = None) -> int:
+        """Apply an action to all messages, one batchModify call per BATCH_SIZE ids"""
+        changes = self.label_changes(action, label_id)
+        batch_size = gmail.BATCH_SIZE
+        processed = 0
+
+        for start in range(0, len(message_ids), batch_size):
+            processed += gmail.batch_modify(
+                message_ids[start:start + batch_size],
+                add_label_ids=changes["add"],
+                remove_label_ids=changes["remove"]
+            )
+            if on_progress:
+                on_progress(processed, len(message_ids))
+
+        return processed
+
+    def run_job(self, job: Dict[str, Any], gmail, message_ids: List[str],
+                label_id: Optional[str] = None) -> Dict[str, Any]:
+        """Execute a registered job, recording progress and outcome"""
+        def update_progress(processed: int, total: int) -> None:
+            job["processed"] = processed
+            self._save_job(job)
+
+        job["status"] = "running"
+        self._save_job(job)
+        try:
+            self.execute(gmail, job["action"], message_ids, label_id, on_progress=update_progress)
+            job["status"] = "completed"
+        except Exception as e:
+            logger.error(f"Bulk {job['action']} job {job['job_id']} failed: {e}")
+            job["status"] = "failed"
+            job["error"] = str(e)
+
+        self._save_job(job)
+        return job
+
+    def run_query_job(self, job: Dict[str, Any], gmail, query: str, max_messages: int,
+                      label_id: Optional[str] = None) -> Dict[str, Any]:
+        """List the messages matching query, then execute the job on them; the total is known after listing"""
+        try:
+            message_ids = gmail.list_message_ids(query=query, max_results=max_messages)
+        except Exception as e:
+            logger.error(f"Bulk {job['action']} job {job['job_id']} could not list messages: {e}")
+            job["status"] = "failed"
+            job["error"] = str(e)
+            self._save_job(job)
+            return job
+
+        job["total"] = len(message_ids)
+        return self.run_job(job, gmail, message_ids, label_id)
+
+
+bulk_service = BulkActionService()
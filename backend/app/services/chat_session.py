@@ -0,0 +1,181 @@
+from typing import Dict, Any, Optional, List, Tuple, Callable
+from app.core.metrics import CACHE_REQUESTS
+from app.core.state import StateBackend, state, state_lock
+from app.models.message import MessageRecord
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (~4 characters per token) used for history budgets"""
+    return len(text) // 4 + 1
+
+
+class ConversationStore:
+    """Per-user chat state: the last listed emails, recent turns and any action awaiting confirmation"""
+
+    # Reply generation reads at most this much of a body
+    MAX_BODY_CHARS = 4000
+    # A single turn is stored truncated; history never carries email bodies
+    MAX_TURN_CHARS = 600
+    # Turns always kept verbatim when older ones are folded into the summary
+    KEEP_RECENT_TURNS = 4
+    # Emails listed in the model context
+    MAX_CONTEXT_EMAILS = 10
+
+    def __init__(self, ttl_seconds: float = 1800.0, history_token_budget: int = 600,
+                 backend: Optional[StateBackend] = None):
+        self.ttl_seconds = ttl_seconds
+        self.history_token_budget = history_token_budget
+        # Sessions live in the shared backend so consecutive messages may hit
+        # different workers; the backend expires idle sessions and evicts the
+        # least recently used ones under memory pressure
+        self.state = backend or state
+
+    def _locked(self, user_key: str):
+        """Hold the user's session for a read-modify-write, across all workers"""
+        return state_lock(self.state, f"chat:lock:{user_key}")
+
+    def _load(self, user_key: str, create: bool = False) -> Optional[Dict[str, Any]]:
+        """Stored session for a user, or a new one when create is set"""
+        session = self.state.get_json(f"chat:{user_key}")
+        if session is None and create:
+            session = {"emails": [], "source": None, "query": None, "pending": None,
+                       "turns": [], "summary": "", "history_tokens": 0}
+        return session
+
+    def _save(self, user_key: str, session: Dict[str, Any]) -> None:
+        """Write a session back, restarting its idle timeout; caller holds _locked()"""
+        self.state.set_json(f"chat:{user_key}", session, ttl=self.ttl_seconds)
+
+    def remember_emails(self, user_key: str, emails: List[Dict[str, Any]], source: str,
+                        query: Optional[str] = None) -> None:
+        """Store the list the user is looking at; numbers refer to it (1-based)"""
+        # Bodies are kept compressed; only reply generation decodes them
+        kept = [MessageRecord.from_email(email, self.MAX_BODY_CHARS).to_state() for email in emails]
+
+        with self._locked(user_key):
+            session = self._load(user_key, create=True)
+            session["emails"] = kept
+            session["source"] = source
+            session["query"] = query
+            self._save(user_key, session)
+
+    def last_list(self, user_key: str) -> Tuple[Optional[str], List[Dict[str, Any]]]:
+        """The remembered list (without bodies) and where it came from ("inbox" or "search")"""
+        session = self._load(user_key)
+        if not session:
+            return None, []
+        return session["source"], [
+            MessageRecord.from_state(email).to_dict(include_body=False) for email in session["emails"] if email
+        ]
+
+    def email_by_number(self, user_key: str, number: int) -> Optional[Dict[str, Any]]:
+        """Resolve 'email 3' against the last list shown to the user"""
+        session = self._load(user_key)
+        emails = session["emails"] if session else []
+        found = emails[number - 1] if 0 < number <= len(emails) else None
+
+        CACHE_REQUESTS.inc(cache="chat_session", result="hit" if found else "miss")
+        return MessageRecord.from_state(found).to_dict() if found else None
+
+    def forget_emails(self, user_key: str, message_ids: List[str]) -> None:
+        """Blank out deleted messages, keeping the numbers of the others stable"""
+        removed = set(message_ids)
+        with self._locked(user_key):
+            session = self._load(user_key)
+            if session:
+                session["emails"] = [
+                    None if email and email['id'] in removed else email for email in session["emails"]
+                ]
+                self._save(user_key, session)
+
+    def set_pending(self, user_key: str, action: Dict[str, Any]) -> None:
+        """Remember an action the user has been asked to confirm"""
+        with self._locked(user_key):
+            session = self._load(user_key, create=True)
+            session["pending"] = dict(action)
+            self._save(user_key, session)
+
+    def pop_pending(self, user_key: str, expected: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+        """Take the action awaiting confirmation, if any; with expected, only one having those fields"""
+        with self._locked(user_key):
+            session = self._load(user_key)
+            if not session or not session["pending"]:
+                return None
+            if expected and any(session["pending"].get(key) != value for key, value in expected.items()):
+                return None
+            pending, session["pending"] = session["pending"], None
+            self._save(user_key, session)
+            return pending
+
+    def _recount(self, session: Dict[str, Any]) -> None:
+        """Refresh a session's history token count"""
+        session["history_tokens"] = (
+            estimate_tokens(session["summary"]) + sum(turn["tokens"] for turn in session["turns"])
+        )
+
+    def add_turn(self, user_key: str, role: str, text: str) -> bool:
+        """Append a user/assistant turn; returns True when the history is over budget"""
+        text = text[:self.MAX_TURN_CHARS]
+        with self._locked(user_key):
+            session = self._load(user_key, create=True)
+            session["turns"].append({"role": role, "text": text, "tokens": estimate_tokens(text)})
+            self._recount(session)
+            self._save(user_key, session)
+            return session["history_tokens"] > self.history_token_budget
+
+    def compact(self, user_key: str, summarize: Callable[[str, List[Dict[str, Any]]], str]) -> None:
+        """Fold the oldest turns into the rolling summary until the history fits its budget.
+
+        summarize(previous_summary, turns) returns the new summary; it runs
+        outside the lock since it may call the model.
+        """
+        session = self._load(user_key)
+        if not session or session["history_tokens"] <= self.history_token_budget:
+            return
+        folded = session["turns"][:-self.KEEP_RECENT_TURNS]
+        previous = session["summary"]
+        if not folded:
+            return
+
+        summary = summarize(previous, folded)
+        # Hard cap: the summary may use at most half of the budget
+        summary = summary[:self.history_token_budget * 2]
+
+        with self._locked(user_key):
+            session = self._load(user_key)
+            if not session or session["summary"] != previous:
+                return
+            # Turns are only appended, so the folded ones are still the oldest
+            session["turns"] = session["turns"][len(folded):]
+            session["summary"] = summary
+            self._recount(session)
+            self._save(user_key, session)
+
+    def context(self, user_key: str) -> str:
+        """Compact conversation context for the model: summary, recent turns, emails shown"""
+        session = self._load(user_key)
+        if not session:
+            return ""
+        summary = session["summary"]
+        turns = session["turns"]
+        emails = session["emails"][:self.MAX_CONTEXT_EMAILS]
+
+        lines = []
+        if summary:
+            lines.append(f"Earlier in the conversation: {summary}")
+        lines.extend(f"{turn['role'].capitalize()}: {turn['text']}" for turn in turns)
+        listed = [f"{number}. {email['sender_name']} - {email['subject']}"
+                  for number, email in enumerate(emails, 1) if email]
+        if listed:
+            lines.append("Emails currently shown:")
+            lines.extend(listed)
+        return "\n".join(lines)
+
+    def clear(self, user_key: str) -> None:
+        self.state.delete(f"chat:{user_key}")
+
+
+conversation_store = ConversationStore()
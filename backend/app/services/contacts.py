@@ -0,0 +1,228 @@
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Dict, Any, List, Optional, Iterable, get_args
+from app.core.config import settings
+from app.core.metrics import CACHE_REQUESTS
+from app.core.state import StateBackend, state, state_lock
+from app.models.schemas import EmailCategory
+from app.services.semantic_index import message_timestamp
+import numpy as np
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+CATEGORIES = list(get_args(EmailCategory))
+CATEGORY_INDEX = {category: i for i, category in enumerate(CATEGORIES)}
+
+
+class _UserContacts:
+    """Per-sender counters of one user in parallel arrays indexed by sender id.
+
+    Messages are remembered by id (up to a limit) so seeing one again, e.g.
+    on the next listing, does not count it twice and its category can be
+    corrected. Forgetting an old message id keeps its counts.
+    """
+
+    def __init__(self, max_messages: int):
+        self.max_messages = max_messages
+        self.sender_ids: Dict[str, int] = {}
+        self.counts = np.zeros(64, dtype=np.int32)
+        self.last_seen = np.zeros(64, dtype=np.float64)
+        self.categories = np.zeros((64, len(CATEGORIES)), dtype=np.int32)
+        # message id -> [sender id, category index or -1], oldest first
+        self.messages: "OrderedDict[str, List[int]]" = OrderedDict()
+
+    def sender_id(self, address: str, create: bool = True) -> Optional[int]:
+        address = address.lower()
+        sender = self.sender_ids.get(address)
+        if sender is None and create:
+            sender = self.sender_ids[address] = len(self.sender_ids)
+            if sender >= len(self.counts):
+                size = 2 * len(self.counts)
+                # np.resize repeats the data; the new tail must start at zero
+                self.counts = np.resize(self.counts, size)
+                self.last_seen = np.resize(self.last_seen, size)
+                self.categories = np.resize(self.categories, (size, len(CATEGORIES)))
+                for array in (self.counts, self.last_seen, self.categories):
+                    array[sender:] = 0
+        return sender
+
+    def add(self, email: Dict[str, Any]) -> None:
+        if email['id'] in self.messages:
+            self.messages.move_to_end(email['id'])
+            return
+        sender = self.sender_id(email.get('sender_email', ''))
+        self.counts[sender] += 1
+        self.last_seen[sender] = max(self.last_seen[sender], message_timestamp(email.get('date', '')))
+        self.messages[email['id']] = [sender, -1]
+        while len(self.messages) > self.max_messages:
+            self.messages.popitem(last=False)
+
+    def set_category(self, message_id: str, category: str) -> None:
+        entry = self.messages.get(message_id)
+        index = CATEGORY_INDEX.get(category)
+        if entry is None or index is None:
+            return
+        sender, previous = entry
+        if previous >= 0:
+            self.categories[sender, previous] -= 1
+        self.categories[sender, index] += 1
+        entry[1] = index
+
+
+class ContactIndex:
+    """Per-user sender statistics built from the messages the app syncs.
+
+    Tracks, per sender address, how many messages arrived, when the last one
+    did, how often the user replied and which categories their messages got.
+    Priority ranking reads these as features, categorization skips the LLM
+    for senders whose mail is always the same kind (newsletters, social
+    notifications), and reply drafting tells the model who the sender is.
+
+    Reply counts live in the shared state backend, since replies are recorded
+    by whichever process's outbox worker sends them. Message counts and
+    categories are kept in process memory: each worker counts the messages
+    it syncs itself, so with several workers each sees part of the mailbox.
+    """
+
+    # A user's reply counts are kept this long after their last reply
+    REPLIES_TTL_SECONDS = 90 * 24 * 3600
+
+    def __init__(self, max_messages_per_user: int = 5000, max_users: int = 1000,
+                 backend: Optional[StateBackend] = None):
+        self.max_messages_per_user = max_messages_per_user
+        self.max_users = max_users
+        self.state = backend or state
+        self._users: "OrderedDict[str, _UserContacts]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _user(self, user_key: str, create: bool = False) -> Optional[_UserContacts]:
+        contacts = self._users.get(user_key)
+        if contacts is None and create:
+            contacts = self._users[user_key] = _UserContacts(self.max_messages_per_user)
+            while len(self._users) > self.max_users:
+                self._users.popitem(last=False)
+        if contacts is not None:
+            self._users.move_to_end(user_key)
+        return contacts
+
+    def add(self, user_key: str, emails: Iterable[Dict[str, Any]]) -> None:
+        """Count messages not seen before towards their senders"""
+        with self._lock:
+            contacts = self._user(user_key, create=True)
+            for email in emails:
+                if email.get('id') and email.get('sender_email'):
+                    contacts.add(email)
+
+    def set_categories(self, user_key: str, categories: Dict[str, str]) -> None:
+        """Record the categories of added messages; a message's later category replaces its earlier one"""
+        with self._lock:
+            contacts = self._user(user_key)
+            if contacts is not None:
+                for message_id, category in categories.items():
+                    contacts.set_category(message_id, category)
+
+    def record_reply(self, user_key: str, sender_email: str) -> None:
+        key = f"contacts:replies:{user_key}"
+        with state_lock(self.state, f"{key}:lock"):
+            replies = self.state.get_json(key) or {}
+            address = sender_email.lower()
+            replies[address] = replies.get(address, 0) + 1
+            self.state.set_json(key, replies, ttl=self.REPLIES_TTL_SECONDS)
+
+    def _replies(self, user_key: str) -> Dict[str, int]:
+        """Reply counts by lower-cased sender address, shared by every worker"""
+        return self.state.get_json(f"contacts:replies:{user_key}") or {}
+
+    def reset(self) -> None:
+        """Forget every user, e.g. after switching to a different mailbox"""
+        with self._lock:
+            self._users.clear()
+        for key in self.state.keys("contacts:replies:"):
+            self.state.delete(key)
+
+    def sender_features(self, user_key: str, addresses: List[str]) -> np.ndarray:
+        """(len(addresses), 2) matrix of sender frequency and reply ratio, both in [0, 1].
+
+        Frequency is log-scaled relative to the user's most frequent sender.
+        """
+        features = np.zeros((len(addresses), 2), dtype=np.float32)
+        replied = self._replies(user_key)
+        with self._lock:
+            contacts = self._user(user_key)
+            if contacts is None or not contacts.sender_ids:
+                return features
+            senders = np.array([contacts.sender_ids.get(address.lower(), -1) for address in addresses],
+                               dtype=np.int64)
+            known = senders >= 0
+            counts = contacts.counts[senders[known]].astype(np.float32)
+            replies = np.array([replied.get(address.lower(), 0) for address, is_known in zip(addresses, known)
+                                if is_known], dtype=np.float32)
+            busiest = max(1, int(contacts.counts.max()))
+
+        features[known, 0] = np.log1p(counts) / np.log1p(busiest)
+        features[known, 1] = np.minimum(1.0, replies / np.maximum(counts, 1.0))
+        return features
+
+    def known_categories(self, user_key: str, emails: List[Dict[str, Any]]) -> Dict[int, str]:
+        """Categories implied by the sender alone, keyed by position in emails.
+
+        A sender qualifies once CONTACT_CATEGORY_MIN_MESSAGES of their messages
+        were categorized, at least CONTACT_CATEGORY_SHARE of them into one of
+        CONTACT_CATEGORY_SHORTCUTS, and the user has never replied to them.
+        """
+        shortcuts = [CATEGORY_INDEX[name.strip()] for name in settings.CONTACT_CATEGORY_SHORTCUTS.split(",")
+                     if name.strip() in CATEGORY_INDEX]
+        known = {}
+        replied = self._replies(user_key)
+        with self._lock:
+            contacts = self._user(user_key)
+            for i, email in enumerate(emails):
+                address = email.get('sender_email', '')
+                sender = contacts.sender_id(address, create=False) if contacts else None
+                if sender is None or replied.get(address.lower()):
+                    continue
+                row = contacts.categories[sender]
+                total = int(row.sum())
+                top = int(row.argmax())
+                if (total >= settings.CONTACT_CATEGORY_MIN_MESSAGES and top in shortcuts
+                        and row[top] >= settings.CONTACT_CATEGORY_SHARE * total):
+                    known[i] = CATEGORIES[top]
+
+        CACHE_REQUESTS.inc(len(known), cache="contact_category", result="hit")
+        CACHE_REQUESTS.inc(len(emails) - len(known), cache="contact_category", result="miss")
+        return known
+
+    def get(self, user_key: str, sender_email: str) -> Optional[Dict[str, Any]]:
+        """Statistics of one sender, or None when they never wrote"""
+        replied = self._replies(user_key)
+        with self._lock:
+            contacts = self._user(user_key)
+            sender = contacts.sender_id(sender_email, create=False) if contacts else None
+            if sender is None or not contacts.counts[sender]:
+                return None
+            row = contacts.categories[sender]
+            return {
+                'sender_email': sender_email.lower(),
+                'messages': int(contacts.counts[sender]),
+                'replies': replied.get(sender_email.lower(), 0),
+                'last_seen': float(contacts.last_seen[sender]),
+                'categories': {CATEGORIES[i]: int(row[i]) for i in np.flatnonzero(row)},
+            }
+
+    def describe(self, user_key: str, sender_email: str) -> Optional[str]:
+        """One line about the sender for prompts, e.g. reply drafting"""
+        stats = self.get(user_key, sender_email)
+        if stats is None:
+            return None
+        parts = [f"{stats['messages']} message(s) from this sender so far", f"the user replied {stats['replies']} time(s)"]
+        if stats['categories']:
+            parts.append(f"usually {max(stats['categories'], key=stats['categories'].get)}")
+        if stats['last_seen']:
+            last = datetime.fromtimestamp(stats['last_seen'], timezone.utc)
+            parts.append(f"last one on {last:%Y-%m-%d}")
+        return "; ".join(parts)
+
+
+contact_index = ContactIndex()
@@ -0,0 +1,192 @@
+from typing import Dict, Any, Optional, List
+from datetime import datetime, timedelta, timezone
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+from app.core.config import settings
+from app.core.security import encrypt_secret, decrypt_secret
+from app.core.state import StateBackend, state
+from app.core.tracing import hash_user
+import asyncio
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def validate_timezone(name: str) -> str:
+    """Return the IANA time zone name or raise ValueError"""
+    try:
+        ZoneInfo(name)
+    except (ZoneInfoNotFoundError, ValueError):
+        raise ValueError(f"Unknown time zone: {name}")
+    return name
+
+
+class DigestScheduler:
+    """Precomputes each user's daily digest shortly before their local morning.
+
+    Schedules and digests live in the shared backend; every worker runs the
+    loop, and a claim key per user and morning makes sure only one of them
+    computes each digest.
+    """
+
+    # Schedules of users who stop using the app expire after this long
+    USER_TTL_SECONDS = 30 * 24 * 3600
+    DIGEST_TTL_SECONDS = 2 * 24 * 3600
+
+    def __init__(self, backend: Optional[StateBackend] = None):
+        self.state = backend or state
+        self._lock = threading.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    def _user(self, user_key: str) -> Optional[Dict[str, Any]]:
+        return self.state.get_json(f"digest:user:{user_key}")
+
+    def _save_user(self, user_key: str, user: Dict[str, Any]) -> None:
+        self.state.set_json(f"digest:user:{user_key}", user, ttl=self.USER_TTL_SECONDS)
+
+    def save_digest(self, user_key: str, entry: Dict[str, Any]) -> None:
+        self.state.set_json(f"digest:result:{user_key}", entry, ttl=self.DIGEST_TTL_SECONDS)
+
+    def register(self, user_key: str, access_token: str, refresh_token: str,
+                 tz: Optional[str] = None, hour: Optional[int] = None) -> Dict[str, Any]:
+        """Add or update a user's schedule; tokens are refreshed on every request"""
+        with self._lock:
+            user = self._user(user_key) or {
+                "timezone": settings.DIGEST_DEFAULT_TIMEZONE,
+                "hour": settings.DIGEST_DEFAULT_HOUR
+            }
+            # Encrypted at rest: the backend may be a shared file or Redis
+            user["access_token"] = encrypt_secret(access_token)
+            user["refresh_token"] = encrypt_secret(refresh_token)
+            user["retry_after"] = None
+            if tz is not None:
+                user["timezone"] = validate_timezone(tz)
+            if hour is not None:
+                if not 0 <= hour <= 23:
+                    raise ValueError("hour must be between 0 and 23")
+                user["hour"] = hour
+            self._save_user(user_key, user)
+            return {"timezone": user["timezone"], "hour": user["hour"]}
+
+    def stagger_offset(self, user_key: str) -> timedelta:
+        """Stable per-user offset that spreads precomputation over the stagger window"""
+        window = max(1, settings.DIGEST_STAGGER_SECONDS)
+        return timedelta(seconds=int(hash_user(user_key), 16) % window)
+
+    def _run_time(self, user_key: str, morning: datetime) -> datetime:
+        return morning - timedelta(minutes=settings.DIGEST_LEAD_MINUTES) - self.stagger_offset(user_key)
+
+    def current_morning(self, user_key: str, now: datetime) -> datetime:
+        """The local morning whose precomputation time most recently passed"""
+        user = self._user(user_key)
+        local_now = now.astimezone(ZoneInfo(user["timezone"]))
+        morning = local_now.replace(hour=user["hour"], minute=0, second=0, microsecond=0)
+        if self._run_time(user_key, morning) > local_now:
+            morning -= timedelta(days=1)
+        return morning
+
+    def next_run(self, user_key: str, now: datetime) -> datetime:
+        """UTC time of the user's next precomputation"""
+        morning = self.current_morning(user_key, now) + timedelta(days=1)
+        return self._run_time(user_key, morning).astimezone(timezone.utc)
+
+    def due_users(self, now: datetime) -> List[str]:
+        """Users whose run time has passed without a digest for that morning"""
+        prefix = "digest:user:"
+        due = []
+        for key in self.state.keys(prefix):
+            user_key = key[len(prefix):]
+            user = self._user(user_key)
+            if not user:
+                continue
+            if user.get("retry_after") and now < datetime.fromisoformat(user["retry_after"]):
+                continue
+            stored = self.get_digest(user_key)
+            morning = self.current_morning(user_key, now).date().isoformat()
+            if not stored or stored["morning"] != morning:
+                due.append(user_key)
+        return due
+
+    def get_digest(self, user_key: str) -> Optional[Dict[str, Any]]:
+        return self.state.get_json(f"digest:result:{user_key}")
+
+    def fresh_digest(self, user_key: str, now: Optional[datetime] = None) -> Optional[Dict[str, Any]]:
+        """The stored digest if it was made for the current morning"""
+        stored = self.get_digest(user_key)
+        morning = self.current_morning(user_key, now or datetime.now(timezone.utc)).date().isoformat()
+        return stored if stored and stored["morning"] == morning else None
+
+    def compute(self, user_key: str, now: Optional[datetime] = None) -> Dict[str, Any]:
+        """Fetch recent emails, generate the digest and store it with its real timestamp"""
+        from app.services.gmail_service import GmailService
+        from app.services.ai_service import AIService
+
+        user = self._user(user_key)
+        access_token, refresh_token = decrypt_secret(user["access_token"]), decrypt_secret(user["refresh_token"])
+        if not refresh_token:
+            raise ValueError("Stored credentials are unreadable; they are replaced on the user's next request")
+
+        gmail = GmailService(access_token=access_token, refresh_token=refresh_token)
+        emails = gmail.list_emails(max_results=20)
+        digest = AIService().generate_daily_digest(emails)
+
+        generated_at = now or datetime.now(timezone.utc)
+        entry = {
+            "digest": digest,
+            "email_count": len(emails),
+            "generated_at": generated_at.isoformat(),
+            "morning": self.current_morning(user_key, generated_at).date().isoformat()
+        }
+        self.save_digest(user_key, entry)
+        return entry
+
+    async def run_due(self, now: Optional[datetime] = None) -> int:
+        """Precompute every due digest, a few at a time to spare the providers"""
+        now = now or datetime.now(timezone.utc)
+        semaphore = asyncio.Semaphore(settings.DIGEST_CONCURRENCY)
+
+        async def run(user_key: str) -> bool:
+            # Another worker may already be on it
+            morning = self.current_morning(user_key, now).date().isoformat()
+            if not self.state.add(f"digest:claim:{user_key}:{morning}", "1",
+                                  ttl=settings.DIGEST_RETRY_SECONDS):
+                return False
+            async with semaphore:
+                try:
+                    await asyncio.to_thread(self.compute, user_key, now)
+                except Exception as e:
+                    logger.error(f"Digest precomputation failed for {hash_user(user_key)}: {e}")
+                    # Expired tokens or provider trouble: do not retry on every tick
+                    with self._lock:
+                        user = self._user(user_key)
+                        if user:
+                            user["retry_after"] = (now + timedelta(seconds=settings.DIGEST_RETRY_SECONDS)).isoformat()
+                            self._save_user(user_key, user)
+            return True
+
+        ran = await asyncio.gather(*(run(user_key) for user_key in self.due_users(now)))
+        return sum(ran)
+
+    async def _loop(self) -> None:
+        while True:
+            try:
+                await self.run_due()
+            except Exception as e:
+                logger.error(f"Digest scheduler tick failed: {e}")
+            await asyncio.sleep(settings.DIGEST_SCHEDULER_INTERVAL_SECONDS)
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._loop())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+digest_scheduler = DigestScheduler()
@@ -1,38 +1,110 @@
 from google.oauth2.credentials import Credentials
-from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Iterator, Tuple
+from contextlib import ExitStack
 from datetime import datetime
+from functools import lru_cache
 import base64
 from email.mime.text import MIMEText
+from app.core.config import settings
+from app.core.tracing import trace_stage, SPAN_KIND_INTERNAL
+from app.services.google_api import build_service
+from app.core.http_transport import google_http, auth_request
+from app.core.resilience import CircuitBreaker
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Quota (429) and server-side errors Google asks clients to retry with backoff
+TRANSIENT_STATUSES = {429, 500, 502, 503, 504}
+
+
+def _is_transient(error: Exception) -> bool:
+    if isinstance(error, HttpError):
+        return error.resp.status in TRANSIENT_STATUSES
+    return isinstance(error, (TimeoutError, ConnectionError))
+
+
+def _is_outage(error: Exception) -> bool:
+    # 429s are per-user quota, not a sign that Gmail is down for everyone
+    if isinstance(error, HttpError):
+        return error.resp.status >= 500
+    return isinstance(error, (TimeoutError, ConnectionError))
+
+
+@lru_cache(maxsize=4096)
+def parse_sender(sender: str) -> tuple:
+    """(name, email) of a From header; cached since the same senders recur across a mailbox"""
+    if '<' in sender and '>' in sender:
+        # Format: "Name <email@example.com>"
+        name = sender.split('<')[0].strip().strip('"')
+        email = sender.split('<')[1].split('>')[0].strip()
+    else:
+        # Format: "email@example.com"
+        name = sender.split('@')[0]
+        email = sender
+    
+    return name, email
+
+
+# Shared by every user: when Gmail itself is failing, requests fail fast instead of each waiting it out
+gmail_circuit = CircuitBreaker(
+    "gmail",
+    failure_threshold=settings.GMAIL_CIRCUIT_FAILURE_THRESHOLD,
+    recovery_seconds=settings.GMAIL_CIRCUIT_RECOVERY_SECONDS
+)
+
 
 class GmailService:
     """Gmail API service for email operations"""
     
+    METADATA_HEADERS = ['From', 'Subject', 'Date', 'Message-ID']
+    
+    # Gmail accepts at most 1000 ids per batchModify call
+    BATCH_SIZE = 1000
+    
     def __init__(self, access_token: str, refresh_token: str):
         """Initialize Gmail service with OAuth tokens"""
         self.credentials = Credentials(
             token=access_token,
             refresh_token=refresh_token,
             token_uri="https://oauth2.googleapis.com/token",
-            client_id=None,  # Not needed for API calls
-            client_secret=None
+            # Lets expired access tokens refresh, e.g. for scheduled digests
+            client_id=settings.GOOGLE_CLIENT_ID,
+            client_secret=settings.GOOGLE_CLIENT_SECRET
+        )
+        client_options = {"api_endpoint": settings.GMAIL_API_ENDPOINT} if settings.GMAIL_API_ENDPOINT else None
+        self.service = build_service('gmail', 'v1', self.credentials, client_options)
+    
+    def _execute(self, request, operation: str, idempotent: bool = True) -> Dict[str, Any]:
+        """Execute an API request through the Gmail circuit, retrying idempotent ones on transient errors"""
+        return gmail_circuit.call(
+            request.execute, operation,
+            retries=settings.GMAIL_MAX_RETRIES if idempotent else 0,
+            retryable=_is_transient,
+            is_failure=_is_outage
         )
-        self.service = build('gmail', 'v1', credentials=self.credentials)
     
     def list_emails(self, max_results: int = 5, query: str = "") -> List[Dict[str, Any]]:
         """Fetch emails from inbox"""
+        return self.list_emails_page(max_results=max_results, query=query)['emails']
+    
+    def list_emails_page(self, max_results: int = 5, query: str = "",
+                         page_token: Optional[str] = None) -> Dict[str, Any]:
+        """Fetch one page of emails from inbox along with the token for the next page"""
         try:
-            results = self.service.users().messages().list(
-                userId='me',
-                maxResults=max_results,
-                q=query,
-                labelIds=['INBOX']
-            ).execute()
+            params = {
+                'userId': 'me',
+                'maxResults': max_results,
+                'q': query,
+                'labelIds': ['INBOX']
+            }
+            if page_token:
+                params['pageToken'] = page_token
+            
+            with trace_stage("gmail_list", **{"gmail.max_results": max_results}) as span:
+                results = self._execute(self.service.users().messages().list(**params), 'list')
+                span.set_attribute("gmail.message_count", len(results.get('messages', [])))
             
             messages = results.get('messages', [])
             emails = []
@@ -42,7 +114,10 @@ class GmailService:
                 if email_data:
                     emails.append(email_data)
             
-            return emails
+            return {
+                'emails': emails,
+                'next_page_token': results.get('nextPageToken')
+            }
         
         except HttpError as error:
             logger.error(f"Gmail API error: {error}")
@@ -51,24 +126,26 @@ class GmailService:
     def get_email_details(self, message_id: str) -> Optional[Dict[str, Any]]:
         """Get detailed information about a specific email"""
         try:
-            message = self.service.users().messages().get(
-                userId='me',
-                id=message_id,
-                format='full'
-            ).execute()
+            with trace_stage("gmail_get"):
+                message = self._execute(self.service.users().messages().get(
+                    userId='me',
+                    id=message_id,
+                    format='full'
+                ), 'get')
             
             headers = message['payload']['headers']
             
             # Extract key information
-            subject = next((h['value'] for h in headers if h['name'].lower() == 'subject'), 'No Subject')
-            sender = next((h['value'] for h in headers if h['name'].lower() == 'from'), 'Unknown')
-            date = next((h['value'] for h in headers if h['name'].lower() == 'date'), '')
+            subject = self._get_header(headers, 'subject', 'No Subject')
+            sender = self._get_header(headers, 'from', 'Unknown')
+            date = self._get_header(headers, 'date', '')
             
             # Parse sender name and email
             sender_name, sender_email = self._parse_sender(sender)
             
             # Get email body
-            body = self._get_email_body(message['payload'])
+            with trace_stage("mime_decode", kind=SPAN_KIND_INTERNAL):
+                body = self._get_email_body(message['payload'])
             
             return {
                 'id': message_id,
@@ -78,13 +155,91 @@ class GmailService:
                 'snippet': message.get('snippet', ''),
                 'body': body,
                 'date': date,
-                'thread_id': message.get('threadId', '')
+                'thread_id': message.get('threadId', ''),
+                'history_id': message.get('historyId', ''),
+                'message_id_header': self._get_header(headers, 'message-id', ''),
+                'attachments': self._get_attachments(message['payload'])
             }
         
         except HttpError as error:
             logger.error(f"Failed to get email {message_id}: {error}")
             return None
     
+    def get_message_metadata(self, message_id: str) -> Optional[Dict[str, Any]]:
+        """Get headers of a specific email without downloading its body"""
+        try:
+            with trace_stage("gmail_get_metadata"):
+                message = self._execute(self.service.users().messages().get(
+                    userId='me',
+                    id=message_id,
+                    format='metadata',
+                    metadataHeaders=self.METADATA_HEADERS
+                ), 'get_metadata')
+            
+            return self._parse_metadata_message(message)
+        
+        except HttpError as error:
+            logger.error(f"Failed to get email metadata {message_id}: {error}")
+            return None
+    
+    def list_threads_page(self, max_results: int = 5, query: str = "",
+                          page_token: Optional[str] = None) -> Dict[str, Any]:
+        """Fetch one page of inbox threads (ids, snippets and history ids only)"""
+        try:
+            params = {
+                'userId': 'me',
+                'maxResults': max_results,
+                'q': query,
+                'labelIds': ['INBOX']
+            }
+            if page_token:
+                params['pageToken'] = page_token
+            
+            with trace_stage("gmail_list_threads"):
+                results = self._execute(self.service.users().threads().list(**params), 'list_threads')
+            
+            threads = [
+                {
+                    'id': thread['id'],
+                    'snippet': thread.get('snippet', ''),
+                    'history_id': thread.get('historyId', '')
+                }
+                for thread in results.get('threads', [])
+            ]
+            
+            return {
+                'threads': threads,
+                'next_page_token': results.get('nextPageToken')
+            }
+        
+        except HttpError as error:
+            logger.error(f"Gmail API error: {error}")
+            raise Exception(f"Failed to fetch threads: {str(error)}")
+    
+    def get_thread(self, thread_id: str) -> Optional[Dict[str, Any]]:
+        """Get a thread with the headers of all its messages in a single call"""
+        try:
+            with trace_stage("gmail_get_thread") as span:
+                thread = self._execute(self.service.users().threads().get(
+                    userId='me',
+                    id=thread_id,
+                    format='metadata',
+                    metadataHeaders=self.METADATA_HEADERS
+                ), 'get_thread')
+                span.set_attribute("gmail.message_count", len(thread.get('messages', [])))
+            
+            messages = [self._parse_metadata_message(msg) for msg in thread.get('messages', [])]
+            
+            return {
+                'id': thread_id,
+                'history_id': thread.get('historyId', ''),
+                'messages': messages
+            }
+        
+        except HttpError as error:
+            logger.error(f"Failed to get thread {thread_id}: {error}")
+            return None
+    
     def send_reply(self, to_email: str, subject: str, body: str, 
                    thread_id: Optional[str] = None, message_id: Optional[str] = None) -> bool:
         """Send an email reply"""
@@ -93,6 +248,11 @@ class GmailService:
             message['to'] = to_email
             message['subject'] = f"Re: {subject}" if not subject.startswith('Re:') else subject
             
+            if message_id:
+                # Keep the reply in the same conversation for all mail clients
+                message['In-Reply-To'] = message_id
+                message['References'] = message_id
+            
             raw_message = base64.urlsafe_b64encode(message.as_bytes()).decode('utf-8')
             
             send_message = {'raw': raw_message}
@@ -100,25 +260,29 @@ class GmailService:
             if thread_id:
                 send_message['threadId'] = thread_id
             
-            self.service.users().messages().send(
-                userId='me',
-                body=send_message
-            ).execute()
+            with trace_stage("gmail_send"):
+                # Not idempotent: a retry after a lost response would send the email twice
+                self._execute(self.service.users().messages().send(
+                    userId='me',
+                    body=send_message
+                ), 'send', idempotent=False)
             
             logger.info(f"Email sent successfully to {to_email}")
             return True
         
         except HttpError as error:
             logger.error(f"Failed to send email: {error}")
-            raise Exception(f"Failed to send email: {str(error)}")
+            # Chained so callers can tell a transient status from a rejected message
+            raise Exception(f"Failed to send email: {str(error)}") from error
     
     def delete_email(self, message_id: str) -> bool:
         """Move email to trash"""
         try:
-            self.service.users().messages().trash(
-                userId='me',
-                id=message_id
-            ).execute()
+            with trace_stage("gmail_trash"):
+                self._execute(self.service.users().messages().trash(
+                    userId='me',
+                    id=message_id
+                ), 'trash')
             
             logger.info(f"Email {message_id} moved to trash")
             return True
@@ -127,27 +291,213 @@ class GmailService:
             logger.error(f"Failed to delete email {message_id}: {error}")
             raise Exception(f"Failed to delete email: {str(error)}")
     
+    def list_message_ids(self, query: str = "", max_results: int = 500,
+                         label_ids: Optional[List[str]] = None) -> List[str]:
+        """Collect message ids matching a query without fetching message details"""
+        try:
+            message_ids = []
+            page_token = None
+            
+            while len(message_ids) < max_results:
+                params = {
+                    'userId': 'me',
+                    'maxResults': min(500, max_results - len(message_ids)),
+                    'q': query
+                }
+                if label_ids:
+                    params['labelIds'] = label_ids
+                if page_token:
+                    params['pageToken'] = page_token
+                
+                with trace_stage("gmail_list_ids"):
+                    results = self._execute(self.service.users().messages().list(**params), 'list_ids')
+                message_ids.extend(msg['id'] for msg in results.get('messages', []))
+                
+                page_token = results.get('nextPageToken')
+                if not page_token:
+                    break
+            
+            return message_ids
+        
+        except HttpError as error:
+            logger.error(f"Gmail API error: {error}")
+            raise Exception(f"Failed to list message ids: {str(error)}")
+    
+    def get_history_id(self) -> str:
+        """Current history id of the mailbox, the starting point for list_history"""
+        try:
+            with trace_stage("gmail_profile"):
+                profile = self._execute(self.service.users().getProfile(userId='me'), 'profile')
+            return profile['historyId']
+        
+        except HttpError as error:
+            logger.error(f"Gmail API error: {error}")
+            raise Exception(f"Failed to get profile: {str(error)}")
+    
+    def list_history(self, start_history_id: str, max_pages: int = 5) -> Optional[Dict[str, Any]]:
+        """Mailbox changes since a history id; None when Gmail no longer has that history"""
+        try:
+            records = []
+            page_token = None
+            history_id = start_history_id
+            
+            for _ in range(max_pages):
+                params = {'userId': 'me', 'startHistoryId': start_history_id, 'maxResults': 500}
+                if page_token:
+                    params['pageToken'] = page_token
+                
+                with trace_stage("gmail_history") as span:
+                    results = self._execute(self.service.users().history().list(**params), 'history')
+                    span.set_attribute("gmail.history_count", len(results.get('history', [])))
+                records.extend(results.get('history', []))
+                history_id = results.get('historyId', history_id)
+                
+                page_token = results.get('nextPageToken')
+                if not page_token:
+                    break
+            
+            return {
+                'history': records,
+                'history_id': history_id,
+                # More changes than max_pages can hold; the caller should reload instead
+                'truncated': bool(page_token)
+            }
+        
+        except HttpError as error:
+            if error.resp.status == 404:
+                # startHistoryId is older than the history Gmail keeps (about a week)
+                return None
+            logger.error(f"Gmail API error: {error}")
+            raise Exception(f"Failed to list history: {str(error)}")
+    
+    def batch_modify(self, message_ids: List[str], add_label_ids: Optional[List[str]] = None,
+                     remove_label_ids: Optional[List[str]] = None) -> int:
+        """Add/remove labels on up to BATCH_SIZE messages in a single call"""
+        if not message_ids:
+            return 0
+        
+        try:
+            body = {'ids': message_ids[:self.BATCH_SIZE]}
+            if add_label_ids:
+                body['addLabelIds'] = add_label_ids
+            if remove_label_ids:
+                body['removeLabelIds'] = remove_label_ids
+            
+            with trace_stage("gmail_batch_modify", **{"gmail.message_count": len(body['ids'])}):
+                self._execute(self.service.users().messages().batchModify(
+                    userId='me',
+                    body=body
+                ), 'batch_modify')
+            
+            logger.info(f"Modified {len(body['ids'])} emails")
+            return len(body['ids'])
+        
+        except HttpError as error:
+            logger.error(f"Failed to batch modify emails: {error}")
+            raise Exception(f"Failed to modify emails: {str(error)}")
+    
     def search_emails(self, query: str, max_results: int = 10) -> List[Dict[str, Any]]:
         """Search emails with custom query"""
         return self.list_emails(max_results=max_results, query=query)
     
+    def _get_header(self, headers: List[Dict[str, str]], name: str, default: str = '') -> str:
+        """Return the value of a header by case-insensitive name"""
+        return next((h['value'] for h in headers if h['name'].lower() == name), default)
+    
+    def _parse_metadata_message(self, message: Dict[str, Any]) -> Dict[str, Any]:
+        """Convert a metadata-format message into an email dict without body"""
+        headers = message.get('payload', {}).get('headers', [])
+        sender_name, sender_email = self._parse_sender(self._get_header(headers, 'from', 'Unknown'))
+        
+        return {
+            'id': message['id'],
+            'sender_name': sender_name,
+            'sender_email': sender_email,
+            'subject': self._get_header(headers, 'subject', 'No Subject'),
+            'snippet': message.get('snippet', ''),
+            'date': self._get_header(headers, 'date', ''),
+            'thread_id': message.get('threadId', ''),
+            'message_id_header': self._get_header(headers, 'message-id', '')
+        }
+    
     def _parse_sender(self, sender: str) -> tuple:
         """Parse sender string to extract name and email"""
-        if '<' in sender and '>' in sender:
-            # Format: "Name <email@example.com>"
-            name = sender.split('<')[0].strip().strip('"')
-            email = sender.split('<')[1].split('>')[0].strip()
-        else:
-            # Format: "email@example.com"
-            name = sender.split('@')[0]
-            email = sender
+        return parse_sender(sender)
+    
+    def _get_attachments(self, payload: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Metadata of every attachment in the MIME tree; bytes are fetched separately"""
+        attachments = []
+        for part in payload.get('parts', []):
+            attachment_id = part.get('body', {}).get('attachmentId')
+            if part.get('filename') and attachment_id:
+                attachments.append({
+                    'attachment_id': attachment_id,
+                    'part_id': part.get('partId', ''),
+                    'filename': part['filename'],
+                    'mime_type': part.get('mimeType', 'application/octet-stream'),
+                    'size': part.get('body', {}).get('size', 0)
+                })
+            attachments.extend(self._get_attachments(part))
+        return attachments
+    
+    def stream_attachment(self, message_id: str, attachment_id: str,
+                          chunk_size: Optional[int] = None) -> Iterator[bytes]:
+        """Iterator over an attachment's bytes as they arrive from Gmail, without buffering the file.
+        
+        The request is made before this returns, so a missing attachment raises
+        FileNotFoundError here. The iterator keeps no span open: Starlette
+        advances it from worker threads, each in a different context.
+        """
+        base_url = settings.GMAIL_API_ENDPOINT or "https://gmail.googleapis.com/"
+        url = f"{base_url}gmail/v1/users/me/messages/{message_id}/attachments/{attachment_id}"
+        if self.credentials.expired and self.credentials.refresh_token:
+            self.credentials.refresh(auth_request())
         
-        return name, email
+        with trace_stage("gmail_get_attachment"):
+            stream, response = self._open_attachment(url)
+            if response.status_code == 401 and self.credentials.refresh_token:
+                # Expired without a known expiry: refresh once, as the API client does
+                stream.close()
+                self.credentials.refresh(auth_request())
+                stream, response = self._open_attachment(url)
+            if response.status_code >= 400:
+                stream.close()
+                if response.status_code in (400, 404):
+                    raise FileNotFoundError(f"Attachment {attachment_id} not found")
+                raise Exception(f"Failed to fetch attachment: HTTP {response.status_code}")
+        
+        return self._attachment_chunks(stream, response, chunk_size or settings.ATTACHMENT_CHUNK_SIZE)
+    
+    def _open_attachment(self, url: str) -> Tuple[ExitStack, Any]:
+        """Start the download; the ExitStack closes the response"""
+        stream = ExitStack()
+        response = stream.enter_context(google_http.stream(
+            "GET", url,
+            params={"fields": "data"},
+            headers={"Authorization": f"Bearer {self.credentials.token}"},
+            timeout=settings.ATTACHMENT_TIMEOUT_SECONDS
+        ))
+        return stream, response
+    
+    @staticmethod
+    def _attachment_chunks(stream: ExitStack, response, chunk_size: int) -> Iterator[bytes]:
+        from app.services.attachments import Base64FieldDecoder
+        
+        decoder = Base64FieldDecoder()
+        with stream:
+            for chunk in response.iter_bytes(chunk_size):
+                data = decoder.feed(chunk)
+                if data:
+                    yield data
+            data = decoder.finish()
+            if data:
+                yield data
     
     def _get_email_body(self, payload: Dict[str, Any]) -> str:
         """Extract email body from payload"""
         if 'parts' in payload:
-            parts = payload['parts']
+            # Attachments (parts with a filename) are not the body
+            parts = [part for part in payload['parts'] if not part.get('filename')]
             for part in parts:
                 if part['mimeType'] == 'text/plain':
                     data = part['body'].get('data', '')
@@ -0,0 +1,45 @@
+from functools import lru_cache
+from typing import Dict, Any, Optional
+from app.core.http_transport import HttplibAdapter, google_http
+import orjson
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+@lru_cache(maxsize=None)
+def _discovery_text(api: str, version: str) -> Optional[str]:
+    """Discovery document bundled with googleapiclient, read from disk once per process"""
+    from googleapiclient import discovery_cache
+
+    return discovery_cache.get_static_doc(api, version)
+
+
+def discovery_document(api: str, version: str) -> Optional[Dict[str, Any]]:
+    """A fresh parse of the cached discovery document.
+
+    build_from_document mutates the document it is given, so clients never
+    share one; parsing the cached text is cheaper than a deep copy.
+    """
+    document = _discovery_text(api, version)
+    return orjson.loads(document) if document else None
+
+
+def authorized_http(credentials):
+    """Credentials-aware http for googleapiclient over the shared connection pool"""
+    from google_auth_httplib2 import AuthorizedHttp
+
+    return AuthorizedHttp(credentials, http=HttplibAdapter(google_http))
+
+
+def build_service(api: str, version: str, credentials, client_options: Optional[Dict[str, Any]] = None):
+    """Build a Google API client without re-reading the discovery document on every request"""
+    from googleapiclient.discovery import build, build_from_document
+
+    # Token refreshes go through the same pool as the API calls
+    http = authorized_http(credentials)
+    document = discovery_document(api, version)
+    if document is None:
+        # Not bundled with this googleapiclient version: let build() fetch it
+        return build(api, version, http=http, client_options=client_options)
+    return build_from_document(document, http=http, client_options=client_options)
@@ -0,0 +1,62 @@
+from typing import List, Dict, Any, Iterable, Optional
+
+# Labels that take a message out of the inbox view even while it keeps INBOX
+HIDDEN_LABELS = {"TRASH", "SPAM"}
+
+
+def _in_inbox(labels: Iterable[str]) -> bool:
+    labels = set(labels)
+    return "INBOX" in labels and not labels & HIDDEN_LABELS
+
+
+def latest_history_id(emails: List[Dict[str, Any]]) -> Optional[str]:
+    """History id to poll from after listing these emails: every later change is newer than it"""
+    history_ids = [int(email['history_id']) for email in emails if email.get('history_id')]
+    return str(max(history_ids)) if history_ids else None
+
+
+def compute_delta(history: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Net inbox changes from Gmail history records, oldest first.
+
+    A message that appeared and disappeared within the window is dropped;
+    one that (re-)entered the inbox is reported as added, so clients can
+    treat added as an upsert. Returns added ids (newest first), removed
+    ids and {id: label_ids} of messages that stayed in the inbox.
+    """
+    states: Dict[str, Dict[str, Any]] = {}
+
+    def state(message: Dict[str, Any]) -> Dict[str, Any]:
+        entry = states.pop(message['id'], None) or {'new': False, 'entered': False, 'deleted': False, 'labels': None}
+        # Re-inserted so iteration order follows the latest change
+        states[message['id']] = entry
+        if 'labelIds' in message:
+            entry['labels'] = message['labelIds']
+        return entry
+
+    for record in history:
+        for item in record.get('messagesAdded', []):
+            state(item['message'])['new'] = True
+        for item in record.get('messagesDeleted', []):
+            state(item['message'])['deleted'] = True
+        for item in record.get('labelsAdded', []):
+            entry = state(item['message'])
+            if 'INBOX' in item.get('labelIds', []):
+                entry['entered'] = True
+        for item in record.get('labelsRemoved', []):
+            entry = state(item['message'])
+            if set(item.get('labelIds', [])) & HIDDEN_LABELS:
+                entry['entered'] = True
+
+    added, removed, changed = [], [], {}
+    for message_id, entry in states.items():
+        labels = entry['labels'] or []
+        if entry['deleted'] or not _in_inbox(labels):
+            if not entry['new']:
+                removed.append(message_id)
+        elif entry['new'] or entry['entered']:
+            added.append(message_id)
+        else:
+            changed[message_id] = labels
+
+    added.reverse()
+    return {'added': added, 'removed': removed, 'changed': changed}
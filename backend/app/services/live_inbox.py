@@ -0,0 +1,313 @@
+from typing import Dict, Any, Optional, Set, List
+from app.core.config import settings
+from app.core.metrics import LIVE_CONNECTIONS, LIVE_EVENTS
+from app.core.responses import dumps
+from app.core.state import StateBackend, state, state_lock
+from app.core.tracing import hash_user
+from app.models.message import project_emails
+from app.services.gmail_service import GmailService
+from app.services.ai_service import AIService
+from app.services.semantic_index import semantic_index
+from app.services.priority import priority_ranker
+from app.services.contacts import contact_index
+from app.services.inbox_delta import compute_delta
+import asyncio
+import json
+import time
+import uuid
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class LiveConnection:
+    """Outgoing event queue of one WebSocket.
+
+    The queue is bounded: a client that cannot keep up loses its backlog and
+    gets a single resync event instead, so a slow reader never holds memory
+    or blocks the publishers.
+    """
+
+    def __init__(self, max_queue: int):
+        self.queue: asyncio.Queue = asyncio.Queue(max_queue)
+        self.dropped = 0
+
+    def offer(self, event_type: str, data: str) -> None:
+        try:
+            self.queue.put_nowait((event_type, data))
+            return
+        except asyncio.QueueFull:
+            pass
+
+        while not self.queue.empty():
+            dropped_type, _ = self.queue.get_nowait()
+            if dropped_type != "resync":
+                self.dropped += 1
+                LIVE_EVENTS.inc(type=dropped_type, result="dropped")
+        self.dropped += 1
+        LIVE_EVENTS.inc(type=event_type, result="dropped")
+        self.queue.put_nowait(("resync", dumps({"type": "resync", "dropped": self.dropped}).decode("utf-8")))
+
+
+class LiveInbox:
+    """Per-user live event channel: new mail, summaries, categories and job progress.
+
+    Each event is serialized once and fanned out to every connection of the
+    user. One watcher task per connected user (not per connection) polls the
+    Gmail history and turns it into events. publish() is safe to call from
+    worker threads; connections and watchers live on the event loop.
+
+    With several worker processes, each one holding connections of a user
+    registers itself in the shared state backend. publish() pushes the event
+    onto the queue of every other registered worker, whose relay task hands
+    it to its connections, so job progress and reply status reach the user
+    whichever process produced them. Only the worker holding the user's
+    watcher lease polls Gmail.
+    """
+
+    def __init__(self, poll_seconds: Optional[float] = None, queue_size: Optional[int] = None,
+                 backend: Optional[StateBackend] = None):
+        self.poll_seconds = poll_seconds
+        self.queue_size = queue_size
+        self.state = backend or state
+        self.worker_id = uuid.uuid4().hex
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self._connections: Dict[str, Set[LiveConnection]] = {}
+        self._tokens: Dict[str, Dict[str, str]] = {}
+        self._watchers: Dict[str, asyncio.Task] = {}
+        self._relay: Optional[asyncio.Task] = None
+
+    def connect(self, user_key: str, access_token: str, refresh_token: str) -> LiveConnection:
+        """Register a connection; starts the user's watcher if it is the first one"""
+        self.loop = asyncio.get_running_loop()
+        connection = LiveConnection(self.queue_size or settings.LIVE_QUEUE_SIZE)
+        self._connections.setdefault(user_key, set()).add(connection)
+        # The newest connection's tokens are the freshest
+        self._tokens[user_key] = {"access_token": access_token, "refresh_token": refresh_token}
+        if user_key not in self._watchers:
+            self._watchers[user_key] = self.loop.create_task(self._watch(user_key))
+        if self._relay is None or self._relay.done():
+            self._relay = self.loop.create_task(self._relay_events())
+        LIVE_CONNECTIONS.inc()
+        return connection
+
+    def disconnect(self, user_key: str, connection: LiveConnection) -> None:
+        connections = self._connections.get(user_key)
+        if connections is None or connection not in connections:
+            return
+        connections.discard(connection)
+        LIVE_CONNECTIONS.dec()
+        if not connections:
+            del self._connections[user_key]
+            self._tokens.pop(user_key, None)
+            watcher = self._watchers.pop(user_key, None)
+            if watcher:
+                watcher.cancel()
+            self.loop.run_in_executor(None, self._unregister, user_key)
+        # Nothing left to relay to until the next connection starts it again
+        if not self._connections and self._relay is not None:
+            self._relay.cancel()
+            self._relay = None
+
+    def connection_count(self, user_key: str) -> int:
+        return len(self._connections.get(user_key, ()))
+
+    def _workers_key(self, user_key: str) -> str:
+        return f"live:workers:{user_key}"
+
+    def _presence_ttl(self) -> float:
+        # Registrations and the watcher lease outlive a few missed polls, not a dead worker
+        return 3 * (self.poll_seconds or settings.LIVE_POLL_SECONDS)
+
+    def _register(self, user_key: str) -> None:
+        """Announce that this process holds connections of the user, renewed by each watcher tick"""
+        ttl = self._presence_ttl()
+        with state_lock(self.state, f"{self._workers_key(user_key)}:lock"):
+            workers = self.state.get_json(self._workers_key(user_key)) or {}
+            now = time.time()
+            workers = {worker: expires for worker, expires in workers.items() if expires > now}
+            workers[self.worker_id] = now + ttl
+            self.state.set_json(self._workers_key(user_key), workers, ttl=ttl)
+
+    def _unregister(self, user_key: str) -> None:
+        if self.connection_count(user_key):
+            return
+        with state_lock(self.state, f"{self._workers_key(user_key)}:lock"):
+            workers = self.state.get_json(self._workers_key(user_key)) or {}
+            if workers.pop(self.worker_id, None) is not None:
+                self.state.set_json(self._workers_key(user_key), workers, ttl=self._presence_ttl())
+        # Let another worker with connections take over the Gmail polling at once
+        if self.state.get(f"live:watcher:{user_key}") == self.worker_id:
+            self.state.delete(f"live:watcher:{user_key}")
+
+    def publish(self, user_key: str, event: Dict[str, Any]) -> None:
+        """Send an event to every open connection of the user, in this and other worker processes"""
+        data = dumps(event).decode("utf-8")
+        workers = self.state.get_json(self._workers_key(user_key)) or {}
+        now = time.time()
+        for worker, expires in workers.items():
+            if worker != self.worker_id and expires > now:
+                self.state.push(f"live:events:{worker}", json.dumps([user_key, event["type"], data]))
+        self._deliver(user_key, event["type"], data)
+
+    def _deliver(self, user_key: str, event_type: str, data: str) -> None:
+        if user_key not in self._connections or self.loop is None:
+            return
+        try:
+            on_loop = asyncio.get_running_loop() is self.loop
+        except RuntimeError:
+            on_loop = False
+        if on_loop:
+            self._fan_out(user_key, event_type, data)
+        elif not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(self._fan_out, user_key, event_type, data)
+
+    def _fan_out(self, user_key: str, event_type: str, data: str) -> None:
+        for connection in self._connections.get(user_key, ()):
+            connection.offer(event_type, data)
+
+    async def serve(self, websocket, user_key: str, access_token: str, refresh_token: str) -> None:
+        """Pump events to an accepted WebSocket until either side goes away"""
+        connection = self.connect(user_key, access_token, refresh_token)
+        sender = asyncio.create_task(self._send_events(websocket, connection))
+        receiver = asyncio.create_task(self._receive_until_closed(websocket))
+        try:
+            done, _ = await asyncio.wait({sender, receiver}, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                # A send to a client that already left fails; that is just the end of the stream
+                if not task.cancelled() and task.exception():
+                    logger.debug(f"Live connection ended: {task.exception()}")
+        finally:
+            sender.cancel()
+            receiver.cancel()
+            self.disconnect(user_key, connection)
+
+    async def _send_events(self, websocket, connection: LiveConnection) -> None:
+        while True:
+            try:
+                async with asyncio.timeout(settings.LIVE_HEARTBEAT_SECONDS):
+                    event_type, data = await connection.queue.get()
+            except TimeoutError:
+                # Keeps idle connections open through proxies
+                event_type, data = "ping", '{"type":"ping"}'
+            if event_type == "resync":
+                connection.dropped = 0
+            try:
+                # Waits while the socket's write buffer is full: the backpressure point
+                async with asyncio.timeout(settings.LIVE_SEND_TIMEOUT_SECONDS):
+                    await websocket.send_text(data)
+            except TimeoutError:
+                logger.info("Closing live connection that stopped reading")
+                return
+            LIVE_EVENTS.inc(type=event_type, result="sent")
+
+    async def _receive_until_closed(self, websocket) -> None:
+        # Clients only send pings; anything received just proves the connection is alive
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                return
+
+    def _drain(self, limit: int = 500) -> List[List[str]]:
+        """Events other workers queued for this one, oldest first"""
+        events = []
+        while len(events) < limit:
+            raw = self.state.pop(f"live:events:{self.worker_id}")
+            if raw is None:
+                break
+            events.append(json.loads(raw))
+        return events
+
+    async def _relay_events(self) -> None:
+        """Hand events published by other workers to this worker's connections"""
+        while self._connections:
+            try:
+                for user_key, event_type, data in await asyncio.to_thread(self._drain):
+                    self._fan_out(user_key, event_type, data)
+            except Exception as e:
+                logger.warning(f"Live event relay failed: {e}")
+            await asyncio.sleep(settings.LIVE_RELAY_SECONDS)
+
+    async def _watch(self, user_key: str) -> None:
+        """Turn the user's Gmail history into events while they have a connection open"""
+        while True:
+            tokens = self._tokens.get(user_key)
+            if tokens is None:
+                return
+            try:
+                await asyncio.to_thread(self._watch_tick, user_key, tokens)
+            except Exception as e:
+                logger.warning(f"Live inbox check failed for {hash_user(user_key)}: {e}")
+            await asyncio.sleep(self.poll_seconds or settings.LIVE_POLL_SECONDS)
+
+    def _watch_tick(self, user_key: str, tokens: Dict[str, str]) -> None:
+        """Renew this worker's registration and, when it holds the watcher lease, check the mailbox"""
+        self._register(user_key)
+        ttl = self._presence_ttl()
+        lease = f"live:watcher:{user_key}"
+        if not self.state.add(lease, self.worker_id, ttl=ttl):
+            if self.state.get(lease) != self.worker_id:
+                # Another worker polls Gmail for this user and publishes to everyone
+                return
+            self.state.set(lease, self.worker_id, ttl=ttl)
+        history_key = f"live:history:{user_key}"
+        history_id = self.check_mailbox(user_key, tokens, self.state.get(history_key))
+        self.state.set(history_key, history_id, ttl=ttl)
+
+    def check_mailbox(self, user_key: str, tokens: Dict[str, str], history_id: Optional[str]) -> str:
+        """Publish what changed since history_id and return the id to continue from"""
+        gmail = GmailService(access_token=tokens["access_token"], refresh_token=tokens["refresh_token"])
+        if history_id is None:
+            return gmail.get_history_id()
+
+        history = gmail.list_history(history_id)
+        if history is None or history['truncated']:
+            self.publish(user_key, {"type": "resync", "dropped": 0})
+            return gmail.get_history_id()
+
+        delta = compute_delta(history['history'])
+        if len(delta['added']) > settings.LIVE_MAX_ADDED:
+            # Same cut-off as /emails/delta: reloading beats fetching and summarizing this many
+            self.publish(user_key, {"type": "resync", "dropped": 0})
+            return history['history_id']
+        for message_id in delta['removed']:
+            self.publish(user_key, {"type": "message.removed", "id": message_id})
+        for message_id, labels in delta['changed'].items():
+            self.publish(user_key, {"type": "message.changed", "id": message_id, "label_ids": labels})
+        if delta['removed']:
+            semantic_index.remove(user_key, delta['removed'])
+            priority_ranker.remove(user_key, delta['removed'])
+
+        emails = [email for email in map(gmail.get_email_details, delta['added']) if email]
+        if emails:
+            semantic_index.add(user_key, emails)
+            priority_ranker.add(user_key, emails)
+            contact_index.add(user_key, emails)
+            self._publish_new_mail(user_key, emails, AIService())
+        return history['history_id']
+
+    def _publish_new_mail(self, user_key: str, emails: List[Dict[str, Any]], ai: AIService) -> None:
+        # Headers right away, then the AI results as each batch completes
+        for email in project_emails(emails):
+            self.publish(user_key, {"type": "message.added", "email": email})
+        for email, summary in zip(emails, ai.summarize_emails(emails)):
+            self.publish(user_key, {"type": "summary.completed", "id": email['id'], "summary": summary})
+        categories = ai.categorize_emails(emails, user_key)
+        categorized_ids = {email['id']: category for email, category in zip(emails, categories)}
+        priority_ranker.set_categories(user_key, categorized_ids)
+        contact_index.set_categories(user_key, categorized_ids)
+        for email, category in zip(emails, categories):
+            self.publish(user_key, {"type": "category.completed", "id": email['id'], "category": category})
+
+    async def stop(self) -> None:
+        watchers = list(self._watchers.values())
+        self._watchers.clear()
+        if self._relay is not None:
+            watchers.append(self._relay)
+            self._relay = None
+        for watcher in watchers:
+            watcher.cancel()
+        await asyncio.gather(*watchers, return_exceptions=True)
+
+
+live_inbox = LiveInbox()
@@ -0,0 +1,584 @@
+from typing import Dict, Any, Optional, List, Tuple, Callable, Awaitable
+from collections import deque
+from dataclasses import dataclass
+from app.core.config import settings
+from app.core.metrics import (
+    AI_REQUEST_LATENCY, AI_IN_FLIGHT, AI_TOKENS, AI_HEDGES, AI_FAILOVERS, AI_PROVIDER_HEALTHY,
+    AI_QUALITY
+)
+from app.core.tracing import tracer, SPAN_KIND_CLIENT
+from app.core.resilience import CircuitBreaker, CLOSED, DependencyUnavailable, DeadlineExceeded, remaining_seconds
+import asyncio
+import concurrent.futures
+import contextvars
+import json
+import math
+import random
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Completion:
+    """Text returned by a provider together with its token usage"""
+    text: str
+    input_tokens: int = 0
+    output_tokens: int = 0
+    provider: str = ""
+    model: str = ""
+    tier: str = ""
+
+
+# Model tiers: "small" for short structured tasks, "large" for long-form writing
+TIERS = ("small", "large")
+
+
+class LLMProvider:
+    """Uniform async completion interface implemented by every provider"""
+
+    name = ""
+
+    def __init__(self, api_key: Optional[str], base_url: Optional[str] = None):
+        self.api_key = api_key
+        self.base_url = base_url
+        self._client = None
+
+    @property
+    def available(self) -> bool:
+        return bool(self.api_key)
+
+    @property
+    def tier_models(self) -> Dict[str, str]:
+        return {}
+
+    @property
+    def default_model(self) -> str:
+        return self.tier_models.get("large", "")
+
+    def model_for(self, tier: str, model: Optional[str] = None) -> str:
+        """Resolve an explicit model, a tier name or the tier default to a model id"""
+        if model and model not in TIERS:
+            return model
+        return self.tier_models.get(model or tier) or self.default_model
+
+    def client(self):
+        """SDK client, created (and its SDK imported) on first use or during warm-up"""
+        raise NotImplementedError
+
+    async def complete(self, model: str, prompt: str, max_tokens: int,
+                       schema: Optional[Dict[str, Any]] = None) -> Completion:
+        """Complete a prompt; with a {"name", "schema"} output schema the text is a JSON document"""
+        raise NotImplementedError
+
+
+def json_schema_instruction(schema: Dict[str, Any]) -> str:
+    """System prompt asking for a JSON object that matches an output schema"""
+    return f"Respond only with a JSON object matching this JSON schema:\n{json.dumps(schema['schema'])}"
+
+
+class AnthropicProvider(LLMProvider):
+    """Anthropic Messages API"""
+
+    name = "anthropic"
+
+    @property
+    def tier_models(self) -> Dict[str, str]:
+        return {"small": settings.ANTHROPIC_SMALL_MODEL, "large": settings.ANTHROPIC_LARGE_MODEL}
+
+    def client(self):
+        if self._client is None:
+            from anthropic import AsyncAnthropic
+            self._client = AsyncAnthropic(
+                api_key=self.api_key,
+                base_url=self.base_url,
+                timeout=settings.AI_REQUEST_TIMEOUT_SECONDS,
+                max_retries=settings.AI_MAX_RETRIES
+            )
+        return self._client
+
+    async def complete(self, model: str, prompt: str, max_tokens: int,
+                       schema: Optional[Dict[str, Any]] = None) -> Completion:
+
+        messages = [{"role": "user", "content": prompt}]
+        kwargs = {}
+        if schema:
+            # The schema goes in the system prompt and a prefilled "{" forces a bare JSON object
+            kwargs["system"] = json_schema_instruction(schema)
+            messages.append({"role": "assistant", "content": "{"})
+
+        response = await self.client().messages.create(
+            model=model,
+            max_tokens=max_tokens,
+            messages=messages,
+            **kwargs
+        )
+
+        text = response.content[0].text
+        if schema:
+            text = "{" + text
+
+        return Completion(
+            text=text,
+            input_tokens=response.usage.input_tokens,
+            output_tokens=response.usage.output_tokens,
+            provider=self.name,
+            model=model
+        )
+
+
+class OpenAIProvider(LLMProvider):
+    """OpenAI Chat Completions API"""
+
+    name = "openai"
+
+    @property
+    def tier_models(self) -> Dict[str, str]:
+        return {"small": settings.OPENAI_SMALL_MODEL, "large": settings.OPENAI_LARGE_MODEL}
+
+    def client(self):
+        if self._client is None:
+            from openai import AsyncOpenAI
+            self._client = AsyncOpenAI(
+                api_key=self.api_key,
+                base_url=self.base_url,
+                timeout=settings.AI_REQUEST_TIMEOUT_SECONDS,
+                max_retries=settings.AI_MAX_RETRIES
+            )
+        return self._client
+
+    async def complete(self, model: str, prompt: str, max_tokens: int,
+                       schema: Optional[Dict[str, Any]] = None) -> Completion:
+
+        messages = [{"role": "user", "content": prompt}]
+        kwargs = {}
+        if schema:
+            # JSON mode works on every chat model; the schema travels in the system message
+            kwargs["response_format"] = {"type": "json_object"}
+            messages.insert(0, {"role": "system", "content": json_schema_instruction(schema)})
+
+        response = await self.client().chat.completions.create(
+            model=model,
+            max_tokens=max_tokens,
+            messages=messages,
+            **kwargs
+        )
+        return Completion(
+            text=response.choices[0].message.content,
+            input_tokens=response.usage.prompt_tokens,
+            output_tokens=response.usage.completion_tokens,
+            provider=self.name,
+            model=model
+        )
+
+
+class ProviderRegistry:
+    """Named provider factories; instances (and their HTTP pools) are shared across requests"""
+
+    def __init__(self):
+        self._factories: Dict[str, Callable[[], LLMProvider]] = {}
+        self._instances: Dict[str, LLMProvider] = {}
+        self._lock = threading.Lock()
+
+    def register(self, name: str, factory: Callable[[], LLMProvider]) -> None:
+        self._factories[name] = factory
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._factories
+
+    def names(self) -> List[str]:
+        return list(self._factories)
+
+    def get(self, name: str) -> LLMProvider:
+        """Return the shared instance, rebuilt if its key or endpoint settings changed"""
+        if name not in self._factories:
+            raise ValueError(f"Invalid AI provider: {name}")
+
+        fresh = self._factories[name]()
+        with self._lock:
+            cached = self._instances.get(name)
+            if cached and (cached.api_key, cached.base_url) == (fresh.api_key, fresh.base_url):
+                return cached
+            self._instances[name] = fresh
+            return fresh
+
+
+provider_registry = ProviderRegistry()
+provider_registry.register(
+    "anthropic", lambda: AnthropicProvider(settings.ANTHROPIC_API_KEY, settings.ANTHROPIC_BASE_URL)
+)
+provider_registry.register(
+    "openai", lambda: OpenAIProvider(settings.OPENAI_API_KEY, settings.OPENAI_BASE_URL)
+)
+
+
+class HealthTracker:
+    """Rolling latency window and a circuit breaker per (provider, model)"""
+
+    def __init__(self, window: int = 200, failure_threshold: int = 3, cooldown_seconds: float = 30.0):
+        self.window = window
+        self.failure_threshold = failure_threshold
+        self.cooldown_seconds = cooldown_seconds
+        self._latencies: Dict[Tuple[str, str], deque] = {}
+        self._breakers: Dict[Tuple[str, str], CircuitBreaker] = {}
+        self._lock = threading.Lock()
+
+    def breaker(self, target: Tuple[str, str]) -> CircuitBreaker:
+        with self._lock:
+            breaker = self._breakers.get(target)
+            if breaker is None:
+                breaker = self._breakers[target] = CircuitBreaker(
+                    f"{target[0]}:{target[1]}", self.failure_threshold, self.cooldown_seconds
+                )
+            return breaker
+
+    def record_success(self, target: Tuple[str, str], latency: float) -> None:
+        with self._lock:
+            self._latencies.setdefault(target, deque(maxlen=self.window)).append(latency)
+        self.breaker(target).record_success()
+        AI_PROVIDER_HEALTHY.set(1, provider=target[0], model=target[1])
+
+    def record_failure(self, target: Tuple[str, str]) -> None:
+        breaker = self.breaker(target)
+        breaker.record_failure()
+        if breaker.state != CLOSED:
+            # Tripped: skipped until the cooldown expires, then one request probes it
+            AI_PROVIDER_HEALTHY.set(0, provider=target[0], model=target[1])
+
+    def is_healthy(self, target: Tuple[str, str]) -> bool:
+        return self.breaker(target).available()
+
+    def allow(self, target: Tuple[str, str]) -> bool:
+        """Admit a request to the target (claims the probe while it is half-open)"""
+        return self.breaker(target).allow()
+
+    def reset(self) -> None:
+        with self._lock:
+            breakers = list(self._breakers.values())
+        for breaker in breakers:
+            breaker.reset()
+
+    def percentile(self, target: Tuple[str, str], pct: float, min_samples: int = 20) -> Optional[float]:
+        """Latency percentile in seconds, or None until enough samples exist"""
+        with self._lock:
+            samples = sorted(self._latencies.get(target, ()))
+        if len(samples) < min_samples:
+            return None
+        return samples[max(0, math.ceil(pct / 100 * len(samples)) - 1)]
+
+
+def parse_routes(spec: str) -> Dict[str, List[Tuple[str, Optional[str]]]]:
+    """Parse 'categorize=openai:gpt-4o-mini|anthropic;default=anthropic' into ordered targets"""
+    routes = {}
+    for entry in filter(None, (part.strip() for part in spec.split(";"))):
+        operation, _, targets = entry.partition("=")
+        parsed = []
+        for target in filter(None, (t.strip() for t in targets.split("|"))):
+            provider, _, model = target.partition(":")
+            parsed.append((provider.strip(), model.strip() or None))
+        routes[operation.strip()] = parsed
+    return routes
+
+
+# Tier used per operation unless AI_OPERATION_TIERS overrides it; "auto" lets the selector decide
+OPERATION_TIERS = {
+    "categorize": "auto",
+    "parse_intent": "auto",
+    "summarize": "auto",
+    "summarize_thread": "auto",
+    "summarize_conversation": "small",
+    "daily_digest": "large",
+    "generate_reply": "large",
+}
+
+
+def parse_operation_tiers(spec: str) -> Dict[str, str]:
+    """Parse 'summarize=large;categorize=small' into a mapping"""
+    tiers = {}
+    for entry in filter(None, (part.strip() for part in spec.split(";"))):
+        operation, _, tier = entry.partition("=")
+        tiers[operation.strip()] = tier.strip()
+    return tiers
+
+
+class TierSelector:
+    """Picks a model tier per operation from configuration and observed latency/quality"""
+
+    def __init__(self, window: int = 200, min_samples: int = 20):
+        self.window = window
+        self.min_samples = min_samples
+        self._latencies: Dict[Tuple[str, str], deque] = {}
+        self._quality: Dict[Tuple[str, str], deque] = {}
+        self._tokens: Dict[Tuple[str, str], List[int]] = {}
+        self._lock = threading.Lock()
+
+    def configured_tier(self, operation: str) -> str:
+        overrides = parse_operation_tiers(settings.AI_OPERATION_TIERS)
+        return overrides.get(operation) or OPERATION_TIERS.get(operation, "large")
+
+    def failure_rate(self, operation: str, tier: str) -> Optional[float]:
+        with self._lock:
+            samples = list(self._quality.get((operation, tier), ()))
+        if len(samples) < self.min_samples:
+            return None
+        return samples.count(False) / len(samples)
+
+    def p95(self, operation: str, tier: str) -> Optional[float]:
+        with self._lock:
+            samples = sorted(self._latencies.get((operation, tier), ()))
+        if len(samples) < self.min_samples:
+            return None
+        return samples[max(0, math.ceil(0.95 * len(samples)) - 1)]
+
+    def tier_for(self, operation: str) -> str:
+        """Small tier unless its observed quality or latency says the large one is better"""
+        tier = self.configured_tier(operation)
+        if tier != "auto":
+            return tier
+
+        failure_rate = self.failure_rate(operation, "small")
+        small_p95, large_p95 = self.p95(operation, "small"), self.p95(operation, "large")
+        small_worse = (
+            (failure_rate is not None and failure_rate > settings.AI_TIER_MAX_FAILURE_RATE) or
+            (small_p95 is not None and large_p95 is not None and small_p95 > large_p95)
+        )
+
+        # Keep probing the small tier so it can win back the operation
+        if small_worse and random.random() >= settings.AI_TIER_PROBE_RATE:
+            return "large"
+        return "small"
+
+    def record_latency(self, operation: str, tier: str, latency: float,
+                       input_tokens: int, output_tokens: int) -> None:
+        key = (operation, tier)
+        with self._lock:
+            self._latencies.setdefault(key, deque(maxlen=self.window)).append(latency)
+            totals = self._tokens.setdefault(key, [0, 0, 0])
+            totals[0] += input_tokens
+            totals[1] += output_tokens
+            totals[2] += 1
+
+    def record_quality(self, operation: str, tier: str, ok: bool) -> None:
+        """Record whether a tier's output was usable (parsed, valid category, non-empty...)"""
+        with self._lock:
+            self._quality.setdefault((operation, tier), deque(maxlen=self.window)).append(ok)
+        AI_QUALITY.inc(operation=operation, tier=tier, result="ok" if ok else "failed")
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """Per operation/tier latency, token and quality statistics"""
+        with self._lock:
+            keys = set(self._latencies) | set(self._quality)
+            tokens = {key: list(value) for key, value in self._tokens.items()}
+
+        stats = {}
+        for operation, tier in sorted(keys):
+            input_tokens, output_tokens, calls = tokens.get((operation, tier), [0, 0, 0])
+            stats[f"{operation}/{tier}"] = {
+                "calls": calls,
+                "p95_seconds": self.p95(operation, tier),
+                "avg_input_tokens": input_tokens / calls if calls else 0,
+                "avg_output_tokens": output_tokens / calls if calls else 0,
+                "failure_rate": self.failure_rate(operation, tier),
+            }
+        return stats
+
+
+class LLMRouter:
+    """Per-operation provider selection with hedged requests and automatic failover"""
+
+    def __init__(self, registry: ProviderRegistry, health: Optional[HealthTracker] = None,
+                 selector: Optional[TierSelector] = None):
+        self.registry = registry
+        self.health = health or HealthTracker(
+            failure_threshold=settings.AI_FAILURE_THRESHOLD,
+            cooldown_seconds=settings.AI_UNHEALTHY_COOLDOWN_SECONDS
+        )
+        self.selector = selector or TierSelector()
+
+    def targets_for(self, operation: str, tier: str = "large") -> List[Tuple[str, str]]:
+        """Configured targets for an operation at a tier, healthy ones first"""
+        routes = parse_routes(settings.AI_OPERATION_ROUTES)
+        configured = routes.get(operation) or routes.get("default") or [(settings.AI_PROVIDER, None)]
+
+        if settings.AI_FALLBACK_PROVIDER and all(p != settings.AI_FALLBACK_PROVIDER for p, _ in configured):
+            configured = configured + [(settings.AI_FALLBACK_PROVIDER, None)]
+
+        targets = []
+        for index, (name, model) in enumerate(configured):
+            provider = self.registry.get(name)
+            # Keep the primary even without a key so the error surfaces as before
+            if index > 0 and not provider.available:
+                continue
+            target = (name, provider.model_for(tier, model))
+            if target not in targets:
+                targets.append(target)
+
+        return sorted(targets, key=lambda target: not self.health.is_healthy(target))
+
+    def hedge_delay(self, target: Tuple[str, str]) -> float:
+        """Seconds to wait on a target before firing the hedge: its observed p95"""
+        p95 = self.health.percentile(target, 95)
+        floor = settings.AI_HEDGE_MIN_DELAY_MS / 1000
+        if p95 is None:
+            return max(floor, settings.AI_HEDGE_DEFAULT_DELAY_MS / 1000)
+        return max(floor, p95)
+
+    async def _attempt(self, operation: str, tier: str, target: Tuple[str, str], prompt: str,
+                       max_tokens: int, schema: Optional[Dict[str, Any]] = None) -> Completion:
+        provider_name, model = target
+        if not self.health.allow(target):
+            # Another request is already probing this target; do not count this against it
+            raise self.health.breaker(target).unavailable()
+        labels = {"operation": operation, "provider": provider_name, "model": model, "tier": tier}
+        start = time.perf_counter()
+        outcome = "error"
+
+        try:
+            with tracer.start_span(
+                f"llm.{operation}",
+                kind=SPAN_KIND_CLIENT,
+                **{"gen_ai.system": provider_name, "gen_ai.request.model": model,
+                   "gen_ai.request.max_tokens": max_tokens}
+            ) as span, AI_IN_FLIGHT.track_inprogress(provider=provider_name):
+                completion = await self.registry.get(provider_name).complete(
+                    model, prompt, max_tokens, schema=schema
+                )
+                span.set_attribute("gen_ai.usage.input_tokens", completion.input_tokens)
+                span.set_attribute("gen_ai.usage.output_tokens", completion.output_tokens)
+
+            outcome = "success"
+            completion.tier = tier
+            latency = time.perf_counter() - start
+            self.health.record_success(target, latency)
+            self.selector.record_latency(operation, tier, latency, completion.input_tokens,
+                                         completion.output_tokens)
+            AI_TOKENS.inc(completion.input_tokens, direction="input", **labels)
+            AI_TOKENS.inc(completion.output_tokens, direction="output", **labels)
+            return completion
+
+        except asyncio.CancelledError:
+            # Lost a hedge race; says nothing about the target's health
+            outcome = "cancelled"
+            raise
+        except Exception:
+            self.health.record_failure(target)
+            raise
+        finally:
+            AI_REQUEST_LATENCY.observe(time.perf_counter() - start, outcome=outcome, **labels)
+
+    async def _race(self, operation: str, tier: str, primary: Tuple[str, str],
+                    hedge: Optional[Tuple[str, str]], prompt: str, max_tokens: int,
+                    schema: Optional[Dict[str, Any]] = None) -> Completion:
+        """Run the primary; start the hedge if the primary is slow or fails; first success wins"""
+        primary_task = asyncio.ensure_future(
+            self._attempt(operation, tier, primary, prompt, max_tokens, schema)
+        )
+        if hedge is None:
+            return await primary_task
+
+        done, _ = await asyncio.wait({primary_task}, timeout=self.hedge_delay(primary))
+        if done and not primary_task.exception():
+            return primary_task.result()
+
+        hedge_task = asyncio.ensure_future(
+            self._attempt(operation, tier, hedge, prompt, max_tokens, schema)
+        )
+        pending = {hedge_task} if done else {primary_task, hedge_task}
+        last_error: Optional[BaseException] = primary_task.exception() if done else None
+
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is hedge_task:
+                            AI_HEDGES.inc(operation=operation, result="won")
+                        return task.result()
+                    last_error = task.exception()
+            raise last_error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def complete(self, operation: str, prompt: str, max_tokens: int,
+                       schema: Optional[Dict[str, Any]] = None) -> Completion:
+        """Complete a prompt at the operation's tier, failing over through its targets.
+
+        Raises DependencyUnavailable at once when every target's circuit is
+        open, and DeadlineExceeded when the request deadline runs out first.
+        """
+        tier = self.selector.tier_for(operation)
+        targets = [target for target in self.targets_for(operation, tier) if self.health.is_healthy(target)]
+        if not targets:
+            raise DependencyUnavailable(f"Every LLM target for {operation} is failing")
+
+        timeout = asyncio.timeout(remaining_seconds())
+        try:
+            async with timeout:
+                return await self._failover(operation, tier, targets, prompt, max_tokens, schema)
+        except TimeoutError:
+            if timeout.expired():
+                raise DeadlineExceeded(f"LLM {operation} did not finish before the request deadline")
+            raise
+
+    async def _failover(self, operation: str, tier: str, targets: List[Tuple[str, str]], prompt: str,
+                        max_tokens: int, schema: Optional[Dict[str, Any]] = None) -> Completion:
+        last_error: Optional[BaseException] = None
+        index = 0
+
+        while index < len(targets):
+            primary = targets[index]
+            hedge = targets[index + 1] if settings.AI_HEDGE_ENABLED and index + 1 < len(targets) else None
+            if index > 0:
+                AI_FAILOVERS.inc(operation=operation, provider=primary[0])
+            try:
+                return await self._race(operation, tier, primary, hedge, prompt, max_tokens, schema)
+            except Exception as e:
+                logger.warning(f"LLM {operation} failed on {primary[0]}:{primary[1]}: {e}")
+                last_error = e
+                index += 2 if hedge else 1
+
+        raise last_error
+
+
+class _BackgroundLoop:
+    """Event loop thread hosting the async provider clients for sync callers"""
+
+    def __init__(self):
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._lock = threading.Lock()
+
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                threading.Thread(target=self._loop.run_forever, name="llm-loop", daemon=True).start()
+            return self._loop
+
+    def run(self, coro: Awaitable, timeout: Optional[float] = None):
+        """Run a coroutine on the loop, keeping the caller's context (trace spans)"""
+        loop = self._ensure_loop()
+        context = contextvars.copy_context()
+        future: concurrent.futures.Future = concurrent.futures.Future()
+
+        def start() -> None:
+            task = loop.create_task(coro, context=context)
+
+            def finish(t: asyncio.Task) -> None:
+                if t.cancelled():
+                    future.cancel()
+                elif t.exception() is not None:
+                    future.set_exception(t.exception())
+                else:
+                    future.set_result(t.result())
+
+            task.add_done_callback(finish)
+
+        loop.call_soon_threadsafe(start)
+        return future.result(timeout)
+
+
+background_loop = _BackgroundLoop()
+llm_router = LLMRouter(provider_registry)
@@ -0,0 +1,313 @@
+from typing import Dict, Any, Optional, List
+from datetime import datetime, timezone
+from googleapiclient.errors import HttpError
+from app.core.config import settings
+from app.core.metrics import OUTBOX_REPLIES, OUTBOX_DELIVERY_LATENCY
+from app.core.resilience import DependencyUnavailable, backoff_delay
+from app.core.security import encrypt_secret, decrypt_secret
+from app.core.state import StateBackend, state
+from app.core.tracing import hash_user
+from app.services.gmail_service import GmailService, TRANSIENT_STATUSES
+from app.services.live_inbox import live_inbox
+from app.services.contacts import contact_index
+import asyncio
+import time
+import uuid
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Item fields never shown to the client
+PRIVATE_FIELDS = ("access_token", "refresh_token", "body", "lease")
+
+FINAL_STATUSES = ("sent", "failed")
+
+
+def _retryable(error: Exception) -> bool:
+    """Whether a failed send certainly did not go out and may be tried again.
+
+    Gmail answered with a transient status, or the circuit stopped the call
+    before it was made. Timeouts and dropped connections are not retried:
+    the message may have been sent, and a retry would send it twice.
+    """
+    if isinstance(error, DependencyUnavailable):
+        return True
+    cause = error.__cause__ or error
+    return isinstance(cause, HttpError) and cause.resp.status in TRANSIENT_STATUSES
+
+
+class ReplyOutbox:
+    """Replies accepted by the API and sent to Gmail by a background worker.
+
+    Items live in the shared backend and their ids on a shared queue, so any
+    worker process can deliver them and answer status polls. Each reply
+    carries the thread id and Message-ID of the original, taken from what the
+    app already fetched; only a reply to a message this process never saw
+    fetches its headers, and then on the worker rather than the request.
+    Status changes are pushed to the user's live connections.
+
+    A worker leases each reply it takes off the queue. A reply whose lease
+    runs out, because the worker died, goes back on the queue; one that was
+    already being sent fails instead, since it may have gone out.
+    """
+
+    QUEUE = "outbox:queue"
+    LEASE_PREFIX = "outbox:lease:"
+    # Delivered and failed replies can be polled for this long
+    ITEM_TTL_SECONDS = 7 * 24 * 3600
+
+    def __init__(self, backend: Optional[StateBackend] = None):
+        self.state = backend or state
+        self._task: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wakeup: Optional[asyncio.Event] = None
+
+    def _save(self, item: Dict[str, Any]) -> None:
+        self.state.set_json(f"outbox:item:{item['outbox_id']}", item, ttl=self.ITEM_TTL_SECONDS)
+        live_inbox.publish(item["user"], {"type": "reply.status", "reply": self.public(item)})
+
+    def _load(self, outbox_id: str) -> Optional[Dict[str, Any]]:
+        return self.state.get_json(f"outbox:item:{outbox_id}")
+
+    @staticmethod
+    def public(item: Dict[str, Any]) -> Dict[str, Any]:
+        return {key: value for key, value in item.items() if key not in PRIVATE_FIELDS}
+
+    def enqueue(self, user_key: str, access_token: str, refresh_token: str, email_id: str, body: str,
+                original: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Persist a reply and queue it for sending; original holds the headers when they are known"""
+        original = original or {}
+        item = {
+            "outbox_id": uuid.uuid4().hex,
+            "user": user_key,
+            "email_id": email_id,
+            "to": original.get("sender_email") or None,
+            "subject": original.get("subject") or None,
+            "thread_id": original.get("thread_id") or None,
+            "message_id": original.get("message_id_header") or None,
+            # Encrypted at rest, like the body: the backend may be a shared file or Redis
+            "body": encrypt_secret(body),
+            "access_token": encrypt_secret(access_token),
+            "refresh_token": encrypt_secret(refresh_token),
+            "status": "queued",
+            "attempts": 0,
+            "error": None,
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "next_attempt_at": None,
+            "sent_at": None
+        }
+        self._save(item)
+        self.state.push(self.QUEUE, item["outbox_id"])
+        OUTBOX_REPLIES.inc(result="queued")
+        self._wake()
+        return item
+
+    def get(self, user_key: str, outbox_id: str) -> Optional[Dict[str, Any]]:
+        """Return a reply owned by the user, without its tokens and body"""
+        item = self._load(outbox_id)
+        if item and item["user"] == user_key:
+            return self.public(item)
+        return None
+
+    def _lease(self, outbox_id: str, token: str, now: float) -> None:
+        self.state.set_json(f"{self.LEASE_PREFIX}{outbox_id}",
+                            {"token": token, "expires_at": now + settings.OUTBOX_LEASE_SECONDS})
+
+    def _holds_lease(self, item: Dict[str, Any]) -> bool:
+        """False once the lease taken with the item ran out and was reclaimed"""
+        lease = self.state.get_json(f"{self.LEASE_PREFIX}{item['outbox_id']}")
+        return bool(lease) and lease["token"] == item.get("lease")
+
+    def _renew_lease(self, item: Dict[str, Any]) -> bool:
+        """Extend the lease taken with the item; False when it ran out and was reclaimed"""
+        if not self._holds_lease(item):
+            return False
+        self._lease(item["outbox_id"], item["lease"], time.time())
+        return True
+
+    def _release(self, outbox_id: str) -> None:
+        self.state.delete(f"{self.LEASE_PREFIX}{outbox_id}")
+
+    def deliver(self, item: Dict[str, Any]) -> Dict[str, Any]:
+        """Make one send attempt, recording the outcome and requeueing transient failures"""
+        if not self._renew_lease(item):
+            # Taken too long ago: it was requeued and another worker owns it now
+            return item
+        item["status"] = "sending"
+        item["attempts"] += 1
+        self._save(item)
+
+        try:
+            refresh_token = decrypt_secret(item["refresh_token"])
+            if not refresh_token:
+                raise ValueError("Stored credentials are unreadable")
+            gmail = GmailService(access_token=decrypt_secret(item["access_token"]), refresh_token=refresh_token)
+            if not item["to"]:
+                original = gmail.get_message_metadata(item["email_id"])
+                if not original:
+                    raise ValueError("Email not found")
+                item["to"] = original["sender_email"]
+                item["subject"] = original["subject"]
+                item["thread_id"] = original.get("thread_id") or None
+                item["message_id"] = original.get("message_id_header") or None
+
+            # The lookup may have taken a while: the send gets a whole lease
+            if not self._renew_lease(item):
+                return item
+            gmail.send_reply(
+                to_email=item["to"],
+                subject=item["subject"],
+                body=decrypt_secret(item["body"]),
+                thread_id=item["thread_id"],
+                message_id=item["message_id"]
+            )
+        except Exception as e:
+            if not self._holds_lease(item):
+                return self._lost_lease(item)
+            item["error"] = str(e)
+            if _retryable(e) and item["attempts"] < settings.OUTBOX_MAX_ATTEMPTS:
+                delay = max(1.0, backoff_delay(item["attempts"], settings.OUTBOX_RETRY_BASE_SECONDS,
+                                               settings.OUTBOX_RETRY_MAX_SECONDS))
+                item["status"] = "retrying"
+                item["next_attempt_at"] = time.time() + delay
+                self._save(item)
+                self._release(item["outbox_id"])
+                self.state.push(self.QUEUE, item["outbox_id"])
+                OUTBOX_REPLIES.inc(result="retried")
+                return item
+
+            logger.error(f"Reply {item['outbox_id']} for {hash_user(item['user'])} failed: {e}")
+            item["status"] = "failed"
+            OUTBOX_REPLIES.inc(result="failed")
+        else:
+            if not self._holds_lease(item):
+                return self._lost_lease(item)
+            sent_at = datetime.now(timezone.utc)
+            item["status"] = "sent"
+            item["error"] = None
+            item["sent_at"] = sent_at.isoformat()
+            OUTBOX_REPLIES.inc(result="sent")
+            contact_index.record_reply(item["user"], item["to"])
+            OUTBOX_DELIVERY_LATENCY.observe(
+                (sent_at - datetime.fromisoformat(item["created_at"])).total_seconds()
+            )
+
+        # Nothing left to send: the tokens and body are not kept around
+        item["access_token"] = item["refresh_token"] = item["body"] = None
+        item["next_attempt_at"] = None
+        self._save(item)
+        self._release(item["outbox_id"])
+        return item
+
+    def _lost_lease(self, item: Dict[str, Any]) -> Dict[str, Any]:
+        # The send outlived the lease and another worker already recorded the reply as
+        # interrupted; overwriting that would race it, so its verdict stands
+        logger.warning(f"Reply {item['outbox_id']} for {hash_user(item['user'])} finished after its lease ran out")
+        return self._load(item["outbox_id"]) or item
+
+    def _take_due(self, now: float) -> List[Dict[str, Any]]:
+        """Pop up to OUTBOX_BATCH_SIZE queued replies, putting back those waiting for a retry"""
+        due, waiting = [], []
+        for _ in range(settings.OUTBOX_BATCH_SIZE):
+            outbox_id = self.state.pop(self.QUEUE)
+            if outbox_id is None:
+                break
+            # Leased before anything else, so a worker dying from here on does not lose it
+            token = uuid.uuid4().hex
+            self._lease(outbox_id, token, now)
+            item = self._load(outbox_id)
+            if item is None or item["status"] in FINAL_STATUSES:
+                self._release(outbox_id)
+                continue
+            if item["next_attempt_at"] and item["next_attempt_at"] > now:
+                waiting.append(outbox_id)
+            else:
+                item["lease"] = token
+                due.append(item)
+        for outbox_id in waiting:
+            self._release(outbox_id)
+            self.state.push(self.QUEUE, outbox_id)
+        return due
+
+    def _reclaim_expired(self, now: float) -> None:
+        """Requeue replies whose worker stopped before finishing them"""
+        for key in self.state.keys(self.LEASE_PREFIX):
+            lease = self.state.get_json(key)
+            if not lease or lease["expires_at"] > now:
+                continue
+            outbox_id = key[len(self.LEASE_PREFIX):]
+            # Only one worker reclaims a given lease
+            if not self.state.add(f"outbox:reclaim:{outbox_id}:{lease['token']}", "1",
+                                  ttl=settings.OUTBOX_LEASE_SECONDS):
+                continue
+            self._release(outbox_id)
+            item = self._load(outbox_id)
+            if item is None or item["status"] in FINAL_STATUSES:
+                continue
+            if item["status"] == "sending":
+                # Like a timeout: it may have been sent, and a retry could send it twice
+                logger.error(f"Reply {outbox_id} for {hash_user(item['user'])} was interrupted while sending")
+                item["status"] = "failed"
+                item["error"] = "Delivery was interrupted; the reply may or may not have been sent"
+                item["access_token"] = item["refresh_token"] = item["body"] = None
+                item["next_attempt_at"] = None
+                self._save(item)
+                OUTBOX_REPLIES.inc(result="failed")
+            else:
+                self.state.push(self.QUEUE, outbox_id)
+                OUTBOX_REPLIES.inc(result="reclaimed")
+
+    async def process_due(self, now: Optional[float] = None) -> int:
+        """Send every reply whose attempt is due, a few at a time; returns how many were attempted"""
+        now = now or time.time()
+        self._reclaim_expired(now)
+        due = self._take_due(now)
+        semaphore = asyncio.Semaphore(settings.OUTBOX_CONCURRENCY)
+
+        async def send(item: Dict[str, Any]) -> None:
+            async with semaphore:
+                try:
+                    await asyncio.to_thread(self.deliver, item)
+                except Exception as e:
+                    logger.error(f"Outbox delivery of {item['outbox_id']} crashed: {e}")
+
+        await asyncio.gather(*(send(item) for item in due))
+        return len(due)
+
+    def _wake(self) -> None:
+        if self._loop is not None and self._wakeup is not None and not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    async def _loop_forever(self) -> None:
+        while True:
+            self._wakeup.clear()
+            try:
+                if await self.process_due():
+                    # More may be waiting behind a full batch
+                    continue
+            except Exception as e:
+                logger.error(f"Outbox tick failed: {e}")
+            try:
+                async with asyncio.timeout(settings.OUTBOX_POLL_SECONDS):
+                    await self._wakeup.wait()
+            except TimeoutError:
+                pass
+
+    def start(self) -> None:
+        if self._task is None:
+            self._loop = asyncio.get_running_loop()
+            self._wakeup = asyncio.Event()
+            self._task = self._loop.create_task(self._loop_forever())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+            self._loop = self._wakeup = None
+
+
+reply_outbox = ReplyOutbox()
@@ -0,0 +1,221 @@
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional, Tuple, Iterable
+from app.core.config import settings
+from app.core.metrics import CACHE_REQUESTS
+from app.services.contacts import contact_index
+from app.services.semantic_index import message_timestamp
+import numpy as np
+import re
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Phrases that ask the reader to act soon
+URGENCY_PATTERN = re.compile(
+    r"\b(urgent|asap|immediately|action required|response required|deadline|overdue|final notice|"
+    r"time[- ]sensitive|important|due (today|tomorrow)|by (today|tomorrow|eod|end of day))\b",
+    re.IGNORECASE
+)
+
+# How much each category matters; messages not categorized yet sit in the middle
+CATEGORY_WEIGHTS = {"Urgent": 1.0, "Work": 0.7, "Personal": 0.6, "Finance": 0.6, "Social": 0.2, "Promotions": 0.0}
+UNKNOWN_CATEGORY_WEIGHT = 0.4
+
+FEATURES = ("sender_frequency", "replied", "category", "recency", "urgency")
+DEFAULT_WEIGHTS = {"sender_frequency": 1.0, "replied": 1.5, "category": 1.0, "recency": 1.5, "urgency": 2.0}
+
+
+def parse_weights(spec: str) -> np.ndarray:
+    """Feature weights from 'urgency=3;recency=1', defaulting the ones not given.
+
+    Raises ValueError for a weight that is not a finite number.
+    """
+    weights = dict(DEFAULT_WEIGHTS)
+    for entry in filter(None, (part.strip() for part in spec.split(";"))):
+        feature, _, weight = entry.partition("=")
+        feature = feature.strip()
+        if feature not in weights:
+            logger.warning(f"Ignoring unknown priority feature: {feature!r}")
+            continue
+        try:
+            weights[feature] = float(weight)
+        except ValueError:
+            raise ValueError(f"Invalid priority weight: {entry!r}") from None
+        if not np.isfinite(weights[feature]):
+            raise ValueError(f"Invalid priority weight: {entry!r}")
+    return np.array([weights[feature] for feature in FEATURES], dtype=np.float32)
+
+
+def urgency_score(subject: str, snippet: str) -> float:
+    """1.0 for an urgent subject, 0.5 when only the preview is urgent, else 0"""
+    if URGENCY_PATTERN.search(subject or ""):
+        return 1.0
+    return 0.5 if URGENCY_PATTERN.search(snippet or "") else 0.0
+
+
+class _UserRanking:
+    """Feature rows of one user's recent messages.
+
+    Per-message features (urgency, category, timestamp) are computed once when
+    the message is first seen. Sender features come from the contact index at
+    ranking time, so a new reply re-ranks all of that sender's messages.
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.urgency = np.zeros(capacity, dtype=np.float32)
+        self.category = np.full(capacity, UNKNOWN_CATEGORY_WEIGHT, dtype=np.float32)
+        self.timestamps = np.zeros(capacity, dtype=np.float64)
+        self.senders: List[str] = [""] * capacity
+        # message id -> row, oldest insertion first
+        self.rows: "OrderedDict[str, int]" = OrderedDict()
+        self.free: List[int] = list(range(capacity - 1, -1, -1))
+
+    def add(self, email: Dict[str, Any]) -> None:
+        row = self.rows.get(email['id'])
+        if row is not None:
+            # Already counted; only refresh the per-message features
+            self.rows.move_to_end(email['id'])
+        else:
+            if not self.free:
+                self.remove(next(iter(self.rows)))
+            row = self.free.pop()
+            self.rows[email['id']] = row
+            self.senders[row] = email.get('sender_email', '')
+            self.category[row] = UNKNOWN_CATEGORY_WEIGHT
+        self.urgency[row] = urgency_score(email.get('subject', ''), email.get('snippet', ''))
+        self.timestamps[row] = message_timestamp(email.get('date', ''))
+        if email.get('category'):
+            self.category[row] = CATEGORY_WEIGHTS.get(email['category'], UNKNOWN_CATEGORY_WEIGHT)
+
+    def remove(self, message_id: str) -> None:
+        row = self.rows.pop(message_id, None)
+        if row is not None:
+            self.free.append(row)
+
+    def features(self, rows: np.ndarray, senders: np.ndarray, now: float, half_life_hours: float) -> np.ndarray:
+        """(len(rows), len(FEATURES)) matrix, every column scaled to [0, 1]; senders from ContactIndex"""
+        age_hours = np.maximum(0.0, now - self.timestamps[rows]) / 3600
+        recency = np.where(self.timestamps[rows] > 0, 0.5 ** (age_hours / half_life_hours), 0.0)
+        return np.column_stack([
+            senders[:, 0],
+            senders[:, 1],
+            self.category[rows],
+            recency,
+            self.urgency[rows],
+        ]).astype(np.float32)
+
+
+class PriorityRanker:
+    """Per-user priority scores for inbox messages.
+
+    Messages are added as the app sees them (listing, live updates) and
+    scored with one matrix-vector product over sender frequency, how often
+    the user replies to the sender, category, recency and urgency keywords.
+    Ranking needs no Gmail or LLM call for messages already seen. Sender
+    features are read from the contact index, which callers feed themselves.
+    """
+
+    def __init__(self, max_messages_per_user: int = 1000, max_users: int = 1000,
+                 weights: Optional[str] = None):
+        self.max_messages_per_user = max_messages_per_user
+        self.max_users = max_users
+        # Parsed once, so a bad PRIORITY_WEIGHTS stops the app at startup
+        self.weights = parse_weights(settings.PRIORITY_WEIGHTS if weights is None else weights)
+        self._users: "OrderedDict[str, _UserRanking]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _user(self, user_key: str, create: bool = False) -> Optional[_UserRanking]:
+        ranking = self._users.get(user_key)
+        if ranking is None and create:
+            ranking = self._users[user_key] = _UserRanking(self.max_messages_per_user)
+            while len(self._users) > self.max_users:
+                self._users.popitem(last=False)
+        if ranking is not None:
+            self._users.move_to_end(user_key)
+        return ranking
+
+    def add(self, user_key: str, emails: Iterable[Dict[str, Any]]) -> None:
+        """Compute features of newly seen messages (re-adding one does not count it twice)"""
+        emails = [email for email in emails if email.get('id')]
+        with self._lock:
+            ranking = self._user(user_key, create=True)
+            for email in emails:
+                ranking.add(email)
+
+    def remove(self, user_key: str, message_ids: List[str]) -> None:
+        with self._lock:
+            ranking = self._user(user_key)
+            if ranking is not None:
+                for message_id in message_ids:
+                    ranking.remove(message_id)
+
+    def set_categories(self, user_key: str, categories: Dict[str, str]) -> None:
+        """Record AI categories of already added messages"""
+        with self._lock:
+            ranking = self._user(user_key)
+            if ranking is None:
+                return
+            for message_id, category in categories.items():
+                row = ranking.rows.get(message_id)
+                if row is not None:
+                    ranking.category[row] = CATEGORY_WEIGHTS.get(category, UNKNOWN_CATEGORY_WEIGHT)
+
+    def reset(self) -> None:
+        """Forget every user, e.g. after switching to a different mailbox"""
+        with self._lock:
+            self._users.clear()
+
+    def unknown(self, user_key: str, message_ids: List[str]) -> List[str]:
+        """Ids that have not been added yet and need their headers fetched"""
+        with self._lock:
+            ranking = self._user(user_key)
+            known = ranking.rows if ranking is not None else {}
+            missing = [message_id for message_id in message_ids if message_id not in known]
+        CACHE_REQUESTS.inc(len(message_ids) - len(missing), cache="priority_features", result="hit")
+        CACHE_REQUESTS.inc(len(missing), cache="priority_features", result="miss")
+        return missing
+
+    def rank(self, user_key: str, message_ids: List[str], now: Optional[float] = None) -> List[Tuple[str, float]]:
+        """(id, score) highest first; ids never added keep their order at the end with score 0"""
+        with self._lock:
+            ranking = self._user(user_key)
+            known = [message_id for message_id in message_ids if ranking and message_id in ranking.rows]
+            if not known:
+                return [(message_id, 0.0) for message_id in message_ids]
+            rows = np.fromiter((ranking.rows[message_id] for message_id in known), dtype=np.int64, count=len(known))
+            senders = contact_index.sender_features(user_key, [ranking.senders[row] for row in rows])
+            features = ranking.features(rows, senders, now or time.time(), settings.PRIORITY_RECENCY_HALF_LIFE_HOURS)
+
+        scores = features @ self.weights
+        # Stable: equal scores keep Gmail's (newest first) order
+        order = np.argsort(-scores, kind="stable")
+        ranked = [(known[i], round(float(scores[i]), 4)) for i in order]
+        known_ids = set(known)
+        return ranked + [(message_id, 0.0) for message_id in message_ids if message_id not in known_ids]
+
+    def top_emails(self, gmail, user_key: str, max_results: int, query: str = "") -> List[Dict[str, Any]]:
+        """Full details of the highest ranked among the newest PRIORITY_CANDIDATES inbox messages.
+
+        Costs one id listing, header fetches for messages not seen before, and
+        full fetches for the max_results returned.
+        """
+        candidates = gmail.list_message_ids(query=query, max_results=settings.PRIORITY_CANDIDATES,
+                                            label_ids=['INBOX'])
+        fetched = [email for email in map(gmail.get_message_metadata, self.unknown(user_key, candidates)) if email]
+        self.add(user_key, fetched)
+        contact_index.add(user_key, fetched)
+
+        ranked = self.rank(user_key, candidates)[:max_results]
+        emails = []
+        for message_id, score in ranked:
+            email = gmail.get_email_details(message_id)
+            if email:
+                email['priority'] = score
+                emails.append(email)
+        return emails
+
+
+priority_ranker = PriorityRanker()
@@ -0,0 +1,231 @@
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from email.utils import parsedate_to_datetime
+from typing import Dict, Any, List, Optional, Tuple
+from app.core.metrics import CACHE_REQUESTS
+from app.models.message import MessageRecord
+import numpy as np
+import re
+import threading
+import zlib
+import logging
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_DIM = 1024
+
+# Command and filler words that say nothing about which email is meant
+STOPWORDS = {
+    "a", "an", "the", "my", "me", "i", "to", "from", "of", "for", "on", "in", "at", "about", "with",
+    "and", "or", "that", "this", "it", "is", "was", "please", "can", "you",
+    "email", "emails", "mail", "message", "messages", "one",
+    "reply", "respond", "answer", "delete", "remove", "trash", "open", "show", "find", "read",
+    "last", "latest", "recent", "week", "month", "today", "yesterday",
+}
+
+# Relative time phrases that narrow the candidates by date
+TIME_PHRASES = [
+    (r'\btoday\b', timedelta(days=1)),
+    (r'\byesterday\b', timedelta(days=2)),
+    (r'\b(last|this|past) week\b', timedelta(days=7)),
+    (r'\b(last|this|past) month\b', timedelta(days=31)),
+]
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+
+def _features(text: str) -> List[str]:
+    """Words plus character trigrams, so 'invoices' still matches 'invoice'"""
+    features = []
+    for word in TOKEN_PATTERN.findall(text.lower()):
+        if word in STOPWORDS:
+            continue
+        features.append(word)
+        padded = f"#{word}#"
+        features.extend(padded[i:i + 3] for i in range(len(padded) - 2))
+    return features
+
+
+def embed(texts: List[str], dim: int = EMBEDDING_DIM) -> np.ndarray:
+    """Hashed bag-of-features embeddings, L2-normalized, one row per text"""
+    vectors = np.zeros((len(texts), dim), dtype=np.float32)
+    for row, text in enumerate(texts):
+        for feature in _features(text):
+            h = zlib.crc32(feature.encode("utf-8"))
+            vectors[row, h % dim] += 1.0 if h & 0x80000000 else -1.0
+    # Sublinear term frequency keeps long bodies from drowning the subject
+    np.copysign(np.log1p(np.abs(vectors)), vectors, out=vectors)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    np.divide(vectors, norms, out=vectors, where=norms > 0)
+    return vectors
+
+
+def _email_text(email: Dict[str, Any]) -> str:
+    """Text indexed for a message; sender and subject are repeated to weigh more than the body"""
+    sender = f"{email.get('sender_name', '')} {email.get('sender_email', '').replace('@', ' ')}"
+    subject = email.get('subject', '')
+    return f"{sender} {sender} {subject} {subject} {(email.get('body') or email.get('snippet') or '')[:500]}"
+
+
+def message_timestamp(date: str) -> float:
+    try:
+        return parsedate_to_datetime(date).timestamp()
+    except (TypeError, ValueError, IndexError):
+        return 0.0
+
+
+def parse_time_window(query: str, now: Optional[datetime] = None) -> Optional[float]:
+    """Earliest timestamp implied by phrases like 'last week', or None"""
+    for pattern, window in TIME_PHRASES:
+        if re.search(pattern, query.lower()):
+            return ((now or datetime.now(timezone.utc)) - window).timestamp()
+    return None
+
+
+class _UserIndex:
+    """Dense vector matrix for one user; rows are reused as messages are evicted.
+
+    The arrays start small and double as messages arrive, up to capacity, so
+    a user with a handful of indexed messages does not hold a full matrix.
+    """
+
+    def __init__(self, capacity: int, dim: int, initial_rows: int = 32):
+        self.capacity = capacity
+        size = min(capacity, initial_rows)
+        self.vectors = np.zeros((size, dim), dtype=np.float32)
+        self.timestamps = np.zeros(size, dtype=np.float64)
+        self.valid = np.zeros(size, dtype=bool)
+        self.ids: List[Optional[str]] = [None] * size
+        self.metadata: List[Optional[MessageRecord]] = [None] * size
+        # message id -> row, oldest insertion first
+        self.rows: "OrderedDict[str, int]" = OrderedDict()
+
+    def add(self, emails: List[Dict[str, Any]], vectors: np.ndarray) -> None:
+        for email, vector in zip(emails, vectors):
+            row = self.rows.pop(email['id'], None)
+            if row is None:
+                if len(self.rows) >= self.capacity:
+                    _, row = self.rows.popitem(last=False)
+                else:
+                    if len(self.rows) >= len(self.valid):
+                        self._grow()
+                    row = int(np.flatnonzero(~self.valid)[0])
+            self.rows[email['id']] = row
+            self.vectors[row] = vector
+            self.timestamps[row] = message_timestamp(email.get('date', ''))
+            self.valid[row] = True
+            self.ids[row] = email['id']
+            self.metadata[row] = MessageRecord.from_email(email, keep_body=False)
+
+    def _grow(self) -> None:
+        size = min(self.capacity, 2 * len(self.valid))
+        added = size - len(self.valid)
+        # np.resize repeats the data; the new tail must start empty
+        self.vectors = np.resize(self.vectors, (size, self.vectors.shape[1]))
+        self.timestamps = np.resize(self.timestamps, size)
+        self.valid = np.resize(self.valid, size)
+        for array in (self.vectors, self.timestamps, self.valid):
+            array[size - added:] = 0
+        self.ids.extend([None] * added)
+        self.metadata.extend([None] * added)
+
+    def remove(self, message_ids: List[str]) -> None:
+        for message_id in message_ids:
+            row = self.rows.pop(message_id, None)
+            if row is not None:
+                self.valid[row] = False
+                self.ids[row] = None
+                self.metadata[row] = None
+
+
+class SemanticIndex:
+    """Per-user embedding index over recently fetched messages.
+
+    Resolves references like "the Amazon email" or "the invoice from last
+    week" to message ids with one matrix-vector product, without Gmail calls.
+    """
+
+    def __init__(self, max_messages_per_user: int = 500, max_users: int = 1000,
+                 dim: int = EMBEDDING_DIM, min_score: float = 0.2):
+        self.max_messages_per_user = max_messages_per_user
+        self.max_users = max_users
+        self.dim = dim
+        self.min_score = min_score
+        self._users: "OrderedDict[str, _UserIndex]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _user(self, user_key: str, create: bool = False) -> Optional[_UserIndex]:
+        index = self._users.get(user_key)
+        if index is None and create:
+            index = _UserIndex(self.max_messages_per_user, self.dim)
+            self._users[user_key] = index
+            while len(self._users) > self.max_users:
+                self._users.popitem(last=False)
+        if index is not None:
+            self._users.move_to_end(user_key)
+        return index
+
+    def add(self, user_key: str, emails: List[Dict[str, Any]]) -> None:
+        """Index (or re-index) fetched messages, evicting the user's oldest ones"""
+        emails = [email for email in emails if email.get('id')]
+        if not emails:
+            return
+        vectors = embed([_email_text(email) for email in emails], self.dim)
+        with self._lock:
+            self._user(user_key, create=True).add(emails, vectors)
+
+    def remove(self, user_key: str, message_ids: List[str]) -> None:
+        """Drop messages, e.g. after they were trashed"""
+        with self._lock:
+            index = self._user(user_key)
+            if index is not None:
+                index.remove(message_ids)
+
+    def get(self, user_key: str, message_id: str) -> Optional[Dict[str, Any]]:
+        """Headers of an indexed message (no body), or None"""
+        with self._lock:
+            index = self._user(user_key)
+            row = index.rows.get(message_id) if index is not None else None
+            record = index.metadata[row] if row is not None else None
+            found = record.to_dict(include_body=False) if record else None
+
+        CACHE_REQUESTS.inc(cache="semantic_index", result="hit" if found else "miss")
+        return found
+
+    def search(self, user_key: str, query: str, top_k: int = 3) -> List[Tuple[Dict[str, Any], float]]:
+        """Best matching messages as (metadata, cosine score), highest first"""
+        query_vector = embed([query], self.dim)[0]
+        if not query_vector.any():
+            return []
+        since = parse_time_window(query)
+
+        with self._lock:
+            index = self._user(user_key)
+            if index is None or not index.rows:
+                CACHE_REQUESTS.inc(cache="semantic_index", result="miss")
+                return []
+
+            mask = index.valid.copy()
+            if since is not None:
+                mask &= index.timestamps >= since
+            scores = np.where(mask, index.vectors @ query_vector, -1.0)
+
+            k = min(top_k, int(mask.sum()))
+            if k == 0:
+                CACHE_REQUESTS.inc(cache="semantic_index", result="miss")
+                return []
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+            results = [(index.metadata[row].project(), float(scores[row]))
+                       for row in top if scores[row] >= self.min_score]
+
+        CACHE_REQUESTS.inc(cache="semantic_index", result="hit" if results else "miss")
+        return results
+
+    def resolve(self, user_key: str, query: str) -> Optional[Dict[str, Any]]:
+        """The single best match for a reference, or None"""
+        results = self.search(user_key, query, top_k=1)
+        return results[0][0] if results else None
+
+
+semantic_index = SemanticIndex()
@@ -0,0 +1,93 @@
+from typing import Dict, Any, Optional
+from app.core.metrics import CACHE_REQUESTS
+from app.core.state import StateBackend, state
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class ThreadSummaryCache:
+    """Per-user cache of thread summaries that is extended as messages are appended"""
+
+    # Only the newest messages of a changed thread are downloaded in full
+    MAX_NEW_BODIES = 5
+
+    # Entries not refreshed for this long are dropped by the backend
+    TTL_SECONDS = 7 * 24 * 3600
+
+    def __init__(self, backend: Optional[StateBackend] = None):
+        self.state = backend or state
+
+    def get(self, user_key: str, thread_id: str) -> Optional[Dict[str, Any]]:
+        """Return the cached entry for a thread, if any"""
+        return self.state.get_json(f"thread:{user_key}:{thread_id}")
+
+    def put(self, user_key: str, thread_id: str, entry: Dict[str, Any]) -> None:
+        """Store a thread entry; the backend evicts the least recently used ones"""
+        self.state.set_json(f"thread:{user_key}:{thread_id}", entry, ttl=self.TTL_SECONDS)
+
+    def summarize(self, user_key: str, thread_ref: Dict[str, Any], gmail, ai) -> Optional[Dict[str, Any]]:
+        """Return a summarized thread entry, only doing Gmail/LLM work for what changed"""
+        thread_id = thread_ref['id']
+        cached = self.get(user_key, thread_id)
+
+        # Unchanged history id: no Gmail call, no LLM call
+        if cached and thread_ref.get('history_id') and cached['history_id'] == thread_ref['history_id']:
+            CACHE_REQUESTS.inc(cache="thread_summary", result="hit")
+            return cached
+
+        CACHE_REQUESTS.inc(cache="thread_summary", result="miss")
+
+        thread = gmail.get_thread(thread_id)
+        if not thread or not thread['messages']:
+            return cached
+
+        messages = thread['messages']
+        message_ids = [msg['id'] for msg in messages]
+
+        # Messages were removed from the thread, start over
+        if cached and not set(cached['message_ids']).issubset(message_ids):
+            cached = None
+
+        known = set(cached['message_ids']) if cached else set()
+        new_messages = [msg for msg in messages if msg['id'] not in known]
+        subject = messages[0]['subject']
+
+        if cached and not new_messages:
+            # Only labels changed
+            summary = cached['summary']
+        else:
+            detailed = []
+            for msg in new_messages[-self.MAX_NEW_BODIES:]:
+                details = gmail.get_email_details(msg['id'])
+                detailed.append(details or msg)
+
+            summary = ai.summarize_thread(
+                subject=subject,
+                messages=detailed,
+                previous_summary=cached['summary'] if cached else None
+            )
+
+        latest = messages[-1]
+        participants = list(dict.fromkeys(msg['sender_name'] for msg in messages))
+
+        entry = {
+            'id': thread_id,
+            'subject': subject,
+            'participants': participants,
+            'message_count': len(messages),
+            'summary': summary,
+            'snippet': thread_ref.get('snippet') or latest['snippet'],
+            'date': latest['date'],
+            'latest_message_id': latest['id'],
+            'latest_sender_name': latest['sender_name'],
+            'latest_sender_email': latest['sender_email'],
+            'message_ids': message_ids,
+            'history_id': thread['history_id']
+        }
+
+        self.put(user_key, thread_id, entry)
+        return entry
+
+
+thread_summary_cache = ThreadSummaryCache()
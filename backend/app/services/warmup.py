@@ -0,0 +1,89 @@
+"""Warm-up run on startup so the first request after a deploy or scale-up is not the slow one.
+
+Heavy modules (the LLM SDKs, google_auth_oauthlib, the discovery client)
+are imported lazily where they are used; warm-up imports and initializes
+them ahead of traffic instead.
+"""
+from typing import Dict, Callable, List, Tuple
+from app.core.metrics import STARTUP_DURATION
+from app.core.state import state
+import asyncio
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def _google_api() -> None:
+    """Parse the bundled discovery documents, build the client classes once and open the HTTP pool"""
+    from google.auth.transport import requests  # noqa: F401 (used on token refresh)
+    from google.oauth2.credentials import Credentials
+    from app.core.http_transport import google_http
+    from app.services.google_api import build_service
+
+    # Loads the CA bundle into the TLS context
+    google_http.client
+    credentials = Credentials(token="warmup")
+    build_service('gmail', 'v1', credentials)
+    build_service('oauth2', 'v2', credentials)
+
+
+def _oauth_flow() -> None:
+    from google_auth_oauthlib.flow import Flow  # noqa: F401
+
+
+def _llm_clients() -> None:
+    """Import the SDKs and create the shared clients of every configured provider"""
+    from app.services.llm_providers import provider_registry, background_loop
+
+    for name in provider_registry.names():
+        provider = provider_registry.get(name)
+        if provider.available:
+            provider.client()
+    background_loop.run(asyncio.sleep(0))
+
+
+def _output_schemas() -> None:
+    from app.models.schemas import IntentResult, CategoryResult, BatchSummaryResult, BatchCategoryResult
+    from app.services.ai_service import _output_schema
+
+    for model in (IntentResult, CategoryResult, BatchSummaryResult, BatchCategoryResult):
+        _output_schema(model)
+
+
+def _state_backend() -> None:
+    """Open the state backend connection (SQLite file, Redis socket)"""
+    state.get("warmup")
+
+
+def _embeddings() -> None:
+    from app.services.semantic_index import embed
+
+    embed(["warm up the embedding path"])
+
+
+WARMUP_STEPS: List[Tuple[str, Callable[[], None]]] = [
+    ("google_api", _google_api),
+    ("oauth_flow", _oauth_flow),
+    ("llm_clients", _llm_clients),
+    ("output_schemas", _output_schemas),
+    ("state_backend", _state_backend),
+    ("embeddings", _embeddings),
+]
+
+
+def warm_up() -> Dict[str, float]:
+    """Run every warm-up step, returning seconds per step; failures are logged, never raised"""
+    report = {}
+    for name, step in WARMUP_STEPS:
+        start = time.perf_counter()
+        try:
+            step()
+        except Exception as e:
+            logger.warning(f"Warm-up step {name} failed: {e}")
+        report[name] = time.perf_counter() - start
+        STARTUP_DURATION.set(report[name], phase=f"warmup_{name}")
+
+    steps = ", ".join(f"{name} {seconds * 1000:.0f}ms" for name, seconds in report.items())
+    logger.info(f"Warm-up finished in {sum(report.values()):.3f}s ({steps})")
+    return report
@@ -0,0 +1,140 @@
+"""Cold-start benchmark: import profile and first-request latency of a fresh process.
+
+Usage (from backend/):
+
+    python -m benchmarks.cold_start
+    python -m benchmarks.cold_start --runs 5 --top 20
+
+Every measurement runs in a new interpreter, like a freshly deployed or
+scaled-up instance. The first request is timed with and without the
+startup warm-up, against the fake Gmail and Anthropic servers.
+"""
+from typing import Dict, Any, List, Tuple
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+# Needs the LLM SDK, Gmail client and intent schema: the slowest first request
+FIRST_REQUEST = ("POST", "/api/chat/message", {"json": {"message": "show me my latest emails"}})
+
+
+def parse_importtime(output: str, module: str = "app.main") -> Tuple[float, List[Tuple[str, float]]]:
+    """Cumulative seconds of a module and self time per top-level package from `python -X importtime`"""
+    by_package: Dict[str, float] = defaultdict(float)
+    total = 0.0
+    for line in output.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        name = name.strip()
+        by_package[name.split(".")[0]] += int(self_us) / 1e6
+        if name == module:
+            total = int(cumulative_us) / 1e6
+    ranked = sorted(by_package.items(), key=lambda item: item[1], reverse=True)
+    return total, ranked
+
+
+def import_profile() -> Tuple[float, List[Tuple[str, float]]]:
+    """Import app.main in a fresh interpreter and report where the time goes"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app.main"],
+        cwd=BACKEND_DIR, capture_output=True, text=True, check=True
+    )
+    return parse_importtime(result.stderr)
+
+
+def _child(warmup: bool) -> Dict[str, Any]:
+    """Runs inside the fresh interpreter: import, optional warm-up, first and second request"""
+    import logging
+    logging.disable(logging.INFO)
+
+    from benchmarks.fakes import FakeGmailServer, FakeAnthropicServer
+    gmail = FakeGmailServer(mailbox_size=20).start()
+    llm = FakeAnthropicServer().start()
+
+    start = time.perf_counter()
+    from benchmarks.run import configure_app
+    app, token = configure_app(gmail.url, llm.url, "anthropic")
+    import_s = time.perf_counter() - start
+
+    warmup_s = 0.0
+    if warmup:
+        from app.services.warmup import warm_up
+        start = time.perf_counter()
+        warm_up()
+        warmup_s = time.perf_counter() - start
+
+    from fastapi.testclient import TestClient
+    client = TestClient(app)
+    method, path, kwargs = FIRST_REQUEST
+    timings = []
+    for _ in range(2):
+        start = time.perf_counter()
+        response = client.request(method, path, headers={"Authorization": f"Bearer {token}"}, **kwargs)
+        timings.append(time.perf_counter() - start)
+        response.raise_for_status()
+
+    gmail.stop()
+    llm.stop()
+    return {"import_s": import_s, "warmup_s": warmup_s,
+            "first_request_s": timings[0], "second_request_s": timings[1]}
+
+
+def measure_cold_start(warmup: bool) -> Dict[str, Any]:
+    """One cold start in a new interpreter"""
+    args = [sys.executable, "-m", "benchmarks.cold_start", "--child"] + (["--warmup"] if warmup else [])
+    result = subprocess.run(args, cwd=BACKEND_DIR, capture_output=True, text=True, env=dict(os.environ))
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1] if result.stderr else "cold start failed")
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def run_cold_start(runs: int = 3) -> Dict[str, Any]:
+    """Median timings over several cold starts, with and without warm-up"""
+    report = {}
+    for mode, warmup in (("lazy", False), ("warmup", True)):
+        samples = [measure_cold_start(warmup) for _ in range(runs)]
+        report[mode] = {
+            key[:-2] + "_ms": round(statistics.median(sample[key] for sample in samples) * 1000, 1)
+            for key in ("import_s", "warmup_s", "first_request_s", "second_request_s")
+        }
+    return report
+
+
+def format_report(total: float, packages: List[Tuple[str, float]], report: Dict[str, Any], top: int) -> str:
+    lines = [f"import app.main: {total * 1000:.0f} ms", "self time by package:"]
+    lines.extend(f"  {name:<28} {seconds * 1000:8.1f} ms" for name, seconds in packages[:top])
+    lines.append("")
+    lines.append(f"{'mode':<8} {'import':>9} {'warm-up':>9} {'1st req':>9} {'2nd req':>9}  (ms, median)")
+    for mode, stats in report.items():
+        lines.append(f"{mode:<8} {stats['import_ms']:>9} {stats['warmup_ms']:>9} "
+                     f"{stats['first_request_ms']:>9} {stats['second_request_ms']:>9}")
+    return "\n".join(lines)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=3, help="cold starts per mode")
+    parser.add_argument("--top", type=int, default=15, help="packages listed in the import profile")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--warmup", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(_child(args.warmup)))
+        return
+
+    total, packages = import_profile()
+    print(format_report(total, packages, run_cold_start(args.runs), args.top))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,564 @@
+"""Local fake Gmail, Anthropic, OpenAI and Redis servers for offline benchmarks.
+
+Each HTTP fake is a stdlib ThreadingHTTPServer with configurable latency,
+jitter and error rate, so the backend can be driven end to end without
+network access or API keys.
+"""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from socketserver import StreamRequestHandler, ThreadingTCPServer
+from fnmatch import fnmatchcase
+from typing import Dict, Any, List, Optional, Tuple
+from urllib.parse import urlparse, parse_qs
+import base64
+import json
+import random
+import re
+import ssl
+import threading
+import time
+
+
+class FakeBehavior:
+    """Latency and failure profile shared by the fake servers.
+
+    connect_latency_ms is paid once per new connection, standing in for the
+    TCP and TLS handshake round trips to a remote API.
+    """
+
+    def __init__(self, latency_ms: float = 0.0, jitter_ms: float = 0.0, error_rate: float = 0.0,
+                 connect_latency_ms: float = 0.0):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.connect_latency_ms = connect_latency_ms
+
+    def delay(self) -> None:
+        delay_ms = self.latency_ms + random.uniform(0, self.jitter_ms)
+        if delay_ms > 0:
+            time.sleep(delay_ms / 1000)
+
+    def should_fail(self) -> bool:
+        return self.error_rate > 0 and random.random() < self.error_rate
+
+
+class _JSONHandler(BaseHTTPRequestHandler):
+    """Request handler that routes to the owning server's handle() method"""
+
+    protocol_version = "HTTP/1.1"
+    # Headers and body go out in separate writes; without this, keep-alive clients stall on delayed ACKs
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def _dispatch(self, method: str) -> None:
+        length = int(self.headers.get("Content-Length") or 0)
+        raw = self.rfile.read(length) if length else b""
+        body = json.loads(raw) if raw else None
+
+        behavior = self.server.behavior
+        behavior.delay()
+
+        if behavior.should_fail():
+            status, payload = 503, {"error": {"code": 503, "message": "Injected failure"}}
+        else:
+            parsed = urlparse(self.path)
+            status, payload = self.server.handle(method, parsed.path, parse_qs(parsed.query), body)
+
+        data = json.dumps(payload).encode("utf-8") if payload is not None else b""
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        self._dispatch("GET")
+
+    def do_POST(self):
+        self._dispatch("POST")
+
+    def do_DELETE(self):
+        self._dispatch("DELETE")
+
+
+class FakeServer(ThreadingHTTPServer):
+    """Base class: binds to a free local port and serves on a daemon thread"""
+
+    daemon_threads = True
+
+    def __init__(self, behavior: Optional[FakeBehavior] = None):
+        super().__init__(("127.0.0.1", 0), _JSONHandler)
+        self.behavior = behavior or FakeBehavior()
+        self.requests = 0
+        self.connections = 0
+        self._connections_lock = threading.Lock()
+        self.scheme = "http"
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"{self.scheme}://{host}:{port}"
+
+    def use_tls(self, certfile: str, keyfile: str) -> "FakeServer":
+        """Serve HTTPS; call before start()"""
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(certfile, keyfile)
+        # Handshakes run on the connection's thread, not in the accept loop
+        self.socket = context.wrap_socket(self.socket, server_side=True, do_handshake_on_connect=False)
+        self.scheme = "https"
+        return self
+
+    def process_request_thread(self, request, client_address):
+        with self._connections_lock:
+            self.connections += 1
+        if self.behavior.connect_latency_ms > 0:
+            time.sleep(self.behavior.connect_latency_ms / 1000)
+        super().process_request_thread(request, client_address)
+
+    def start(self) -> "FakeServer":
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
+
+    def handle(self, method: str, path: str, query: Dict[str, List[str]],
+               body: Optional[Dict[str, Any]]) -> Tuple[int, Any]:
+        raise NotImplementedError
+
+
+def _b64(text: str) -> str:
+    return base64.urlsafe_b64encode(text.encode("utf-8")).decode("ascii")
+
+
+SENDERS = [
+    ("Amazon", "shipment-tracking@amazon.com", "Your order has shipped"),
+    ("Jane Smith", "jane.smith@example.com", "Q4 project timeline"),
+    ("GitHub", "noreply@github.com", "New pull request review"),
+    ("Finance Team", "billing@example.com", "Invoice #4821 due"),
+    ("Newsletter", "news@deals.example.com", "50% off sale this weekend"),
+    ("John Doe", "john.doe@example.com", "Meeting tomorrow at 10"),
+]
+
+
+class FakeGmailServer(FakeServer):
+    """In-memory mailbox speaking the subset of the Gmail v1 REST API the backend uses"""
+
+    def __init__(self, mailbox_size: int = 500, thread_size: int = 3, body_size: int = 2000,
+                 behavior: Optional[FakeBehavior] = None):
+        super().__init__(behavior)
+        self.lock = threading.Lock()
+        self.messages: Dict[str, Dict[str, Any]] = {}
+        self.attachments: Dict[str, bytes] = {}
+        self.order: List[str] = []
+        self.thread_size, self.body_size = thread_size, body_size
+        for i in range(mailbox_size):
+            self._add_message(i, thread_size, body_size)
+        # Mailbox history: changes after history_floor are kept, like Gmail's ~1 week
+        self.history: List[Dict[str, Any]] = []
+        self.history_id = 1000 + max(0, mailbox_size - 1)
+        self.history_floor = 1000
+        # Sent message bodies, and how many upcoming sends answer 503
+        self.sent: List[Dict[str, Any]] = []
+        self.send_failures = 0
+
+    def _record(self, change: str, message: Dict[str, Any], label_ids: Optional[List[str]] = None) -> None:
+        """Append a history record (messagesAdded, labelsAdded, ...) and bump the message's historyId"""
+        with self.lock:
+            self.history_id += 1
+            message["historyId"] = str(self.history_id)
+            ref = {"id": message["id"], "threadId": message["threadId"], "labelIds": list(message["labelIds"])}
+            item = {"message": ref} if label_ids is None else {"message": ref, "labelIds": label_ids}
+            self.history.append({"id": str(self.history_id), "messages": [ref], change: [item]})
+
+    def deliver(self, count: int = 1) -> List[str]:
+        """New messages arriving at the top of the inbox"""
+        ids = []
+        for _ in range(count):
+            self._add_message(len(self.messages), self.thread_size, self.body_size)
+            message_id = self.order.pop()
+            self.order.insert(0, message_id)
+            self._record("messagesAdded", self.messages[message_id])
+            ids.append(message_id)
+        return ids
+
+    def _modify(self, message: Dict[str, Any], add: List[str], remove: List[str]) -> None:
+        remove = [l for l in remove if l in message["labelIds"]]
+        add = [l for l in add if l not in message["labelIds"]]
+        message["labelIds"] = [l for l in message["labelIds"] if l not in remove] + add
+        if add:
+            self._record("labelsAdded", message, add)
+        if remove:
+            self._record("labelsRemoved", message, remove)
+
+    def _add_message(self, i: int, thread_size: int, body_size: int) -> None:
+        name, address, subject = SENDERS[i % len(SENDERS)]
+        message_id = f"m{i:06d}"
+        thread_id = f"t{i // max(1, thread_size):06d}"
+        body = (f"Hello, this is message {i} about {subject.lower()}. " * 50)[:body_size]
+        self.messages[message_id] = {
+            "id": message_id,
+            "threadId": thread_id,
+            "labelIds": ["INBOX", "UNREAD"] if i % 2 else ["INBOX"],
+            "snippet": body[:100],
+            "historyId": str(1000 + i),
+            "internalDate": str(1700000000000 - i * 60000),
+            "payload": {
+                "mimeType": "multipart/alternative",
+                "headers": [
+                    {"name": "From", "value": f"{name} <{address}>"},
+                    {"name": "Subject", "value": subject},
+                    {"name": "Date", "value": "Mon, 1 Jan 2024 10:00:00 +0000"},
+                    {"name": "Message-ID", "value": f"<{message_id}@mail.example.com>"},
+                ],
+                "body": {"size": 0},
+                "parts": [
+                    {"partId": "0", "mimeType": "text/plain", "body": {"size": len(body), "data": _b64(body)}},
+                    {"partId": "1", "mimeType": "text/html", "body": {"size": len(body), "data": _b64(f"<p>{body}</p>")}},
+                ],
+            },
+        }
+        if i % 4 == 0:
+            # Every fourth message carries a text attachment
+            attachment = (f"Attachment notes for message {i}. " * 200).encode("utf-8")
+            self.attachments[f"att-{message_id}"] = attachment
+            self.messages[message_id]["payload"]["parts"].append({
+                "partId": "2", "mimeType": "text/plain", "filename": "notes.txt",
+                "body": {"attachmentId": f"att-{message_id}", "size": len(attachment)},
+            })
+        self.order.append(message_id)
+
+    def _inbox(self, query: Dict[str, List[str]]) -> List[str]:
+        labels = query.get("labelIds", [])
+        q = (query.get("q") or [""])[0].lower()
+        ids = [mid for mid in self.order if all(l in self.messages[mid]["labelIds"] for l in labels)]
+        if q.startswith("from:"):
+            needle = q[5:].split()[0]
+            ids = [mid for mid in ids if needle in self.messages[mid]["payload"]["headers"][0]["value"].lower()]
+        return ids
+
+    def _page(self, ids: List[str], query: Dict[str, List[str]]) -> Tuple[List[str], Optional[str]]:
+        max_results = int((query.get("maxResults") or ["100"])[0])
+        start = int((query.get("pageToken") or ["0"])[0])
+        page = ids[start:start + max_results]
+        next_token = str(start + max_results) if start + max_results < len(ids) else None
+        return page, next_token
+
+    def _metadata(self, message: Dict[str, Any], query: Dict[str, List[str]]) -> Dict[str, Any]:
+        wanted = {h.lower() for h in query.get("metadataHeaders", [])}
+        payload = {
+            "mimeType": message["payload"]["mimeType"],
+            "headers": [h for h in message["payload"]["headers"] if not wanted or h["name"].lower() in wanted],
+        }
+        return {**{k: v for k, v in message.items() if k != "payload"}, "payload": payload}
+
+    def handle(self, method, path, query, body):
+        with self.lock:
+            self.requests += 1
+        path = re.sub(r"^/gmail/v1/users/[^/]+", "", path)
+
+        if method == "GET" and path == "/messages":
+            page, next_token = self._page(self._inbox(query), query)
+            result = {"messages": [{"id": mid, "threadId": self.messages[mid]["threadId"]} for mid in page],
+                      "resultSizeEstimate": len(page)}
+            if next_token:
+                result["nextPageToken"] = next_token
+            return 200, result
+
+        match = re.fullmatch(r"/messages/([^/]+)", path)
+        if method == "GET" and match:
+            message = self.messages.get(match.group(1))
+            if not message:
+                return 404, {"error": {"code": 404, "message": "Not Found"}}
+            if (query.get("format") or ["full"])[0] == "metadata":
+                return 200, self._metadata(message, query)
+            return 200, message
+
+        match = re.fullmatch(r"/messages/([^/]+)/attachments/([^/]+)", path)
+        if method == "GET" and match:
+            data = self.attachments.get(match.group(2))
+            if data is None:
+                return 404, {"error": {"code": 404, "message": "Not Found"}}
+            return 200, {"size": len(data), "data": base64.urlsafe_b64encode(data).decode("ascii").rstrip("=")}
+
+        if method == "GET" and path == "/threads":
+            thread_ids = list(dict.fromkeys(self.messages[mid]["threadId"] for mid in self._inbox(query)))
+            page, next_token = self._page(thread_ids, query)
+            result = {"threads": [{"id": tid, "snippet": "", "historyId": "1000"} for tid in page]}
+            if next_token:
+                result["nextPageToken"] = next_token
+            return 200, result
+
+        match = re.fullmatch(r"/threads/([^/]+)", path)
+        if method == "GET" and match:
+            messages = [self._metadata(m, query) for m in self.messages.values() if m["threadId"] == match.group(1)]
+            return 200, {"id": match.group(1), "historyId": "1000", "messages": messages}
+
+        if method == "POST" and path == "/messages/send":
+            with self.lock:
+                if self.send_failures > 0:
+                    self.send_failures -= 1
+                    return 503, {"error": {"code": 503, "message": "Backend Error"}}
+                self.sent.append(body or {})
+            return 200, {"id": f"sent{self.requests}", "threadId": (body or {}).get("threadId", ""), "labelIds": ["SENT"]}
+
+        match = re.fullmatch(r"/messages/([^/]+)/trash", path)
+        if method == "POST" and match:
+            message = self.messages.get(match.group(1))
+            if message:
+                self._modify(message, ["TRASH"], ["INBOX"])
+            return 200, {"id": match.group(1)}
+
+        if method == "POST" and path == "/messages/batchModify":
+            for mid in (body or {}).get("ids", []):
+                message = self.messages.get(mid)
+                if message:
+                    self._modify(message, body.get("addLabelIds", []), body.get("removeLabelIds", []))
+            return 204, None
+
+        if method == "GET" and path == "/profile":
+            return 200, {"emailAddress": "bench@example.com", "messagesTotal": len(self.messages),
+                         "historyId": str(self.history_id)}
+
+        if method == "GET" and path == "/history":
+            start = int((query.get("startHistoryId") or ["0"])[0])
+            if start < self.history_floor:
+                return 404, {"error": {"code": 404, "message": "Requested entity was not found."}}
+            records = [record for record in self.history if int(record["id"]) > start]
+            page, next_token = self._page(records, query)
+            result = {"historyId": str(self.history_id)}
+            if page:
+                result["history"] = page
+            if next_token:
+                result["nextPageToken"] = next_token
+            return 200, result
+
+        return 404, {"error": {"code": 404, "message": f"Unknown path {path}"}}
+
+
+FAKE_SUMMARY = "This is a concise summary of the email. The sender asks for a short follow-up this week."
+
+
+def _fake_completion(prompt: str) -> str:
+    """Deterministic model output for free-text prompts"""
+    return FAKE_SUMMARY
+
+
+def _schema_title(instruction: str) -> str:
+    """Name of the result model embedded in a JSON schema system prompt"""
+    return json.loads(instruction.split("\n", 1)[1]).get("title", "")
+
+
+def _fake_intent(prompt: str) -> Dict[str, Any]:
+    """Keyword intent classifier standing in for the model"""
+    match = re.search(r'User message: "(.*)"', prompt)
+    message = (match.group(1) if match else "").lower()
+    number = re.search(r"\d+", message)
+    for keyword, intent in (("delete", "delete_email"), ("reply", "generate_reply"),
+                            ("search", "search_emails"), ("digest", "daily_digest")):
+        if keyword in message:
+            params = {"email_number": int(number.group())} if number else {}
+            return {"intent": intent, "params": params, "confidence": "high"}
+    return {"intent": "read_emails", "params": {"count": 5}, "confidence": "high"}
+
+
+def _fake_structured(name: str, prompt: str) -> Dict[str, Any]:
+    """Deterministic structured output for the backend's result schemas"""
+    indexes = [int(i) for i in re.findall(r"^\[(\d+)\]", prompt, re.MULTILINE)]
+    if name == "IntentResult":
+        return _fake_intent(prompt)
+    if name == "CategoryResult":
+        return {"category": "Work"}
+    if name == "BatchSummaryResult":
+        return {"summaries": [{"index": i, "summary": FAKE_SUMMARY} for i in indexes]}
+    if name == "BatchCategoryResult":
+        return {"categories": [{"index": i, "category": "Work"} for i in indexes]}
+    return {}
+
+
+class FakeAnthropicServer(FakeServer):
+    """Fake of the Anthropic Messages API (POST /v1/messages)"""
+
+    def __init__(self, output_tokens: int = 60, behavior: Optional[FakeBehavior] = None):
+        super().__init__(behavior)
+        self.output_tokens = output_tokens
+
+    def handle(self, method, path, query, body):
+        self.requests += 1
+        if method != "POST" or path != "/v1/messages":
+            return 404, {"type": "error", "error": {"type": "not_found_error", "message": path}}
+
+        prompt = body["messages"][-1]["content"]
+        prompt = prompt if isinstance(prompt, str) else json.dumps(prompt)
+        prefilled = body["messages"][-1]["role"] == "assistant"
+        if prefilled:
+            # Structured request: continue the prefilled "{" of a JSON object
+            prompt = body["messages"][-2]["content"]
+            text = json.dumps(_fake_structured(_schema_title(body["system"]), prompt))[1:]
+        else:
+            text = _fake_completion(prompt)
+        return 200, {
+            "id": f"msg_{self.requests}",
+            "type": "message",
+            "role": "assistant",
+            "model": body.get("model", "fake"),
+            "content": [{"type": "text", "text": text}],
+            "stop_reason": "end_turn",
+            "stop_sequence": None,
+            "usage": {"input_tokens": len(prompt) // 4, "output_tokens": self.output_tokens},
+        }
+
+
+class FakeOpenAIServer(FakeServer):
+    """Fake of the OpenAI Chat Completions API (POST /v1/chat/completions)"""
+
+    def __init__(self, output_tokens: int = 60, behavior: Optional[FakeBehavior] = None):
+        super().__init__(behavior)
+        self.output_tokens = output_tokens
+
+    def handle(self, method, path, query, body):
+        self.requests += 1
+        if method != "POST" or path != "/v1/chat/completions":
+            return 404, {"error": {"message": path, "type": "invalid_request_error"}}
+
+        prompt = body["messages"][-1]["content"]
+        prompt = prompt if isinstance(prompt, str) else json.dumps(prompt)
+        if body.get("response_format"):
+            text = json.dumps(_fake_structured(_schema_title(body["messages"][0]["content"]), prompt))
+        else:
+            text = _fake_completion(prompt)
+        return 200, {
+            "id": f"chatcmpl-{self.requests}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "fake"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": text},
+                "finish_reason": "stop",
+            }],
+            "usage": {
+                "prompt_tokens": len(prompt) // 4,
+                "completion_tokens": self.output_tokens,
+                "total_tokens": len(prompt) // 4 + self.output_tokens,
+            },
+        }
+
+
+class _RESPHandler(StreamRequestHandler):
+    def handle(self):
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            args = []
+            for _ in range(int(line[1:-2])):
+                length = int(self.rfile.readline()[1:-2])
+                args.append(self.rfile.read(length + 2)[:-2].decode("utf-8"))
+            try:
+                reply = self.server.execute(args[0].upper(), args[1:])
+            except Exception as e:
+                self.wfile.write(f"-ERR {e}\r\n".encode())
+                continue
+            self.wfile.write(_resp(reply))
+
+
+def _resp(value: Any) -> bytes:
+    if value is None:
+        return b"$-1\r\n"
+    if isinstance(value, bool):
+        return b"+OK\r\n" if value else b"$-1\r\n"
+    if isinstance(value, int):
+        return b":%d\r\n" % value
+    if isinstance(value, list):
+        return b"*%d\r\n" % len(value) + b"".join(_resp(item) for item in value)
+    data = str(value).encode("utf-8")
+    return b"$%d\r\n%s\r\n" % (len(data), data)
+
+
+class FakeRedisServer(ThreadingTCPServer):
+    """In-memory server for the subset of the Redis protocol used by app.core.state"""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), _RESPHandler)
+        self.data: Dict[str, Any] = {}
+        self.expires: Dict[str, float] = {}
+        self.commands = 0
+        self._lock = threading.Lock()
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"redis://{host}:{port}/0"
+
+    def start(self) -> "FakeRedisServer":
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
+
+    def _live(self, key: str) -> Any:
+        if key in self.expires and self.expires[key] <= time.monotonic():
+            self.data.pop(key, None)
+            self.expires.pop(key, None)
+        return self.data.get(key)
+
+    def execute(self, command: str, args: List[str]) -> Any:
+        with self._lock:
+            self.commands += 1
+            if command in ("PING", "AUTH", "SELECT"):
+                return True
+            if command == "GET":
+                return self._live(args[0])
+            if command == "SET":
+                key, value, options = args[0], args[1], [arg.upper() for arg in args[2:]]
+                if "NX" in options and self._live(key) is not None:
+                    return None
+                self.data[key] = value
+                self.expires.pop(key, None)
+                if "PX" in options:
+                    self.expires[key] = time.monotonic() + int(args[2 + options.index("PX") + 1]) / 1000
+                elif "EX" in options:
+                    self.expires[key] = time.monotonic() + int(args[2 + options.index("EX") + 1])
+                return True
+            if command == "DEL":
+                removed = sum(1 for key in args if self._live(key) is not None)
+                for key in args:
+                    self.data.pop(key, None)
+                    self.expires.pop(key, None)
+                return removed
+            if command == "INCRBY":
+                value = int(self._live(args[0]) or 0) + int(args[1])
+                self.data[args[0]] = str(value)
+                return value
+            if command == "PEXPIRE":
+                if self._live(args[0]) is None:
+                    return 0
+                self.expires[args[0]] = time.monotonic() + int(args[1]) / 1000
+                return 1
+            if command == "SCAN":
+                pattern = args[args.index("MATCH") + 1] if "MATCH" in args else "*"
+                return ["0", [key for key in list(self.data) if self._live(key) is not None
+                              and fnmatchcase(key, pattern)]]
+            if command == "RPUSH":
+                items = self.data.setdefault(args[0], [])
+                items.extend(args[1:])
+                return len(items)
+            if command == "LPOP":
+                items = self._live(args[0])
+                if not items:
+                    return None
+                value = items.pop(0)
+                if not items:
+                    del self.data[args[0]]
+                return value
+            raise ValueError(f"unknown command '{command}'")
@@ -0,0 +1,141 @@
+"""Google API transport: a new httplib2 connection per request vs the shared keep-alive pool.
+
+Usage (from backend/):
+
+    python -m benchmarks.http_pool
+    python -m benchmarks.http_pool --requests 200 --concurrency 8 --connect-latency-ms 60
+
+Each simulated API request makes the Gmail calls of a 3-email list page
+(one list, three gets) against a local HTTPS stub of the Gmail API with a
+throwaway self-signed certificate (needs the openssl command). The stub
+adds --connect-latency-ms to every new connection, standing in for the
+TCP and TLS round trips to googleapis.com; the TLS handshake itself is real.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Dict, Any
+import argparse
+import statistics
+import subprocess
+import tempfile
+import time
+
+from benchmarks.fakes import FakeBehavior, FakeGmailServer
+from benchmarks.run import percentile
+
+
+def make_certificate(directory: Path) -> Dict[str, str]:
+    """Self-signed certificate for 127.0.0.1, valid for a day"""
+    certfile, keyfile = directory / "cert.pem", directory / "key.pem"
+    subprocess.run(
+        ["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1",
+         "-keyout", str(keyfile), "-out", str(certfile), "-subj", "/CN=127.0.0.1",
+         "-addext", "subjectAltName=IP:127.0.0.1"],
+        check=True, capture_output=True
+    )
+    return {"certfile": str(certfile), "keyfile": str(keyfile)}
+
+
+def _list_page(service) -> None:
+    messages = service.users().messages().list(userId='me', maxResults=3, labelIds=['INBOX']).execute()
+    for message in messages['messages']:
+        service.users().messages().get(userId='me', id=message['id'], format='full').execute()
+
+
+def _per_request_httplib2(url: str, certfile: str) -> Callable[[], None]:
+    """What the backend did before: a fresh httplib2.Http inside every GmailService"""
+    import httplib2
+    from google.oauth2.credentials import Credentials
+    from google_auth_httplib2 import AuthorizedHttp
+    from googleapiclient.discovery import build_from_document
+    from app.services.google_api import discovery_document
+
+    document = discovery_document('gmail', 'v1')
+
+    def request() -> None:
+        http = AuthorizedHttp(Credentials(token="bench"), http=httplib2.Http(ca_certs=certfile))
+        _list_page(build_from_document(document, http=http, client_options={"api_endpoint": url}))
+    return request
+
+
+def _shared_pool(url: str) -> Callable[[], None]:
+    from google.oauth2.credentials import Credentials
+    from app.services.google_api import build_service
+
+    def request() -> None:
+        _list_page(build_service('gmail', 'v1', Credentials(token="bench"), {"api_endpoint": url}))
+    return request
+
+
+def _measure(request: Callable[[], None], server: FakeGmailServer, requests: int, concurrency: int) -> Dict[str, Any]:
+    request()
+    connections_before = server.connections
+    latencies = []
+
+    def timed(_):
+        start = time.perf_counter()
+        request()
+        latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        list(pool.map(timed, range(requests)))
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "p50_ms": round(statistics.median(latencies) * 1000, 1),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 1),
+        "requests_per_s": round(requests / elapsed, 1),
+        "connections": server.connections - connections_before,
+    }
+
+
+def run(requests: int = 100, concurrency: int = 4, connect_latency_ms: float = 30.0,
+        latency_ms: float = 5.0) -> Dict[str, Dict[str, Any]]:
+    from app.core.config import settings
+    from app.core.http_transport import google_http
+    from app.core.metrics import HTTP_POOL_REQUESTS
+
+    with tempfile.TemporaryDirectory() as directory:
+        cert = make_certificate(Path(directory))
+        behavior = FakeBehavior(latency_ms=latency_ms, connect_latency_ms=connect_latency_ms)
+        server = FakeGmailServer(mailbox_size=50, behavior=behavior).use_tls(**cert).start()
+        url = server.url + "/"
+        settings.GOOGLE_HTTP_CA_BUNDLE = cert["certfile"]
+        google_http.close()
+        try:
+            report = {"httplib2 per request": _measure(_per_request_httplib2(url, cert["certfile"]),
+                                                       server, requests, concurrency)}
+            reused = HTTP_POOL_REQUESTS.value(host="127.0.0.1", connection="reused")
+            new = HTTP_POOL_REQUESTS.value(host="127.0.0.1", connection="new")
+            report["shared pool"] = _measure(_shared_pool(url), server, requests, concurrency)
+            reused = HTTP_POOL_REQUESTS.value(host="127.0.0.1", connection="reused") - reused
+            new = HTTP_POOL_REQUESTS.value(host="127.0.0.1", connection="new") - new
+            report["shared pool"]["reuse_ratio"] = round(reused / max(1, reused + new), 3)
+            report["shared pool"]["http2"] = google_http.http2
+            return report
+        finally:
+            google_http.close()
+            server.stop()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=100, help="simulated API requests per mode")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--connect-latency-ms", type=float, default=30.0)
+    parser.add_argument("--latency-ms", type=float, default=5.0, help="stub latency per Gmail call")
+    args = parser.parse_args()
+
+    report = run(args.requests, args.concurrency, args.connect_latency_ms, args.latency_ms)
+    print(f"{'mode':<22} {'p50 ms':>8} {'p95 ms':>8} {'req/s':>8} {'conns':>6}")
+    for mode, stats in report.items():
+        print(f"{mode:<22} {stats['p50_ms']:>8} {stats['p95_ms']:>8} {stats['requests_per_s']:>8} "
+              f"{stats['connections']:>6}")
+    pool = report["shared pool"]
+    print(f"pool reuse ratio {pool['reuse_ratio']}, HTTP/2 {'on' if pool['http2'] else 'off (h2 not installed)'}")
+
+
+if __name__ == "__main__":
+    main()
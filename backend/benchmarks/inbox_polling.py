@@ -0,0 +1,70 @@
+"""Bytes on the wire per dashboard refresh: full list reloads vs delta polling.
+
+Usage (from backend/):
+
+    python -m benchmarks.inbox_polling
+    python -m benchmarks.inbox_polling --page-size 50 --changes 0,1,5
+
+Each refresh either reloads the first page of /api/emails/list or asks
+/api/emails/delta for what changed since the last history id, with and
+without gzip, against the fake Gmail and Anthropic servers.
+"""
+from typing import Dict, List
+import argparse
+import logging
+
+from fastapi.testclient import TestClient
+
+from benchmarks.fakes import FakeGmailServer, FakeAnthropicServer
+from benchmarks.run import configure_app
+
+
+def _wire_bytes(client: TestClient, path: str, headers: Dict[str, str], encoding: str) -> int:
+    """Body bytes as sent, i.e. after any content encoding"""
+    with client.stream("GET", path, headers={**headers, "Accept-Encoding": encoding}) as response:
+        response.raise_for_status()
+        return sum(len(chunk) for chunk in response.iter_raw())
+
+
+def run(page_size: int = 50, changes: List[int] = (0, 1, 5)) -> Dict[str, Dict[str, int]]:
+    logging.disable(logging.INFO)
+    gmail = FakeGmailServer(mailbox_size=max(200, page_size)).start()
+    llm = FakeAnthropicServer().start()
+    try:
+        app, token = configure_app(gmail.url, llm.url, "anthropic")
+        client = TestClient(app)
+        headers = {"Authorization": f"Bearer {token}"}
+        list_path = f"/api/emails/list?max_results={page_size}"
+
+        report = {}
+        for count in changes:
+            history_id = client.get(list_path, headers=headers).json()["history_id"]
+            gmail.deliver(count)
+            delta_path = f"/api/emails/delta?history_id={history_id}"
+            report[f"{count} new"] = {
+                "list": _wire_bytes(client, list_path, headers, "identity"),
+                "list gzip": _wire_bytes(client, list_path, headers, "gzip"),
+                "delta": _wire_bytes(client, delta_path, headers, "identity"),
+                "delta gzip": _wire_bytes(client, delta_path, headers, "gzip"),
+            }
+        return report
+    finally:
+        gmail.stop()
+        llm.stop()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--page-size", type=int, default=50)
+    parser.add_argument("--changes", default="0,1,5", help="comma separated new messages per refresh")
+    args = parser.parse_args()
+
+    report = run(args.page_size, [int(count) for count in args.changes.split(",")])
+    columns = ("list", "list gzip", "delta", "delta gzip")
+    print(f"{'refresh':<10}" + "".join(f"{column:>12}" for column in columns) + "  (bytes)")
+    for name, sizes in report.items():
+        print(f"{name:<10}" + "".join(f"{sizes[column]:>12}" for column in columns))
+
+
+if __name__ == "__main__":
+    main()
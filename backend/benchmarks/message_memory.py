@@ -0,0 +1,100 @@
+"""Per-message memory and response size of plain email dicts vs MessageRecord.
+
+Usage (from backend/):
+
+    python -m benchmarks.message_memory
+    python -m benchmarks.message_memory --messages 2000 --body-size 6000
+
+Bodies are generated from a fixed vocabulary with a seeded RNG so they
+compress like prose rather than like the fake server's repeated sentence.
+"""
+from typing import Dict, Any, List, Callable
+import argparse
+import gc
+import json
+import random
+import tracemalloc
+
+from app.models.message import MessageRecord, project_emails
+from benchmarks.fakes import SENDERS
+
+WORDS = (
+    "the order invoice meeting project review please attached update schedule thanks regards team "
+    "payment account delivery tomorrow week report draft comments approve request question budget "
+    "customer support ticket release deadline call notes follow agenda summary contract renewal"
+).split()
+
+
+def make_emails(count: int, body_size: int, seed: int = 7) -> List[Dict[str, Any]]:
+    """GmailService-shaped email dicts, built fresh so no strings are shared between them"""
+    rng = random.Random(seed)
+    emails = []
+    for i in range(count):
+        name, address, subject = SENDERS[i % len(SENDERS)]
+        body = " ".join(rng.choice(WORDS) for _ in range(body_size // 6))[:body_size]
+        emails.append({
+            'id': f"m{i:06d}",
+            # Copies, as the Gmail client decodes every header into a new string
+            'sender_name': "".join(list(name)),
+            'sender_email': "".join(list(address)),
+            'subject': subject,
+            'snippet': body[:100],
+            'body': body,
+            'date': "Mon, 1 Jan 2024 10:00:00 +0000",
+            'thread_id': f"t{i // 3:06d}",
+            'message_id_header': f"<m{i:06d}@mail.example.com>",
+            'attachments': [],
+        })
+    return emails
+
+
+def measure(build: Callable[[], Any], count: int) -> float:
+    """Bytes per message still allocated for what build() returns (its inputs are freed by then)"""
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    kept = build()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del kept
+    return (after - before) / count
+
+
+def run(messages: int = 1000, body_size: int = 4000) -> Dict[str, Dict[str, float]]:
+    emails = make_emails(messages, body_size)
+
+    memory = {
+        "dict with body": measure(lambda: make_emails(messages, body_size), messages),
+        "record with body": measure(
+            lambda: [MessageRecord.from_email(email) for email in make_emails(messages, body_size)], messages
+        ),
+        "index metadata dict": measure(lambda: project_emails(make_emails(messages, body_size)), messages),
+        "index metadata record": measure(
+            lambda: [MessageRecord.from_email(email, keep_body=False) for email in make_emails(messages, body_size)],
+            messages
+        ),
+    }
+    sizes = {
+        "search response, full dicts": len(json.dumps({"emails": emails[:10]})),
+        "search response, projection": len(json.dumps({"emails": project_emails(emails[:10])})),
+        "session state, plain": len(json.dumps(emails[:10])),
+        "session state, records": len(json.dumps([MessageRecord.from_email(e).to_state() for e in emails[:10]])),
+    }
+    return {"memory_bytes_per_message": memory, "bytes_per_10_emails": sizes}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=1000)
+    parser.add_argument("--body-size", type=int, default=4000)
+    args = parser.parse_args()
+
+    report = run(args.messages, args.body_size)
+    for section, values in report.items():
+        print(section)
+        for name, value in values.items():
+            print(f"  {name:<30} {value:>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
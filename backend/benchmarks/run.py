@@ -0,0 +1,328 @@
+"""Offline load test for the backend against fake Gmail and LLM servers.
+
+Usage (from backend/):
+
+    python -m benchmarks.run --concurrency 8 --requests 200
+    python -m benchmarks.run --scenarios list,chat --gmail-latency-ms 40 --llm-latency-ms 300
+    python -m benchmarks.run --compare latest
+
+Each run is written to benchmarks/results/<timestamp>-<commit>.json so that
+later runs can be compared against it with --compare.
+"""
+from typing import Dict, Any, List, Optional
+import argparse
+import asyncio
+import json
+import logging
+import math
+import os
+import resource
+import socket
+import subprocess
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+
+from benchmarks.fakes import (
+    FakeBehavior, FakeGmailServer, FakeAnthropicServer, FakeOpenAIServer
+)
+
+RESULTS_DIR = Path(__file__).parent / "results"
+
+SCENARIOS = {
+    "list": ("GET", "/api/emails/list", {"params": {"max_results": 10}}),
+    "chat": ("POST", "/api/chat/message", {"json": {"message": "show me my latest emails"}}),
+    "digest": ("GET", "/api/emails/digest/daily", {}),
+    "reply": ("POST", "/api/emails/generate-reply", {"json": {"email_id": "m000001"}}),
+}
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, math.ceil(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[rank]
+
+
+def summarize_latencies(latencies: List[float], errors: int, elapsed: float) -> Dict[str, Any]:
+    """Reduce raw latencies (seconds) to the reported statistics"""
+    ordered = sorted(latencies)
+    total = len(latencies) + errors
+    return {
+        "requests": total,
+        "errors": errors,
+        "p50_ms": round(percentile(ordered, 50) * 1000, 2),
+        "p95_ms": round(percentile(ordered, 95) * 1000, 2),
+        "p99_ms": round(percentile(ordered, 99) * 1000, 2),
+        "mean_ms": round(sum(ordered) / len(ordered) * 1000, 2) if ordered else 0.0,
+        "throughput_rps": round(total / elapsed, 2) if elapsed > 0 else 0.0,
+    }
+
+
+def max_rss_mb() -> float:
+    """Peak resident set size of this process (server and driver share it)"""
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+def current_commit() -> str:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except Exception:
+        return "unknown"
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+# Settings overridden while a benchmark runs, restored afterwards
+OVERRIDDEN_SETTINGS = [
+    "AI_PROVIDER", "GMAIL_API_ENDPOINT", "ANTHROPIC_BASE_URL", "OPENAI_BASE_URL",
+    "ANTHROPIC_API_KEY", "OPENAI_API_KEY",
+]
+
+
+def configure_app(gmail_url: str, llm_url: str, provider: str):
+    """Point the backend at the fakes and return (app, bearer token)"""
+    from app.core.config import settings
+    settings.AI_PROVIDER = provider
+    settings.GMAIL_API_ENDPOINT = gmail_url + "/"
+    settings.ANTHROPIC_BASE_URL = llm_url
+    settings.OPENAI_BASE_URL = llm_url + "/v1"
+    settings.ANTHROPIC_API_KEY = settings.ANTHROPIC_API_KEY or "benchmark"
+    settings.OPENAI_API_KEY = settings.OPENAI_API_KEY or "benchmark"
+
+    from app.core.security import create_access_token
+    from app.main import app
+    from app.services.gmail_service import gmail_circuit
+    from app.services.llm_providers import llm_router
+    from app.services.contacts import contact_index
+    from app.services.priority import priority_ranker
+
+    # New dependencies: forget failures recorded against the previous ones
+    gmail_circuit.reset()
+    llm_router.health.reset()
+    # ...and the sender history learned from the previous mailbox
+    priority_ranker.reset()
+    contact_index.reset()
+
+    token = create_access_token({
+        "email": "bench@example.com", "name": "Bench", "picture": None,
+        "access_token": "fake-access-token", "refresh_token": "fake-refresh-token",
+    })
+    return app, token
+
+
+@contextmanager
+def fake_app(mailbox_size: int = 20, provider: str = "anthropic"):
+    """Backend wired to fresh fakes, for tests: yields (app, bearer token, Gmail fake),
+    then stops the fakes and restores the settings"""
+    from app.core.config import settings
+    from app.services.gmail_service import gmail_circuit
+    saved_settings = {key: getattr(settings, key) for key in OVERRIDDEN_SETTINGS}
+
+    gmail = FakeGmailServer(mailbox_size=mailbox_size).start()
+    llm = (FakeAnthropicServer if provider == "anthropic" else FakeOpenAIServer)().start()
+    try:
+        app, token = configure_app(gmail.url, llm.url, provider)
+        yield app, token, gmail
+    finally:
+        gmail_circuit.reset()
+        gmail.stop()
+        llm.stop()
+        for key, value in saved_settings.items():
+            setattr(settings, key, value)
+
+
+class _ServerThread:
+    """Run uvicorn on a background thread"""
+
+    def __init__(self, app, port: int):
+        import uvicorn
+        config = uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning", lifespan="off")
+        self.server = uvicorn.Server(config)
+        self.thread = threading.Thread(target=self.server.run, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        while not self.server.started:
+            time.sleep(0.01)
+        return self
+
+    def __exit__(self, *exc):
+        self.server.should_exit = True
+        self.thread.join(timeout=5)
+
+
+async def _drive(base_url: str, token: str, scenario: str, requests: int, concurrency: int,
+                 timeout: float) -> Dict[str, Any]:
+    import httpx
+
+    method, path, kwargs = SCENARIOS[scenario]
+    latencies: List[float] = []
+    errors = 0
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=timeout,
+                                 headers={"Authorization": f"Bearer {token}"},
+                                 limits=httpx.Limits(max_connections=concurrency)) as client:
+        async def one():
+            nonlocal errors
+            async with semaphore:
+                start = time.perf_counter()
+                try:
+                    response = await client.request(method, path, **kwargs)
+                    ok = response.status_code < 400
+                except httpx.HTTPError:
+                    ok = False
+                if ok:
+                    latencies.append(time.perf_counter() - start)
+                else:
+                    errors += 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one() for _ in range(requests)))
+        elapsed = time.perf_counter() - start
+
+    return summarize_latencies(latencies, errors, elapsed)
+
+
+def run_benchmark(scenarios: List[str], requests: int = 50, concurrency: int = 4,
+                  mailbox_size: int = 500, provider: str = "anthropic",
+                  gmail_latency_ms: float = 20.0, llm_latency_ms: float = 150.0,
+                  jitter_ms: float = 10.0, error_rate: float = 0.0,
+                  timeout: float = 60.0) -> Dict[str, Any]:
+    """Start the fakes and the backend, drive each scenario and return the report"""
+    for key, value in {
+        "GOOGLE_CLIENT_ID": "benchmark", "GOOGLE_CLIENT_SECRET": "benchmark",
+        "GOOGLE_REDIRECT_URI": "http://localhost/callback", "SECRET_KEY": "benchmark-secret",
+    }.items():
+        os.environ.setdefault(key, value)
+
+    from app.core.config import settings
+    saved_settings = {key: getattr(settings, key) for key in OVERRIDDEN_SETTINGS}
+
+    gmail = FakeGmailServer(
+        mailbox_size=mailbox_size,
+        behavior=FakeBehavior(gmail_latency_ms, jitter_ms, error_rate)
+    ).start()
+    llm_cls = FakeAnthropicServer if provider == "anthropic" else FakeOpenAIServer
+    llm = llm_cls(behavior=FakeBehavior(llm_latency_ms, jitter_ms, error_rate)).start()
+
+    try:
+        app, token = configure_app(gmail.url, llm.url, provider)
+        port = _free_port()
+        rss_before = max_rss_mb()
+
+        results = {}
+        with _ServerThread(app, port):
+            for scenario in scenarios:
+                gmail_before, llm_before = gmail.requests, llm.requests
+                results[scenario] = asyncio.run(
+                    _drive(f"http://127.0.0.1:{port}", token, scenario, requests, concurrency, timeout)
+                )
+                results[scenario]["gmail_calls"] = gmail.requests - gmail_before
+                results[scenario]["llm_calls"] = llm.requests - llm_before
+
+        return {
+            "commit": current_commit(),
+            "timestamp": datetime.utcnow().isoformat(),
+            "config": {
+                "requests": requests, "concurrency": concurrency, "mailbox_size": mailbox_size,
+                "provider": provider, "gmail_latency_ms": gmail_latency_ms,
+                "llm_latency_ms": llm_latency_ms, "jitter_ms": jitter_ms, "error_rate": error_rate,
+            },
+            "results": results,
+            "memory": {"max_rss_before_mb": rss_before, "max_rss_after_mb": max_rss_mb()},
+        }
+    finally:
+        gmail.stop()
+        llm.stop()
+        for key, value in saved_settings.items():
+            setattr(settings, key, value)
+
+
+def save_report(report: Dict[str, Any], results_dir: Path = RESULTS_DIR) -> Path:
+    results_dir.mkdir(parents=True, exist_ok=True)
+    stamp = datetime.utcnow().strftime("%Y%m%dT%H%M%S")
+    path = results_dir / f"{stamp}-{report['commit']}.json"
+    path.write_text(json.dumps(report, indent=2))
+    return path
+
+
+def load_report(reference: str, results_dir: Path = RESULTS_DIR, exclude: Optional[Path] = None) -> Optional[Dict[str, Any]]:
+    """Load a report by path, or the newest stored one for 'latest'"""
+    if reference != "latest":
+        return json.loads(Path(reference).read_text())
+
+    candidates = sorted(p for p in results_dir.glob("*.json") if p != exclude)
+    return json.loads(candidates[-1].read_text()) if candidates else None
+
+
+def format_report(report: Dict[str, Any], baseline: Optional[Dict[str, Any]] = None) -> str:
+    """Render a table, with % change against a baseline when given"""
+    lines = [f"commit {report['commit']}  {report['config']}"]
+    header = f"{'scenario':<10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'req/s':>10}{'errors':>8}{'gmail':>8}{'llm':>8}"
+    lines.append(header)
+
+    for scenario, stats in report["results"].items():
+        row = (f"{scenario:<10}{stats['p50_ms']:>10}{stats['p95_ms']:>10}{stats['p99_ms']:>10}"
+               f"{stats['throughput_rps']:>10}{stats['errors']:>8}{stats['gmail_calls']:>8}{stats['llm_calls']:>8}")
+        base = (baseline or {}).get("results", {}).get(scenario)
+        if base and base.get("p95_ms"):
+            change = (stats["p95_ms"] - base["p95_ms"]) / base["p95_ms"] * 100
+            row += f"   p95 {change:+.1f}% vs {baseline['commit']}"
+        lines.append(row)
+
+    memory = report["memory"]
+    lines.append(f"max RSS {memory['max_rss_before_mb']} MB -> {memory['max_rss_after_mb']} MB")
+    return "\n".join(lines)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="comma separated: " + ",".join(SCENARIOS))
+    parser.add_argument("--requests", type=int, default=50, help="requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--mailbox-size", type=int, default=500)
+    parser.add_argument("--provider", choices=["anthropic", "openai"], default="anthropic")
+    parser.add_argument("--gmail-latency-ms", type=float, default=20.0)
+    parser.add_argument("--llm-latency-ms", type=float, default=150.0)
+    parser.add_argument("--jitter-ms", type=float, default=10.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--compare", help="baseline report path, or 'latest'")
+    parser.add_argument("--no-save", action="store_true", help="do not store the report")
+    args = parser.parse_args()
+
+    # Per-request client logs would dominate the output
+    for name in ("httpx", "googleapiclient.discovery_cache", "app"):
+        logging.getLogger(name).setLevel(logging.WARNING)
+
+    baseline = load_report(args.compare) if args.compare else None
+
+    report = run_benchmark(
+        scenarios=[s for s in args.scenarios.split(",") if s],
+        requests=args.requests,
+        concurrency=args.concurrency,
+        mailbox_size=args.mailbox_size,
+        provider=args.provider,
+        gmail_latency_ms=args.gmail_latency_ms,
+        llm_latency_ms=args.llm_latency_ms,
+        jitter_ms=args.jitter_ms,
+        error_rate=args.error_rate,
+    )
+
+    print(format_report(report, baseline))
+    if not args.no_save:
+        print(f"saved {save_report(report)}")
+
+
+if __name__ == "__main__":
+    main()
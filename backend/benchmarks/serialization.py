@@ -0,0 +1,90 @@
+"""Serialization cost of 100-email list and search responses, old path vs lean path.
+
+Usage (from backend/):
+
+    python -m benchmarks.serialization
+    python -m benchmarks.serialization --emails 500 --iterations 200
+
+The old path is what FastAPI did before: pydantic models per email,
+response_model validation, jsonable_encoder and stdlib json. The lean path
+builds plain dicts and renders them with FastJSONResponse (orjson).
+"""
+from typing import Dict, Any, Callable
+import argparse
+import asyncio
+import time
+
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+
+from app.core.responses import FastJSONResponse, parse_fields, project
+from app.models.message import project_emails
+from app.models.schemas import EmailListResponse, EmailSummary
+from benchmarks.message_memory import make_emails
+
+# One loop for every call, so event loop setup is not counted against the old path
+_loop = asyncio.new_event_loop()
+
+
+def _old_list(emails) -> bytes:
+    models = [EmailSummary(id=e['id'], sender_name=e['sender_name'], sender_email=e['sender_email'],
+                           subject=e['subject'], summary=e['snippet'], snippet=e['snippet'], date=e['date'])
+              for e in emails]
+    content = EmailListResponse(emails=models, total=len(models), next_cursor=None)
+    field = create_response_field(name="response", type_=EmailListResponse)
+    return JSONResponse(_loop.run_until_complete(serialize_response(field=field, response_content=content))).body
+
+
+def _new_list(emails, fields=None) -> bytes:
+    summaries = [{'id': e['id'], 'sender_name': e['sender_name'], 'sender_email': e['sender_email'],
+                  'subject': e['subject'], 'summary': e['snippet'], 'snippet': e['snippet'], 'date': e['date']}
+                 for e in emails]
+    return FastJSONResponse({'emails': project(summaries, fields), 'total': len(summaries),
+                             'next_cursor': None}).body
+
+
+def _old_search(emails) -> bytes:
+    return JSONResponse(_loop.run_until_complete(serialize_response(
+        response_content={"emails": emails, "total": len(emails), "query": "invoice"}
+    ))).body
+
+
+def _new_search(emails) -> bytes:
+    return FastJSONResponse({"emails": project_emails(emails), "total": len(emails), "query": "invoice"}).body
+
+
+def _time(fn: Callable[[], bytes], iterations: int) -> Dict[str, float]:
+    fn()
+    start = time.perf_counter()
+    for _ in range(iterations):
+        body = fn()
+    elapsed = time.perf_counter() - start
+    return {"us_per_response": round(elapsed / iterations * 1e6, 1), "bytes": len(body)}
+
+
+def run(emails: int = 100, iterations: int = 100) -> Dict[str, Dict[str, float]]:
+    data = make_emails(emails, body_size=4000)
+    fields = parse_fields("id,subject,summary", tuple(EmailSummary.model_fields))
+    return {
+        "list, pydantic + json": _time(lambda: _old_list(data), iterations),
+        "list, dicts + orjson": _time(lambda: _new_list(data), iterations),
+        "list, ?fields=id,subject,summary": _time(lambda: _new_list(data, fields), iterations),
+        "search, full dicts + json": _time(lambda: _old_search(data), iterations),
+        "search, projection + orjson": _time(lambda: _new_search(data), iterations),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--emails", type=int, default=100)
+    parser.add_argument("--iterations", type=int, default=100)
+    args = parser.parse_args()
+
+    print(f"{'path':<36} {'us/response':>12} {'bytes':>10}")
+    for name, stats in run(args.emails, args.iterations).items():
+        print(f"{name:<36} {stats['us_per_response']:>12} {stats['bytes']:>10}")
+
+
+if __name__ == "__main__":
+    main()
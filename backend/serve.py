@@ -0,0 +1,36 @@
+"""Production entry point: one uvicorn worker per core sharing the state backend.
+
+    python serve.py
+
+WEB_CONCURRENCY overrides the worker count. With more than one worker,
+set STATE_BACKEND to sqlite (single host) or redis (several hosts) so
+sessions, caches and job status are visible to every worker.
+"""
+import logging
+import os
+import uvicorn
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+def worker_count() -> int:
+    return settings.WEB_CONCURRENCY or os.cpu_count() or 1
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    workers = worker_count()
+    if workers > 1 and settings.STATE_BACKEND == "memory":
+        logger.warning(
+            "Running %d workers with the memory state backend; chat sessions, job status and reply counts "
+            "will not be shared between them. Set STATE_BACKEND=sqlite or redis.", workers
+        )
+    uvicorn.run(
+        "app.main:app",
+        host=settings.HOST,
+        port=settings.PORT,
+        workers=workers,
+        proxy_headers=True,
+        forwarded_allow_ips=settings.FORWARDED_ALLOW_IPS
+    )
@@ -0,0 +1,16 @@
+import pytest
+from fastapi.testclient import TestClient
+from benchmarks.run import fake_app
+
+
+@pytest.fixture
+def mailbox_size():
+    """Messages in the fake mailbox behind the api fixture; a test module can override it"""
+    return 20
+
+
+@pytest.fixture
+def api(mailbox_size):
+    """App wired to fake Gmail and Anthropic servers: (client, auth headers, Gmail fake)"""
+    with fake_app(mailbox_size) as (app, token, gmail):
+        yield TestClient(app), {"Authorization": f"Bearer {token}"}, gmail
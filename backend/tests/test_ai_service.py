@@ -1,8 +1,23 @@
 import pytest
+from app.core.state import MemoryBackend
 from app.services.ai_service import AIService
+from app.services.llm_providers import Completion, TierSelector
 from app.core.config import settings
 
 
+class ScriptedRouter:
+    """Router stand-in returning canned completions"""
+
+    def __init__(self, *texts):
+        self.texts = list(texts)
+        self.schemas = []
+        self.selector = TierSelector()
+
+    async def complete(self, operation, prompt, max_tokens, schema=None):
+        self.schemas.append(schema)
+        return Completion(text=self.texts.pop(0), tier="small")
+
+
 @pytest.fixture
 def ai_service():
     """Create AI service instance"""
@@ -80,5 +95,46 @@ async def test_daily_digest_generation(ai_service):
     assert len(digest) > 0
 
 
+def test_parse_intent_structured_output(ai_service, monkeypatch):
+    """Test a schema-valid intent is parsed and served from cache afterwards"""
+    monkeypatch.setattr("app.services.ai_service.state", MemoryBackend())
+    ai_service.router = ScriptedRouter(
+        '{"intent": "delete_email", "params": {"email_number": 2}, "confidence": "high"}'
+    )
+    
+    first = ai_service.parse_intent("Delete email 2")
+    second = ai_service.parse_intent("delete  email 2")
+    
+    assert first["intent"] == "delete_email"
+    assert first["params"] == {"email_number": 2}
+    assert ai_service.router.schemas[0]["name"] == "IntentResult"
+    assert second["intent"] == "delete_email"
+    assert len(ai_service.router.schemas) == 1
+
+
+def test_parse_intent_rejects_invalid_output(ai_service, monkeypatch):
+    """Test output outside the schema falls back to help and is not cached"""
+    monkeypatch.setattr("app.services.ai_service.state", MemoryBackend())
+    ai_service.router = ScriptedRouter('{"intent": "launch_rockets"}', '{"intent": "help"}')
+    
+    assert ai_service.parse_intent("do something")["confidence"] == "low"
+    assert ai_service.parse_intent("do something")["intent"] == "help"
+    assert ai_service.router.selector._quality[("parse_intent", "small")][0] is False
+
+
+def test_summarize_emails_batch(ai_service):
+    """Test batch summaries keep input order and fill gaps from the body"""
+    ai_service.router = ScriptedRouter(
+        '{"summaries": [{"index": 1, "summary": "Second"}, {"index": 0, "summary": "First"}]}'
+    )
+    emails = [
+        {"sender_name": "A", "subject": "One", "body": "body one"},
+        {"sender_name": "B", "subject": "Two", "body": "body two"},
+        {"sender_name": "C", "subject": "Three", "body": "body three"},
+    ]
+    
+    assert ai_service.summarize_emails(emails) == ["First", "Second", "body three"]
+
+
 if __name__ == "__main__":
     pytest.main([__file__, "-v"])
@@ -0,0 +1,115 @@
+import base64
+import contextvars
+import json
+import pytest
+from datetime import datetime, timedelta
+from app.core.config import settings
+from app.core.state import MemoryBackend
+from app.core.tracing import Tracer, BatchSpanProcessor, FileSpanExporter
+from app.services.attachments import Base64FieldDecoder, AttachmentTextCache, extract_text
+from app.services.gmail_service import GmailService
+from benchmarks.fakes import FakeGmailServer
+
+
+def decode_in_chunks(document: bytes, chunk_size: int) -> bytes:
+    decoder = Base64FieldDecoder()
+    out = b"".join(decoder.feed(document[i:i + chunk_size]) for i in range(0, len(document), chunk_size))
+    return out + decoder.finish()
+
+
+@pytest.mark.parametrize("chunk_size", [1, 3, 7, 64, 4096])
+def test_decoder_handles_any_chunk_boundary(chunk_size):
+    """Test the streaming decoder matches a one-shot decode"""
+    data = bytes(range(256)) * 10 + b"tail"
+    document = json.dumps({
+        "size": len(data),
+        "data": base64.urlsafe_b64encode(data).decode("ascii").rstrip("=")
+    }).encode("utf-8")
+
+    assert decode_in_chunks(document, chunk_size) == data
+
+
+def test_extract_text_caps_and_skips_unsupported_types():
+    """Test text extraction is size-capped and ignores binary types"""
+    assert extract_text(b"x" * 100, "text/plain", max_chars=10) == "x" * 10
+    assert extract_text(b"\x89PNG", "image/png", max_chars=10) is None
+
+
+@pytest.fixture
+def gmail(monkeypatch):
+    server = FakeGmailServer(mailbox_size=4).start()
+    monkeypatch.setattr(settings, "GMAIL_API_ENDPOINT", server.url + "/")
+    yield GmailService(access_token="token", refresh_token="refresh"), server
+    server.stop()
+
+
+def test_attachment_metadata_and_streaming(gmail):
+    """Test attachments are listed without bytes and streamed in chunks"""
+    service, server = gmail
+    email = service.get_email_details("m000000")
+
+    assert len(email['attachments']) == 1
+    attachment = email['attachments'][0]
+    assert attachment['filename'] == "notes.txt"
+    assert "Attachment notes" not in email['body']
+
+    chunks = list(service.stream_attachment("m000000", attachment['attachment_id'], chunk_size=1024))
+    assert len(chunks) > 1
+    assert b"".join(chunks) == server.attachments[attachment['attachment_id']]
+
+    with pytest.raises(FileNotFoundError):
+        list(service.stream_attachment("m000000", "missing"))
+
+
+def test_stream_survives_context_switches(gmail, monkeypatch, tmp_path):
+    """Test a traced download can be advanced from a fresh context per chunk, as Starlette does"""
+    service, server = gmail
+    monkeypatch.setattr("app.core.tracing.tracer", Tracer(BatchSpanProcessor(FileSpanExporter(str(tmp_path / "t")))))
+    attachment_id = service.get_email_details("m000000")['attachments'][0]['attachment_id']
+
+    chunks = service.stream_attachment("m000000", attachment_id, chunk_size=1024)
+    data = b""
+    while True:
+        chunk = contextvars.copy_context().run(next, chunks, None)
+        if chunk is None:
+            break
+        data += chunk
+
+    assert data == server.attachments[attachment_id]
+
+
+def test_stream_refreshes_expired_token(gmail, monkeypatch):
+    """Test an expired access token is refreshed before the download instead of failing it"""
+    service, server = gmail
+    attachment_id = service.get_email_details("m000000")['attachments'][0]['attachment_id']
+    refreshed = []
+
+    def refresh(request):
+        refreshed.append(request)
+        service.credentials.token = "fresh-token"
+        service.credentials.expiry = datetime.utcnow() + timedelta(hours=1)
+
+    service.credentials.expiry = datetime.utcnow() - timedelta(minutes=5)
+    monkeypatch.setattr(service.credentials, "refresh", refresh)
+
+    assert b"".join(service.stream_attachment("m000000", attachment_id)) == server.attachments[attachment_id]
+    assert len(refreshed) == 1 and service.credentials.token == "fresh-token"
+
+
+def test_attachment_text_is_cached(gmail):
+    """Test extracted text is fetched once per message part"""
+    service, server = gmail
+    attachment = service.get_email_details("m000000")['attachments'][0]
+    cache = AttachmentTextCache(backend=MemoryBackend())
+
+    first = cache.get_text("user", service, "m000000", attachment)
+    requests = server.requests
+    second = cache.get_text("user", service, "m000000", {**attachment, 'attachment_id': "rotated"})
+
+    assert first.startswith("Attachment notes for message 0")
+    assert second == first
+    assert server.requests == requests
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
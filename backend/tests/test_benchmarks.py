@@ -0,0 +1,58 @@
+import pytest
+from benchmarks.run import run_benchmark, percentile, format_report
+from benchmarks.cold_start import parse_importtime, measure_cold_start
+
+
+def test_percentile_nearest_rank():
+    """Test nearest-rank percentiles"""
+    values = [float(i) for i in range(1, 101)]
+
+    assert percentile(values, 50) == 50.0
+    assert percentile(values, 95) == 95.0
+    assert percentile(values, 99) == 99.0
+    assert percentile([], 95) == 0.0
+
+
+def test_benchmark_smoke():
+    """Test the harness drives every scenario against the fakes"""
+    report = run_benchmark(
+        scenarios=["list", "chat", "digest", "reply"],
+        requests=2,
+        concurrency=2,
+        mailbox_size=20,
+        gmail_latency_ms=0,
+        llm_latency_ms=0,
+        jitter_ms=0
+    )
+
+    for scenario, stats in report["results"].items():
+        assert stats["errors"] == 0, scenario
+        assert stats["llm_calls"] > 0, scenario
+    assert "p95" in format_report(report)
+
+
+def test_parse_importtime():
+    """Test self time is grouped by package and the module total is its cumulative time"""
+    output = "\n".join([
+        "import time: self [us] | cumulative | imported package",
+        "import time:       500 |        500 |     numpy.core",
+        "import time:       200 |        700 |   numpy",
+        "import time:       100 |       1000 | app.main",
+    ])
+
+    total, packages = parse_importtime(output)
+
+    assert total == 0.001
+    assert packages[0] == ("numpy", 0.0007)
+
+
+def test_cold_start_smoke():
+    """Test a fresh process serves its first request after warm-up"""
+    result = measure_cold_start(warmup=True)
+
+    assert result["warmup_s"] > 0
+    assert result["first_request_s"] > 0
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
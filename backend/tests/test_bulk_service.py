@@ -0,0 +1,98 @@
+import pytest
+from pydantic import ValidationError
+from app.core.state import MemoryBackend
+from app.services.bulk_service import BulkActionService
+from app.api.chat import build_bulk_query
+from app.models.schemas import BulkActionRequest
+
+
+class FakeGmail:
+    """Gmail stand-in recording batchModify calls"""
+
+    BATCH_SIZE = 1000
+
+    def __init__(self):
+        self.calls = []
+
+    def batch_modify(self, message_ids, add_label_ids=None, remove_label_ids=None):
+        self.calls.append((len(message_ids), add_label_ids, remove_label_ids))
+        return len(message_ids)
+
+    def list_message_ids(self, query="", max_results=100):
+        if query == "broken":
+            raise RuntimeError("Gmail unavailable")
+        return [f"m{i}" for i in range(min(max_results, 30))]
+
+
+@pytest.fixture
+def bulk():
+    """Create bulk action service"""
+    return BulkActionService(backend=MemoryBackend())
+
+
+def test_trash_uses_one_call_per_batch(bulk):
+    """Test 2500 ids are trashed in three batchModify calls"""
+    gmail = FakeGmail()
+    progress = []
+
+    processed = bulk.execute(gmail, "trash", [str(i) for i in range(2500)],
+                             on_progress=lambda done, total: progress.append(done))
+
+    assert processed == 2500
+    assert [call[0] for call in gmail.calls] == [1000, 1000, 500]
+    assert gmail.calls[0][1] == ["TRASH"]
+    assert progress == [1000, 2000, 2500]
+
+
+def test_label_requires_label_id(bulk):
+    """Test label actions need a label id and unknown actions are rejected"""
+    assert bulk.label_changes("label", "Label_1") == {"add": ["Label_1"], "remove": []}
+
+    with pytest.raises(ValueError):
+        bulk.label_changes("label")
+    with pytest.raises(ValueError):
+        bulk.label_changes("shred")
+
+
+@pytest.mark.parametrize("fields", [
+    {"action": "shred", "query": "in:inbox"},
+    {"action": "trash", "email_ids": [str(i) for i in range(501)]},
+    {"action": "trash", "query": "in:inbox", "max_messages": 0},
+    {"action": "trash", "query": "in:inbox", "max_messages": 100000},
+])
+def test_bulk_request_is_bounded(fields):
+    """Test the API rejects unknown actions and selections larger than MAX_BULK_MESSAGES"""
+    with pytest.raises(ValidationError):
+        BulkActionRequest(**fields)
+
+
+def test_jobs_are_scoped_to_user(bulk):
+    """Test a job can only be read by its owner"""
+    job = bulk.create_job("alice@example.com", "archive", 3)
+    bulk.run_job(job, FakeGmail(), ["a", "b", "c"])
+
+    assert bulk.get_job("alice@example.com", job["job_id"])["status"] == "completed"
+    assert bulk.get_job("bob@example.com", job["job_id"]) is None
+
+
+def test_query_jobs_list_in_the_background(bulk):
+    """Test a query job fills in its total after listing, and a failed listing fails the job"""
+    job = bulk.create_job("alice@example.com", "archive", 0)
+    bulk.run_query_job(job, FakeGmail(), "in:inbox", max_messages=20)
+
+    stored = bulk.get_job("alice@example.com", job["job_id"])
+    assert (stored["status"], stored["total"], stored["processed"]) == ("completed", 20, 20)
+
+    failed = bulk.run_query_job(bulk.create_job("alice@example.com", "archive", 0), FakeGmail(), "broken", 20)
+    assert failed["status"] == "failed" and "unavailable" in failed["error"]
+
+
+def test_build_bulk_query():
+    """Test chat phrases become Gmail search queries"""
+    assert build_bulk_query("delete all promotions from last week") == "category:promotions newer_than:7d"
+    assert build_bulk_query("delete all emails from amazon") == "from:amazon"
+    assert build_bulk_query("delete all of them") == ""
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,186 @@
+import threading
+import time
+import pytest
+from app.core.state import MemoryBackend, SQLiteBackend, state, state_lock
+from app.services.chat_session import ConversationStore
+
+
+def make_emails(count):
+    return [
+        {'id': f"m{i}", 'sender_name': f"Sender {i}", 'subject': f"Subject {i}", 'body': "x" * 10000}
+        for i in range(1, count + 1)
+    ]
+
+
+def test_numbered_references_resolve_from_last_list():
+    """Test 'email 2' resolves against the remembered list"""
+    store = ConversationStore(backend=MemoryBackend())
+    store.remember_emails("user", make_emails(3), source="inbox")
+
+    selected = store.email_by_number("user", 2)
+
+    assert selected['id'] == "m2"
+    assert len(selected['body']) == ConversationStore.MAX_BODY_CHARS
+    assert store.email_by_number("user", 4) is None
+    assert store.email_by_number("other", 1) is None
+
+
+def test_forget_keeps_numbering_stable():
+    """Test deleting email 1 does not renumber the rest"""
+    store = ConversationStore(backend=MemoryBackend())
+    store.remember_emails("user", make_emails(3), source="inbox")
+
+    store.forget_emails("user", ["m1"])
+
+    assert store.email_by_number("user", 1) is None
+    assert store.email_by_number("user", 2)['id'] == "m2"
+    assert [email['id'] for email in store.last_list("user")[1]] == ["m2", "m3"]
+
+
+def test_pending_action_is_taken_once():
+    """Test a confirmation consumes the pending action"""
+    store = ConversationStore(backend=MemoryBackend())
+    store.set_pending("user", {"action": "delete", "email_id": "m1"})
+
+    assert store.pop_pending("user") == {"action": "delete", "email_id": "m1"}
+    assert store.pop_pending("user") is None
+
+
+def test_unrelated_turn_drops_pending_delete(api):
+    """Test a confirmation only applies right after the question it answers"""
+    client, headers, gmail = api
+
+    def say(text):
+        return client.post("/api/chat/message", headers=headers, json={"message": text}).json()
+
+    say("show my emails")
+    assert say("delete email 2")["action"] == "delete_confirm"
+    say("show my emails")
+    reply = say("ok")
+
+    assert reply["action"] != "delete_success"
+    assert not any("TRASH" in message["labelIds"] for message in gmail.messages.values())
+
+
+def test_bulk_confirmation_trashes_the_proposed_ids(api):
+    """Test confirming a bulk delete by query trashes what was counted, not what the query matches now"""
+    client, headers, gmail = api
+    proposed = client.post("/api/chat/message", headers=headers,
+                           json={"message": "delete all promotions"}).json()
+    assert proposed["action"] == "bulk_delete_confirm" and proposed["data"]["count"] == 20
+    new_ids = gmail.deliver(2)
+
+    def confirm(**params):
+        return client.post("/api/chat/confirm-delete", headers=headers, params=params)
+
+    assert confirm(query="category:social").status_code == 400
+    confirmed = confirm(query=proposed["data"]["query"])
+
+    assert confirmed.json()["data"]["count"] == 20
+    assert not any("TRASH" in gmail.messages[message_id]["labelIds"] for message_id in new_ids)
+    assert confirm(query=proposed["data"]["query"]).status_code == 400
+    assert confirm(email_ids=[f"m{i}" for i in range(501)]).status_code == 422
+
+
+def test_waiting_for_session_lock_does_not_block_other_requests(api):
+    """Test a chat request waiting on a locked session leaves the event loop free"""
+    client, headers, _ = api
+    responses = []
+
+    # One event loop serves every request inside the with block, as in uvicorn
+    with client, state_lock(state, "chat:lock:bench@example.com"):
+        waiting = threading.Thread(target=lambda: responses.append(
+            client.post("/api/chat/message", headers=headers, json={"message": "help"})))
+        waiting.start()
+        time.sleep(0.2)
+        started = time.monotonic()
+        assert client.get("/health").status_code == 200
+        assert time.monotonic() - started < 1.0
+    waiting.join()
+
+    assert responses[0].status_code == 200
+
+
+def test_workers_do_not_lose_updates(tmp_path):
+    """Test two workers sharing a backend neither drop turns nor both take one pending action"""
+    backend = SQLiteBackend(str(tmp_path / "state.db"))
+    workers = [ConversationStore(backend=backend), ConversationStore(backend=backend)]
+    workers[0].set_pending("user", {"action": "delete", "email_id": "m1"})
+    popped = []
+
+    def chat(store, n):
+        popped.append(store.pop_pending("user"))
+        for i in range(10):
+            store.add_turn("user", "user", f"worker {n} message {i}")
+
+    threads = [threading.Thread(target=chat, args=(store, n)) for n, store in enumerate(workers * 2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(backend.get_json("chat:user")["turns"]) == 40
+    assert [action for action in popped if action] == [{"action": "delete", "email_id": "m1"}]
+
+
+def test_sessions_expire_and_are_bounded(monkeypatch):
+    """Test TTL expiry and LRU eviction"""
+    clock = [1000.0]
+    monkeypatch.setattr("app.core.state.time.monotonic", lambda: clock[0])
+    store = ConversationStore(ttl_seconds=60, backend=MemoryBackend(max_keys=2))
+
+    store.remember_emails("a", make_emails(1), source="inbox")
+    store.remember_emails("b", make_emails(1), source="inbox")
+    store.remember_emails("c", make_emails(1), source="inbox")
+    assert store.email_by_number("a", 1) is None
+
+    clock[0] += 61
+    assert store.email_by_number("b", 1) is None
+
+
+def test_history_is_folded_into_summary_within_budget():
+    """Test older turns are summarized once the session exceeds its token budget"""
+    store = ConversationStore(history_token_budget=100, backend=MemoryBackend())
+    calls = []
+
+    def summarize(previous, turns):
+        calls.append(len(turns))
+        return "User listed emails and asked about invoices."
+
+    over_budget = False
+    for i in range(8):
+        over_budget = store.add_turn("user", "user", f"message {i} " + "x" * 100)
+
+    assert over_budget
+    store.compact("user", summarize)
+    context = store.context("user")
+
+    assert calls == [8 - ConversationStore.KEEP_RECENT_TURNS]
+    assert context.startswith("Earlier in the conversation: User listed emails")
+    assert "message 0" not in context and "message 7" in context
+
+
+def test_context_lists_shown_emails_without_bodies():
+    """Test the model context carries numbered subjects, never bodies"""
+    store = ConversationStore(backend=MemoryBackend())
+    store.remember_emails("user", make_emails(2), source="inbox")
+    store.add_turn("user", "user", "show my emails")
+
+    context = store.context("user")
+
+    assert "1. Sender 1 - Subject 1" in context
+    assert "xxxx" not in context
+
+
+def test_memory_pressure_evicts_least_recent_sessions():
+    """Test a full backend evicts other users' sessions first"""
+    store = ConversationStore(backend=MemoryBackend(max_keys=1))
+    store.add_turn("a", "user", "x" * 300)
+    store.add_turn("b", "user", "x" * 300)
+
+    assert store.context("a") == ""
+    assert "xxx" in store.context("b")
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
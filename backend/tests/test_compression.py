@@ -0,0 +1,75 @@
+import gzip
+import pytest
+from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from fastapi.testclient import TestClient
+from app.core.compression import CompressionMiddleware, negotiate_encoding
+
+
+@pytest.fixture
+def client():
+    app = FastAPI()
+    app.add_middleware(CompressionMiddleware, minimum_size=100)
+
+    @app.get("/large")
+    async def large():
+        return {"emails": [{"id": f"m{i}", "subject": "Invoice due"} for i in range(50)]}
+
+    @app.get("/small")
+    async def small():
+        return {"ok": True}
+
+    @app.get("/stream")
+    async def stream():
+        return StreamingResponse((f"line {i}\n" * 20 for i in range(3)), media_type="text/plain")
+
+    @app.get("/binary")
+    async def binary():
+        return PlainTextResponse("x" * 500, media_type="application/octet-stream")
+
+    return TestClient(app)
+
+
+def test_negotiate_encoding():
+    """Test q-values, wildcards and server preference decide the encoding"""
+    assert negotiate_encoding("gzip, deflate", ("br", "gzip")) == "gzip"
+    assert negotiate_encoding("gzip, br", ("br", "gzip")) == "br"
+    assert negotiate_encoding("br;q=0.5, gzip;q=0.8", ("br", "gzip")) == "gzip"
+    assert negotiate_encoding("*;q=0.1", ("gzip",)) == "gzip"
+    assert negotiate_encoding("gzip;q=0, identity", ("gzip",)) is None
+    assert negotiate_encoding("", ("gzip",)) is None
+
+
+def test_large_json_is_gzipped(client):
+    """Test large JSON bodies are compressed with exact length and Vary set"""
+    response = client.get("/large", headers={"Accept-Encoding": "gzip"})
+
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["vary"] == "Accept-Encoding"
+    assert int(response.headers["content-length"]) < len(response.content)
+    assert response.json()["emails"][49]["id"] == "m49"
+
+
+def test_small_binary_and_identity_untouched(client):
+    """Test small bodies, non-text types and clients without gzip get plain responses"""
+    small = client.get("/small", headers={"Accept-Encoding": "gzip"})
+    binary = client.get("/binary", headers={"Accept-Encoding": "gzip"})
+    identity = client.get("/large", headers={"Accept-Encoding": "identity"})
+
+    for response in (small, binary, identity):
+        assert "content-encoding" not in response.headers
+    assert identity.json()["emails"]
+
+
+def test_streamed_body_is_compressed_per_chunk(client):
+    """Test streamed text is gzipped without a content length and decodes completely"""
+    with client.stream("GET", "/stream", headers={"Accept-Encoding": "gzip"}) as response:
+        raw = b"".join(response.iter_raw())
+
+    assert response.headers["content-encoding"] == "gzip"
+    assert "content-length" not in response.headers
+    assert gzip.decompress(raw).decode() == "".join(f"line {i}\n" * 20 for i in range(3))
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,129 @@
+import pytest
+from app.core.metrics import CACHE_REQUESTS
+from app.core.state import MemoryBackend, SQLiteBackend
+from app.services.ai_service import AIService
+from app.services.contacts import ContactIndex
+from app.services.gmail_service import parse_sender
+from app.services.llm_providers import Completion, TierSelector
+
+DATE = "Mon, 1 Jan 2024 10:00:00 +0000"
+
+
+class ScriptedRouter:
+    """Router stand-in returning canned completions and keeping the prompts"""
+
+    def __init__(self, *texts):
+        self.texts = list(texts)
+        self.prompts = []
+        self.selector = TierSelector()
+
+    async def complete(self, operation, prompt, max_tokens, schema=None):
+        self.prompts.append(prompt)
+        return Completion(text=self.texts.pop(0), tier="small")
+
+
+def _email(message_id, sender, subject="Hello"):
+    return {"id": message_id, "sender_email": sender, "subject": subject, "body": subject, "date": DATE}
+
+
+def _newsletter(index, user="u", count=3):
+    emails = [_email(f"n{i}", "News@Deals.example.com", "Weekly deals") for i in range(count)]
+    index.add(user, emails)
+    index.set_categories(user, {email["id"]: "Promotions" for email in emails})
+
+
+def test_counts_each_message_once():
+    """Test re-seen messages are not recounted and a new category replaces the old one"""
+    index = ContactIndex(backend=MemoryBackend())
+    index.add("u", [_email("a", "jane@example.com"), _email("b", "jane@example.com")])
+    index.add("u", [_email("a", "jane@example.com")])
+    index.set_categories("u", {"a": "Personal", "b": "Work"})
+    index.set_categories("u", {"a": "Work"})
+    index.record_reply("u", "Jane@Example.com")
+
+    stats = index.get("u", "jane@example.com")
+
+    assert (stats["messages"], stats["replies"], stats["categories"]) == (2, 1, {"Work": 2})
+    assert stats["last_seen"] == 1704103200.0
+    assert "2 message(s)" in index.describe("u", "jane@example.com")
+    assert index.get("u", "nobody@example.com") is None and index.get("other", "jane@example.com") is None
+
+
+def test_sender_features_grow_past_initial_capacity():
+    """Test frequency and reply ratio stay correct once the sender arrays are resized"""
+    index = ContactIndex(backend=MemoryBackend())
+    index.add("u", [_email(f"m{i}", f"sender{i}@example.com") for i in range(100)])
+    index.add("u", [_email("extra", "sender99@example.com")])
+    index.record_reply("u", "sender99@example.com")
+
+    features = index.sender_features("u", ["sender0@example.com", "sender99@example.com", "unknown@example.com"])
+
+    assert features[1].tolist() == pytest.approx([1.0, 0.5])
+    assert 0 < features[0, 0] < 1 and features[0, 1] == 0
+    assert features[2].tolist() == [0.0, 0.0]
+
+
+def test_replies_are_shared_between_workers(tmp_path):
+    """Test a reply recorded by one process's outbox worker counts in another process's index"""
+    backend = SQLiteBackend(str(tmp_path / "state.db"))
+    web, worker = ContactIndex(backend=backend), ContactIndex(backend=backend)
+    web.add("u", [_email("a", "jane@example.com"), _email("b", "jane@example.com")])
+
+    worker.record_reply("u", "Jane@Example.com")
+
+    assert web.get("u", "jane@example.com")["replies"] == 1
+    assert web.sender_features("u", ["jane@example.com"])[0, 1] == pytest.approx(0.5)
+    web.reset()
+    assert backend.get_json("contacts:replies:u") is None
+
+
+def test_known_categories():
+    """Test only consistent, never-answered senders of shortcut categories are recognized"""
+    index = ContactIndex(backend=MemoryBackend())
+    _newsletter(index)
+    index.add("u", [_email(f"w{i}", "boss@example.com") for i in range(3)])
+    index.set_categories("u", {f"w{i}": "Work" for i in range(3)})
+    _newsletter(index, user="replied")
+    index.record_reply("replied", "news@deals.example.com")
+
+    emails = [_email("x", "boss@example.com"), _email("y", "news@deals.example.com")]
+
+    assert index.known_categories("u", emails) == {1: "Promotions"}
+    assert index.known_categories("replied", emails) == {}
+    # Two categorized messages are not enough to trust the sender
+    _newsletter(index, user="new", count=2)
+    assert index.known_categories("new", emails) == {}
+
+
+def test_categorize_skips_llm_for_known_senders(monkeypatch):
+    """Test known newsletter mail is categorized from the index and only the rest reaches the model"""
+    index = ContactIndex(backend=MemoryBackend())
+    _newsletter(index)
+    monkeypatch.setattr("app.services.ai_service.contact_index", index)
+    ai = AIService()
+    ai.router = ScriptedRouter('{"categories": [{"index": 0, "category": "Work"}]}')
+    hits = CACHE_REQUESTS.value(cache="contact_category", result="hit")
+    emails = [_email("y", "news@deals.example.com", "Flash sale"), _email("x", "boss@example.com", "Roadmap")]
+
+    assert ai.categorize_emails(emails, "u") == ["Promotions", "Work"]
+    assert len(ai.router.prompts) == 1
+    assert "Roadmap" in ai.router.prompts[0] and "Flash sale" not in ai.router.prompts[0]
+    assert CACHE_REQUESTS.value(cache="contact_category", result="hit") == hits + 1
+
+    assert ai.categorize_emails(emails[:1], "u") == ["Promotions"]
+    assert len(ai.router.prompts) == 1
+
+
+def test_parse_sender():
+    """Test both From formats parse, and repeated headers come from the cache"""
+    hits = parse_sender.cache_info().hits
+
+    assert parse_sender('"Jane Smith" <jane@example.com>') == ("Jane Smith", "jane@example.com")
+    assert parse_sender("bob@example.com") == ("bob", "bob@example.com")
+    parse_sender("bob@example.com")
+
+    assert parse_sender.cache_info().hits == hits + 1
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
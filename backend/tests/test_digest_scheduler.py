@@ -0,0 +1,92 @@
+import asyncio
+import pytest
+from datetime import datetime, timezone
+from app.core.config import settings
+from app.core.security import decrypt_secret
+from app.core.state import MemoryBackend
+from app.services.digest_scheduler import DigestScheduler
+
+
+@pytest.fixture
+def scheduler(monkeypatch):
+    monkeypatch.setattr(settings, "DIGEST_LEAD_MINUTES", 30)
+    monkeypatch.setattr(settings, "DIGEST_STAGGER_SECONDS", 1200)
+    scheduler = DigestScheduler(backend=MemoryBackend())
+    computed = []
+
+    def fake_compute(user_key, now=None):
+        computed.append(user_key)
+        entry = {"digest": "digest", "email_count": 0, "generated_at": now.isoformat(),
+                 "morning": scheduler.current_morning(user_key, now).date().isoformat()}
+        scheduler.save_digest(user_key, entry)
+        return entry
+
+    monkeypatch.setattr(scheduler, "compute", fake_compute)
+    scheduler.computed = computed
+    return scheduler
+
+
+def test_runs_before_local_morning(scheduler):
+    """Test a Berlin user is precomputed before 8:00 local time, once per morning"""
+    scheduler.register("berlin@example.com", "token", "refresh", tz="Europe/Berlin", hour=8)
+    scheduler.save_digest("berlin@example.com", {"morning": "2024-06-09"})
+
+    # 08:00 CEST is 06:00 UTC; the run is 30 minutes plus the stagger offset earlier
+    run_at = scheduler.next_run("berlin@example.com", datetime(2024, 6, 9, 12, tzinfo=timezone.utc))
+    assert datetime(2024, 6, 10, 5, 10, tzinfo=timezone.utc) <= run_at <= datetime(2024, 6, 10, 5, 30, tzinfo=timezone.utc)
+
+    asyncio.run(scheduler.run_due(datetime(2024, 6, 10, 5, 9, tzinfo=timezone.utc)))
+    assert scheduler.computed == []
+
+    asyncio.run(scheduler.run_due(datetime(2024, 6, 10, 5, 31, tzinfo=timezone.utc)))
+    asyncio.run(scheduler.run_due(datetime(2024, 6, 10, 6, 0, tzinfo=timezone.utc)))
+    assert scheduler.computed == ["berlin@example.com"]
+    assert scheduler.fresh_digest("berlin@example.com", datetime(2024, 6, 10, 7, tzinfo=timezone.utc))
+
+
+def test_users_are_staggered(scheduler):
+    """Test users with the same morning get different run times"""
+    now = datetime(2024, 6, 9, 12, tzinfo=timezone.utc)
+    users = [f"user{i}@example.com" for i in range(20)]
+    for user in users:
+        scheduler.register(user, "token", "refresh")
+
+    assert len({scheduler.next_run(user, now) for user in users}) > 10
+
+
+def test_each_morning_is_claimed_once(scheduler):
+    """Test a second worker sharing the backend does not recompute the digest"""
+    scheduler.register("user@example.com", "token", "refresh")
+    other = DigestScheduler(backend=scheduler.state)
+    other.compute = lambda user_key, now=None: scheduler.computed.append(f"other:{user_key}")
+    now = datetime(2024, 6, 10, 7, 59, tzinfo=timezone.utc)
+
+    async def both():
+        return await asyncio.gather(scheduler.run_due(now), other.run_due(now))
+
+    assert sorted(asyncio.run(both())) == [0, 1]
+    assert len(scheduler.computed) == 1
+
+
+def test_tokens_are_encrypted_at_rest(scheduler):
+    """Test OAuth tokens are not written to the shared backend in plaintext"""
+    scheduler.register("user@example.com", "access-secret", "refresh-secret")
+
+    raw = scheduler.state.get("digest:user:user@example.com")
+    stored = scheduler.state.get_json("digest:user:user@example.com")
+
+    assert "access-secret" not in raw and "refresh-secret" not in raw
+    assert decrypt_secret(stored["refresh_token"]) == "refresh-secret"
+    assert decrypt_secret("not a token") is None
+
+
+def test_invalid_schedule_is_rejected(scheduler):
+    """Test unknown time zones and hours raise ValueError"""
+    with pytest.raises(ValueError):
+        scheduler.register("user@example.com", "token", "refresh", tz="Mars/Olympus")
+    with pytest.raises(ValueError):
+        scheduler.register("user@example.com", "token", "refresh", hour=25)
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
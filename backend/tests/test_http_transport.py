@@ -0,0 +1,69 @@
+import socket
+import pytest
+import requests
+from google.oauth2.credentials import Credentials
+from googleapiclient.errors import HttpError
+from app.core.http_transport import PooledTransport, google_http, requests_session
+from app.core.metrics import HTTP_POOL_REQUESTS
+from app.services.google_api import build_service, discovery_document
+from benchmarks.fakes import FakeGmailServer
+
+
+@pytest.fixture
+def gmail():
+    server = FakeGmailServer(mailbox_size=5).start()
+    google_http.close()
+    yield server
+    google_http.close()
+    server.stop()
+
+
+def test_google_clients_share_pooled_connections(gmail):
+    """Test every client built by build_service reuses one keep-alive connection"""
+    reused = HTTP_POOL_REQUESTS.value(host="127.0.0.1", connection="reused")
+
+    for _ in range(3):
+        service = build_service('gmail', 'v1', Credentials(token="t"), {"api_endpoint": gmail.url + "/"})
+        listed = service.users().messages().list(userId='me', maxResults=2).execute()
+        service.users().messages().get(userId='me', id=listed['messages'][0]['id']).execute()
+
+    assert gmail.connections == 1
+    assert HTTP_POOL_REQUESTS.value(host="127.0.0.1", connection="reused") - reused == 5
+    with pytest.raises(HttpError) as error:
+        service.users().messages().get(userId='me', id='missing').execute()
+    assert error.value.resp.status == 404
+
+
+def test_builds_do_not_share_discovery_document():
+    """Test every build gets its own document, so one client's mutations do not leak into the next"""
+    first = discovery_document('gmail', 'v1')
+    first['resources'].clear()
+
+    second = discovery_document('gmail', 'v1')
+
+    assert second is not first and second['resources']
+    assert build_service('gmail', 'v1', Credentials(token="t")).users().messages()
+
+
+def test_requests_session_goes_through_pool(gmail):
+    """Test requests-based clients (google.auth, requests-oauthlib) use the pool and its errors"""
+    transport = PooledTransport()
+    session = requests_session(transport)
+
+    first = session.get(gmail.url + "/gmail/v1/users/me/profile")
+    second = session.post(gmail.url + "/gmail/v1/users/me/messages/m000000/trash", json={})
+
+    assert first.json()["messagesTotal"] == 5
+    assert second.status_code == 200
+    assert gmail.connections == 1
+
+    with socket.socket() as unused:
+        unused.bind(("127.0.0.1", 0))
+        port = unused.getsockname()[1]
+    with pytest.raises(requests.exceptions.ConnectionError):
+        session.get(f"http://127.0.0.1:{port}/")
+    transport.close()
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
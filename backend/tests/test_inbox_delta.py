@@ -0,0 +1,63 @@
+import pytest
+from app.services.inbox_delta import compute_delta
+
+
+def _ref(message_id, *labels):
+    return {"message": {"id": message_id, "labelIds": list(labels)}}
+
+
+def test_compute_delta_nets_out_changes():
+    """Test added, removed and changed are net of every record in the window"""
+    history = [
+        {"messagesAdded": [_ref("new1", "INBOX", "UNREAD")]},
+        {"messagesAdded": [_ref("new2", "INBOX")]},
+        {"labelsRemoved": [{**_ref("old1", "INBOX"), "labelIds": ["UNREAD"]}]},
+        {"labelsAdded": [{**_ref("old2", "TRASH"), "labelIds": ["TRASH"]}]},
+        {"messagesAdded": [_ref("gone", "INBOX")]},
+        {"messagesDeleted": [_ref("gone")]},
+        {"labelsRemoved": [{**_ref("back", "INBOX"), "labelIds": ["TRASH"]}]},
+        {"messagesAdded": [_ref("sent", "SENT")]},
+    ]
+
+    delta = compute_delta(history)
+
+    assert delta["added"] == ["back", "new2", "new1"]
+    assert delta["removed"] == ["old2"]
+    assert delta["changed"] == {"old1": ["INBOX"]}
+
+
+def test_delta_endpoint(api):
+    """Test the delta endpoint returns only what changed since the listed history id"""
+    client, headers, gmail = api
+
+    listed = client.get("/api/emails/list?max_results=5", headers=headers).json()
+    unchanged = client.get(f"/api/emails/delta?history_id={listed['history_id']}", headers=headers).json()
+
+    new_ids = gmail.deliver(2)
+    client.delete(f"/api/emails/{listed['emails'][0]['id']}", headers=headers)
+    client.post("/api/emails/bulk", headers=headers,
+                json={"action": "mark_read", "email_ids": [listed["emails"][1]["id"]]})
+    delta = client.get(f"/api/emails/delta?history_id={listed['history_id']}&fields=id,summary",
+                       headers=headers).json()
+
+    assert (unchanged["added"], unchanged["removed"], unchanged["changed"], unchanged["reset"]) == ([], [], [], False)
+    assert [email["id"] for email in delta["added"]] == new_ids[::-1]
+    assert list(delta["added"][0]) == ["id", "summary"]
+    assert delta["removed"] == [listed["emails"][0]["id"]]
+    assert delta["changed"] == [{"id": listed["emails"][1]["id"], "label_ids": ["INBOX"]}]
+    assert int(delta["history_id"]) > int(listed["history_id"])
+
+
+def test_delta_expired_history_resets(api):
+    """Test an expired history id asks the client to reload"""
+    client, headers, gmail = api
+    gmail.history_floor = 5000
+
+    response = client.get("/api/emails/delta?history_id=1010", headers=headers)
+
+    assert response.json()["reset"] is True
+    assert client.get("/api/emails/delta?history_id=abc", headers=headers).status_code == 400
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,151 @@
+import asyncio
+import json
+import threading
+import time
+import pytest
+from starlette.websockets import WebSocketDisconnect
+from app.core.config import settings
+from app.core.state import SQLiteBackend
+from app.services.live_inbox import LiveConnection, LiveInbox
+
+
+@pytest.fixture(autouse=True)
+def fast_polling(monkeypatch):
+    monkeypatch.setattr(settings, "LIVE_POLL_SECONDS", 0.05)
+    monkeypatch.setattr(settings, "LIVE_HEARTBEAT_SECONDS", 0.2)
+
+
+def _live_url(client, headers):
+    ticket = client.post("/api/live/ticket", headers=headers).json()["ticket"]
+    return f"/api/live?ticket={ticket}"
+
+
+def _events_until(websocket, event_type, timeout=10.0):
+    """Received events up to and including the first one of event_type"""
+    events = []
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        event = websocket.receive_json()
+        events.append(event)
+        if event["type"] == event_type:
+            return events
+    raise AssertionError(f"No {event_type} event, got {[e['type'] for e in events]}")
+
+
+def test_slow_connection_gets_resync_instead_of_backlog():
+    """Test a full queue is replaced by one resync event counting what was dropped"""
+    connection = LiveConnection(max_queue=3)
+
+    for i in range(5):
+        connection.offer("message.added", json.dumps({"type": "message.added", "n": i}))
+
+    queued = [connection.queue.get_nowait() for _ in range(connection.queue.qsize())]
+    assert [event_type for event_type, _ in queued] == ["resync", "message.added"]
+    assert json.loads(queued[0][1]) == {"type": "resync", "dropped": 4}
+    assert json.loads(queued[1][1])["n"] == 4
+
+
+def test_publish_fans_out_from_threads():
+    """Test one event reaches every connection of the user, also when published from a thread"""
+    hub = LiveInbox(poll_seconds=3600)
+
+    async def scenario():
+        first = hub.connect("a@example.com", "token", "refresh")
+        second = hub.connect("a@example.com", "token", "refresh")
+        other = hub.connect("b@example.com", "token", "refresh")
+        thread = threading.Thread(target=hub.publish, args=("a@example.com", {"type": "job.progress"}))
+        thread.start()
+        thread.join()
+        received = [await asyncio.wait_for(c.queue.get(), 1) for c in (first, second)]
+        for connection in (first, second, other):
+            hub.disconnect("a@example.com" if connection is not other else "b@example.com", connection)
+        await hub.stop()
+        return received, other.queue.qsize()
+
+    received, other_queued = asyncio.run(scenario())
+
+    assert received == [("job.progress", '{"type":"job.progress"}')] * 2
+    assert other_queued == 0
+    assert hub.connection_count("a@example.com") == 0
+
+
+def test_events_reach_connections_in_other_workers(tmp_path, monkeypatch):
+    """Test an event published by one worker process reaches a connection held by another,
+    and only one worker polls Gmail for the user"""
+    monkeypatch.setattr(settings, "LIVE_RELAY_SECONDS", 0.01)
+    backend = SQLiteBackend(str(tmp_path / "state.db"))
+    web, worker = LiveInbox(poll_seconds=3600, backend=backend), LiveInbox(poll_seconds=3600, backend=backend)
+    checks = []
+    monkeypatch.setattr(LiveInbox, "check_mailbox", lambda self, *args: checks.append(self.worker_id) or "1")
+
+    async def scenario():
+        connection = web.connect("a@example.com", "token", "refresh")
+        await asyncio.sleep(0.1)
+        # The outbox worker of another process reports a sent reply
+        await asyncio.to_thread(worker.publish, "a@example.com", {"type": "reply.status"})
+        received = await asyncio.wait_for(connection.queue.get(), 2)
+        # A second process with its own connection leaves the polling to the first
+        worker.connect("a@example.com", "token", "refresh")
+        await asyncio.sleep(0.1)
+        await web.stop()
+        await worker.stop()
+        return received
+
+    assert asyncio.run(scenario()) == ("reply.status", '{"type":"reply.status"}')
+    assert checks == [web.worker_id]
+
+
+def test_live_channel_pushes_new_mail_and_job_progress(api):
+    """Test new mail arrives with its summary and category, and bulk jobs report progress"""
+    client, headers, gmail = api
+
+    with client.websocket_connect(_live_url(client, headers)) as websocket:
+        # Let the watcher take its starting history id
+        time.sleep(0.5)
+        new_id = gmail.deliver(1)[0]
+        events = _events_until(websocket, "category.completed")
+
+        client.post("/api/emails/bulk", headers=headers,
+                    json={"action": "mark_read", "email_ids": [new_id]})
+        progress = _events_until(websocket, "job.progress")
+
+    by_type = {event["type"]: event for event in events}
+    assert by_type["message.added"]["email"]["id"] == new_id
+    assert "body" not in by_type["message.added"]["email"]
+    assert by_type["summary.completed"]["id"] == new_id
+    assert by_type["category.completed"]["id"] == new_id
+    assert progress[-1]["job"]["action"] == "mark_read"
+
+
+def test_large_mail_burst_sends_resync(api, monkeypatch):
+    """Test more new messages than LIVE_MAX_ADDED in one check send a resync instead of fetching them"""
+    client, headers, gmail = api
+    monkeypatch.setattr(settings, "LIVE_MAX_ADDED", 2)
+
+    with client.websocket_connect(_live_url(client, headers)) as websocket:
+        time.sleep(0.5)
+        gmail.deliver(3)
+        events = _events_until(websocket, "resync")
+
+    assert "message.added" not in [event["type"] for event in events]
+
+
+def test_live_channel_requires_ticket(api):
+    """Test the session token is not accepted in the URL and a ticket opens one connection only"""
+    client, headers, _ = api
+    token = headers["Authorization"].removeprefix("Bearer ")
+    url = _live_url(client, headers)
+
+    for refused in (f"/api/live?token={token}", f"/api/live?ticket={token}", "/api/live?ticket=invalid"):
+        with pytest.raises(WebSocketDisconnect):
+            with client.websocket_connect(refused) as websocket:
+                websocket.receive_json()
+    with client.websocket_connect(url):
+        pass
+    with pytest.raises(WebSocketDisconnect):
+        with client.websocket_connect(url) as websocket:
+            websocket.receive_json()
+    assert client.post("/api/live/ticket").status_code == 401
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,167 @@
+import asyncio
+import pytest
+from app.core.config import settings
+from app.core.resilience import DependencyUnavailable, DeadlineExceeded, deadline
+from app.services.llm_providers import (
+    LLMProvider, Completion, ProviderRegistry, LLMRouter, HealthTracker, TierSelector, parse_routes
+)
+
+
+class FakeProvider(LLMProvider):
+    """Provider with scripted latency and failures"""
+
+    default_model = "fake-model"
+
+    def __init__(self, name, delay=0.0, fail=False):
+        super().__init__(api_key="key")
+        self.name = name
+        self.delay = delay
+        self.fail = fail
+        self.calls = 0
+
+    async def complete(self, model, prompt, max_tokens, schema=None):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        if self.fail:
+            raise RuntimeError(f"{self.name} down")
+        return Completion(text=f"from {self.name}", provider=self.name, model=model)
+
+
+@pytest.fixture
+def make_router(monkeypatch):
+    """Build a router over fake providers"""
+    monkeypatch.setattr(settings, "AI_OPERATION_ROUTES", "default=slow|fast")
+    monkeypatch.setattr(settings, "AI_FALLBACK_PROVIDER", None)
+    monkeypatch.setattr(settings, "AI_HEDGE_ENABLED", True)
+    monkeypatch.setattr(settings, "AI_HEDGE_MIN_DELAY_MS", 10)
+    monkeypatch.setattr(settings, "AI_HEDGE_DEFAULT_DELAY_MS", 50)
+
+    def build(**providers):
+        registry = ProviderRegistry()
+        for name, provider in providers.items():
+            registry.register(name, lambda provider=provider: provider)
+        return LLMRouter(registry, HealthTracker(failure_threshold=1, cooldown_seconds=60))
+
+    return build
+
+
+def test_parse_routes():
+    """Test route spec parsing"""
+    routes = parse_routes("categorize=openai:gpt-4o-mini|anthropic;default=anthropic")
+
+    assert routes["categorize"] == [("openai", "gpt-4o-mini"), ("anthropic", None)]
+    assert routes["default"] == [("anthropic", None)]
+
+
+def test_hedge_wins_when_primary_is_slow(make_router):
+    """Test the backup answers once the primary exceeds the hedge delay"""
+    slow, fast = FakeProvider("slow", delay=1.0), FakeProvider("fast")
+    router = make_router(slow=slow, fast=fast)
+
+    completion = asyncio.run(router.complete("summarize", "hi", 10))
+
+    assert completion.provider == "fast"
+    assert slow.calls == 1
+
+
+def test_primary_answers_without_hedge_when_fast(make_router):
+    """Test no hedge is fired when the primary is quick"""
+    slow, fast = FakeProvider("slow", delay=0.0), FakeProvider("fast")
+    router = make_router(slow=slow, fast=fast)
+
+    completion = asyncio.run(router.complete("summarize", "hi", 10))
+
+    assert completion.provider == "slow"
+    assert fast.calls == 0
+
+
+def test_failed_provider_is_skipped_until_cooldown(make_router, monkeypatch):
+    """Test failover and health tracking move traffic off a failing provider"""
+    monkeypatch.setattr(settings, "AI_HEDGE_ENABLED", False)
+    broken, fast = FakeProvider("slow", fail=True), FakeProvider("fast")
+    router = make_router(slow=broken, fast=fast)
+
+    assert asyncio.run(router.complete("summarize", "hi", 10)).provider == "fast"
+    assert asyncio.run(router.complete("summarize", "hi", 10)).provider == "fast"
+    assert broken.calls == 1
+
+
+def test_all_targets_failing_raises(make_router):
+    """Test the last error surfaces when every target fails"""
+    router = make_router(slow=FakeProvider("slow", fail=True), fast=FakeProvider("fast", fail=True))
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(router.complete("summarize", "hi", 10))
+
+
+def test_open_circuits_fail_fast(make_router):
+    """Test no provider is called once every target's circuit is open"""
+    slow, fast = FakeProvider("slow", fail=True), FakeProvider("fast", fail=True)
+    router = make_router(slow=slow, fast=fast)
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(router.complete("summarize", "hi", 10))
+    with pytest.raises(DependencyUnavailable):
+        asyncio.run(router.complete("summarize", "hi", 10))
+    assert (slow.calls, fast.calls) == (1, 1)
+
+
+def test_request_deadline_cuts_llm_call(make_router, monkeypatch):
+    """Test a completion stops at the request deadline instead of the provider timeout"""
+    monkeypatch.setattr(settings, "AI_HEDGE_ENABLED", False)
+    router = make_router(slow=FakeProvider("slow", delay=5.0), fast=FakeProvider("fast", delay=5.0))
+
+    with deadline(0.1), pytest.raises(DeadlineExceeded):
+        asyncio.run(router.complete("summarize", "hi", 10))
+
+
+class TieredProvider(FakeProvider):
+    """Fake provider exposing small and large models"""
+
+    default_model = "fake-large"
+
+    @property
+    def tier_models(self):
+        return {"small": "fake-small", "large": "fake-large"}
+
+
+def test_auto_tier_uses_small_model(make_router, monkeypatch):
+    """Test auto operations start on the small tier and fixed ones use theirs"""
+    monkeypatch.setattr(settings, "AI_OPERATION_ROUTES", "default=tiered")
+    monkeypatch.setattr(settings, "AI_OPERATION_TIERS", "")
+    router = make_router(tiered=TieredProvider("tiered"))
+
+    categorized = asyncio.run(router.complete("categorize", "hi", 10))
+    reply = asyncio.run(router.complete("generate_reply", "hi", 10))
+
+    assert (categorized.model, categorized.tier) == ("fake-small", "small")
+    assert (reply.model, reply.tier) == ("fake-large", "large")
+
+
+def test_selector_escalates_on_poor_quality(monkeypatch):
+    """Test the small tier is dropped once its outputs keep failing validation"""
+    monkeypatch.setattr(settings, "AI_OPERATION_TIERS", "")
+    monkeypatch.setattr(settings, "AI_TIER_MAX_FAILURE_RATE", 0.1)
+    monkeypatch.setattr(settings, "AI_TIER_PROBE_RATE", 0.0)
+    selector = TierSelector(min_samples=5)
+
+    for _ in range(5):
+        selector.record_quality("categorize", "small", True)
+    assert selector.tier_for("categorize") == "small"
+
+    for _ in range(5):
+        selector.record_quality("categorize", "small", False)
+    assert selector.tier_for("categorize") == "large"
+
+
+def test_selector_respects_configured_tier(monkeypatch):
+    """Test AI_OPERATION_TIERS overrides the defaults"""
+    monkeypatch.setattr(settings, "AI_OPERATION_TIERS", "categorize=large;generate_reply=small")
+    selector = TierSelector()
+
+    assert selector.tier_for("categorize") == "large"
+    assert selector.tier_for("generate_reply") == "small"
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
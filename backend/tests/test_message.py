@@ -0,0 +1,48 @@
+import json
+import pytest
+from app.models.message import MessageRecord, LIST_FIELDS, project_emails
+from benchmarks.message_memory import make_emails
+
+
+def test_record_round_trips_through_state():
+    """Test a compressed body survives the JSON state form unchanged"""
+    email = make_emails(1, body_size=4000)[0]
+
+    record = MessageRecord.from_email(email)
+    restored = MessageRecord.from_state(json.loads(json.dumps(record.to_state())))
+
+    assert record.body_compressed
+    assert len(record.body_data) < len(email['body'])
+    assert restored.body == email['body']
+    assert restored.to_dict() == {**email, 'attachments': []}
+
+
+def test_short_bodies_and_truncation():
+    """Test short bodies stay uncompressed and max_body_chars truncates"""
+    email = {**make_emails(1, body_size=4000)[0]}
+
+    assert not MessageRecord.from_email({**email, 'body': "short"}).body_compressed
+    assert len(MessageRecord.from_email(email, max_body_chars=100).body) == 100
+    assert MessageRecord.from_email(email, keep_body=False).body == ""
+
+
+def test_senders_are_interned():
+    """Test records of the same sender share one string"""
+    first, second = make_emails(7, body_size=10)[0], make_emails(7, body_size=10)[6]
+
+    assert first['sender_email'] is not second['sender_email']
+    assert MessageRecord.from_email(first).sender_email is MessageRecord.from_email(second).sender_email
+
+
+def test_projection_has_no_body():
+    """Test list projections carry only the list fields"""
+    emails = make_emails(3, body_size=4000)
+
+    projected = project_emails(emails)
+
+    assert [list(email) for email in projected] == [list(LIST_FIELDS)] * 3
+    assert MessageRecord.from_email(emails[0]).project() == projected[0]
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
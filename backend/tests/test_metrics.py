@@ -0,0 +1,60 @@
+import pytest
+from fastapi.testclient import TestClient
+from app.core.config import settings
+from app.core.metrics import Counter, Histogram
+from app.main import app
+
+
+def test_histogram_renders_cumulative_buckets():
+    """Test histogram output follows the Prometheus exposition format"""
+    histogram = Histogram("test_latency_seconds", "Test latency", ["stage"], buckets=(0.1, 1.0))
+    histogram.observe(0.05, stage="a")
+    histogram.observe(0.5, stage="a")
+    histogram.observe(5, stage="a")
+
+    output = histogram.render()
+
+    assert 'test_latency_seconds_bucket{stage="a",le="0.1"} 1' in output
+    assert 'test_latency_seconds_bucket{stage="a",le="1.0"} 2' in output
+    assert 'test_latency_seconds_bucket{stage="a",le="+Inf"} 3' in output
+    assert 'test_latency_seconds_count{stage="a"} 3' in output
+    assert histogram.count(stage="a") == 3
+
+
+def test_counter_escapes_label_values():
+    """Test label values with quotes are escaped"""
+    counter = Counter("test_total", "Test counter", ["cache"])
+    counter.inc(cache='say "hi"')
+
+    assert 'test_total{cache="say \\"hi\\""} 1' in counter.render()
+
+
+def test_metrics_endpoint_reports_http_latency(monkeypatch):
+    """Test /metrics exposes route-level latency after a request"""
+    monkeypatch.setattr(settings, "ENVIRONMENT", "development")
+    client = TestClient(app)
+    client.get("/health")
+
+    response = client.get("/metrics")
+
+    assert response.status_code == 200
+    assert 'route="/health"' in response.text
+    assert "gmail_assistant_stage_duration_seconds" in response.text
+
+
+
+def test_metrics_endpoint_needs_token_in_production(monkeypatch):
+    """Test production serves /metrics only to the configured bearer token"""
+    monkeypatch.setattr(settings, "ENVIRONMENT", "production")
+    monkeypatch.setattr(settings, "METRICS_TOKEN", None)
+    client = TestClient(app)
+
+    assert client.get("/metrics").status_code == 404
+
+    monkeypatch.setattr(settings, "METRICS_TOKEN", "scrape-token")
+    assert client.get("/metrics").status_code == 401
+    assert client.get("/metrics", headers={"Authorization": "Bearer wrong"}).status_code == 401
+    assert client.get("/metrics", headers={"Authorization": "Bearer scrape-token"}).status_code == 200
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
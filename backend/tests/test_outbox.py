@@ -0,0 +1,144 @@
+import asyncio
+import base64
+import time
+import pytest
+from app.core.config import settings
+from app.core.state import state
+from app.services.gmail_service import GmailService
+from app.services.outbox import reply_outbox
+from app.services.semantic_index import semantic_index
+
+
+def _raw_headers(sent):
+    raw = base64.urlsafe_b64decode(sent["raw"]).decode("utf-8")
+    return raw.split("\n\n", 1)[0]
+
+
+def test_reply_is_acknowledged_then_sent_in_thread(api):
+    """Test the request only queues the reply and the worker sends it threaded, without refetching"""
+    client, headers, gmail = api
+    listed = client.get("/api/emails/list", headers=headers).json()["emails"][0]
+    original = gmail.messages[listed["id"]]
+    requests_before = gmail.requests
+
+    response = client.post("/api/emails/send-reply", headers=headers,
+                           params={"email_id": listed["id"], "reply_content": "Thanks!"})
+
+    assert response.status_code == 202
+    reply = response.json()
+    assert reply["status"] == "queued"
+    stored = state.get(f"outbox:item:{reply['outbox_id']}")
+    assert "fake-refresh-token" not in stored and "Thanks!" not in stored
+    assert gmail.requests == requests_before
+
+    asyncio.run(reply_outbox.process_due())
+
+    status = client.get(f"/api/emails/outbox/{reply['outbox_id']}", headers=headers).json()
+    assert status["status"] == "sent" and status["attempts"] == 1
+    assert gmail.requests == requests_before + 1
+    assert gmail.sent[0]["threadId"] == original["threadId"]
+    message_id = next(h["value"] for h in original["payload"]["headers"] if h["name"] == "Message-ID")
+    assert f"In-Reply-To: {message_id}" in _raw_headers(gmail.sent[0])
+
+
+def test_transient_send_failure_is_retried(api, monkeypatch):
+    """Test a 503 from Gmail requeues the reply for a later attempt"""
+    client, headers, gmail = api
+    monkeypatch.setattr(settings, "OUTBOX_RETRY_BASE_SECONDS", 1.0)
+    gmail.send_failures = 1
+    email_id = gmail.order[-1]
+    semantic_index.remove("bench@example.com", [email_id])
+
+    reply = client.post("/api/emails/send-reply", headers=headers,
+                        params={"email_id": email_id, "reply_content": "On it"}).json()
+    asyncio.run(reply_outbox.process_due())
+
+    status = client.get(f"/api/emails/outbox/{reply['outbox_id']}", headers=headers).json()
+    assert status["status"] == "retrying" and "503" in status["error"]
+    assert asyncio.run(reply_outbox.process_due()) == 0
+
+    asyncio.run(reply_outbox.process_due(now=time.time() + 3600))
+
+    status = client.get(f"/api/emails/outbox/{reply['outbox_id']}", headers=headers).json()
+    assert status["status"] == "sent" and status["attempts"] == 2
+    # Not indexed, so the worker looked the threading headers up itself
+    assert status["to"] and status["thread_id"] == gmail.messages[email_id]["threadId"]
+    assert len(gmail.sent) == 1
+
+
+def test_reply_taken_by_a_dead_worker_is_requeued(api):
+    """Test a reply whose worker stopped before sending is sent after its lease runs out"""
+    client, headers, gmail = api
+    email_id = client.get("/api/emails/list", headers=headers).json()["emails"][0]["id"]
+    reply = client.post("/api/emails/send-reply", headers=headers,
+                        params={"email_id": email_id, "reply_content": "Thanks!"}).json()
+    # A worker takes the reply off the queue and dies
+    taken = reply_outbox._take_due(time.time())
+    assert [item["outbox_id"] for item in taken] == [reply["outbox_id"]]
+
+    assert asyncio.run(reply_outbox.process_due()) == 0
+    asyncio.run(reply_outbox.process_due(now=time.time() + settings.OUTBOX_LEASE_SECONDS + 1))
+
+    status = client.get(f"/api/emails/outbox/{reply['outbox_id']}", headers=headers).json()
+    assert (status["status"], status["attempts"]) == ("sent", 1)
+    assert len(gmail.sent) == 1 and "lease" not in status
+    # The stale worker coming back does not send it again
+    reply_outbox.deliver(taken[0])
+    assert len(gmail.sent) == 1
+
+
+def test_reply_interrupted_while_sending_fails(api):
+    """Test a reply whose worker stopped mid-send is not sent a second time"""
+    client, headers, gmail = api
+    email_id = client.get("/api/emails/list", headers=headers).json()["emails"][0]["id"]
+    reply = client.post("/api/emails/send-reply", headers=headers,
+                        params={"email_id": email_id, "reply_content": "Thanks!"}).json()
+    item = reply_outbox._take_due(time.time())[0]
+    item["status"] = "sending"
+    reply_outbox._save(item)
+
+    asyncio.run(reply_outbox.process_due(now=time.time() + settings.OUTBOX_LEASE_SECONDS + 1))
+
+    status = client.get(f"/api/emails/outbox/{reply['outbox_id']}", headers=headers).json()
+    assert status["status"] == "failed" and "interrupted" in status["error"]
+    assert not gmail.sent
+    assert state.get_json(f"outbox:item:{reply['outbox_id']}")["body"] is None
+
+
+def test_lease_running_out_mid_send_keeps_the_reclaimed_status(api, monkeypatch):
+    """Test a worker whose lease is reclaimed while Gmail sends does not overwrite the reclaimed status"""
+    client, headers, gmail = api
+    email_id = client.get("/api/emails/list", headers=headers).json()["emails"][0]["id"]
+    reply = client.post("/api/emails/send-reply", headers=headers,
+                        params={"email_id": email_id, "reply_content": "Thanks!"}).json()
+    send_reply = GmailService.send_reply
+
+    def slow_send(self, **kwargs):
+        # The lease runs out and another worker reclaims the reply before Gmail answers
+        reply_outbox._reclaim_expired(time.time() + settings.OUTBOX_LEASE_SECONDS + 1)
+        return send_reply(self, **kwargs)
+
+    monkeypatch.setattr(GmailService, "send_reply", slow_send)
+    asyncio.run(reply_outbox.process_due())
+
+    status = client.get(f"/api/emails/outbox/{reply['outbox_id']}", headers=headers).json()
+    assert status["status"] == "failed" and "interrupted" in status["error"]
+    assert len(gmail.sent) == 1
+
+
+def test_reply_to_missing_email_fails(api):
+    """Test a reply whose original cannot be found fails without retries, and stays private"""
+    client, headers, gmail = api
+
+    reply = client.post("/api/emails/send-reply", headers=headers,
+                        params={"email_id": "does-not-exist", "reply_content": "Hi"}).json()
+    asyncio.run(reply_outbox.process_due())
+
+    status = client.get(f"/api/emails/outbox/{reply['outbox_id']}", headers=headers).json()
+    assert (status["status"], status["error"], status["attempts"]) == ("failed", "Email not found", 1)
+    assert "access_token" not in status and not gmail.sent
+    assert client.get("/api/emails/outbox/unknown", headers=headers).status_code == 404
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,77 @@
+import base64
+import json
+import pytest
+from app.core.pagination import encode_cursor, decode_cursor
+from app.core.security import create_access_token
+
+
+def test_cursor_round_trip():
+    """Test cursor encodes and decodes back to the page token"""
+    cursor = encode_cursor("gmail-page-token-123", query="from:amazon")
+
+    assert cursor is not None
+    assert "gmail-page-token-123" not in cursor
+    assert decode_cursor(cursor, query="from:amazon") == "gmail-page-token-123"
+
+
+def test_no_page_token_means_no_cursor():
+    """Test last page produces no cursor"""
+    assert encode_cursor(None) is None
+    assert encode_cursor("") is None
+
+
+def test_cursor_bound_to_query():
+    """Test cursor cannot be reused with a different query"""
+    cursor = encode_cursor("token", query="invoice")
+
+    with pytest.raises(ValueError):
+        decode_cursor(cursor, query="newsletter")
+
+
+def test_cursor_bound_to_user():
+    """Test cursor cannot be reused by another user"""
+    cursor = encode_cursor("token", query="invoice", user="a@example.com")
+
+    assert decode_cursor(cursor, query="invoice", user="a@example.com") == "token"
+    with pytest.raises(ValueError):
+        decode_cursor(cursor, query="invoice", user="b@example.com")
+
+
+def test_other_users_cursor_gets_400(api):
+    """Test a cursor issued to one user is refused on another user's list"""
+    client, headers, _ = api
+    cursor = client.get("/api/emails/list?max_results=2", headers=headers).json()["next_cursor"]
+    other = create_access_token({
+        "email": "other@example.com", "name": "Other", "picture": None,
+        "access_token": "fake-access-token", "refresh_token": "fake-refresh-token",
+    })
+
+    response = client.get(f"/api/emails/list?max_results=2&cursor={cursor}",
+                          headers={"Authorization": f"Bearer {other}"})
+
+    assert response.status_code == 400
+    assert client.get(f"/api/emails/list?max_results=2&cursor={cursor}", headers=headers).status_code == 200
+
+
+def test_malformed_cursor_rejected():
+    """Test garbage cursors raise ValueError"""
+    with pytest.raises(ValueError):
+        decode_cursor("not-a-cursor!!")
+
+
+@pytest.mark.parametrize("data", [
+    {"t": "token", "s": 123},
+    {"t": ["token"], "s": "abc"},
+    {"t": "token", "s": "é"},
+    ["token", "abc"],
+])
+def test_forged_cursor_fields_rejected(data):
+    """Test non-string or non-ASCII cursor fields raise ValueError rather than TypeError"""
+    cursor = base64.urlsafe_b64encode(json.dumps(data).encode('utf-8')).decode('ascii')
+
+    with pytest.raises(ValueError):
+        decode_cursor(cursor)
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
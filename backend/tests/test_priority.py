@@ -0,0 +1,103 @@
+import pytest
+from app.services.contacts import contact_index
+from app.services.priority import PriorityRanker, parse_weights, urgency_score
+
+NOW = 1704103200.0  # Mon, 1 Jan 2024 10:00:00 +0000
+DATE = "Mon, 1 Jan 2024 10:00:00 +0000"
+
+
+@pytest.fixture
+def mailbox_size():
+    return 30
+
+
+def _email(message_id, sender, subject="Hello", date=DATE, snippet=""):
+    return {"id": message_id, "sender_email": sender, "subject": subject, "snippet": snippet, "date": date}
+
+
+def test_urgency_and_weights():
+    """Test urgency keywords in the subject outweigh those in the preview, and weights parse"""
+    assert urgency_score("ACTION REQUIRED: renew", "") == 1.0
+    assert urgency_score("Renewal", "please reply asap") == 0.5
+    assert urgency_score("Lunch?", "no rush") == 0.0
+
+    weights = parse_weights("urgency=3; bogus=1")
+    assert weights[4] == 3.0 and weights[0] == 1.0
+    for spec in ("urgency=high", "recency=", "replied=inf"):
+        with pytest.raises(ValueError):
+            parse_weights(spec)
+    with pytest.raises(ValueError):
+        PriorityRanker(weights="urgency=high")
+    assert PriorityRanker(weights="urgency=0").weights[4] == 0.0
+
+
+def test_ranks_by_features():
+    """Test urgent, replied-to and newer mail ranks above promotions and old mail"""
+    ranker = PriorityRanker()
+    emails = [
+        _email("promo", "deals@shop.example.com", "Weekend sale"),
+        _email("old", "someone@example.com", "Notes", date="Mon, 1 Jan 2023 10:00:00 +0000"),
+        _email("boss", "boss@example.com", "Quarterly plan"),
+        _email("urgent", "ops@example.com", "Urgent: server down"),
+    ]
+    categories = {"promo": "Promotions", "boss": "Work", "urgent": "Urgent"}
+    ranker.add("ranked", emails)
+    ranker.set_categories("ranked", categories)
+    # The ranker only reads sender statistics; syncing code feeds the contact index
+    assert contact_index.get("ranked", "boss@example.com") is None
+    contact_index.add("ranked", emails)
+    contact_index.set_categories("ranked", categories)
+    contact_index.record_reply("ranked", "Boss@Example.com")
+
+    ranked = ranker.rank("ranked", ["promo", "old", "boss", "urgent", "never-seen"], now=NOW)
+    scores = dict(ranked)
+
+    assert [message_id for message_id, _ in ranked] == ["urgent", "boss", "promo", "old", "never-seen"]
+    assert ranked[-1][1] == 0.0
+    # Boss's reply ratio adds the "replied" weight on top of what promo's sender gets
+    assert scores["boss"] - scores["promo"] > 1.5
+
+
+def test_incremental_updates():
+    """Test re-adding a message does not count its sender twice, and removal frees it"""
+    ranker = PriorityRanker(max_messages_per_user=2)
+    ranker.add("incremental", [_email("a", "x@example.com"), _email("b", "y@example.com")])
+    ranker.add("incremental", [_email("a", "x@example.com")])
+    scores = dict(ranker.rank("incremental", ["a", "b"], now=NOW))
+    assert scores["a"] == scores["b"]
+
+    # Capacity 2: adding a third evicts the oldest
+    ranker.add("incremental", [_email("c", "y@example.com")])
+    assert ranker.unknown("incremental", ["a", "b", "c"]) == ["b"]
+
+    ranker.remove("incremental", ["c"])
+    assert ranker.unknown("incremental", ["a", "c"]) == ["c"]
+
+
+def test_list_sorted_by_priority(api):
+    """Test sort=priority returns the top messages with scores, fetching headers only once"""
+    client, headers, gmail = api
+    gmail.messages[gmail.order[7]]["payload"]["headers"][1]["value"] = "URGENT: contract expires today"
+
+    response = client.get("/api/emails/list", headers=headers, params={"max_results": 3, "sort": "priority"})
+
+    assert response.status_code == 200
+    body = response.json()
+    emails = body["emails"]
+    assert len(emails) == 3 and body["next_cursor"] is None and body["history_id"]
+    assert emails[0]["id"] == gmail.order[7]
+    assert emails[0]["priority"] >= emails[1]["priority"] >= emails[2]["priority"]
+
+    requests_before = gmail.requests
+    again = client.get("/api/emails/list", headers=headers, params={"max_results": 3, "sort": "priority"}).json()
+    # One id listing, three full fetches and the profile; no header fetches
+    assert gmail.requests - requests_before == 5
+    assert [email["id"] for email in again["emails"]] == [email["id"] for email in emails]
+
+    assert client.get("/api/emails/list", headers=headers, params={"sort": "size"}).status_code == 400
+    assert client.get("/api/emails/list", headers=headers,
+                      params={"sort": "priority", "cursor": "abc"}).status_code == 400
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,161 @@
+import threading
+import time
+import pytest
+from app.core.config import settings
+from app.core.metrics import CIRCUIT_STATE, CIRCUIT_REJECTIONS, DEPENDENCY_RETRIES
+from app.core.resilience import (
+    CircuitBreaker, DependencyUnavailable, DeadlineExceeded, deadline, deadline_for, CLOSED, HALF_OPEN, OPEN
+)
+from app.services.bulk_service import bulk_service
+from app.services.gmail_service import GmailService, gmail_circuit
+
+
+class Flaky:
+    """Callable failing a scripted number of times before it succeeds"""
+
+    def __init__(self, failures, error=ConnectionError):
+        self.failures = failures
+        self.error = error
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise self.error("boom")
+        return "ok"
+
+
+@pytest.fixture
+def fast_retries(monkeypatch):
+    monkeypatch.setattr(settings, "RETRY_BASE_DELAY_MS", 1)
+    monkeypatch.setattr(settings, "RETRY_MAX_DELAY_MS", 5)
+
+
+def test_circuit_opens_fails_fast_and_recovers():
+    """Test the breaker trips after consecutive failures, then lets one probe through"""
+    breaker = CircuitBreaker("test-dependency", failure_threshold=2, recovery_seconds=0.05)
+    failing = Flaky(failures=2)
+
+    for _ in range(2):
+        with pytest.raises(ConnectionError):
+            breaker.call(failing, "op")
+    assert breaker.state == OPEN
+    assert CIRCUIT_STATE.value(dependency="test-dependency") == 2
+
+    with pytest.raises(DependencyUnavailable):
+        breaker.call(failing, "op")
+    assert failing.calls == 2
+
+    time.sleep(0.06)
+    assert breaker.state == HALF_OPEN
+    assert breaker.allow() and not breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CLOSED
+    assert CIRCUIT_STATE.value(dependency="test-dependency") == 0
+
+
+def test_retries_only_retryable_errors(fast_retries):
+    """Test transient errors are retried with backoff and others surface at once"""
+    breaker = CircuitBreaker("test-retries", failure_threshold=10)
+    transient = Flaky(failures=2)
+    retries_before = DEPENDENCY_RETRIES.value(dependency="test-retries", operation="read")
+
+    result = breaker.call(transient, "read", retries=2, retryable=lambda e: isinstance(e, ConnectionError))
+
+    assert result == "ok" and transient.calls == 3
+    assert DEPENDENCY_RETRIES.value(dependency="test-retries", operation="read") - retries_before == 2
+
+    permanent = Flaky(failures=1, error=ValueError)
+    with pytest.raises(ValueError):
+        breaker.call(permanent, "read", retries=2, retryable=lambda e: isinstance(e, ConnectionError))
+    assert permanent.calls == 1
+
+
+def test_deadline_bounds_retries(monkeypatch):
+    """Test no retry starts once its backoff would outlast the request deadline"""
+    monkeypatch.setattr(settings, "RETRY_BASE_DELAY_MS", 1000)
+    monkeypatch.setattr(settings, "RETRY_MAX_DELAY_MS", 1000)
+    monkeypatch.setattr("app.core.resilience.random.uniform", lambda low, high: high)
+    breaker = CircuitBreaker("test-deadline", failure_threshold=10)
+    failing = Flaky(failures=5)
+
+    with deadline(0.2):
+        start = time.monotonic()
+        with pytest.raises(ConnectionError):
+            breaker.call(failing, "read", retries=3, retryable=lambda e: True)
+        assert time.monotonic() - start < 0.2
+        time.sleep(0.2)
+        with pytest.raises(DeadlineExceeded):
+            breaker.call(failing, "read")
+    assert failing.calls == 1
+
+
+def test_deadline_for_uses_longest_prefix(monkeypatch):
+    """Test per-endpoint deadlines match the most specific configured path"""
+    monkeypatch.setattr(settings, "REQUEST_DEADLINE_SECONDS", 60.0)
+    monkeypatch.setattr(settings, "REQUEST_DEADLINES", "/api/emails=20;/api/emails/delta=5")
+
+    assert deadline_for("/api/emails/delta") == 5.0
+    assert deadline_for("/api/emails/list") == 20.0
+    assert deadline_for("/api/chat/message") == 60.0
+
+
+def test_gmail_outage_fails_fast_with_503(api, monkeypatch, fast_retries):
+    """Test Gmail 5xx are retried, and once the circuit opens requests get 503 without calling Gmail"""
+    client, headers, gmail = api
+    monkeypatch.setattr(gmail_circuit, "failure_threshold", 3)
+    gmail.behavior.error_rate = 1.0
+
+    response = client.get("/api/emails/list", headers=headers)
+    assert response.status_code == 500
+    assert gmail_circuit.state == OPEN
+
+    rejected = CIRCUIT_REJECTIONS.value(dependency="gmail")
+    response = client.get("/api/emails/list", headers=headers)
+    assert response.status_code == 503
+    assert CIRCUIT_REJECTIONS.value(dependency="gmail") == rejected + 1
+
+    gmail.behavior.error_rate = 0.0
+    monkeypatch.setattr(gmail_circuit, "recovery_seconds", 0.0)
+    response = client.get("/api/emails/list", headers=headers)
+    assert response.status_code == 200
+    assert gmail_circuit.state == CLOSED
+
+
+def test_retry_backoff_does_not_block_other_requests(api, monkeypatch):
+    """Test an email request sleeping between Gmail retries leaves the event loop free"""
+    client, headers, gmail = api
+    monkeypatch.setattr("app.core.resilience.backoff_delay", lambda *args: 0.5)
+    gmail.behavior.error_rate = 1.0
+    responses = []
+
+    # One event loop serves every request inside the with block, as in uvicorn
+    with client:
+        retrying = threading.Thread(target=lambda: responses.append(
+            client.get("/api/emails/list", headers=headers)))
+        retrying.start()
+        time.sleep(0.2)
+        started = time.monotonic()
+        assert client.get("/health").status_code == 200
+        assert time.monotonic() - started < 0.3
+    retrying.join()
+
+    assert responses[0].status_code == 500
+
+
+def test_background_job_outlives_request_deadline(api, monkeypatch):
+    """Test a bulk job scheduled by a request still runs after that request's deadline has passed"""
+    client, headers, gmail = api
+    monkeypatch.setattr(settings, "REQUEST_DEADLINES", "/api/emails/bulk=0.2")
+    monkeypatch.setattr(GmailService, "BATCH_SIZE", 2)
+    gmail.behavior.latency_ms = 150
+
+    response = client.post("/api/emails/bulk", headers=headers,
+                           json={"action": "archive", "email_ids": gmail.order[:6]})
+
+    job = bulk_service.get_job("bench@example.com", response.json()["job_id"])
+    assert (job["status"], job["processed"]) == ("completed", 6)
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,44 @@
+import json
+import pytest
+from app.core.responses import FastJSONResponse, parse_fields, project
+
+
+def test_parse_fields():
+    """Test projections are de-duplicated and unknown fields rejected"""
+    assert parse_fields(None, ("id", "subject")) is None
+    assert parse_fields("subject, id,subject", ("id", "subject")) == ("subject", "id")
+
+    with pytest.raises(ValueError):
+        parse_fields("id,body", ("id", "subject"))
+
+
+def test_project_and_render():
+    """Test projection keeps only the requested keys and rendering is compact JSON"""
+    items = [{"id": "m1", "subject": "Héllo", "body": "x"}]
+
+    body = FastJSONResponse({"emails": project(items, ("id", "subject"))}).body
+
+    assert json.loads(body) == {"emails": [{"id": "m1", "subject": "Héllo"}]}
+    assert b", " not in body
+
+
+def test_list_and_search_fields(api):
+    """Test ?fields= on the list and search endpoints"""
+    client, headers, _ = api
+
+    listed = client.get("/api/emails/list?max_results=3&fields=id,summary", headers=headers).json()
+    found = client.get("/api/emails/search/Amazon?max_results=2", headers=headers).json()
+    with_body = client.get("/api/emails/search/Amazon?max_results=2&fields=id,body", headers=headers).json()
+
+    assert [list(email) for email in listed["emails"]] == [["id", "summary"]] * 3
+    assert listed["total"] == 3
+    assert found["emails"] and "body" not in found["emails"][0]
+    assert with_body["emails"][0]["body"]
+    assert client.get("/api/emails/list?fields=password", headers=headers).status_code == 400
+    # Each listed message goes into one summarization request, so the page size is bounded
+    assert client.get("/api/emails/list?max_results=500", headers=headers).status_code == 422
+    assert client.get("/api/emails/list?max_results=0", headers=headers).status_code == 422
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
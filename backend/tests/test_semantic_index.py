@@ -0,0 +1,81 @@
+import pytest
+from datetime import datetime, timezone
+from app.services.semantic_index import SemanticIndex, parse_time_window
+
+
+def make_email(message_id, sender_name, sender_email, subject, body="", date="Mon, 1 Jan 2024 10:00:00 +0000"):
+    return {
+        'id': message_id,
+        'sender_name': sender_name,
+        'sender_email': sender_email,
+        'subject': subject,
+        'body': body,
+        'snippet': body[:100],
+        'date': date
+    }
+
+
+@pytest.fixture
+def index():
+    index = SemanticIndex(max_messages_per_user=3)
+    index.add("user@example.com", [
+        make_email("a", "Amazon", "shipment-tracking@amazon.com", "Your order has shipped"),
+        make_email("b", "Finance Team", "billing@example.com", "Invoice #4821 due", "Please pay the invoice"),
+        make_email("c", "Jane Smith", "jane.smith@example.com", "Q4 project timeline"),
+    ])
+    return index
+
+
+def test_resolves_natural_language_references(index):
+    """Test references resolve to the right message ids"""
+    assert index.resolve("user@example.com", "reply to the Amazon email")['id'] == "a"
+    assert index.resolve("user@example.com", "the invoices")['id'] == "b"
+    assert index.resolve("user@example.com", "Jane's project")['id'] == "c"
+    assert index.resolve("user@example.com", "something unrelated xyz") is None
+
+
+def test_index_is_per_user(index):
+    """Test one user's messages never match another user's query"""
+    assert index.search("other@example.com", "Amazon") == []
+
+
+def test_eviction_and_removal(index):
+    """Test the oldest message is evicted at capacity and removed ids stop matching"""
+    index.add("user@example.com", [make_email("d", "GitHub", "noreply@github.com", "New pull request review")])
+
+    assert index.resolve("user@example.com", "Amazon order") is None
+    assert index.resolve("user@example.com", "pull request")['id'] == "d"
+
+    index.remove("user@example.com", ["d"])
+    assert index.resolve("user@example.com", "pull request") is None
+
+
+def test_matrix_grows_on_demand():
+    """Test a user's matrix starts small and doubles up to capacity without losing messages"""
+    index = SemanticIndex(max_messages_per_user=100)
+    index.add("u", [make_email("first", "Amazon", "orders@amazon.com", "Your order has shipped")])
+    assert index._users["u"].vectors.shape[0] == 32
+
+    index.add("u", [make_email(f"m{i}", "Sender", f"s{i}@example.com", f"Topic number {i}") for i in range(99)])
+
+    assert index._users["u"].vectors.shape[0] == 100
+    assert index.resolve("u", "Amazon order")['id'] == "first"
+    assert index.get("u", "m98")["subject"] == "Topic number 98"
+    index.add("u", [make_email("last", "GitHub", "noreply@github.com", "New pull request review")])
+    assert index.resolve("u", "Amazon order") is None and index.resolve("u", "pull request")['id'] == "last"
+
+
+def test_time_window_filters_candidates():
+    """Test 'last week' only considers recent messages"""
+    now = datetime(2024, 1, 10, tzinfo=timezone.utc)
+    assert parse_time_window("the invoice from last week", now) == datetime(2024, 1, 3, tzinfo=timezone.utc).timestamp()
+    assert parse_time_window("the invoice", now) is None
+
+    index = SemanticIndex()
+    index.add("u", [make_email("old", "Finance Team", "billing@example.com", "Invoice", date="Mon, 1 Jan 2001 10:00:00 +0000")])
+    assert index.resolve("u", "the invoice from last week") is None
+    assert index.resolve("u", "the invoice")['id'] == "old"
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
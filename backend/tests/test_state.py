@@ -0,0 +1,125 @@
+import threading
+import pytest
+from app.core.state import MemoryBackend, SQLiteBackend, RedisBackend, RedisError, rate_limited
+from benchmarks.fakes import FakeRedisServer
+
+
+@pytest.fixture(params=["memory", "sqlite", "redis"])
+def backend(request, tmp_path):
+    """Each state backend, the Redis one against a local fake server"""
+    if request.param == "memory":
+        yield MemoryBackend()
+    elif request.param == "sqlite":
+        backend = SQLiteBackend(str(tmp_path / "state.db"))
+        yield backend
+        backend.close()
+    else:
+        server = FakeRedisServer().start()
+        backend = RedisBackend(server.url)
+        yield backend
+        backend.close()
+        server.stop()
+
+
+def test_values_and_expiry(backend, monkeypatch):
+    """Test get/set/delete, JSON helpers and TTL expiry"""
+    backend.set("a", "1")
+    backend.set_json("b", {"x": [1, 2]}, ttl=60)
+    backend.set("c", "3", ttl=0.05)
+
+    assert backend.get("a") == "1"
+    assert backend.get_json("b") == {"x": [1, 2]}
+    assert sorted(backend.keys("")) == ["a", "b", "c"]
+
+    backend.delete("a")
+    threading.Event().wait(0.1)
+
+    assert backend.get("a") is None
+    assert backend.get("c") is None
+    assert backend.keys("") == ["b"]
+
+
+def test_add_and_incr_are_atomic(backend):
+    """Test only one of many concurrent claims wins and counters add up"""
+    wins = []
+
+    def worker():
+        wins.append(backend.add("claim", "1", ttl=60))
+        for _ in range(10):
+            backend.incr("counter", ttl=60)
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert wins.count(True) == 1
+    assert backend.get("counter") == "80"
+
+
+def test_queue_is_fifo(backend):
+    """Test queued values come out in order, once"""
+    for value in ("one", "two", "three"):
+        backend.push("jobs", value)
+
+    assert [backend.pop("jobs") for _ in range(4)] == ["one", "two", "three", None]
+
+
+def test_memory_backend_evicts_only_cached_keys():
+    """Test key pressure evicts least recently used TTL keys, never queues, leases or locks"""
+    backend = MemoryBackend(max_keys=4)
+    backend.push("outbox:queue", "reply-1")
+    backend.set_json("outbox:lease:reply-1", {"token": "t"})
+    assert backend.add("chat:lock:u", "token", ttl=10)
+    backend.set("cache:a", "1", ttl=60)
+    backend.set("cache:b", "2", ttl=60)
+    backend.get("cache:a")
+    backend.set("cache:c", "3", ttl=60)
+
+    assert backend.get("cache:b") is None and backend.get("cache:a") is None
+    assert backend.get("cache:c") == "3"
+    assert backend.pop("outbox:queue") == "reply-1"
+    assert backend.get_json("outbox:lease:reply-1") == {"token": "t"}
+    assert not backend.add("chat:lock:u", "other", ttl=10)
+
+
+def test_redis_error_reply_keeps_connection_pooled():
+    """Test an error reply returns the connection to the pool instead of leaking it"""
+    server = FakeRedisServer().start()
+    backend = RedisBackend(server.url)
+    try:
+        backend.set("text", "abc")
+        pooled = backend._pool.queue[0]
+
+        with pytest.raises(RedisError):
+            backend.incr("text")
+
+        assert backend._pool.qsize() == 1 and backend._pool.queue[0] is pooled
+        assert backend.get("text") == "abc"
+    finally:
+        backend.close()
+        server.stop()
+
+
+def test_sqlite_state_is_shared_between_processes(tmp_path):
+    """Test two backends on the same file (as two workers would) see each other's writes"""
+    first = SQLiteBackend(str(tmp_path / "state.db"))
+    second = SQLiteBackend(str(tmp_path / "state.db"))
+
+    first.set_json("chat:user", {"turns": 1})
+    assert second.get_json("chat:user") == {"turns": 1}
+    assert first.add("digest:claim", "1") and not second.add("digest:claim", "1")
+
+
+def test_rate_limit_window(monkeypatch):
+    """Test the limit applies per user and a limit of 0 disables it"""
+    monkeypatch.setattr("app.core.state.state", MemoryBackend())
+
+    assert [rate_limited("chat", "alice", 2) for _ in range(3)] == [False, False, True]
+    assert not rate_limited("chat", "bob", 2)
+    assert not any(rate_limited("chat", "alice", 0) for _ in range(5))
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
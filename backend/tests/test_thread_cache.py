@@ -0,0 +1,91 @@
+import pytest
+from app.core.state import MemoryBackend
+from app.services.thread_cache import ThreadSummaryCache
+
+
+class FakeGmail:
+    """Minimal Gmail stand-in that counts calls"""
+
+    def __init__(self):
+        self.threads = {}
+        self.thread_calls = 0
+        self.detail_calls = 0
+
+    def add_message(self, thread_id, message_id, sender, history_id):
+        thread = self.threads.setdefault(thread_id, {'id': thread_id, 'messages': []})
+        thread['history_id'] = history_id
+        thread['messages'].append({
+            'id': message_id,
+            'sender_name': sender,
+            'sender_email': f"{sender.lower()}@example.com",
+            'subject': "Project plan",
+            'snippet': f"snippet {message_id}",
+            'date': "Mon, 1 Jan 2024 10:00:00 +0000",
+            'thread_id': thread_id
+        })
+
+    def get_thread(self, thread_id):
+        self.thread_calls += 1
+        return self.threads.get(thread_id)
+
+    def get_email_details(self, message_id):
+        self.detail_calls += 1
+        return None
+
+
+class FakeAI:
+    """AI stand-in that records what it was asked to summarize"""
+
+    def __init__(self):
+        self.calls = []
+
+    def summarize_thread(self, subject, messages, previous_summary=None):
+        self.calls.append(([msg['id'] for msg in messages], previous_summary))
+        return f"summary of {len(messages)} new"
+
+
+@pytest.fixture
+def cache():
+    """Create an empty thread cache"""
+    return ThreadSummaryCache(backend=MemoryBackend())
+
+
+def test_unchanged_thread_skips_gmail_and_llm(cache):
+    """Test a thread with the same history id is served from cache"""
+    gmail, ai = FakeGmail(), FakeAI()
+    gmail.add_message("t1", "m1", "Alice", "100")
+
+    cache.summarize("user", {'id': "t1", 'history_id': "100"}, gmail, ai)
+    entry = cache.summarize("user", {'id': "t1", 'history_id': "100"}, gmail, ai)
+
+    assert entry['message_count'] == 1
+    assert gmail.thread_calls == 1
+    assert len(ai.calls) == 1
+
+
+def test_appended_messages_summarized_incrementally(cache):
+    """Test only new messages are sent to the model with the previous summary"""
+    gmail, ai = FakeGmail(), FakeAI()
+    gmail.add_message("t1", "m1", "Alice", "100")
+    cache.summarize("user", {'id': "t1", 'history_id': "100"}, gmail, ai)
+
+    gmail.add_message("t1", "m2", "Bob", "101")
+    entry = cache.summarize("user", {'id': "t1", 'history_id': "101"}, gmail, ai)
+
+    assert ai.calls[-1] == (["m2"], "summary of 1 new")
+    assert entry['participants'] == ["Alice", "Bob"]
+    assert entry['latest_sender_name'] == "Bob"
+
+
+def test_cache_is_bounded():
+    """Test least recently used threads are evicted"""
+    cache = ThreadSummaryCache(backend=MemoryBackend(max_keys=2))
+    for i in range(3):
+        cache.put("user", f"t{i}", {'id': f"t{i}"})
+
+    assert cache.get("user", "t0") is None
+    assert cache.get("user", "t2") is not None
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,63 @@
+import json
+import pytest
+from app.core.tracing import (
+    Tracer, BatchSpanProcessor, FileSpanExporter, parse_traceparent, hash_user, SPAN_KIND_CLIENT
+)
+
+
+@pytest.fixture
+def file_tracer(tmp_path):
+    """Create a tracer exporting to a temporary file"""
+    path = tmp_path / "traces.jsonl"
+    return Tracer(BatchSpanProcessor(FileSpanExporter(str(path)))), path
+
+
+def test_nested_spans_share_trace(file_tracer):
+    """Test child spans link to their parent and are exported as OTLP/JSON"""
+    tracer, path = file_tracer
+
+    with tracer.start_span("POST /api/chat/message") as root:
+        with tracer.start_span("gmail_list", kind=SPAN_KIND_CLIENT) as child:
+            child.set_attribute("gmail.message_count", 5)
+    tracer.shutdown()
+
+    document = json.loads(path.read_text().splitlines()[0])
+    spans = {span["name"]: span for span in document["resourceSpans"][0]["scopeSpans"][0]["spans"]}
+
+    assert spans["gmail_list"]["traceId"] == root.trace_id
+    assert spans["gmail_list"]["parentSpanId"] == root.span_id
+    assert {"key": "gmail.message_count", "value": {"intValue": "5"}} in spans["gmail_list"]["attributes"]
+
+
+def test_errors_marked_on_span(file_tracer):
+    """Test exceptions set an error status and still propagate"""
+    tracer, path = file_tracer
+
+    with pytest.raises(RuntimeError):
+        with tracer.start_span("llm.summarize") as span:
+            raise RuntimeError("provider down")
+
+    assert span.status_code == 2
+    assert span.attributes["exception.type"] == "RuntimeError"
+
+
+def test_disabled_tracer_is_noop():
+    """Test spans are non-recording without an exporter"""
+    with Tracer().start_span("anything") as span:
+        span.set_attribute("ignored", True)
+
+    assert span.sampled is False
+
+
+def test_traceparent_and_user_hash():
+    """Test W3C traceparent parsing and pseudonymous user ids"""
+    header = "00-4bf92f3577b34da6a3ce929d0e0e4736-00f067aa0ba902b7-01"
+
+    assert parse_traceparent(header) == ("4bf92f3577b34da6a3ce929d0e0e4736", "00f067aa0ba902b7")
+    assert parse_traceparent("garbage") is None
+    assert hash_user("User@Example.com") == hash_user("user@example.com")
+    assert "example" not in hash_user("user@example.com")
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
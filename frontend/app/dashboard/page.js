@@ -3,10 +3,12 @@
 import { useEffect, useState, useRef } from 'react';
 import { useRouter } from 'next/navigation';
 import { useAuth } from '@/lib/auth';
-import { chatAPI, emailAPI } from '@/lib/api';
+import { chatAPI, emailAPI, liveAPI } from '@/lib/api';
 import ChatMessage from '@/components/ChatMessage';
 import EmailCard from '@/components/EmailCard';
 
+const PAGE_SIZE = 10;
+
 export default function Dashboard() {
   const router = useRouter();
   const { user, isAuthenticated, loading, logout } = useAuth();
@@ -15,7 +17,11 @@ export default function Dashboard() {
   const [isSending, setIsSending] = useState(false);
   const [emails, setEmails] = useState([]);
   const [pendingAction, setPendingAction] = useState(null);
+  const [nextCursor, setNextCursor] = useState(null);
+  const [isLoadingMore, setIsLoadingMore] = useState(false);
+  const [historyId, setHistoryId] = useState(null);
   const messagesEndRef = useRef(null);
+  const historyIdRef = useRef(null);
 
   useEffect(() => {
     if (!loading && !isAuthenticated) {
@@ -36,6 +42,79 @@ export default function Dashboard() {
     scrollToBottom();
   }, [messages]);
 
+  useEffect(() => {
+    historyIdRef.current = historyId;
+  }, [historyId]);
+
+  // Pushed updates keep the listed emails fresh without polling
+  useEffect(() => {
+    if (!isAuthenticated) return;
+    return liveAPI.connect(handleLiveEvent, { onOpen: syncEmails });
+  }, [isAuthenticated]);
+
+  // Catch up on changes missed while disconnected or too slow to keep up
+  const syncEmails = async () => {
+    if (!historyIdRef.current) return;
+    try {
+      const delta = await emailAPI.getEmailDelta(historyIdRef.current);
+      if (delta.reset) {
+        const response = await emailAPI.listEmails(PAGE_SIZE);
+        setEmails(response.emails);
+        setNextCursor(response.next_cursor || null);
+        setHistoryId(response.history_id || null);
+        return;
+      }
+      if (delta.added.length || delta.removed.length) {
+        const dropped = new Set([...delta.removed, ...delta.added.map(e => e.id)]);
+        setEmails(prev => [...delta.added, ...prev.filter(e => !dropped.has(e.id))]);
+      }
+      setHistoryId(delta.history_id);
+    } catch (error) {
+      console.error('Sync emails error:', error);
+    }
+  };
+
+  const updateEmail = (id, changes) => {
+    setEmails(prev => prev.map(e => (e.id === id ? { ...e, ...changes } : e)));
+  };
+
+  const handleLiveEvent = (event) => {
+    switch (event.type) {
+      case 'message.added':
+        // Only once the inbox is listed; the summary follows in its own event
+        if (historyIdRef.current) {
+          setEmails(prev => [event.email, ...prev.filter(e => e.id !== event.email.id)]);
+        }
+        break;
+      case 'message.removed':
+        setEmails(prev => prev.filter(e => e.id !== event.id));
+        break;
+      case 'summary.completed':
+        updateEmail(event.id, { summary: event.summary });
+        break;
+      case 'category.completed':
+        updateEmail(event.id, { category: event.category });
+        break;
+      case 'job.progress':
+        if (event.job.status === 'completed' || event.job.status === 'failed') {
+          addBotMessage(`Bulk ${event.job.action.replace('_', ' ')} ${event.job.status}: ${event.job.processed} of ${event.job.total} emails.`);
+        }
+        break;
+      case 'reply.status':
+        if (event.reply.status === 'sent') {
+          addBotMessage(`Reply to ${event.reply.to} sent successfully! ✅`);
+        } else if (event.reply.status === 'failed') {
+          addBotMessage(`Failed to send reply: ${event.reply.error}`);
+        }
+        break;
+      case 'resync':
+        syncEmails();
+        break;
+      default:
+        break;
+    }
+  };
+
   const scrollToBottom = () => {
     messagesEndRef.current?.scrollIntoView({ behavior: 'smooth' });
   };
@@ -79,6 +158,8 @@ export default function Dashboard() {
       // Handle specific actions
       if (response.action === 'list_emails' && response.data?.emails) {
         setEmails(response.data.emails);
+        setNextCursor(response.data.next_cursor || null);
+        setHistoryId(response.data.history_id || null);
       }
     } catch (error) {
       console.error('Send message error:', error);
@@ -88,6 +169,28 @@ export default function Dashboard() {
     }
   };
 
+  const loadMoreEmails = async () => {
+    if (!nextCursor || isLoadingMore) return;
+
+    setIsLoadingMore(true);
+    try {
+      const response = await emailAPI.listEmails(PAGE_SIZE, '', nextCursor);
+      setEmails(prev => [...prev, ...response.emails]);
+      setNextCursor(response.next_cursor || null);
+    } catch (error) {
+      console.error('Load more emails error:', error);
+    } finally {
+      setIsLoadingMore(false);
+    }
+  };
+
+  const handleEmailListScroll = (e) => {
+    const { scrollTop, scrollHeight, clientHeight } = e.currentTarget;
+    if (scrollHeight - scrollTop - clientHeight < 200) {
+      loadMoreEmails();
+    }
+  };
+
   const handleGenerateReply = async (emailId) => {
     setIsSending(true);
     try {
@@ -105,8 +208,9 @@ export default function Dashboard() {
   const handleSendReply = async (emailId, replyContent) => {
     setIsSending(true);
     try {
+      // Accepted into the outbox; delivery is reported by a reply.status event
       await emailAPI.sendReply(emailId, replyContent);
-      addBotMessage('Reply sent successfully! ✅');
+      addBotMessage('Reply queued for sending 📤');
       setPendingAction(null);
     } catch (error) {
       console.error('Send reply error:', error);
@@ -233,7 +337,7 @@ export default function Dashboard() {
               <div className="p-4 border-b border-gray-200">
                 <h2 className="text-lg font-semibold text-gray-800">Recent Emails</h2>
               </div>
-              <div className="flex-1 overflow-y-auto p-4 space-y-3">
+              <div className="flex-1 overflow-y-auto p-4 space-y-3" onScroll={handleEmailListScroll}>
                 {emails.map((email, index) => (
                   <EmailCard
                     key={email.id}
@@ -243,6 +347,11 @@ export default function Dashboard() {
                     onDelete={handleDeleteEmail}
                   />
                 ))}
+                {isLoadingMore && (
+                  <div className="flex justify-center py-2">
+                    <div className="w-5 h-5 border-2 border-blue-500 border-t-transparent rounded-full animate-spin"></div>
+                  </div>
+                )}
               </div>
             </div>
           )}
@@ -55,9 +55,25 @@ export const authAPI = {
 
 // Email APIs
 export const emailAPI = {
-  listEmails: async (maxResults = 5, query = '') => {
+  listEmails: async (maxResults = 5, query = '', cursor = null) => {
     const response = await api.get('/api/emails/list', {
-      params: { max_results: maxResults, query },
+      params: { max_results: maxResults, query, ...(cursor && { cursor }) },
+    });
+    return response.data;
+  },
+  
+  // Most important recent messages first (single page, each with a priority score)
+  listPriorityEmails: async (maxResults = 5, query = '') => {
+    const response = await api.get('/api/emails/list', {
+      params: { max_results: maxResults, query, sort: 'priority' },
+    });
+    return response.data;
+  },
+  
+  // Only what changed since historyId (from listEmails or a previous delta)
+  getEmailDelta: async (historyId, maxResults = 25) => {
+    const response = await api.get('/api/emails/delta', {
+      params: { history_id: historyId, max_results: maxResults },
     });
     return response.data;
   },
@@ -82,11 +98,31 @@ export const emailAPI = {
     return response.data;
   },
   
+  getReplyStatus: async (outboxId) => {
+    const response = await api.get(`/api/emails/outbox/${outboxId}`);
+    return response.data;
+  },
+  
   deleteEmail: async (emailId) => {
     const response = await api.delete(`/api/emails/${emailId}`);
     return response.data;
   },
   
+  bulkAction: async (action, { emailIds = null, query = null, labelId = null } = {}) => {
+    const response = await api.post('/api/emails/bulk', {
+      action,
+      email_ids: emailIds,
+      query,
+      label_id: labelId,
+    });
+    return response.data;
+  },
+  
+  getBulkJob: async (jobId) => {
+    const response = await api.get(`/api/emails/bulk/${jobId}`);
+    return response.data;
+  },
+  
   searchEmails: async (query, maxResults = 10) => {
     const response = await api.get(`/api/emails/search/${encodeURIComponent(query)}`, {
       params: { max_results: maxResults },
@@ -105,6 +141,54 @@ export const emailAPI = {
   },
 };
 
+// Live inbox: pushed new mail, AI results and job progress; reconnects with backoff
+export const liveAPI = {
+  connect: (onEvent, { onOpen } = {}) => {
+    let socket = null;
+    let closed = false;
+    let retries = 0;
+    let timer = null;
+
+    const retry = () => {
+      if (closed) return;
+      // 1s, 2s, 4s ... up to 30s between attempts
+      timer = setTimeout(open, Math.min(30000, 1000 * 2 ** retries++));
+    };
+
+    const open = async () => {
+      if (!Cookies.get('token') || closed) return;
+
+      // The session token never goes into the URL; a single-use ticket does
+      let ticket;
+      try {
+        ticket = (await api.post('/api/live/ticket')).data.ticket;
+      } catch {
+        retry();
+        return;
+      }
+      if (closed) return;
+
+      socket = new WebSocket(`${API_URL.replace(/^http/, 'ws')}/api/live?ticket=${encodeURIComponent(ticket)}`);
+      socket.onopen = () => {
+        retries = 0;
+        onOpen?.();
+      };
+      socket.onmessage = (message) => {
+        const event = JSON.parse(message.data);
+        if (event.type !== 'ping') onEvent(event);
+      };
+      socket.onclose = retry;
+    };
+
+    open();
+    return () => {
+      closed = true;
+      clearTimeout(timer);
+      socket?.close();
+    };
+  },
+};
+
 // Chat API
 export const chatAPI = {
   sendMessage: async (message) => {
@@ -118,4 +202,11 @@ export const chatAPI = {
     });
     return response.data;
   },
+  
+  confirmBulkDelete: async (query) => {
+    const response = await api.post('/api/chat/confirm-delete', null, {
+      params: { query },
+    });
+    return response.data;
+  },
 };